@@ -0,0 +1,191 @@
+"""
+OpenNEM API response cache
+
+Caches the JSON responses of stats endpoints in redis. Responses are keyed on the
+endpoint and its normalized query parameters and expire when the next interval
+for the network is due. Ingest bumps a generation counter for the network when
+new intervals are stored which moves all of the network's keys on without having
+to scan for them - the old keys expire on their own.
+
+If redis is unavailable requests are served from the database as normal.
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from opennem.api.stats.schema import OpennemDataSet
+from opennem.api.stats.serializer import stat_set_to_json
+from opennem.core.networks import network_from_network_code
+from opennem.settings import settings
+from opennem.utils.cache import get_cache_client, mark_cache_down
+
+logger = logging.getLogger("opennem.api.cache")
+
+API_CACHE_PREFIX = "opennem:api"
+
+# seconds after an interval ends that its data is expected to have landed
+API_CACHE_INTERVAL_LAG = 60
+
+# parameters that are never part of the key
+API_CACHE_EXCLUDE_PARAMS = ["engine", "session"]
+
+
+def _get_client() -> Optional[Any]:
+    """Returns the redis client or None if caching is disabled or down"""
+    if not settings.api_cache_enabled:
+        return None
+
+    return get_cache_client()
+
+
+def _generation_key(network_code: str) -> str:
+    return "{}:gen:{}".format(API_CACHE_PREFIX, network_code.upper())
+
+
+def _normalize_param(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    if isinstance(value, str):
+        return value.strip()
+
+    return str(value)
+
+
+def get_cache_key(endpoint: str, network_code: str, generation: int, params: Dict) -> str:
+    """Key for an endpoint response from its query parameters. Params that are not
+    set are left out so the defaults and an explicit None share a key"""
+    params_key = "&".join(
+        "{}={}".format(k, _normalize_param(v))
+        for k, v in sorted(params.items())
+        if v is not None and k not in API_CACHE_EXCLUDE_PARAMS
+    )
+
+    return "{}:{}:{}:{}:{}".format(
+        API_CACHE_PREFIX, endpoint, network_code.upper(), generation, params_key
+    )
+
+
+def get_cache_ttl(network_code: str, now: Optional[float] = None) -> int:
+    """Seconds until the next interval for the network is due"""
+    try:
+        network = network_from_network_code(network_code)
+    except Exception:
+        return settings.api_cache_ttl_default
+
+    interval_seconds = network.interval_size * 60
+
+    if not now:
+        now = time.time()
+
+    return int(interval_seconds - now % interval_seconds) + API_CACHE_INTERVAL_LAG
+
+
+def invalidate_network_cache(network_code: str) -> None:
+    """Expire all cached responses for a network. Called by ingest when new
+    intervals have been stored"""
+    client = _get_client()
+
+    if not client:
+        return None
+
+    try:
+        client.incr(_generation_key(network_code))
+    except Exception as e:
+        mark_cache_down(e)
+
+
+def _cache_lookup(endpoint: str, kwargs: Dict) -> Tuple[Optional[Any], Optional[str], Any]:
+    """Returns the redis client, the cache key and any cached content for a request"""
+    network_code: Optional[str] = kwargs.get("network_code")
+    client = _get_client()
+
+    if not client or not network_code:
+        return None, None, None
+
+    try:
+        generation = int(client.get(_generation_key(network_code)) or 0)
+        cache_key = get_cache_key(endpoint, network_code, generation, kwargs)
+
+        return client, cache_key, client.get(cache_key)
+    except Exception as e:
+        mark_cache_down(e)
+
+    return None, None, None
+
+
+def _response_content(result: BaseModel) -> str:
+    if isinstance(result, OpennemDataSet):
+        return stat_set_to_json(result, exclude_unset=True)
+
+    return result.json(exclude_unset=True)
+
+
+def _cache_store(client: Any, cache_key: Optional[str], network_code: str, result: Any) -> Any:
+    """Store the JSON for a result model and return it as the response. The JSON
+    is returned as the response even when the cache is down"""
+    if not isinstance(result, BaseModel):
+        return result
+
+    content = _response_content(result)
+
+    if client and cache_key:
+        try:
+            client.set(cache_key, content, ex=get_cache_ttl(network_code))
+            logger.debug("api cache MISS at key: {}".format(cache_key))
+        except Exception as e:
+            mark_cache_down(e)
+
+    return Response(content=content, media_type="application/json")
+
+
+def cache_response(endpoint: str) -> Callable:
+    """Cache the JSON response for an endpoint that takes a network_code parameter.
+    Cached responses are returned as is without running through the response model.
+
+    Works for both sync and async endpoints"""
+
+    def _cache_response_decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def _cache_response_wrapper_async(*args: Any, **kwargs: Any) -> Any:
+                # redis client is sync so keep its round trips off the event loop
+                client, cache_key, cached_content = await run_in_threadpool(
+                    _cache_lookup, endpoint, kwargs
+                )
+
+                if cached_content:
+                    logger.debug("api cache HIT at key: {}".format(cache_key))
+                    return Response(content=cached_content, media_type="application/json")
+
+                result = await func(*args, **kwargs)
+
+                return await run_in_threadpool(
+                    _cache_store, client, cache_key, kwargs.get("network_code", ""), result
+                )
+
+            return _cache_response_wrapper_async
+
+        @wraps(func)
+        def _cache_response_wrapper(*args: Any, **kwargs: Any) -> Any:
+            client, cache_key, cached_content = _cache_lookup(endpoint, kwargs)
+
+            if cached_content:
+                logger.debug("api cache HIT at key: {}".format(cache_key))
+                return Response(content=cached_content, media_type="application/json")
+
+            result = func(*args, **kwargs)
+
+            return _cache_store(client, cache_key, kwargs.get("network_code", ""), result)
+
+        return _cache_response_wrapper
+
+    return _cache_response_decorator
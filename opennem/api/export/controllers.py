@@ -1,8 +1,10 @@
+import asyncio
 import logging
-import re
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from opennem.api.exceptions import OpennemBaseHttpException, OpenNEMInvalidNetworkRegion
+from sqlalchemy.sql.elements import TextClause
+
+from opennem.api.exceptions import OpennemBaseHttpException
 from opennem.api.export.queries import (
     country_stats_query,
     energy_network_flow_query,
@@ -10,27 +12,28 @@ from opennem.api.export.queries import (
     energy_network_interconnector_emissions_query,
     interconnector_flow_network_regions_query,
     interconnector_power_flow,
-    network_demand_query,
-    power_network_fueltech_query,
     power_network_rooftop_query,
-    price_network_query,
     weather_observation_query,
 )
-from opennem.api.facility.capacities import get_facility_capacities
-from opennem.api.stats.controllers import stats_factory
+from opennem.api.export.query_cache import (
+    ExportQueryCache,
+    ExportQueryKind,
+    run_export_query,
+    run_export_query_async,
+)
+from opennem.api.facility.capacities import get_facility_capacities, get_facility_capacities_async
+from opennem.api.stats.controllers import stats_factory, stats_factory_rows
 from opennem.api.stats.schema import DataQueryResult, OpennemDataSet, RegionFlowEmissionsResult
 from opennem.api.time import human_to_interval, human_to_period
 from opennem.core.flows import net_flows_emissions
 from opennem.core.units import get_unit
 from opennem.db import get_database_engine
+from opennem.db.query import run_query, run_query_async
 from opennem.schema.dates import TimeSeries
 from opennem.schema.network import NetworkNEM, NetworkSchema
 from opennem.schema.stats import StatTypes
 from opennem.schema.time import TimePeriod
 
-_valid_region = re.compile(r"^\w{1,4}\d?$")
-
-
 logger = logging.getLogger(__name__)
 
 
@@ -256,30 +259,23 @@ def demand_week(
     time_series: TimeSeries,
     network_region_code: Optional[str],
     networks_query: Optional[List[NetworkSchema]] = None,
+    query_cache: Optional[ExportQueryCache] = None,
 ) -> Optional[OpennemDataSet]:
-    engine = get_database_engine()
-
-    query = network_demand_query(
+    row = run_export_query(
+        ExportQueryKind.demand,
         time_series=time_series,
         network_region=network_region_code,
         networks_query=networks_query,
+        query_cache=query_cache,
     )
 
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
-
     if len(row) < 1:
         logger.error("No results from network_demand_query with {}".format(time_series))
         return None
 
-    demand = [
-        DataQueryResult(interval=i[0], result=i[2], group_by="demand" if len(i) > 1 else None)
-        for i in row
-    ]
-
-    result = stats_factory(
-        demand,
+    result = stats_factory_rows(
+        row,
+        group_code="demand",
         # code=network_region_code or network.code,
         network=time_series.network,
         period=human_to_period("7d"),
@@ -295,39 +291,18 @@ def demand_week(
     return result
 
 
-def power_week(
+def _power_week_fueltech_stats(
     time_series: TimeSeries,
-    network_region_code: str = None,
-    networks_query: Optional[List[NetworkSchema]] = None,
-    include_capacities: bool = False,
+    network_region_code: Optional[str],
+    row: List,
     include_code: Optional[bool] = True,
 ) -> Optional[OpennemDataSet]:
-    engine = get_database_engine()
-
-    if network_region_code and not re.match(_valid_region, network_region_code):
-        raise OpenNEMInvalidNetworkRegion()
-
-    query = power_network_fueltech_query(
-        time_series=time_series,
-        networks_query=networks_query,
-        network_region=network_region_code,
-    )
-
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
-
-    stats = [
-        DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    if len(stats) < 1:
+    if len(row) < 1:
         logger.error("No results from power week query with {}".format(time_series))
         return None
 
-    result = stats_factory(
-        stats,
+    result = stats_factory_rows(
+        row,
         # code=network_region_code or network.code,
         network=time_series.network,
         interval=time_series.interval,
@@ -342,36 +317,23 @@ def power_week(
         logger.error("No results from power week status factory with {}".format(time_series))
         return None
 
-    if include_capacities and network_region_code:
-        region_fueltech_capacities = get_facility_capacities(
-            time_series.network, network_region_code
-        )
-
-        for ft in result.data:
-            if ft.fuel_tech in region_fueltech_capacities:
-                ft.x_capacity_at_present = region_fueltech_capacities[ft.fuel_tech]
+    return result
 
-    # price
 
-    time_series_price = time_series.copy()
+def _power_week_set_capacities(result: OpennemDataSet, region_fueltech_capacities: Dict) -> None:
+    for ft in result.data:
+        if ft.fuel_tech in region_fueltech_capacities:
+            ft.x_capacity_at_present = region_fueltech_capacities[ft.fuel_tech]
 
-    query = price_network_query(
-        time_series=time_series_price,
-        networks_query=networks_query,
-        network_region=network_region_code,
-    )
-
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
 
-    stats_price = [
-        DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    stats_market_value = stats_factory(
-        stats=stats_price,
+def _power_week_price_stats(
+    time_series: TimeSeries,
+    network_region_code: Optional[str],
+    row: List,
+    include_code: Optional[bool] = True,
+) -> Optional[OpennemDataSet]:
+    return stats_factory_rows(
+        row,
         code=network_region_code or time_series.network.code.lower(),
         units=get_unit("price_energy_mega"),
         network=time_series.network,
@@ -381,30 +343,22 @@ def power_week(
         include_code=include_code,
     )
 
-    result.append_set(stats_market_value)
-
-    # rooftop solar
 
+def _power_week_rooftop_time_series(time_series: TimeSeries) -> TimeSeries:
     time_series_rooftop = time_series.copy()
     time_series_rooftop.interval = human_to_interval("30m")
 
-    query = power_network_rooftop_query(
-        time_series=time_series_rooftop,
-        networks_query=networks_query,
-        network_region=network_region_code,
-    )
-
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
+    return time_series_rooftop
 
-    rooftop_power = [
-        DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None)
-        for i in row
-    ]
 
-    rooftop = stats_factory(
-        rooftop_power,
+def _power_week_rooftop_stats(
+    time_series: TimeSeries,
+    network_region_code: Optional[str],
+    row: List,
+    include_code: Optional[bool] = True,
+) -> Optional[OpennemDataSet]:
+    return stats_factory_rows(
+        row,
         # code=network_region_code or network.code,
         network=time_series.network,
         interval=human_to_interval("30m"),
@@ -416,41 +370,44 @@ def power_week(
         cast_nulls=False,
     )
 
-    # rooftop forecast
-    rooftop_forecast = None
 
-    if rooftop and rooftop.data and len(rooftop.data) > 0:
-        time_series_rooftop_forecast = time_series_rooftop.copy()
-        time_series_rooftop_forecast.start = rooftop.data[0].history.last
-        time_series_rooftop_forecast.forecast = True
+def _power_week_rooftop_forecast_query(
+    time_series: TimeSeries,
+    rooftop: Optional[OpennemDataSet],
+    network_region_code: Optional[str],
+    networks_query: Optional[List[NetworkSchema]] = None,
+) -> Optional[TextClause]:
+    """The forecast runs on from the last rooftop interval so needs the rooftop
+    stats first"""
+    if not rooftop or not rooftop.data or len(rooftop.data) < 1:
+        return None
+
+    time_series_rooftop_forecast = _power_week_rooftop_time_series(time_series)
+    time_series_rooftop_forecast.start = rooftop.data[0].history.last
+    time_series_rooftop_forecast.forecast = True
 
-        query = power_network_rooftop_query(
-            time_series=time_series_rooftop_forecast,
-            networks_query=networks_query,
-            network_region=network_region_code,
-            forecast=True,
-        )
+    return power_network_rooftop_query(
+        time_series=time_series_rooftop_forecast,
+        networks_query=networks_query,
+        network_region=network_region_code,
+        forecast=True,
+    )
 
-        with engine.connect() as c:
-            logger.debug(query)
-            row = list(c.execute(query))
 
-        rooftop_forecast_power = [
-            DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None)
-            for i in row
-        ]
+def _power_week_append_rooftop(
+    result: OpennemDataSet,
+    time_series: TimeSeries,
+    network_region_code: Optional[str],
+    rooftop: Optional[OpennemDataSet],
+    row_forecast: Optional[List],
+    include_code: Optional[bool] = True,
+) -> OpennemDataSet:
+    rooftop_forecast = None
 
-        rooftop_forecast = stats_factory(
-            rooftop_forecast_power,
-            # code=network_region_code or network.code,
-            network=time_series.network,
-            interval=human_to_interval("30m"),
-            period=time_series.period,
-            units=get_unit("power"),
-            region=network_region_code,
-            fueltech_group=True,
-            include_code=include_code,
-            cast_nulls=False,
+    if row_forecast is not None:
+        # forecast rows are shaped the same as rooftop rows
+        rooftop_forecast = _power_week_rooftop_stats(
+            time_series, network_region_code, row_forecast, include_code=include_code
         )
 
     if rooftop and rooftop_forecast:
@@ -469,46 +426,151 @@ def power_week(
     return result
 
 
-def energy_fueltech_daily(
+def power_week(
     time_series: TimeSeries,
-    network_region_code: Optional[str] = None,
+    network_region_code: str = None,
     networks_query: Optional[List[NetworkSchema]] = None,
+    include_capacities: bool = False,
+    include_code: Optional[bool] = True,
+    query_cache: Optional[ExportQueryCache] = None,
 ) -> Optional[OpennemDataSet]:
-    engine = get_database_engine()
-    units = get_unit("energy_giga")
-
-    query = energy_network_fueltech_query(
+    row = run_export_query(
+        ExportQueryKind.power_fueltech,
         time_series=time_series,
+        networks_query=networks_query,
         network_region=network_region_code,
+        query_cache=query_cache,
+    )
+
+    result = _power_week_fueltech_stats(
+        time_series, network_region_code, row, include_code=include_code
+    )
+
+    if not result:
+        return None
+
+    if include_capacities and network_region_code:
+        _power_week_set_capacities(
+            result, get_facility_capacities(time_series.network, network_region_code)
+        )
+
+    # price
+
+    time_series_price = time_series.copy()
+
+    row = run_export_query(
+        ExportQueryKind.price,
+        time_series=time_series_price,
         networks_query=networks_query,
+        network_region=network_region_code,
+        query_cache=query_cache,
     )
 
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
+    result.append_set(
+        _power_week_price_stats(time_series, network_region_code, row, include_code=include_code)
+    )
 
-    results_energy = [
-        DataQueryResult(interval=i[0], group_by=i[1], result=i[2] if len(i) > 1 else None)
-        for i in row
-    ]
+    # rooftop solar
 
-    results_market_value = [
-        DataQueryResult(interval=i[0], group_by=i[1], result=i[3] if len(i) > 1 else None)
-        for i in row
-    ]
+    query = power_network_rooftop_query(
+        time_series=_power_week_rooftop_time_series(time_series),
+        networks_query=networks_query,
+        network_region=network_region_code,
+    )
+
+    rooftop = _power_week_rooftop_stats(
+        time_series, network_region_code, run_query(query), include_code=include_code
+    )
+
+    # rooftop forecast
+    query_forecast = _power_week_rooftop_forecast_query(
+        time_series, rooftop, network_region_code, networks_query
+    )
+
+    row_forecast = run_query(query_forecast) if query_forecast is not None else None
+
+    return _power_week_append_rooftop(
+        result, time_series, network_region_code, rooftop, row_forecast, include_code
+    )
 
-    results_emissions = [
-        DataQueryResult(interval=i[0], group_by=i[1], result=i[4] if len(i) > 1 else None)
-        for i in row
-    ]
 
-    if len(results_energy) < 1:
-        logger.error("No results from query: {}".format(query))
+async def power_week_async(
+    time_series: TimeSeries,
+    network_region_code: str = None,
+    networks_query: Optional[List[NetworkSchema]] = None,
+    include_capacities: bool = False,
+    include_code: Optional[bool] = True,
+) -> Optional[OpennemDataSet]:
+    """power_week on the asyncio engine. The fueltech, price and rooftop queries are
+    independent so are run at once"""
+    row, row_price, row_rooftop = await asyncio.gather(
+        run_export_query_async(
+            ExportQueryKind.power_fueltech,
+            time_series=time_series,
+            networks_query=networks_query,
+            network_region=network_region_code,
+        ),
+        run_export_query_async(
+            ExportQueryKind.price,
+            time_series=time_series.copy(),
+            networks_query=networks_query,
+            network_region=network_region_code,
+        ),
+        run_query_async(
+            power_network_rooftop_query(
+                time_series=_power_week_rooftop_time_series(time_series),
+                networks_query=networks_query,
+                network_region=network_region_code,
+            )
+        ),
+    )
+
+    result = _power_week_fueltech_stats(
+        time_series, network_region_code, row, include_code=include_code
+    )
+
+    if not result:
         return None
 
-    stats = stats_factory(
-        stats=results_energy,
-        units=units,
+    if include_capacities and network_region_code:
+        _power_week_set_capacities(
+            result,
+            await get_facility_capacities_async(time_series.network, network_region_code),
+        )
+
+    result.append_set(
+        _power_week_price_stats(
+            time_series, network_region_code, row_price, include_code=include_code
+        )
+    )
+
+    rooftop = _power_week_rooftop_stats(
+        time_series, network_region_code, row_rooftop, include_code=include_code
+    )
+
+    query_forecast = _power_week_rooftop_forecast_query(
+        time_series, rooftop, network_region_code, networks_query
+    )
+
+    row_forecast = await run_query_async(query_forecast) if query_forecast is not None else None
+
+    return _power_week_append_rooftop(
+        result, time_series, network_region_code, rooftop, row_forecast, include_code
+    )
+
+
+def _energy_fueltech_daily_stats(
+    time_series: TimeSeries,
+    network_region_code: Optional[str],
+    row: List,
+) -> Optional[OpennemDataSet]:
+    if len(row) < 1:
+        logger.error("No results from energy fueltech daily query with {}".format(time_series))
+        return None
+
+    stats = stats_factory_rows(
+        row,
+        units=get_unit("energy_giga"),
         network=time_series.network,
         fueltech_group=True,
         interval=time_series.interval,
@@ -521,8 +583,9 @@ def energy_fueltech_daily(
     if not stats:
         return None
 
-    stats_market_value = stats_factory(
-        stats=results_market_value,
+    stats_market_value = stats_factory_rows(
+        row,
+        value_index=3,
         units=get_unit("market_value"),
         network=time_series.network,
         fueltech_group=True,
@@ -535,8 +598,9 @@ def energy_fueltech_daily(
 
     stats.append_set(stats_market_value)
 
-    stats_emissions = stats_factory(
-        stats=results_emissions,
+    stats_emissions = stats_factory_rows(
+        row,
+        value_index=4,
         units=get_unit("emissions"),
         network=time_series.network,
         fueltech_group=True,
@@ -552,6 +616,36 @@ def energy_fueltech_daily(
     return stats
 
 
+def energy_fueltech_daily(
+    time_series: TimeSeries,
+    network_region_code: Optional[str] = None,
+    networks_query: Optional[List[NetworkSchema]] = None,
+) -> Optional[OpennemDataSet]:
+    query = energy_network_fueltech_query(
+        time_series=time_series,
+        network_region=network_region_code,
+        networks_query=networks_query,
+    )
+
+    return _energy_fueltech_daily_stats(time_series, network_region_code, run_query(query))
+
+
+async def energy_fueltech_daily_async(
+    time_series: TimeSeries,
+    network_region_code: Optional[str] = None,
+    networks_query: Optional[List[NetworkSchema]] = None,
+) -> Optional[OpennemDataSet]:
+    query = energy_network_fueltech_query(
+        time_series=time_series,
+        network_region=network_region_code,
+        networks_query=networks_query,
+    )
+
+    row = await run_query_async(query)
+
+    return _energy_fueltech_daily_stats(time_series, network_region_code, row)
+
+
 def energy_interconnector_region_daily(
     time_series: TimeSeries,
     network_region_code: str,
@@ -0,0 +1,142 @@
+"""
+Export executor
+
+Runs the queries for a list of export map resources concurrently on a bounded pool
+of workers. Each finished stat set is handed to a separate writer pool so uploads
+to S3 overlap with the queries for the next resources.
+
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from opennem.api.export.map import StatExport
+from opennem.api.export.utils import write_output
+from opennem.api.stats.schema import OpennemDataSet
+from opennem.schema.core import BaseConfig
+from opennem.settings import settings
+
+logger = logging.getLogger("opennem.export.executor")
+
+# number of uploads run at once per query worker
+EXPORT_WRITERS_PER_WORKER = 2
+
+ExportQueryFunc = Callable[[StatExport], Optional[OpennemDataSet]]
+
+
+class ExportResult(BaseConfig):
+    path: str
+    query_seconds: float = 0.0
+    write_seconds: float = 0.0
+    byte_count: int = 0
+    # set when the stat set was written, including when the stored object is unchanged
+    written: bool = False
+    error: Optional[str]
+
+    @property
+    def seconds(self) -> float:
+        return self.query_seconds + self.write_seconds
+
+
+def _run_query(
+    export_func: ExportQueryFunc, stat: StatExport
+) -> Tuple[Optional[OpennemDataSet], ExportResult]:
+    result = ExportResult(path=stat.path)
+    stat_set = None
+
+    query_start = time.perf_counter()
+
+    try:
+        stat_set = export_func(stat)
+    except Exception as e:
+        logger.error("Error running export {}: {}".format(stat.path, e))
+        result.error = str(e)
+
+    result.query_seconds = time.perf_counter() - query_start
+
+    return stat_set, result
+
+
+def _run_write(stat_set: OpennemDataSet, result: ExportResult) -> ExportResult:
+    write_start = time.perf_counter()
+
+    try:
+        result.byte_count = write_output(result.path, stat_set)
+        result.written = True
+    except Exception as e:
+        logger.error("Error writing export {}: {}".format(result.path, e))
+        result.error = str(e)
+
+    result.write_seconds = time.perf_counter() - write_start
+
+    logger.info(
+        "Exported {} in {:.2f}s (query: {:.2f}s write: {:.2f}s)".format(
+            result.path, result.seconds, result.query_seconds, result.write_seconds
+        )
+    )
+
+    return result
+
+
+def run_export_resources(
+    stats: List[StatExport],
+    export_func: ExportQueryFunc,
+    workers: Optional[int] = None,
+) -> List[ExportResult]:
+    """Run export_func for each stat and write the returned stat sets to their path.
+
+    Resources that return no stat set are skipped. Returns a result with timings for
+    each resource in the order of stats"""
+    if not workers:
+        workers = settings.export_workers
+
+    run_start = time.perf_counter()
+
+    results: Dict[int, ExportResult] = {}
+
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="opennem_export"
+    ) as query_executor, ThreadPoolExecutor(
+        max_workers=workers * EXPORT_WRITERS_PER_WORKER, thread_name_prefix="opennem_export_write"
+    ) as write_executor:
+        query_futures: Dict[Future, int] = {
+            query_executor.submit(_run_query, export_func, stat): index
+            for index, stat in enumerate(stats)
+        }
+        write_futures: Dict[Future, int] = {}
+
+        pending: Set[Future] = set(query_futures.keys())
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for query_future in done:
+                index = query_futures[query_future]
+                stat_set, result = query_future.result()
+
+                results[index] = result
+
+                if not stat_set:
+                    if not result.error:
+                        logger.info("No stat set for {}".format(result.path))
+                    continue
+
+                write_futures[write_executor.submit(_run_write, stat_set, result)] = index
+
+        for write_future, index in write_futures.items():
+            results[index] = write_future.result()
+
+    results_list = [results[i] for i in sorted(results.keys())]
+
+    logger.info(
+        "Ran {} exports in {:.2f}s on {} workers. wrote: {} errors: {}".format(
+            len(stats),
+            time.perf_counter() - run_start,
+            workers,
+            len(write_futures),
+            len([i for i in results_list if i.error]),
+        )
+    )
+
+    return results_list
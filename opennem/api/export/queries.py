@@ -1,17 +1,17 @@
 from datetime import timedelta
 from textwrap import dedent
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from sqlalchemy import sql
 from sqlalchemy.sql.elements import TextClause
 
-from opennem.api.stats.controllers import networks_to_in
+from opennem.db.query import bind_query
 from opennem.schema.dates import TimeSeries
 from opennem.schema.network import NetworkAPVI, NetworkNEM, NetworkSchema, NetworkWEM
 from opennem.schema.stats import StatTypes
 
 
-def weather_observation_query(time_series: TimeSeries, station_codes: List[str]) -> str:
+def weather_observation_query(time_series: TimeSeries, station_codes: List[str]) -> TextClause:
 
     if time_series.interval.interval >= 1440:
         # @TODO replace with mv
@@ -42,17 +42,14 @@ def weather_observation_query(time_series: TimeSeries, station_codes: List[str])
 
         from bom_observation fs
         where
-            fs.station_id in ({station_codes}) and
-            fs.observation_time <= '{date_end}' and
-            fs.observation_time >= '{date_start}'
+            fs.station_id = ANY(:station_codes) and
+            fs.observation_time <= :date_end and
+            fs.observation_time >= :date_start
         group by 1, 2
         order by 1 asc;
         """.format(
             trunc=time_series.interval.trunc,
             tz=time_series.network.timezone_database,
-            station_codes=",".join(["'{}'".format(i) for i in station_codes]),
-            date_start=time_series.get_range().start,
-            date_end=time_series.get_range().end,
         )
 
     else:
@@ -78,21 +75,23 @@ def weather_observation_query(time_series: TimeSeries, station_codes: List[str])
 
         from bom_observation fs
         where
-            fs.station_id in ({station_codes}) and
-            fs.observation_time <= '{date_end}' and
-            fs.observation_time >= '{date_start}'
+            fs.station_id = ANY(:station_codes) and
+            fs.observation_time <= :date_end and
+            fs.observation_time >= :date_start
         group by 1, 2
         order by 1 desc;
-        """.format(
-            station_codes=",".join(["'{}'".format(i) for i in station_codes]),
-            date_start=time_series.get_range().start,
-            date_end=time_series.get_range().end,
-        )
+        """
 
-    return dedent(__query)
+    return bind_query(
+        "weather_observation",
+        __query,
+        station_codes=station_codes,
+        date_start=time_series.get_range().start,
+        date_end=time_series.get_range().end,
+    )
 
 
-def interconnector_power_flow(time_series: TimeSeries, network_region: str) -> str:
+def interconnector_power_flow(time_series: TimeSeries, network_region: str) -> TextClause:
     """Get interconnector region flows using materialized view"""
 
     ___query = """
@@ -109,27 +108,27 @@ def interconnector_power_flow(time_series: TimeSeries, network_region: str) -> s
         end as exports
     from balancing_summary bs
     where
-        bs.network_id = '{network_id}' and
-        bs.network_region= '{region}' and
-        bs.trading_interval <= '{date_end}' and
-        bs.trading_interval >= '{date_start}'
+        bs.network_id = :network_id and
+        bs.network_region = :network_region and
+        bs.trading_interval <= :date_end and
+        bs.trading_interval >= :date_start
     group by 1, 2
     order by trading_interval desc;
+    """
 
-
-    """.format(
+    return bind_query(
+        "interconnector_power_flow",
+        ___query,
         network_id=time_series.network.code,
-        region=network_region,
+        network_region=network_region,
         date_start=time_series.get_range().start,
         date_end=time_series.get_range().end,
     )
 
-    return dedent(___query)
-
 
 def interconnector_flow_network_regions_query(
     time_series: TimeSeries, network_region: Optional[str] = None
-) -> str:
+) -> TextClause:
     """ """
 
     __query = """
@@ -143,9 +142,9 @@ def interconnector_flow_network_regions_query(
     left join facility f on fs.facility_code = f.code
     where
         f.interconnector is True
-        and f.network_id='{network_id}'
-        and fs.trading_interval <= '{date_end}'
-        and fs.trading_interval >= '{date_start}'
+        and f.network_id = :network_id
+        and fs.trading_interval <= :date_end
+        and fs.trading_interval >= :date_start
         {region_query}
     group by 1, 2, 3, 4
     order by
@@ -155,18 +154,22 @@ def interconnector_flow_network_regions_query(
 
     region_query = ""
 
+    params: Dict[str, Any] = {
+        "network_id": time_series.network.code,
+        "date_start": time_series.get_range().start,
+        "date_end": time_series.get_range().end,
+    }
+
     if network_region:
-        region_query = f"and f.network_region='{network_region}'"
+        region_query = "and f.network_region = :network_region"
+        params["network_region"] = network_region
 
     query = __query.format(
         timezone=time_series.network.timezone_database,
-        network_id=time_series.network.code,
         region_query=region_query,
-        date_start=time_series.get_range().start,
-        date_end=time_series.get_range().end,
     )
 
-    return dedent(query)
+    return bind_query("interconnector_flow_network_regions", query, **params)
 
 
 def country_stats_query(stat_type: StatTypes, country: str = "au") -> TextClause:
@@ -195,7 +198,10 @@ def price_network_query(
     group_field: str = "bs.network_id",
     network_region: Optional[str] = None,
     networks_query: Optional[List[NetworkSchema]] = None,
-) -> str:
+    group_region: bool = False,
+) -> TextClause:
+    """Query price stats. With group_region the results for all regions are returned
+    as they would be for each network_region with the region as the last column"""
 
     if not networks_query:
         networks_query = [time_series.network]
@@ -208,52 +214,58 @@ def price_network_query(
             time_bucket_gapfill('{trunc}', bs.trading_interval) as trading_interval,
             {group_field},
             avg(bs.price) as price
+            {region_field}
         from balancing_summary bs
         where
-            bs.trading_interval <= '{date_max}' and
-            bs.trading_interval >= '{date_min}' and
-            {network_query}
+            bs.trading_interval <= :date_max and
+            bs.trading_interval >= :date_min and
+            bs.network_id = ANY(:network_ids) and
             {network_region_query}
             1=1
-        group by 1, 2
+        group by 1, 2 {region_field}
         order by 1 desc
     """
 
-    timezone = time_series.network.timezone_database
     network_region_query = ""
+    region_field = ""
+
+    params: Dict[str, Any] = {
+        "date_max": time_series.get_range().end,
+        "date_min": time_series.get_range().start,
+        "network_ids": [i.code for i in networks_query],
+    }
 
     if network_region:
-        network_region_query = f"bs.network_region='{network_region}' and "
+        network_region_query = "bs.network_region = :network_region and "
+        params["network_region"] = network_region
+
+    if network_region or group_region:
         group_field = "bs.network_region"
 
-    network_query = "bs.network_id IN ({}) and ".format(networks_to_in(networks_query))
+    if group_region:
+        region_field = ", bs.network_region"
 
     if len(networks_query) > 1:
         group_field = "'AU'"
 
-    date_max = time_series.get_range().end
-    date_min = time_series.get_range().start
-
-    query = dedent(
-        __query.format(
-            network_query=network_query,
-            trunc=time_series.interval.interval_sql,
-            network_region_query=network_region_query,
-            timezone=timezone,
-            date_max=date_max,
-            date_min=date_min,
-            group_field=group_field,
-        )
+    query = __query.format(
+        trunc=time_series.interval.interval_sql,
+        network_region_query=network_region_query,
+        group_field=group_field,
+        region_field=region_field,
     )
 
-    return query
+    return bind_query("price_network", query, **params)
 
 
 def network_demand_query(
     time_series: TimeSeries,
     network_region: Optional[str] = None,
     networks_query: Optional[List[NetworkSchema]] = None,
-) -> str:
+    group_region: bool = False,
+) -> TextClause:
+    """Query demand stats. With group_region the results for all regions are returned
+    as they would be for each network_region with the region as the last column"""
     if not networks_query:
         networks_query = [time_series.network]
 
@@ -265,11 +277,12 @@ def network_demand_query(
         trading_interval at time zone '{timezone}',
         network_id,
         max(demand_total) as demand
+        {region_field}
     from balancing_summary bs
     where
-        bs.trading_interval <= '{date_max}' and
-        bs.trading_interval >= '{date_min}' and
-        {network_query}
+        bs.trading_interval <= :date_max and
+        bs.trading_interval >= :date_min and
+        bs.network_id = ANY(:network_ids) and
         {network_region_query}
         1=1
     group by
@@ -279,37 +292,44 @@ def network_demand_query(
 
     group_keys = ["network_id"]
     network_region_query = ""
+    region_field = ""
 
-    if network_region:
+    params: Dict[str, Any] = {
+        "date_max": time_series.get_range().end,
+        "date_min": time_series.get_range().start,
+        "network_ids": [i.code for i in networks_query],
+    }
+
+    if network_region or group_region:
         group_keys.append("network_region")
-        network_region_query = f"bs.network_region = '{network_region}' and "
 
-    groups_additional = ", ".join(group_keys)
+    if network_region:
+        network_region_query = "bs.network_region = :network_region and "
+        params["network_region"] = network_region
 
-    network_query = "bs.network_id IN ({}) and ".format(networks_to_in(networks_query))
+    if group_region:
+        region_field = ", network_region"
 
-    date_max = time_series.get_range().end
-    date_min = time_series.get_range().start
+    groups_additional = ", ".join(group_keys)
 
     query = __query.format(
         timezone=time_series.network.timezone_database,
-        date_max=date_max,
-        date_min=date_min,
-        network_id=time_series.network.code,
-        network_query=network_query,
         network_region_query=network_region_query,
         groups_additional=groups_additional,
+        region_field=region_field,
     )
 
-    return dedent(query)
+    return bind_query("network_demand", query, **params)
 
 
 def power_network_fueltech_query(
     time_series: TimeSeries,
     network_region: Optional[str] = None,
     networks_query: Optional[List[NetworkSchema]] = None,
-) -> str:
-    """Query power stats"""
+    group_region: bool = False,
+) -> TextClause:
+    """Query power stats. With group_region the results for all regions are returned
+    as they would be for each network_region with the region as the last column"""
 
     if not networks_query:
         networks_query = [time_series.network]
@@ -322,41 +342,54 @@ def power_network_fueltech_query(
         t.trading_interval,
         t.fueltech_code,
         sum(t.fueltech_power)
+        {region_field}
     from (
         select
             time_bucket_gapfill('{trunc}', fs.trading_interval) AS trading_interval,
             ft.code as fueltech_code,
             coalesce(avg(fs.generated), 0) as fueltech_power
+            {region_inner_field}
         from facility_scada fs
         join facility f on fs.facility_code = f.code
         join fueltech ft on f.fueltech_id = ft.code
         where
             fs.is_forecast is False and
             f.fueltech_id is not null and
-            f.fueltech_id not in ({fueltechs_exclude}) and
-            {network_query}
+            f.fueltech_id != ALL(:fueltechs_exclude) and
+            (f.network_id = ANY(:network_ids) {wem_apvi_case}) and
             {network_region_query}
-            fs.trading_interval <= '{date_max}' and
-            fs.trading_interval >= '{date_min}'
-            {fueltech_filter}
-        group by 1, f.code, 2
+            fs.trading_interval <= :date_max and
+            fs.trading_interval >= :date_min
+        group by 1, f.code, 2 {region_inner_field}
     ) as t
-    group by 1, 2
+    group by 1, 2 {region_field}
     order by 1 desc
     """
 
     network_region_query: str = ""
-    fueltech_filter: str = ""
+    region_field: str = ""
+    region_inner_field: str = ""
     wem_apvi_case: str = ""
-    timezone: str = time_series.network.timezone_database
 
     fueltechs_excluded = ["exports", "imports", "interconnector"]
 
     if NetworkNEM in networks_query or NetworkWEM in networks_query:
         fueltechs_excluded.append("solar_rooftop")
 
+    params: Dict[str, Any] = {
+        "date_max": time_series.get_range().end,
+        "date_min": time_series.get_range().start,
+        "network_ids": [i.code for i in networks_query],
+        "fueltechs_exclude": fueltechs_excluded,
+    }
+
     if network_region:
-        network_region_query = f"f.network_region='{network_region}' and "
+        network_region_query = "f.network_region = :network_region and "
+        params["network_region"] = network_region
+
+    if group_region:
+        region_field = ", t.network_region"
+        region_inner_field = ", f.network_region"
 
     if NetworkWEM in networks_query:
         # silly single case we'll refactor out
@@ -364,30 +397,15 @@ def power_network_fueltech_query(
         # in country-wide totals
         wem_apvi_case = "or (f.network_id='APVI' and f.network_region='WEM')"
 
-    network_query = "(f.network_id IN ({}) {}) and ".format(
-        networks_to_in(networks_query), wem_apvi_case
-    )
-
-    date_max = time_series.get_range().end
-    date_min = time_series.get_range().start
-
-    fueltechs_exclude = ", ".join("'{}'".format(i) for i in fueltechs_excluded)
-
-    query = dedent(
-        __query.format(
-            network_query=network_query,
-            trunc=time_series.interval.interval_sql,
-            network_region_query=network_region_query,
-            timezone=timezone,
-            date_max=date_max,
-            date_min=date_min,
-            fueltech_filter=fueltech_filter,
-            wem_apvi_case=wem_apvi_case,
-            fueltechs_exclude=fueltechs_exclude,
-        )
+    query = __query.format(
+        trunc=time_series.interval.interval_sql,
+        network_region_query=network_region_query,
+        wem_apvi_case=wem_apvi_case,
+        region_field=region_field,
+        region_inner_field=region_inner_field,
     )
 
-    return query
+    return bind_query("power_network_fueltech", query, **params)
 
 
 def power_network_rooftop_query(
@@ -395,8 +413,8 @@ def power_network_rooftop_query(
     network_region: Optional[str] = None,
     networks_query: Optional[List[NetworkSchema]] = None,
     forecast: bool = False,
-) -> str:
-    """Query power stats"""
+) -> TextClause:
+    """Query rooftop power stats"""
 
     if not networks_query:
         networks_query = [time_series.network]
@@ -415,10 +433,10 @@ def power_network_rooftop_query(
         where
             {forecast_query}
             f.fueltech_id = 'solar_rooftop' and
-            {network_query}
+            (f.network_id = ANY(:network_ids) {wem_apvi_case}) and
             {network_region_query}
-            fs.trading_interval <= '{date_max}' and
-            fs.trading_interval >= '{date_min}'
+            fs.trading_interval <= :date_max and
+            fs.trading_interval >= :date_min
         group by 1, 2
         order by 1 desc
     """
@@ -426,12 +444,13 @@ def power_network_rooftop_query(
     network_region_query: str = ""
     wem_apvi_case: str = ""
     agg_func = "sum"
-    timezone: str = time_series.network.timezone_database
+    params: Dict[str, Any] = {}
 
     forecast_query = f"fs.is_forecast is {forecast} and"
 
     if network_region:
-        network_region_query = f"f.network_region='{network_region}' and "
+        network_region_query = "f.network_region = :network_region and "
+        params["network_region"] = network_region
 
     if NetworkWEM in networks_query:
         # silly single case we'll refactor out
@@ -445,10 +464,6 @@ def power_network_rooftop_query(
         if NetworkNEM not in networks_query:
             agg_func = "max"
 
-    network_query = "(f.network_id IN ({}) {}) and ".format(
-        networks_to_in(networks_query), wem_apvi_case
-    )
-
     date_max = time_series.get_range().end
     date_min = time_series.get_range().start
 
@@ -457,19 +472,18 @@ def power_network_rooftop_query(
         date_min = time_series.start + timedelta(minutes=30)
         date_max = date_min + timedelta(hours=3)
 
-    query = dedent(
-        __query.format(
-            network_query=network_query,
-            network_region_query=network_region_query,
-            timezone=timezone,
-            date_max=date_max,
-            date_min=date_min,
-            forecast_query=forecast_query,
-            agg_func=agg_func,
-        )
+    params["date_max"] = date_max
+    params["date_min"] = date_min
+    params["network_ids"] = [i.code for i in networks_query]
+
+    query = __query.format(
+        network_region_query=network_region_query,
+        wem_apvi_case=wem_apvi_case,
+        forecast_query=forecast_query,
+        agg_func=agg_func,
     )
 
-    return query
+    return bind_query("power_network_rooftop", query, **params)
 
 
 """
@@ -482,7 +496,7 @@ def energy_network_fueltech_query(
     network_region: Optional[str] = None,
     networks_query: Optional[List[NetworkSchema]] = None,
     coalesce_with: Optional[int] = 0,
-) -> str:
+) -> TextClause:
     """
     Get Energy for a network or network + region
     based on a year
@@ -504,10 +518,10 @@ def energy_network_fueltech_query(
     from at_facility_daily t
     left join facility f on t.facility_code = f.code
     where
-        t.trading_day <= '{date_max}'::date and
-        t.trading_day >= '{date_min}'::date and
+        t.trading_day <= cast(:date_max as date) and
+        t.trading_day >= cast(:date_min as date) and
         t.fueltech_id not in ('imports', 'exports', 'interconnector') and
-        {network_query}
+        t.network_id = ANY(:network_ids) and
         {network_region_query}
         1=1
     group by 1, 2
@@ -517,31 +531,30 @@ def energy_network_fueltech_query(
     network_region_query = ""
     date_range = time_series.get_range()
 
+    params: Dict[str, Any] = {
+        "date_max": date_range.end.date(),
+        "date_min": date_range.start.date(),
+        "network_ids": [i.code for i in networks_query],
+    }
+
     if network_region:
-        network_region_query = f"f.network_region='{network_region}' and"
-
-    networks_list = networks_to_in(networks_query)
-    network_query = "t.network_id IN ({}) and ".format(networks_list)
-
-    query = dedent(
-        __query.format(
-            trunc=date_range.interval.trunc,
-            date_min=date_range.start.date(),
-            date_max=date_range.end.date(),
-            network_query=network_query,
-            network_region_query=network_region_query,
-            coalesce_with=coalesce_with,
-        )
+        network_region_query = "f.network_region = :network_region and"
+        params["network_region"] = network_region
+
+    query = __query.format(
+        trunc=date_range.interval.trunc,
+        network_region_query=network_region_query,
+        coalesce_with=int(coalesce_with or 0),
     )
 
-    return query
+    return bind_query("energy_network_fueltech", query, **params)
 
 
 def energy_network_flow_query(
     time_series: TimeSeries,
     network_region: str,
     networks_query: Optional[List[NetworkSchema]] = None,
-) -> str:
+) -> TextClause:
     """
     Get emissions for a network or network + region
     based on a year
@@ -571,9 +584,9 @@ def energy_network_flow_query(
             ei.exports_market_value_rrp
         from mv_interchange_energy_nem_region ei
         where
-            ei.trading_interval <= '{date_max}'
-            and ei.trading_interval >= '{date_min}'
-            and ei.network_region='{network_region}'
+            ei.trading_interval <= :date_max
+            and ei.trading_interval >= :date_min
+            and ei.network_region = :network_region
     ) as t
     group by 1
     order by 1 desc
@@ -581,23 +594,22 @@ def energy_network_flow_query(
 
     date_range = time_series.get_range()
 
-    query = dedent(
-        __query.format(
-            network_region=network_region,
-            trunc=date_range.interval.trunc,
-            date_min=date_range.start,
-            date_max=date_range.end,
-        )
-    )
+    query = __query.format(trunc=date_range.interval.trunc)
 
-    return query
+    return bind_query(
+        "energy_network_flow",
+        query,
+        network_region=network_region,
+        date_min=date_range.start,
+        date_max=date_range.end,
+    )
 
 
 def energy_network_interconnector_emissions_query(
     time_series: TimeSeries,
     network_region: Optional[str] = None,
     networks_query: Optional[List[NetworkSchema]] = None,
-) -> str:
+) -> TextClause:
     """
     Get emissions for a network or network + region
     based on a year
@@ -619,31 +631,28 @@ def energy_network_interconnector_emissions_query(
         t.flow_to_emissions
     from vw_region_flow_emissions t
     where
-        t.trading_interval <= '{date_max}' and
-        t.trading_interval >= '{date_min}' and
+        t.trading_interval <= :date_max and
+        t.trading_interval >= :date_min and
         {network_region_query}
         1=1
     order by 1 desc
-
     """
 
-    timezone = time_series.network.timezone_database
     network_region_query = ""
     date_range = time_series.get_range()
 
+    params: Dict[str, Any] = {
+        "date_min": date_range.start,
+        "date_max": date_range.end,
+    }
+
     if network_region:
-        network_region_query = f"""
-            (t.flow_from='{network_region}' or t.flow_to='{network_region}') and
-        """
+        network_region_query = "(t.flow_from = :network_region or t.flow_to = :network_region) and"
+        params["network_region"] = network_region
 
-    query = dedent(
-        __query.format(
-            timezone=timezone,
-            # trunc=date_range.interval.trunc,
-            date_min=date_range.start,
-            date_max=date_range.end,
-            network_region_query=network_region_query,
-        )
+    query = __query.format(
+        timezone=time_series.network.timezone_database,
+        network_region_query=network_region_query,
     )
 
-    return query
+    return bind_query("energy_network_interconnector_emissions", query, **params)
@@ -0,0 +1,192 @@
+"""
+Export query cache
+
+A cache of query results shared by the resources of an export run. Many resources
+in the export map run the same queries for each region of a network over the same
+range. The cache runs a query once for the whole network grouped by region and
+splits the rows out for each region.
+
+The cache lives for a single run - see export_power - and is safe to share between
+the workers of opennem.api.export.executor. Concurrent requests for the same
+query wait on the first rather than running it again.
+
+"""
+import logging
+import threading
+from concurrent.futures import Future
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.sql.elements import TextClause
+
+from opennem.api.export.queries import (
+    network_demand_query,
+    power_network_fueltech_query,
+    price_network_query,
+)
+from opennem.db.query import run_query, run_query_async
+from opennem.schema.dates import TimeSeries
+from opennem.schema.network import NetworkSchema
+
+logger = logging.getLogger("opennem.export.query_cache")
+
+
+class ExportQueryKind(Enum):
+    power_fueltech = "power_fueltech"
+    price = "price"
+    demand = "demand"
+
+
+EXPORT_QUERIES: Dict[ExportQueryKind, Callable[..., TextClause]] = {
+    ExportQueryKind.power_fueltech: power_network_fueltech_query,
+    ExportQueryKind.price: price_network_query,
+    ExportQueryKind.demand: network_demand_query,
+}
+
+ExportQueryKey = Tuple[str, str, Tuple[str, ...], str, str, str, bool]
+
+
+def _query_key(
+    query_kind: ExportQueryKind,
+    time_series: TimeSeries,
+    networks_query: Optional[List[NetworkSchema]],
+    group_region: bool,
+) -> ExportQueryKey:
+    """Key on everything the query builders read from their arguments. The builders
+    always add the time series network to the networks queried"""
+    network_codes = set([i.code for i in networks_query or []])
+    network_codes.add(time_series.network.code)
+
+    date_range = time_series.get_range()
+
+    return (
+        query_kind.value,
+        time_series.network.code,
+        tuple(sorted(network_codes)),
+        str(date_range.start),
+        str(date_range.end),
+        time_series.interval.interval_sql,
+        group_region,
+    )
+
+
+class ExportQueryCache:
+    """Per run cache of export query results"""
+
+    def __init__(self) -> None:
+        self._results: Dict[ExportQueryKey, Future] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _get_or_fetch(self, key: ExportQueryKey, fetch: Callable[[], Any]) -> Any:
+        with self._lock:
+            result_future = self._results.get(key)
+            is_owner = result_future is None
+
+            if result_future is None:
+                result_future = Future()
+                self._results[key] = result_future
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if is_owner:
+            try:
+                result_future.set_result(fetch())
+            except Exception as e:
+                # don't cache errors so the next request runs the query again
+                with self._lock:
+                    self._results.pop(key, None)
+
+                result_future.set_exception(e)
+
+        return result_future.result()
+
+    def get_rows(
+        self,
+        query_kind: ExportQueryKind,
+        time_series: TimeSeries,
+        network_region: Optional[str] = None,
+        networks_query: Optional[List[NetworkSchema]] = None,
+    ) -> List[Any]:
+        """Get the rows for a query. Region queries are split out of a single query
+        for the network grouped by region"""
+        query_builder = EXPORT_QUERIES[query_kind]
+
+        if not network_region:
+            return self._get_or_fetch(
+                _query_key(query_kind, time_series, networks_query, False),
+                lambda: run_query(
+                    query_builder(
+                        time_series=time_series,
+                        networks_query=list(networks_query) if networks_query else None,
+                    )
+                ),
+            )
+
+        def _fetch_by_region() -> Dict[str, List[Any]]:
+            rows = run_query(
+                query_builder(
+                    time_series=time_series,
+                    networks_query=list(networks_query) if networks_query else None,
+                    group_region=True,
+                )
+            )
+
+            rows_by_region: Dict[str, List[Any]] = {}
+
+            # region is the last column
+            for row in rows:
+                rows_by_region.setdefault(row[-1], []).append(tuple(row[:-1]))
+
+            return rows_by_region
+
+        rows_by_region = self._get_or_fetch(
+            _query_key(query_kind, time_series, networks_query, True), _fetch_by_region
+        )
+
+        return rows_by_region.get(network_region, [])
+
+
+def run_export_query(
+    query_kind: ExportQueryKind,
+    time_series: TimeSeries,
+    network_region: Optional[str] = None,
+    networks_query: Optional[List[NetworkSchema]] = None,
+    query_cache: Optional[ExportQueryCache] = None,
+) -> List[Any]:
+    """Run an export query through query_cache if one is passed"""
+    if query_cache:
+        return query_cache.get_rows(
+            query_kind,
+            time_series,
+            network_region=network_region,
+            networks_query=networks_query,
+        )
+
+    return run_query(
+        EXPORT_QUERIES[query_kind](
+            time_series=time_series,
+            network_region=network_region,
+            networks_query=networks_query,
+        )
+    )
+
+
+async def run_export_query_async(
+    query_kind: ExportQueryKind,
+    time_series: TimeSeries,
+    network_region: Optional[str] = None,
+    networks_query: Optional[List[NetworkSchema]] = None,
+) -> List[Any]:
+    """Run an export query on the asyncio engine. API requests don't share a run so
+    these are not cached"""
+    return await run_query_async(
+        EXPORT_QUERIES[query_kind](
+            time_series=time_series,
+            network_region=network_region,
+            networks_query=networks_query,
+        )
+    )
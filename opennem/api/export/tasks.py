@@ -10,6 +10,7 @@ require the API
 
 import logging
 from datetime import datetime
+from functools import partial
 from typing import List, Optional
 
 from opennem.api.export.controllers import (
@@ -23,6 +24,7 @@ from opennem.api.export.controllers import (
     power_week,
     weather_daily,
 )
+from opennem.api.export.executor import ExportResult, run_export_resources
 from opennem.api.export.map import (
     PriorityType,
     StatExport,
@@ -30,6 +32,7 @@ from opennem.api.export.map import (
     get_export_map,
     get_weekly_export_map,
 )
+from opennem.api.export.query_cache import ExportQueryCache
 from opennem.api.export.utils import write_output
 from opennem.api.stats.controllers import get_scada_range
 from opennem.api.stats.schema import OpennemDataSet, ScadaDateRange
@@ -53,14 +56,104 @@ from opennem.utils.version import get_version
 logger = logging.getLogger("opennem.export.tasks")
 
 
+def power_stat_set(
+    power_stat: StatExport, query_cache: Optional[ExportQueryCache] = None
+) -> Optional[OpennemDataSet]:
+    """Run the queries for a power export map resource"""
+    date_range_networks = power_stat.networks or []
+
+    if NetworkNEM in date_range_networks:
+        date_range_networks = [NetworkNEM]
+
+    date_range: ScadaDateRange = get_scada_range(
+        network=power_stat.network, networks=date_range_networks
+    )
+
+    logger.debug(
+        "Date range for {}: {} => {}".format(
+            power_stat.network.code, date_range.start, date_range.end
+        )
+    )
+
+    # Migrate to this time_series
+    time_series = TimeSeries(
+        start=date_range.start,
+        end=date_range.end,
+        network=power_stat.network,
+        year=power_stat.year,
+        interval=power_stat.interval,
+        period=power_stat.period,
+    )
+
+    stat_set = power_week(
+        time_series=time_series,
+        network_region_code=power_stat.network_region_query or power_stat.network_region,
+        networks_query=power_stat.networks,
+        query_cache=query_cache,
+    )
+
+    if not stat_set:
+        logger.info(
+            "No power stat set for {} {} {}".format(
+                power_stat.period,
+                power_stat.networks,
+                power_stat.network_region,
+            )
+        )
+        return None
+
+    demand_set = demand_week(
+        time_series=time_series,
+        networks_query=power_stat.networks,
+        network_region_code=power_stat.network_region_query or power_stat.network_region,
+        query_cache=query_cache,
+    )
+
+    stat_set.append_set(demand_set)
+
+    if power_stat.network_region:
+        flow_set = power_flows_region_week(
+            time_series=time_series,
+            network_region_code=power_stat.network_region,
+        )
+
+        if flow_set:
+            stat_set.append_set(flow_set)
+
+    time_series_weather = time_series.copy()
+    time_series_weather.interval = human_to_interval("30m")
+
+    if power_stat.bom_station:
+        try:
+            weather_set = weather_daily(
+                time_series=time_series_weather,
+                station_code=power_stat.bom_station,
+                network_region=power_stat.network_region,
+                include_min_max=False,
+                unit_name="temperature",
+            )
+            stat_set.append_set(weather_set)
+        except Exception:
+            pass
+
+    return stat_set
+
+
 def export_power(
     stats: List[StatExport] = None,
     priority: Optional[PriorityType] = None,
     latest: Optional[bool] = False,
-) -> None:
+    workers: Optional[int] = None,
+) -> List[ExportResult]:
     """
     Export power stats from the export map
 
+    Resources are run concurrently on workers - see
+    opennem.api.export.executor.run_export_resources. With latest only
+    the first resource that has a stat set is exported.
+
+    Queries repeated across resources are shared through a query cache
+    for the run - see opennem.api.export.query_cache
 
     """
 
@@ -79,7 +172,7 @@ def export_power(
 
         stats = export_map.resources
 
-    output_count: int = 0
+    stats = [i for i in stats if i.stat_type == StatType.power]
 
     logger.info(
         "Running {}export {} with {} stats".format(
@@ -87,99 +180,122 @@ def export_power(
         )
     )
 
-    for power_stat in stats:
-        if power_stat.stat_type != StatType.power:
-            continue
+    query_cache = ExportQueryCache()
+    export_func = partial(power_stat_set, query_cache=query_cache)
 
-        if output_count >= 1 and latest:
-            return None
+    if latest:
+        for power_stat in stats:
+            results = run_export_resources([power_stat], export_func, workers=1)
 
-        date_range_networks = power_stat.networks or []
+            if results[0].written:
+                return results
 
-        if NetworkNEM in date_range_networks:
-            date_range_networks = [NetworkNEM]
+        return []
 
-        date_range: ScadaDateRange = get_scada_range(
-            network=power_stat.network, networks=date_range_networks
-        )
+    results = run_export_resources(stats, export_func, workers=workers)
 
-        logger.debug(
-            "Date range for {}: {} => {}".format(
-                power_stat.network.code, date_range.start, date_range.end
+    logger.info(
+        "Export query cache hits: {} misses: {}".format(query_cache.hits, query_cache.misses)
+    )
+
+    return results
+
+
+def energy_stat_set(energy_stat: StatExport) -> Optional[OpennemDataSet]:
+    """Run the queries for a yearly or all time energy export map resource"""
+    # @FIX trim to NEM since it's the one with the shortest
+    # data time span.
+    # @TODO find a better and more flexible way to do this in the
+    # range method
+    date_range_networks = energy_stat.networks or []
+
+    if NetworkNEM in date_range_networks:
+        date_range_networks = [NetworkNEM]
+
+    date_range: ScadaDateRange = get_scada_range(
+        network=energy_stat.network, networks=date_range_networks, energy=True
+    )
+
+    if not date_range:
+        logger.error(
+            "Skipping - Could not get date range for energy {} {}".format(
+                energy_stat.network, date_range_networks
             )
         )
+        return None
 
-        # Migrate to this time_series
-        time_series = TimeSeries(
-            start=date_range.start,
-            end=date_range.end,
-            network=power_stat.network,
-            year=power_stat.year,
-            interval=power_stat.interval,
-            period=power_stat.period,
+    logger.debug(
+        "Date range is: {} {} => {}".format(
+            energy_stat.network.code, date_range.start, date_range.end
         )
+    )
 
-        stat_set = power_week(
-            time_series=time_series,
-            network_region_code=power_stat.network_region_query or power_stat.network_region,
-            networks_query=power_stat.networks,
-        )
+    # Migrate to this time_series
+    time_series = TimeSeries(
+        start=date_range.start,
+        end=date_range.end,
+        network=energy_stat.network,
+        year=energy_stat.year,
+        interval=energy_stat.interval,
+        period=human_to_period("1Y"),
+    )
 
-        if not stat_set:
-            logger.info(
-                "No power stat set for {} {} {}".format(
-                    power_stat.period,
-                    power_stat.networks,
-                    power_stat.network_region,
-                )
-            )
-            continue
+    if not energy_stat.year:
+        time_series.period = human_to_period("all")
+        time_series.interval = human_to_interval("1M")
+        time_series.year = None
+
+    stat_set = energy_fueltech_daily(
+        time_series=time_series,
+        networks_query=energy_stat.networks,
+        network_region_code=energy_stat.network_region_query or energy_stat.network_region,
+    )
+
+    if not stat_set:
+        return None
 
-        demand_set = demand_week(
+    # Hard coded to NEM only atm but we'll put has_interconnectors
+    # in the metadata to automate all this
+    if energy_stat.network == NetworkNEM and energy_stat.network_region:
+        interconnector_flows = energy_interconnector_region_daily(
             time_series=time_series,
-            networks_query=power_stat.networks,
-            network_region_code=power_stat.network_region_query or power_stat.network_region,
+            # networks_query=energy_stat.networks,
+            network_region_code=energy_stat.network_region_query or energy_stat.network_region,
         )
+        stat_set.append_set(interconnector_flows)
 
-        stat_set.append_set(demand_set)
+        interconnector_emissions = energy_interconnector_emissions_region_daily(
+            time_series=time_series,
+            networks_query=energy_stat.networks,
+            network_region_code=energy_stat.network_region_query or energy_stat.network_region,
+        )
+        stat_set.append_set(interconnector_emissions)
 
-        if power_stat.network_region:
-            flow_set = power_flows_region_week(
+    if energy_stat.bom_station:
+        try:
+            weather_stats = weather_daily(
                 time_series=time_series,
-                network_region_code=power_stat.network_region,
+                station_code=energy_stat.bom_station,
+                network_region=energy_stat.network_region,
             )
+            stat_set.append_set(weather_stats)
+        except Exception:
+            pass
 
-            if flow_set:
-                stat_set.append_set(flow_set)
-
-        time_series_weather = time_series.copy()
-        time_series_weather.interval = human_to_interval("30m")
-
-        if power_stat.bom_station:
-            try:
-                weather_set = weather_daily(
-                    time_series=time_series_weather,
-                    station_code=power_stat.bom_station,
-                    network_region=power_stat.network_region,
-                    include_min_max=False,
-                    unit_name="temperature",
-                )
-                stat_set.append_set(weather_set)
-            except Exception:
-                pass
-
-        write_output(power_stat.path, stat_set)
-        output_count += 1
+    return stat_set
 
 
 def export_energy(
     stats: List[StatExport] = None,
     priority: Optional[PriorityType] = None,
     latest: Optional[bool] = False,
-) -> None:
+    workers: Optional[int] = None,
+) -> List[ExportResult]:
     """
     Export energy stats from the export map
 
+    Resources are run concurrently on workers - see
+    opennem.api.export.executor.run_export_resources
 
     """
     if not stats:
@@ -192,138 +308,17 @@ def export_energy(
 
     CURRENT_YEAR = datetime.now().year
 
-    for energy_stat in stats:
-        if energy_stat.stat_type != StatType.energy:
-            continue
-
-        # @FIX trim to NEM since it's the one with the shortest
-        # data time span.
-        # @TODO find a better and more flexible way to do this in the
-        # range method
-        date_range_networks = energy_stat.networks or []
-
-        if NetworkNEM in date_range_networks:
-            date_range_networks = [NetworkNEM]
-
-        date_range: ScadaDateRange = get_scada_range(
-            network=energy_stat.network, networks=date_range_networks, energy=True
-        )
-
-        if not date_range:
-            logger.error(
-                "Skipping - Could not get date range for energy {} {}".format(
-                    energy_stat.network, date_range_networks
-                )
-            )
-            continue
-
-        logger.debug(
-            "Date range is: {} {} => {}".format(
-                energy_stat.network.code, date_range.start, date_range.end
-            )
+    stats = [
+        i
+        for i in stats
+        if i.stat_type == StatType.energy
+        and (
+            (i.year and (not latest or i.year == CURRENT_YEAR))
+            or (not i.year and not latest and i.period and i.period.period_human == "all")
         )
+    ]
 
-        # Migrate to this time_series
-        time_series = TimeSeries(
-            start=date_range.start,
-            end=date_range.end,
-            network=energy_stat.network,
-            year=energy_stat.year,
-            interval=energy_stat.interval,
-            period=human_to_period("1Y"),
-        )
-
-        if energy_stat.year:
-
-            if latest and energy_stat.year != CURRENT_YEAR:
-                continue
-
-            stat_set = energy_fueltech_daily(
-                time_series=time_series,
-                networks_query=energy_stat.networks,
-                network_region_code=energy_stat.network_region_query or energy_stat.network_region,
-            )
-
-            if not stat_set:
-                continue
-
-            # Hard coded to NEM only atm but we'll put has_interconnectors
-            # in the metadata to automate all this
-            if energy_stat.network == NetworkNEM and energy_stat.network_region:
-                interconnector_flows = energy_interconnector_region_daily(
-                    time_series=time_series,
-                    # networks_query=energy_stat.networks,
-                    network_region_code=energy_stat.network_region_query
-                    or energy_stat.network_region,
-                )
-                stat_set.append_set(interconnector_flows)
-
-                interconnector_emissions = energy_interconnector_emissions_region_daily(
-                    time_series=time_series,
-                    networks_query=energy_stat.networks,
-                    network_region_code=energy_stat.network_region_query
-                    or energy_stat.network_region,
-                )
-                stat_set.append_set(interconnector_emissions)
-
-            if energy_stat.bom_station:
-                try:
-                    weather_stats = weather_daily(
-                        time_series=time_series,
-                        station_code=energy_stat.bom_station,
-                        network_region=energy_stat.network_region,
-                    )
-                    stat_set.append_set(weather_stats)
-                except Exception:
-                    pass
-
-            write_output(energy_stat.path, stat_set)
-
-        elif energy_stat.period and energy_stat.period.period_human == "all" and not latest:
-            time_series.period = human_to_period("all")
-            time_series.interval = human_to_interval("1M")
-            time_series.year = None
-
-            stat_set = energy_fueltech_daily(
-                time_series=time_series,
-                networks_query=energy_stat.networks,
-                network_region_code=energy_stat.network_region_query or energy_stat.network_region,
-            )
-
-            if not stat_set:
-                continue
-
-            # Hard coded to NEM only atm but we'll put has_interconnectors
-            # in the metadata to automate all this
-            if energy_stat.network == NetworkNEM and energy_stat.network_region:
-                interconnector_flows = energy_interconnector_region_daily(
-                    time_series=time_series,
-                    # networks_query=energy_stat.networks,
-                    network_region_code=energy_stat.network_region_query
-                    or energy_stat.network_region,
-                )
-                stat_set.append_set(interconnector_flows)
-
-                interconnector_emissions = energy_interconnector_emissions_region_daily(
-                    time_series=time_series,
-                    networks_query=energy_stat.networks,
-                    network_region_code=energy_stat.network_region_query
-                    or energy_stat.network_region,
-                )
-                stat_set.append_set(interconnector_emissions)
-
-            if energy_stat.bom_station:
-                try:
-                    weather_stats = weather_daily(
-                        time_series=time_series,
-                        station_code=energy_stat.bom_station,
-                        network_region=energy_stat.network_region,
-                    )
-                    stat_set.append_set(weather_stats)
-                except Exception:
-                    pass
-
-            write_output(energy_stat.path, stat_set)
+    return run_export_resources(stats, energy_stat_set, workers=workers)
 
 
 def export_all_monthly() -> None:
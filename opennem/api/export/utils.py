@@ -8,6 +8,7 @@ import logging
 from pydantic.main import BaseModel
 
 from opennem.api.stats.schema import OpennemDataSet
+from opennem.api.stats.serializer import stat_set_to_json
 from opennem.exporter.aws import write_statset_to_s3, write_to_s3
 from opennem.exporter.local import write_to_local
 from opennem.settings import settings
@@ -26,12 +27,18 @@ def write_output(
     if settings.export_local:
         is_local = True
 
-    if hasattr(stat_set, "json"):
-        indent = None
+    # stat sets written to s3 are serialized by the s3 writer
+    if isinstance(stat_set, OpennemDataSet) and not is_local:
+        return write_statset_to_s3(stat_set, path, exclude_unset=exclude_unset, exclude=exclude)
 
-        if settings.debug:
-            indent = 4
+    indent = None
 
+    if settings.debug:
+        indent = 4
+
+    if isinstance(stat_set, OpennemDataSet) and not exclude:
+        write_content = stat_set_to_json(stat_set, exclude_unset=exclude_unset, indent=indent)
+    elif hasattr(stat_set, "json"):
         write_content = stat_set.json(exclude_unset=exclude_unset, indent=indent, exclude=exclude)
     else:
         write_content = json.dumps(stat_set)
@@ -42,10 +49,6 @@ def write_output(
         byte_count = write_to_local(path, write_content)
     elif isinstance(stat_set, str):
         byte_count = write_to_s3(stat_set, path)
-    elif isinstance(stat_set, OpennemDataSet):
-        byte_count = write_statset_to_s3(
-            stat_set, path, exclude_unset=exclude_unset, exclude=exclude
-        )
     elif isinstance(stat_set, BaseModel):
         byte_count = write_to_s3(write_content, path)
     else:
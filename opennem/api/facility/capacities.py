@@ -4,45 +4,55 @@ OpenNEM Facility Capacities
 
 """
 
-from textwrap import dedent
 from typing import Dict
 
-from opennem.db import get_database_engine
+from sqlalchemy.sql.elements import TextClause
+
+from opennem.db.query import bind_query, run_query, run_query_async
 from opennem.schema.network import NetworkSchema
 
 
 def facility_capacity_network_region_fueltech_query(
     network: NetworkSchema, network_region: str
-) -> str:
+) -> TextClause:
     query = """
     select
         f.fueltech_id,
         sum(f.capacity_registered)
     from facility f
     where
-        f.network_id='{network_id}'
-        and f.network_region='{network_region}'
+        f.network_id = :network_id
+        and f.network_region = :network_region
         and f.active is True
     group by 1
     order by 1;
-    """.format(
-        network_id=network.code, network_region=network_region
-    )
+    """
 
-    return dedent(query)
+    return bind_query(
+        "facility_capacity_network_region_fueltech",
+        query,
+        network_id=network.code,
+        network_region=network_region,
+    )
 
 
 def get_facility_capacities(network: NetworkSchema, network_region: str) -> Dict:
-    engine = get_database_engine()
-
     query = facility_capacity_network_region_fueltech_query(
         network=network, network_region=network_region
     )
-    results = []
 
-    with engine.connect() as c:
-        results = list(c.execute(query))
+    results = run_query(query)
 
     return_dict = {i[0]: i[1] for i in results}
 
     return return_dict
+
+
+async def get_facility_capacities_async(network: NetworkSchema, network_region: str) -> Dict:
+    query = facility_capacity_network_region_fueltech_query(
+        network=network, network_region=network_region
+    )
+
+    results = await run_query_async(query)
+
+    return {i[0]: i[1] for i in results}
@@ -1,8 +1,7 @@
 import logging
-from collections import OrderedDict
-from datetime import datetime, timedelta, timezone
-from textwrap import dedent
-from typing import Any, Dict, List, Optional, Union
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
 
 import pytz
 from datetime_truncate import truncate as date_trunc
@@ -10,13 +9,13 @@ from fastapi.exceptions import HTTPException
 from starlette import status
 
 from opennem.api.time import human_to_interval
-from opennem.db import get_database_engine
+from opennem.core.facility_ranges import scada_range_query
+from opennem.db.query import run_query
 from opennem.schema.network import NetworkSchema
 from opennem.schema.time import TimeInterval, TimePeriod
 from opennem.schema.units import UnitDefinition
 from opennem.utils.cache import cache_scada_result
-from opennem.utils.numbers import cast_trailing_nulls, trim_nulls
-from opennem.utils.sql import duid_in_case
+from opennem.utils.numbers import cast_trailing_nulls
 from opennem.utils.timezone import is_aware, make_aware
 from opennem.utils.version import get_version
 
@@ -31,8 +30,97 @@ from .schema import (
 logger = logging.getLogger(__name__)
 
 
+StatsGrouped = Dict[str, Dict[datetime, Any]]
+
+
+def _interval_value(interval: Union[datetime, date]) -> datetime:
+    if not isinstance(interval, datetime):
+        return datetime.combine(interval, time.min)
+
+    return interval
+
+
+def _result_value(result: Any) -> Any:
+    if isinstance(result, Decimal):
+        return float(result)
+
+    return result
+
+
+def group_query_rows(
+    rows: Iterable[Sequence[Any]],
+    interval_index: int = 0,
+    group_index: int = 1,
+    value_index: int = 2,
+    group_code: Optional[str] = None,
+) -> StatsGrouped:
+    """Group raw query rows into a series of interval values per group code in a
+    single pass. group_code sets the group for all rows where the query has no
+    group column"""
+    stats_grouped: StatsGrouped = {}
+
+    for row in rows:
+        row_group_code = group_code or row[group_index]
+
+        if not row_group_code:
+            continue
+
+        series = stats_grouped.get(row_group_code)
+
+        if series is None:
+            series = stats_grouped[row_group_code] = {}
+
+        series[_interval_value(row[interval_index])] = _result_value(row[value_index])
+
+    return stats_grouped
+
+
 def stats_factory(
     stats: List[DataQueryResult],
+    **kwargs: Any,
+) -> Optional[OpennemDataSet]:
+    """
+    Takes a list of data query results and returns OpennemDataSets
+
+    Prefer stats_factory_rows when building from query rows
+    """
+    stats_grouped: StatsGrouped = {}
+
+    for stat in stats:
+        if not stat.group_by:
+            continue
+
+        stats_grouped.setdefault(stat.group_by, {})[stat.interval] = stat.result
+
+    return stats_grouped_factory(stats_grouped, **kwargs)
+
+
+def stats_factory_rows(
+    rows: Iterable[Sequence[Any]],
+    interval_index: int = 0,
+    group_index: int = 1,
+    value_index: int = 2,
+    group_code: Optional[str] = None,
+    **kwargs: Any,
+) -> Optional[OpennemDataSet]:
+    """
+    Builds OpennemDataSets directly from query rows without a DataQueryResult per
+    row. The row columns used are set by the index arguments and the rest of the
+    arguments are those of stats_grouped_factory
+    """
+    stats_grouped = group_query_rows(
+        rows,
+        interval_index=interval_index,
+        group_index=group_index,
+        value_index=value_index,
+        group_code=group_code,
+    )
+
+    return stats_grouped_factory(stats_grouped, **kwargs)
+
+
+def stats_grouped_factory(
+    stats_grouped: StatsGrouped,
     units: UnitDefinition,
     interval: TimeInterval,
     period: Optional[TimePeriod] = None,
@@ -49,9 +137,8 @@ def stats_factory(
     cast_nulls: Optional[bool] = True,
 ) -> Optional[OpennemDataSet]:
     """
-    Takes a list of data query results and returns OpennemDataSets
+    Takes series of values by interval per group code and returns OpennemDataSets
 
-    @TODO optional groupby field
     @TODO multiple groupings / slight refactor
 
     """
@@ -59,30 +146,24 @@ def stats_factory(
     if network:
         timezone = network.get_timezone()
 
-    group_codes = list(set([i.group_by for i in stats if i.group_by]))
-
-    stats_grouped = []
-
-    for group_code in group_codes:
-
-        data_grouped: Dict[datetime, Any] = dict()
+    # Cast trailing nulls
+    cast_trailing = (not units.name.startswith("temperature") or (units.cast_nulls is True)) and (
+        cast_nulls is True
+    )
 
-        for stat in stats:
-            if stat.group_by != group_code:
-                continue
+    interval_day = interval == human_to_interval("1d")
+    interval_month = interval == human_to_interval("1M")
 
-            if stat.interval not in data_grouped:
-                data_grouped[stat.interval] = None
+    stats_grouped_data = []
 
-            # if stat.result:
-            data_grouped[stat.interval] = stat.result
+    for group_code, data_grouped in stats_grouped.items():
 
-        data_sorted = OrderedDict(sorted(data_grouped.items()))
+        dates = sorted(data_grouped.keys())
 
-        data_value = list(data_sorted.values())
+        data_value = [data_grouped[i] for i in dates]
 
         # Skip null series
-        if len([i for i in data_value if i]) == 0:
+        if not any(data_value):
             continue
 
         # @TODO possible bring this back
@@ -90,24 +171,24 @@ def stats_factory(
         # if sum([i for i in data_value if i]) == 0:
         # continue
 
-        # Cast trailing nulls
-        if (not units.name.startswith("temperature") or (units.cast_nulls is True)) and (
-            cast_nulls is True
-        ):
+        if cast_trailing:
             data_value = cast_trailing_nulls(data_value)
 
-        data_trimmed = dict(zip(data_sorted.keys(), data_value))
+        # trim preceding and trailing nulls
+        data_start = 0
+        data_end = len(data_value)
 
-        data_trimmed = trim_nulls(data_trimmed)
+        while data_value[data_start] is None:
+            data_start += 1
 
-        # Find start/end dates
-        dates = list(data_trimmed.keys())
+        while data_value[data_end - 1] is None:
+            data_end -= 1
 
-        if not dates:
-            return None
+        data_trimmed = data_value[data_start:data_end]
 
-        start = min(dates)
-        end = max(dates)
+        # Find start/end dates
+        start = dates[data_start]
+        end = dates[data_end - 1]
 
         # should probably make sure these are the same TZ
         if localize:
@@ -133,22 +214,19 @@ def stats_factory(
         # @TODO compose this and make it generic - some intervals
         # get truncated.
         # trunc the date for days and months
-        if interval == human_to_interval("1d"):
+        if interval_day:
             start = date_trunc(start, truncate_to="day")
             end = date_trunc(end, truncate_to="day")
 
-        if interval == human_to_interval("1M"):
+        if interval_month:
             start = date_trunc(start, truncate_to="month")
             end = date_trunc(end, truncate_to="month")
 
-        # free
-        dates = []
-
         history = OpennemDataHistory(
             start=start,
             last=end,
             interval=interval.interval_human,
-            data=data_trimmed.values(),
+            data=data_trimmed,
         )
 
         data = OpennemData(
@@ -241,7 +319,7 @@ def stats_factory(
         if region:
             data.region = region
 
-        stats_grouped.append(data)
+        stats_grouped_data.append(data)
 
     dt_now = datetime.now()
 
@@ -259,7 +337,7 @@ def stats_factory(
 
     stat_set = OpennemDataSet(
         type=units.unit_type,
-        data=stats_grouped,
+        data=stats_grouped_data,
         created_at=dt_now,
         version=get_version(),
     )
@@ -291,82 +369,41 @@ def get_scada_range(
     energy: bool = False,
 ) -> Optional[ScadaDateRange]:
     """Get the start and end dates for a network query. This is more efficient
-    than providing or querying the range at query time
+    than providing or querying the range at query time. Ranges are read from the
+    facility ranges maintained by ingest
     """
-    engine = get_database_engine()
-
-    __query = """
-    select
-        min(f.data_first_seen) at time zone '{timezone}',
-        max(fs.trading_interval)  at time zone '{timezone}'
-    from facility_scada fs
-    left join facility f on fs.facility_code = f.code
-    where
-        fs.trading_interval >= '{date_min}' and
-        {facility_query}
-        {network_query}
-        {network_region_query}
-        f.fueltech_id not in ('solar_rooftop', 'imports', 'exports')
-        and f.interconnector is FALSE
-        and fs.{field} is not null;
-    """
-
-    network_query = ""
     timezone = network.timezone_database if network else "UTC"
-    field_name = "generated"
-
-    # if energy is False and network and network.code in ["WEM"]:
-    # energy = True
-
-    if energy is True:
-        field_name = "eoi_quantity"
 
-    # Only look back 7 days because the query is more optimized
+    # Only look back 7 days for facilities that are still reporting
     date_min = datetime.now() - timedelta(days=7)
 
+    network_ids = None
+
     if network:
-        network_query = f"f.network_id = '{network.code}' and"
+        network_ids = [network.code]
 
     if networks:
-        net_case = networks_to_in(networks)
-        network_query = "f.network_id IN ({}) and ".format(net_case)
-
-    network_region_query = ""
-
-    if network_region:
-        network_region_query = f"f.network_region = '{network_region}' and"
+        network_ids = [n.code for n in networks]
 
-    facility_query = ""
-
-    if facilities:
-        fac_case = duid_in_case(facilities)
-        facility_query = "f.code IN ({}) and ".format(fac_case)
-
-    scada_range_query = dedent(
-        __query.format(
-            field=field_name,
-            date_min=date_min,
-            facility_query=facility_query,
-            network_query=network_query,
-            network_region_query=network_region_query,
+    scada_range_result = run_query(
+        scada_range_query(
             timezone=timezone,
+            date_min=date_min,
+            network_ids=network_ids,
+            network_region=network_region,
+            facilities=facilities,
+            energy=energy,
         )
     )
 
-    logger.debug(scada_range_query)
-
-    with engine.connect() as c:
-        logger.debug(scada_range_query)
-        scada_range_result = list(c.execute(scada_range_query))
-
-        if len(scada_range_result) < 1:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No results",
-            )
+    if len(scada_range_result) < 1:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No results",
+        )
 
-        scada_min = scada_range_result[0][0]
-        scada_max = scada_range_result[0][1]
+    scada_min = scada_range_result[0][0]
+    scada_max = scada_range_result[0][1]
 
     if not scada_min or not scada_max:
         return None
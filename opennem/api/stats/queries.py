@@ -1,21 +1,23 @@
 """
     Queries for network data
 
-    @TODO use sqlalchemy text() compiled queries
+    Queries are bound parameter text statements - see opennem.db.query
 """
 
 from datetime import datetime, timedelta
-from textwrap import dedent
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
+from sqlalchemy.sql.elements import TextClause
+
+from opennem.core.normalizers import normalize_duid
+from opennem.db.query import bind_query
 from opennem.schema.dates import TimeSeries
-from opennem.utils.sql import duid_in_case
 
 
 def power_facility_query(
     time_series: TimeSeries,
     facility_codes: List[str],
-) -> str:
+) -> TextClause:
 
     __query = """
         select
@@ -32,9 +34,9 @@ def power_facility_query(
             from facility_scada fs
             join facility f on fs.facility_code = f.code
             where
-                fs.trading_interval <= '{date_max}' and
-                fs.trading_interval > '{date_min}' and
-                fs.facility_code in ({facility_codes_parsed})
+                fs.trading_interval <= :date_max and
+                fs.trading_interval > :date_min and
+                fs.facility_code = ANY(:facility_codes)
             group by 1, 3
         ) as t
         group by 1, 3
@@ -44,18 +46,20 @@ def power_facility_query(
     date_range = time_series.get_range()
 
     query = __query.format(
-        facility_codes_parsed=duid_in_case(facility_codes),
         trunc=time_series.interval.interval_sql,
-        period=time_series.period.period_sql,
         timezone=time_series.network.timezone_database,
+    )
+
+    return bind_query(
+        "power_facility",
+        query,
         date_max=date_range.end,
         date_min=date_range.start,
+        facility_codes=[normalize_duid(i) for i in facility_codes],
     )
 
-    return query
 
-
-def energy_facility_query(time_series: TimeSeries, facility_codes: List[str]) -> str:
+def energy_facility_query(time_series: TimeSeries, facility_codes: List[str]) -> TextClause:
     """
     Get Energy for a list of facility codes
     """
@@ -69,9 +73,9 @@ def energy_facility_query(time_series: TimeSeries, facility_codes: List[str]) ->
         sum(t.emissions) as fueltech_emissions
     from at_facility_daily t
     where
-        t.trading_day <= '{date_max}' and
-        t.trading_day >= '{date_min}' and
-        t.facility_code in ({facility_codes_parsed})
+        t.trading_day <= :date_max and
+        t.trading_day >= :date_min and
+        t.facility_code = ANY(:facility_codes)
     group by 1, 2
     order by
         trading_day desc;
@@ -79,21 +83,23 @@ def energy_facility_query(time_series: TimeSeries, facility_codes: List[str]) ->
 
     date_range = time_series.get_range()
 
-    query = dedent(
-        __query.format(
-            facility_codes_parsed=duid_in_case(facility_codes),
-            trunc=time_series.interval.trunc,
-            date_max=date_range.end,
-            date_min=date_range.start,
-            timezone=time_series.network.timezone_database,
-        )
+    query = __query.format(
+        trunc=time_series.interval.trunc,
+        timezone=time_series.network.timezone_database,
+    )
+
+    return bind_query(
+        "energy_facility",
+        query,
+        date_max=date_range.end,
+        date_min=date_range.start,
+        facility_codes=[normalize_duid(i) for i in facility_codes],
     )
-    return query
 
 
 def emission_factor_region_query(
     time_series: TimeSeries, network_region_code: Optional[str] = None
-) -> str:
+) -> TextClause:
     __query = """
         select
             f.trading_interval at time zone '{timezone}' as ti,
@@ -101,35 +107,37 @@ def emission_factor_region_query(
             avg(f.emissions_per_mw) * 2
         from mv_region_emissions_45d f
         where
-            f.network_id='{network_id}' and
+            f.network_id = :network_id and
             {network_region_query}
-            f.trading_interval <= '{date_max}' and
-            f.trading_interval >= '{date_min}'
+            f.trading_interval <= :date_max and
+            f.trading_interval >= :date_min
         group by 1, 2
         order by 1 asc;
     """
 
+    date_range = time_series.get_range()
+
     network_region_query = ""
 
-    if network_region_code:
-        network_region_query = f"f.network_region='{network_region_code}' and"
+    params: Dict[str, Any] = {
+        "network_id": time_series.network.code,
+        "date_max": date_range.end,
+        "date_min": date_range.start,
+    }
 
-    date_range = time_series.get_range()
+    if network_region_code:
+        network_region_query = "f.network_region = :network_region and"
+        params["network_region"] = network_region_code
 
-    query = dedent(
-        __query.format(
-            network_region_query=network_region_query,
-            network_id=time_series.network.code,
-            trunc=time_series.interval.trunc,
-            date_max=date_range.end,
-            date_min=date_range.start,
-            timezone=time_series.network.timezone_database,
-        )
+    query = __query.format(
+        network_region_query=network_region_query,
+        timezone=time_series.network.timezone_database,
     )
-    return query
+
+    return bind_query("emission_factor_region", query, **params)
 
 
-def network_fueltech_demand_query(time_series: TimeSeries) -> str:
+def network_fueltech_demand_query(time_series: TimeSeries) -> TextClause:
     __query = """
         select
             f.fueltech_id,
@@ -140,9 +148,9 @@ def network_fueltech_demand_query(time_series: TimeSeries) -> str:
         left join facility f on fs.facility_code = f.code
         join fueltech ft on f.fueltech_id = ft.code
         where
-            fs.trading_interval >= '{date_min}'
-            and fs.trading_interval < '{date_max}'
-            and fs.network_id = '{network_id}'
+            fs.trading_interval >= :date_min
+            and fs.trading_interval < :date_max
+            and fs.network_id = :network_id
             and f.dispatch_type = 'GENERATOR'
         group by 1;
     """
@@ -151,19 +159,16 @@ def network_fueltech_demand_query(time_series: TimeSeries) -> str:
 
     date_min: datetime = date_range.end - timedelta(days=1)
 
-    query = dedent(
-        __query.format(
-            network_id=time_series.network.code,
-            trunc=time_series.interval.trunc,
-            date_max=date_range.end,
-            date_min=date_min,
-            timezone=time_series.network.timezone_database,
-        )
+    return bind_query(
+        "network_fueltech_demand",
+        __query,
+        network_id=time_series.network.code,
+        date_max=date_range.end,
+        date_min=date_min,
     )
-    return query
 
 
-def network_region_price_query(time_series: TimeSeries) -> str:
+def network_region_price_query(time_series: TimeSeries) -> TextClause:
     __query = """
         select
             time_bucket('{trunc}', bs.trading_interval) as trading_interval,
@@ -172,9 +177,9 @@ def network_region_price_query(time_series: TimeSeries) -> str:
             coalesce(avg(bs.price), avg(bs.price_dispatch)) as price
         from balancing_summary bs
         where
-            bs.trading_interval >= '{date_min}'
-            and bs.trading_interval < '{date_max}'
-            and bs.network_id = '{network_id}'
+            bs.trading_interval >= :date_min
+            and bs.trading_interval < :date_max
+            and bs.network_id = :network_id
             {network_regions_query}
         group by 1, 2, 3;
     """
@@ -185,17 +190,19 @@ def network_region_price_query(time_series: TimeSeries) -> str:
 
     network_regions_query = ""
 
+    params: Dict[str, Any] = {
+        "network_id": time_series.network.code,
+        "date_max": date_range.end,
+        "date_min": date_min,
+    }
+
     if time_series.network.regions:
-        network_regions: str = ",".join([f"'{i.code}'" for i in time_series.network.regions])
-        network_regions_query = f"and bs.network_region IN ({network_regions})"
-
-    query = dedent(
-        __query.format(
-            network_id=time_series.network.code,
-            trunc=time_series.interval.interval_human,
-            date_max=date_range.end,
-            date_min=date_min,
-            network_regions_query=network_regions_query,
-        )
+        network_regions_query = "and bs.network_region = ANY(:network_regions)"
+        params["network_regions"] = [i.code for i in time_series.network.regions]
+
+    query = __query.format(
+        trunc=time_series.interval.interval_human,
+        network_regions_query=network_regions_query,
     )
-    return query
+
+    return bind_query("network_region_price", query, **params)
@@ -1,25 +1,27 @@
 import logging
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, Path, Query
-from sqlalchemy.engine.base import Engine
 from sqlalchemy.orm import Session
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 
-from opennem.api.export.controllers import power_week
+from opennem.api.cache import cache_response
+from opennem.api.export.controllers import power_week_async
 from opennem.api.export.queries import interconnector_flow_network_regions_query
 from opennem.api.time import human_to_interval, human_to_period
 from opennem.core.flows import invert_flow_set
 from opennem.core.networks import network_from_network_code
 from opennem.core.units import get_unit
-from opennem.db import get_database_engine, get_database_session
+from opennem.db import get_database_session
 from opennem.db.models.opennem import Facility, Station
+from opennem.db.query import run_query_async
 from opennem.schema.dates import TimeSeries
-from opennem.schema.network import NetworkNetworkRegion
+from opennem.schema.network import NetworkNetworkRegion, NetworkSchema
 from opennem.utils.time import human_to_timedelta
 
-from .controllers import get_scada_range, stats_factory
+from .controllers import get_scada_range, stats_factory_rows
 from .queries import (
     emission_factor_region_query,
     energy_facility_query,
@@ -27,12 +29,37 @@ from .queries import (
     network_region_price_query,
     power_facility_query,
 )
-from .schema import DataQueryResult, OpennemDataSet
+from .schema import OpennemDataSet
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+StationRange = Tuple[Optional[datetime], Optional[datetime], List[str]]
+
+
+def _get_station_range(
+    session: Session, station_code: str, network: NetworkSchema, approved_only: bool = False
+) -> Optional[StationRange]:
+    """Look up a station and its facilities with the ORM session. This is sync so
+    endpoints run it in the threadpool. Returns the seen range and facility codes"""
+    station_query = (
+        session.query(Station)
+        .join(Station.facilities)
+        .filter(Station.code == station_code)
+        .filter(Facility.network_id == network.code)
+    )
+
+    if approved_only:
+        station_query = station_query.filter(Station.approved.is_(True))
+
+    station: Optional[Station] = station_query.one_or_none()
+
+    if not station:
+        return None
+
+    return station.scada_range.date_min, station.scada_range.date_max, station.facility_codes
+
 
 @router.get(
     "/power/station/{network_code}/{station_code:path}",
@@ -41,14 +68,14 @@ router = APIRouter()
     response_model_exclude_unset=True,
     description="Get the power outputs for a station",
 )
-def power_station(
+@cache_response("power_station")
+async def power_station(
     station_code: str = Query(..., description="Station code"),
     network_code: str = Query(..., description="Network code"),
     since: datetime = Query(None, description="Since time"),
     interval_human: str = Query(None, description="Interval"),
     period_human: str = Query("7d", description="Period"),
     session: Session = Depends(get_database_session),
-    engine=Depends(get_database_engine),  # type: ignore
 ) -> OpennemDataSet:
     if not since:
         since = datetime.now() - human_to_timedelta("7d")
@@ -72,26 +99,16 @@ def power_station(
     period = human_to_period(period_human)
     units = get_unit("power")
 
-    station: Optional[Station] = (
-        session.query(Station)
-        .join(Facility)
-        .filter(Station.code == station_code)
-        .filter(Facility.network_id == network.code)
-        .filter(Station.approved.is_(True))
-        .one_or_none()
+    station_range = await run_in_threadpool(
+        _get_station_range, session, station_code, network, approved_only=True
     )
 
-    if not station:
+    if not station_range:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
 
-    facilities_date_range = station.scada_range
-
-    stats = []
+    date_min, date_max, facility_codes = station_range
 
-    date_min = facilities_date_range.date_min
-    date_max = facilities_date_range.date_max
-
-    network_range = get_scada_range(network=network)
+    network_range = await run_in_threadpool(get_scada_range, network=network)
 
     if not date_min:
         date_min = network_range.start
@@ -107,26 +124,20 @@ def power_station(
         interval=interval,
     )
 
-    query = power_facility_query(time_series, station.facility_codes)
-
-    logger.debug(query)
-
-    with engine.connect() as c:
-        results = list(c.execute(query))
+    query = power_facility_query(time_series, facility_codes)
 
-    stats = [
-        DataQueryResult(interval=i[0], result=i[1], group_by=i[2] if len(i) > 1 else None)
-        for i in results
-    ]
+    results = await run_query_async(query)
 
-    if len(stats) < 1:
+    if len(results) < 1:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Station stats not found",
         )
 
-    result = stats_factory(
-        stats,
+    result = stats_factory_rows(
+        results,
+        group_index=2,
+        value_index=1,
         code=station_code,
         network=network,
         interval=interval,
@@ -155,8 +166,8 @@ def power_station(
     response_model=OpennemDataSet,
     response_model_exclude_unset=True,
 )
-def energy_station(
-    engine=Depends(get_database_engine),  # type: ignore
+@cache_response("energy_station")
+async def energy_station(
     session: Session = Depends(get_database_session),
     network_code: str = Query(..., description="Network code"),
     station_code: str = Query(..., description="Station Code"),
@@ -187,27 +198,20 @@ def energy_station(
     period_obj = human_to_period(period)
     units = get_unit("energy")
 
-    station: Optional[Station] = (
-        session.query(Station)
-        .join(Station.facilities)
-        .filter(Station.code == station_code)
-        .filter(Facility.network_id == network.code)
-        .one_or_none()
-    )
+    station_range = await run_in_threadpool(_get_station_range, session, station_code, network)
 
-    if not station:
+    if not station_range:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Station not found")
 
-    if not station.facilities:
+    date_start, date_end, facility_codes = station_range
+
+    if not facility_codes:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Station has no facilities",
         )
 
-    # Start date
-    date_start = station.scada_range.date_min
-    date_end = station.scada_range.date_max
-    network_range = get_scada_range(network=network)
+    network_range = await run_in_threadpool(get_scada_range, network=network)
 
     if not date_start:
         date_start = network_range.start
@@ -225,13 +229,10 @@ def energy_station(
 
     query = energy_facility_query(
         time_series,
-        station.facility_codes,
+        facility_codes,
     )
 
-    logger.debug(query)
-
-    with engine.connect() as c:
-        row = list(c.execute(query))
+    row = await run_query_async(query)
 
     if len(row) < 1:
         raise HTTPException(
@@ -239,29 +240,8 @@ def energy_station(
             detail="Station stats not found",
         )
 
-    results_energy = [
-        DataQueryResult(interval=i[0], group_by=i[1], result=i[2] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    results_market_value = [
-        DataQueryResult(interval=i[0], group_by=i[1], result=i[3] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    results_emissions = [
-        DataQueryResult(interval=i[0], group_by=i[1], result=i[4] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    if len(results_energy) < 1:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Station stats not found",
-        )
-
-    stats = stats_factory(
-        stats=results_energy,
+    stats = stats_factory_rows(
+        row,
         units=units,
         network=network,
         interval=interval_obj,
@@ -276,8 +256,9 @@ def energy_station(
             detail="Station stats not found",
         )
 
-    stats_market_value = stats_factory(
-        stats=results_market_value,
+    stats_market_value = stats_factory_rows(
+        row,
+        value_index=3,
         units=get_unit("market_value"),
         network=network,
         interval=interval_obj,
@@ -288,8 +269,9 @@ def energy_station(
 
     stats.append_set(stats_market_value)
 
-    stats_emissions = stats_factory(
-        stats=results_emissions,
+    stats_emissions = stats_factory_rows(
+        row,
+        value_index=4,
         units=get_unit("emissions"),
         network=network,
         interval=interval_obj,
@@ -316,13 +298,11 @@ Flows endpoints
     response_model=OpennemDataSet,
     response_model_exclude_unset=True,
 )
-def power_flows_network_week(
-    engine=Depends(get_database_engine),  # type: ignore
+@cache_response("power_flows_network")
+async def power_flows_network_week(
     network_code: str = Query(..., description="Network code"),
     month: date = Query(datetime.now().date(), description="Month to query"),
 ) -> Optional[OpennemDataSet]:
-    engine = get_database_engine()
-
     network = network_from_network_code(network_code)
     interval_obj = network.get_interval()
     period_obj = human_to_period("1M")
@@ -330,7 +310,7 @@ def power_flows_network_week(
     if not network:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Network not found")
 
-    scada_range = get_scada_range(network=network)
+    scada_range = await run_in_threadpool(get_scada_range, network=network)
 
     if not scada_range:
         raise Exception("Require a scada range")
@@ -348,20 +328,14 @@ def power_flows_network_week(
 
     query = interconnector_flow_network_regions_query(time_series=time_series)
 
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
+    row = await run_query_async(query)
 
     if len(row) < 1:
         raise Exception("No results from query: {}".format(query))
 
-    imports = [
-        DataQueryResult(interval=i[0], result=i[4], group_by=i[1] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    result = stats_factory(
-        imports,
+    result = stats_factory_rows(
+        row,
+        value_index=4,
         # code=network_region_code or network.code,
         network=time_series.network,
         period=time_series.period,
@@ -398,7 +372,8 @@ def power_flows_network_week(
     response_model=OpennemDataSet,
     response_model_exclude_unset=True,
 )
-def power_network_region_fueltech(
+@cache_response("power_network_region_fueltech")
+async def power_network_region_fueltech(
     network_code: str = Query(..., description="Network code"),
     network_region_code: str = Query(..., description="Network region code"),
     month: date = Query(datetime.now().date(), description="Month to query"),
@@ -414,7 +389,7 @@ def power_network_region_fueltech(
     interval_obj = network.get_interval()
     period_obj = human_to_period("1M")
 
-    scada_range = get_scada_range(network=network)
+    scada_range = await run_in_threadpool(get_scada_range, network=network)
 
     if not scada_range:
         raise Exception("Require a scada range")
@@ -433,7 +408,7 @@ def power_network_region_fueltech(
         period=period_obj,
     )
 
-    stat_set = power_week(time_series, network_region_code, include_capacities=True)
+    stat_set = await power_week_async(time_series, network_region_code, include_capacities=True)
 
     if not stat_set:
         raise Exception("No results")
@@ -447,13 +422,11 @@ def power_network_region_fueltech(
     response_model=OpennemDataSet,
     response_model_exclude_unset=True,
 )
-def emission_factor_per_network(  # type: ignore
-    engine=Depends(get_database_engine),  # type: ignore
+@cache_response("emission_factor_network")
+async def emission_factor_per_network(  # type: ignore
     network_code: str = Query(..., description="Network code"),
     interval: str = Query("30m", description="Interval size"),
 ) -> Optional[OpennemDataSet]:
-    engine = get_database_engine()
-
     network = None
 
     try:
@@ -467,7 +440,7 @@ def emission_factor_per_network(  # type: ignore
     if not interval_obj:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invalid interval size")
 
-    scada_range = get_scada_range(network=network)
+    scada_range = await run_in_threadpool(get_scada_range, network=network)
 
     if not scada_range:
         raise HTTPException(
@@ -490,9 +463,7 @@ def emission_factor_per_network(  # type: ignore
 
     query = emission_factor_region_query(time_series=time_series)
 
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
+    row = await run_query_async(query)
 
     if len(row) < 1:
         raise HTTPException(
@@ -500,13 +471,8 @@ def emission_factor_per_network(  # type: ignore
             detail="No results",
         )
 
-    emission_factors = [
-        DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    result = stats_factory(
-        emission_factors,
+    result = stats_factory_rows(
+        row,
         network=time_series.network,
         period=time_series.period,
         interval=time_series.interval,
@@ -531,23 +497,18 @@ def emission_factor_per_network(  # type: ignore
     response_model=OpennemDataSet,
     response_model_exclude_unset=True,
 )
-def fueltech_demand_mix(
-    engine: Engine = Depends(get_database_engine),  # type: ignore
+@cache_response("fueltech_demand_mix")
+async def fueltech_demand_mix(
     network_code: str = Query(..., description="Network code"),
 ) -> OpennemDataSet:
     """Return fueltech proportion of demand for a network
 
-    Args:
-        engine ([type], optional): Database engine. Defaults to Depends(get_database_engine).
-
     Raises:
         HTTPException: No results
 
     Returns:
         OpennemData: data set
     """
-    engine = get_database_engine()
-
     network = None
 
     try:
@@ -558,7 +519,7 @@ def fueltech_demand_mix(
     interval_obj = human_to_interval("5m")
     period_obj = human_to_period("1d")
 
-    scada_range = get_scada_range(network=network)
+    scada_range = await run_in_threadpool(get_scada_range, network=network)
 
     if not scada_range:
         raise HTTPException(
@@ -581,9 +542,7 @@ def fueltech_demand_mix(
 
     query = network_fueltech_demand_query(time_series=time_series)
 
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
+    row = await run_query_async(query)
 
     if len(row) < 1:
         raise HTTPException(
@@ -591,13 +550,8 @@ def fueltech_demand_mix(
             detail="No results",
         )
 
-    result_set = [
-        DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    result = stats_factory(
-        result_set,
+    result = stats_factory_rows(
+        row,
         network=time_series.network,
         period=time_series.period,
         interval=time_series.interval,
@@ -631,25 +585,20 @@ def fueltech_demand_mix(
     response_model=OpennemDataSet,
     response_model_exclude_unset=True,
 )
-def price_network_endpoint(
-    engine: Engine = Depends(get_database_engine),
+@cache_response("price_network")
+async def price_network_endpoint(
     network_code: str = Path(..., description="Network code"),
     network_region: Optional[str] = Query(None, description="Network region code"),
 ) -> OpennemDataSet:
     """Returns network and network region price info for interval which defaults to network
     interval size
 
-    Args:
-        engine ([type], optional): Database engine. Defaults to Depends(get_database_engine).
-
     Raises:
         HTTPException: No results
 
     Returns:
         OpennemData: data set
     """
-    engine = get_database_engine()
-
     network = None
 
     try:
@@ -660,7 +609,7 @@ def price_network_endpoint(
     interval_obj = human_to_interval("5m")
     period_obj = human_to_period("1d")
 
-    scada_range = get_scada_range(network=network)
+    scada_range = await run_in_threadpool(get_scada_range, network=network)
 
     if not scada_range:
         raise HTTPException(
@@ -686,9 +635,7 @@ def price_network_endpoint(
 
     query = network_region_price_query(time_series=time_series)
 
-    with engine.connect() as c:
-        logger.debug(query)
-        row = list(c.execute(query))
+    row = await run_query_async(query)
 
     if len(row) < 1:
         raise HTTPException(
@@ -696,13 +643,10 @@ def price_network_endpoint(
             detail="No results",
         )
 
-    result_set = [
-        DataQueryResult(interval=i[0], result=i[3], group_by=i[2] if len(i) > 1 else None)
-        for i in row
-    ]
-
-    result = stats_factory(
-        result_set,
+    result = stats_factory_rows(
+        row,
+        group_index=2,
+        value_index=3,
         network=time_series.network,
         period=time_series.period,
         interval=time_series.interval,
@@ -0,0 +1,50 @@
+"""
+OpenNEM stat set serializer
+
+Serializes OpennemDataSet to JSON without going through pydantic `.json()`.
+
+pydantic builds a copy of the model as dicts first and runs every value in every
+series through its encoders. The series values have already been formatted by
+the `data_validate` validator when they were set, so the serializer takes the
+model fields as they are and hands the series lists to the C json encoder as is.
+
+Output is the same as `stat_set.json(exclude_unset=...)`.
+"""
+import json
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+
+from opennem.api.stats.schema import OpennemDataSet
+
+
+def _model_dict(model: BaseModel, exclude_unset: bool) -> Dict[str, Any]:
+    """Model fields in the order pydantic would output them"""
+    model_fields: Iterable[Tuple[str, Any]] = model.__dict__.items()
+
+    if exclude_unset:
+        fields_set = model.__fields_set__
+        model_fields = [(k, v) for k, v in model_fields if k in fields_set]
+
+    return {k: _value(v, exclude_unset) for k, v in model_fields}
+
+
+def _value(value: Any, exclude_unset: bool) -> Any:
+    if isinstance(value, BaseModel):
+        return _model_dict(value, exclude_unset)
+
+    # lists are either all models or all values
+    if isinstance(value, list) and value and isinstance(value[0], BaseModel):
+        return [_model_dict(i, exclude_unset) for i in value]
+
+    return value
+
+
+def stat_set_to_json(
+    stat_set: OpennemDataSet, exclude_unset: bool = True, indent: Optional[int] = None
+) -> str:
+    """Serialize a stat set to JSON"""
+    return json.dumps(
+        _model_dict(stat_set, exclude_unset), default=pydantic_encoder, indent=indent
+    )
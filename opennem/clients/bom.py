@@ -1,15 +1,26 @@
 """OpenNEM BoM Client
 
+Observation feeds are fetched over the shared http session. The ETag and
+Last-Modified of each feed are kept so later polls send a conditional request and
+feeds that haven't been updated are skipped. BOM updates the feeds every 30
+minutes and they're polled every 5.
+
+The validators of a response are returned with its observations and only kept
+once the observations are stored (see save_bom_feed_validators) so a feed that
+failed to store is fetched in full on the next poll.
 """
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import pytz
-import requests
 from pydantic import validator
 
 from opennem.schema.core import BaseConfig
+from opennem.settings import settings
+from opennem.utils.http import http
 from opennem.utils.random_agent import get_random_agent
 from opennem.utils.timezone import UTC
 
@@ -91,6 +102,11 @@ class BOMObservationReturn(BaseConfig):
 
     observations: List[BOMObserationSchema]
 
+    # feed validators for conditional requests. Set for conditional fetches
+    feed_url: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+
     _validate_state = validator("state", pre=True)(lambda x: x.strip().upper())
 
 
@@ -99,13 +115,64 @@ def get_bom_request_headers() -> Dict[str, str]:
     return {**BOM_REQUEST_HEADERS, "User-Agent": get_random_agent()}
 
 
-def get_bom_observations(observation_url: str, station_code: str) -> BOMObservationReturn:
-    """Requests a BOM observation JSON endpoint and returns a schema"""
+# feed url to the ETag and Last-Modified of the last response
+_bom_feed_validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+_bom_feed_validators_lock = threading.Lock()
+
+
+def _get_conditional_headers(observation_url: str) -> Dict[str, str]:
+    with _bom_feed_validators_lock:
+        etag, last_modified = _bom_feed_validators.get(observation_url, (None, None))
+
+    headers = {}
+
+    if etag:
+        headers["If-None-Match"] = etag
+
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    return headers
+
+
+def save_bom_feed_validators(observations_list: List[BOMObservationReturn]) -> None:
+    """Keep the validators of fetched feeds for the next conditional request. Called
+    once the observations are stored"""
+    with _bom_feed_validators_lock:
+        for observations in observations_list:
+            if observations.feed_url:
+                _bom_feed_validators[observations.feed_url] = (
+                    observations.etag,
+                    observations.last_modified,
+                )
+
+
+def reset_bom_feed_validators() -> None:
+    with _bom_feed_validators_lock:
+        _bom_feed_validators.clear()
+
+
+def get_bom_observations(
+    observation_url: str, station_code: str, conditional: bool = False
+) -> Optional[BOMObservationReturn]:
+    """Requests a BOM observation JSON endpoint and returns a schema. With
+    conditional set returns None if the feed hasn't changed since it was last
+    stored"""
     _headers = get_bom_request_headers()
 
+    if conditional:
+        _headers.update(_get_conditional_headers(observation_url))
+
     logger.info("Fetching {}".format(observation_url))
 
-    resp = requests.get(observation_url, headers=_headers)
+    resp = http.get(observation_url, headers=_headers)
+
+    if conditional and resp.status_code == 304:
+        logger.debug("BOM feed not modified: {}".format(observation_url))
+        return None
+
+    if not resp.ok:
+        raise Exception("Bad BOM response {}: {}".format(resp.status_code, observation_url))
 
     resp_object = None
 
@@ -132,9 +199,38 @@ def get_bom_observations(observation_url: str, station_code: str) -> BOMObservat
         }
     )
 
+    if conditional:
+        observations.feed_url = observation_url
+        observations.etag = resp.headers.get("ETag")
+        observations.last_modified = resp.headers.get("Last-Modified")
+
     return observations
 
 
+def get_bom_observations_many(
+    feeds: List[Tuple[str, str]], workers: Optional[int] = None
+) -> List[BOMObservationReturn]:
+    """Fetch a list of (observation_url, station_code) feeds concurrently with
+    conditional requests. Feeds that haven't changed or fail are skipped"""
+    if not workers:
+        workers = settings.http_fetch_workers
+
+    def _fetch_feed(feed: Tuple[str, str]) -> Optional[BOMObservationReturn]:
+        observation_url, station_code = feed
+
+        try:
+            return get_bom_observations(observation_url, station_code, conditional=True)
+        except Exception as e:
+            logger.error("Error fetching BOM feed {}: {}".format(observation_url, e))
+
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="opennem_bom") as executor:
+        results = list(executor.map(_fetch_feed, feeds))
+
+    return [i for i in results if i]
+
+
 if __name__ == "__main__":
     u = "http://www.bom.gov.au/fwo/IDN60801/IDN60801.94768.json"
 
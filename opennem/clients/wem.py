@@ -8,12 +8,16 @@ Four sources:
  * nemweb generation data (usually delayed 3-4 days)
 
 See the URL constants for sources and unit tests
+
+Files are streamed and parsed a row at a time. The delayed sources are large and
+only grow at the end, so their parsers take the latest interval already stored and
+skip the rows up to it before they're validated.
 """
 
 import csv
 import logging
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
 
 import requests
 from pydantic import ValidationError, validator
@@ -22,6 +26,7 @@ from opennem.schema.core import BaseConfig
 from opennem.schema.network import NetworkWEM
 from opennem.utils.dates import get_date_component, parse_date
 from opennem.utils.random_agent import get_random_agent
+from opennem.utils.timezone import is_aware, make_aware
 
 logger = logging.getLogger("opennem.client.wem")
 
@@ -174,8 +179,9 @@ _wem_session = requests.Session()
 _wem_session.headers.update({"User-Agent": get_random_agent()})
 
 
-def wem_downloader(url: str, for_date: Optional[datetime] = None) -> str:
-    """Downloads WEM content using the session"""
+def wem_downloader_stream(url: str, for_date: Optional[datetime] = None) -> Iterator[str]:
+    """Downloads WEM content using the session and returns an iterator of the
+    lines of the response as they're read"""
     url_params = {
         "day": get_date_component("%d", dt=for_date),
         "month": get_date_component("%m", dt=for_date),
@@ -186,23 +192,62 @@ def wem_downloader(url: str, for_date: Optional[datetime] = None) -> str:
 
     logger.info(f"Fetching {_url_parsed}")
 
-    response = _wem_session.get(_url_parsed)
+    response = _wem_session.get(_url_parsed, stream=True)
 
     if not response.ok:
         raise Exception(
             "Get WEM facility intervals summary error: {}".format(response.status_code)
         )
 
-    # @TODO mime detect and decoding
-    _content = response.content.decode("utf-8")
+    response.encoding = "utf-8"
+
+    def _stream_lines() -> Iterator[str]:
+        with response:
+            yield from response.iter_lines(decode_unicode=True)
+
+    return _stream_lines()
+
+
+def _content_lines(content: Union[str, Iterable[str]]) -> Iterable[str]:
+    if isinstance(content, str):
+        return content.split("\n")
+
+    return content
+
+
+def _interval_filter(after: Optional[datetime]) -> Callable[[Optional[str]], bool]:
+    """Returns a check for whether a raw CSV interval value is after the interval
+    `after`. Intervals are repeated for each facility so values are only parsed
+    once"""
+    if after and not is_aware(after):
+        after = make_aware(after, timezone=NetworkWEM.get_timezone())
 
-    return _content
+    intervals_parsed: Dict[str, bool] = {}
 
+    def _is_after(value: Optional[str]) -> bool:
+        if not after or not value:
+            return True
 
-def parse_wem_live_balancing_summary(content: str) -> List[WEMBalancingSummaryInterval]:
+        if value not in intervals_parsed:
+            try:
+                interval = parse_date(value, network=NetworkWEM)
+            except Exception:
+                interval = None
+
+            # rows that don't parse are left to validation to report
+            intervals_parsed[value] = not interval or interval > after  # type: ignore
+
+        return intervals_parsed[value]
+
+    return _is_after
+
+
+def parse_wem_live_balancing_summary(
+    content: Union[str, Iterable[str]]
+) -> List[WEMBalancingSummaryInterval]:
     """Parses a WEM live balancing summary response into models"""
     _models = []
-    csvreader = csv.DictReader(content.split("\n"))
+    csvreader = csv.DictReader(_content_lines(content))
 
     logger.debug("CSV has fields: {}".format(", ".join(csvreader.fieldnames)))  # type: ignore
 
@@ -224,14 +269,21 @@ def parse_wem_live_balancing_summary(content: str) -> List[WEMBalancingSummaryIn
     return _models
 
 
-def parse_wem_balancing_summary(content: str) -> List[WEMBalancingSummaryInterval]:
-    """Parses the wem nemweb balancing summary"""
+def parse_wem_balancing_summary(
+    content: Union[str, Iterable[str]], after: Optional[datetime] = None
+) -> List[WEMBalancingSummaryInterval]:
+    """Parses the wem nemweb balancing summary. Rows up to and including the
+    interval `after` are skipped"""
     _models = []
-    csvreader = csv.DictReader(content.split("\n"))
+    csvreader = csv.DictReader(_content_lines(content))
+    is_after = _interval_filter(after)
 
     logger.debug("CSV has fields: {}".format(", ".join(csvreader.fieldnames)))  # type: ignore
 
     for _csv_rec in csvreader:
+        if not is_after(_csv_rec.get("Trading Interval")):
+            continue
+
         # remap fields
         _csv_rec = {
             "TRADING_DAY_INTERVAL": _csv_rec["Trading Interval"],
@@ -260,7 +312,7 @@ def parse_wem_balancing_summary(content: str) -> List[WEMBalancingSummaryInterva
 def get_wem_live_balancing_summary() -> WEMBalancingSummarySet:
     """Obtains WEM live balancing summary from pulse with forecasts
     (price, generation etc.) and returns a summary set model"""
-    resp = wem_downloader(_AEMO_WEM_LIVE_BALANCING_URL)
+    resp = wem_downloader_stream(_AEMO_WEM_LIVE_BALANCING_URL)
 
     _models = parse_wem_live_balancing_summary(resp)
 
@@ -274,12 +326,12 @@ def get_wem_live_balancing_summary() -> WEMBalancingSummarySet:
     return wem_set
 
 
-def get_wem_balancing_summary() -> WEMBalancingSummarySet:
+def get_wem_balancing_summary(after: Optional[datetime] = None) -> WEMBalancingSummarySet:
     """Obtains WEM balancing summary (price, generation etc.) and returns a
-    summary set model"""
-    resp = wem_downloader(_AEMO_WEM_BALANCING_SUMMARY_URL)
+    summary set model. Only intervals after `after` are returned"""
+    resp = wem_downloader_stream(_AEMO_WEM_BALANCING_SUMMARY_URL)
 
-    _models = parse_wem_balancing_summary(resp)
+    _models = parse_wem_balancing_summary(resp, after=after)
 
     wem_set = WEMBalancingSummarySet(
         crawled_at=datetime.now(),
@@ -314,17 +366,24 @@ def _remap_wem_facility_interval_field(field_name: str) -> str:
     return WEM_FACILITY_INTERVAL_FIELD_REMAP[field_name]
 
 
-def parse_wem_facility_intervals(content: str) -> List[WEMGenerationInterval]:
-    """parses the wem live generation intervals for each facility"""
+def parse_wem_facility_intervals(
+    content: Union[str, Iterable[str]], after: Optional[datetime] = None
+) -> List[WEMGenerationInterval]:
+    """parses the wem live generation intervals for each facility. Rows up to and
+    including the interval `after` are skipped"""
 
     _models = []
 
-    csvreader = csv.DictReader(content.split("\n"))
+    csvreader = csv.DictReader(_content_lines(content))
+    is_after = _interval_filter(after)
 
     for _csv_rec in csvreader:
         # adapts the fields from balancing-summary history to match our schema
         _csv_rec = {_remap_wem_facility_interval_field(i): k for i, k in _csv_rec.items()}
 
+        if not is_after(_csv_rec.get("trading_interval")):
+            continue
+
         _m = None
 
         try:
@@ -343,7 +402,7 @@ def parse_wem_facility_intervals(content: str) -> List[WEMGenerationInterval]:
 
 def get_wem_live_facility_intervals() -> WEMFacilityIntervalSet:
     """Obtains WEM live facility intervals from infogrphic feeds"""
-    content = wem_downloader(_AEMO_WEM_LIVE_SCADA_URL)
+    content = wem_downloader_stream(_AEMO_WEM_LIVE_SCADA_URL)
     _models = parse_wem_facility_intervals(content)
 
     wem_set = WEMFacilityIntervalSet(
@@ -356,13 +415,16 @@ def get_wem_live_facility_intervals() -> WEMFacilityIntervalSet:
     return wem_set
 
 
-def get_wem_facility_intervals(from_date: Optional[datetime] = None) -> WEMFacilityIntervalSet:
-    """Obtains WEM facility intervals from NEM web. Will default to most recent date
+def get_wem_facility_intervals(
+    from_date: Optional[datetime] = None, after: Optional[datetime] = None
+) -> WEMFacilityIntervalSet:
+    """Obtains WEM facility intervals from NEM web. Will default to most recent date.
+    Only intervals after `after` are returned
 
     @TODO not yet smart enough to know if it should check current or archive
     """
-    content = wem_downloader(_AEMO_WEM_SCADA_URL, from_date)
-    _models = parse_wem_facility_intervals(content)
+    content = wem_downloader_stream(_AEMO_WEM_SCADA_URL, from_date)
+    _models = parse_wem_facility_intervals(content, after=after)
 
     wem_set = WEMFacilityIntervalSet(
         crawled_at=datetime.now(), live=False, source_url=_AEMO_WEM_SCADA_URL, intervals=_models
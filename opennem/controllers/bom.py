@@ -1,14 +1,115 @@
 import logging
+from datetime import datetime, timedelta
+from typing import Dict, List
 
 from sqlalchemy.dialects.postgresql import insert
 
-from opennem.clients.bom import BOMObservationReturn
+from opennem.clients.bom import (
+    BOMObservationReturn,
+    BOMObserationSchema,
+    save_bom_feed_validators,
+)
 from opennem.controllers.schema import ControllerReturn
 from opennem.db import SessionLocal, get_database_engine
 from opennem.db.models.opennem import BomObservation
+from opennem.db.query import bind_query, run_query
 
 logger = logging.getLogger(__name__)
 
+# how far back to look for the latest stored observation of a station
+BOM_LATEST_OBSERVATION_LOOKBACK = timedelta(days=7)
+
+
+def _observation_record(station_code: str, obs: BOMObserationSchema) -> Dict:
+    return {
+        "station_id": station_code,
+        "observation_time": obs.observation_time,
+        "temp_apparent": obs.apparent_t,
+        "temp_air": obs.air_temp,
+        "press_qnh": obs.press_qnh,
+        "wind_dir": obs.wind_dir,
+        "wind_spd": obs.wind_spd_kmh,
+        "wind_gust": obs.gust_kmh,
+        "cloud": obs.cloud,
+        "cloud_type": obs.cloud_type,
+        "humidity": obs.rel_hum,
+    }
+
+
+def get_latest_observation_times(station_codes: List[str]) -> Dict[str, datetime]:
+    """Latest stored observation time for each station in a single query"""
+    query = """
+        select station_id, max(observation_time)
+        from bom_observation
+        where
+            station_id = ANY(:station_codes)
+            and observation_time > :date_min
+        group by 1
+    """
+
+    rows = run_query(
+        bind_query(
+            "bom_latest_observation",
+            query,
+            station_codes=station_codes,
+            date_min=datetime.now().astimezone() - BOM_LATEST_OBSERVATION_LOOKBACK,
+        )
+    )
+
+    return {station_id: observation_time for station_id, observation_time in rows}
+
+
+def store_bom_observations_many(observations_list: List[BOMObservationReturn]) -> ControllerReturn:
+    """Store the observations for a number of stations in one insert. Only
+    observations newer than the latest stored for a station are inserted. The feed
+    validators are kept once the observations are stored"""
+    cr = ControllerReturn(total_records=sum([len(i.observations) for i in observations_list]))
+
+    station_codes = [i.station_code for i in observations_list if i.station_code]
+
+    if not station_codes:
+        return cr
+
+    latest_observation_times = get_latest_observation_times(station_codes)
+    records_to_store = []
+
+    for observations in observations_list:
+        latest_observation_time = latest_observation_times.get(observations.station_code)
+
+        for obs in observations.observations:
+            cr.processed_records += 1
+
+            if not obs.observation_time:
+                continue
+
+            if latest_observation_time and obs.observation_time <= latest_observation_time:
+                continue
+
+            records_to_store.append(_observation_record(observations.station_code, obs))
+
+    if not records_to_store:
+        save_bom_feed_validators(observations_list)
+        return cr
+
+    stmt = insert(BomObservation).values(records_to_store)
+    stmt = stmt.on_conflict_do_nothing(index_elements=["observation_time", "station_id"])
+
+    with SessionLocal() as session:
+        try:
+            session.execute(stmt)
+            session.commit()
+        except Exception as e:
+            logger.error("Error: {}".format(e))
+            cr.errors = len(records_to_store)
+            cr.error_detail.append(str(e))
+            return cr
+
+    save_bom_feed_validators(observations_list)
+
+    cr.inserted_records = len(records_to_store)
+
+    return cr
+
 
 def store_bom_observation_intervals(observations: BOMObservationReturn) -> ControllerReturn:
     """Store BOM Observations"""
@@ -20,21 +121,7 @@ def store_bom_observation_intervals(observations: BOMObservationReturn) -> Contr
     records_to_store = []
 
     for obs in observations.observations:
-        records_to_store.append(
-            {
-                "station_id": observations.station_code,
-                "observation_time": obs.observation_time,
-                "temp_apparent": obs.apparent_t,
-                "temp_air": obs.air_temp,
-                "press_qnh": obs.press_qnh,
-                "wind_dir": obs.wind_dir,
-                "wind_spd": obs.wind_spd_kmh,
-                "wind_gust": obs.gust_kmh,
-                "cloud": obs.cloud,
-                "cloud_type": obs.cloud_type,
-                "humidity": obs.rel_hum,
-            }
-        )
+        records_to_store.append(_observation_record(observations.station_code, obs))
         cr.processed_records += 1
 
     if not len(records_to_store):
@@ -10,7 +10,11 @@ from typing import Any, Dict, List, Optional
 from scrapy import Spider
 from sqlalchemy.dialects.postgresql import insert
 
+from opennem.api.cache import invalidate_network_cache
 from opennem.controllers.schema import ControllerReturn
+from opennem.core.dedupe import BALANCING_SUMMARY_KEYS, DedupePolicy, dedupe_records
+from opennem.core.dirty_intervals import mark_dirty_intervals_session
+from opennem.core.facility_ranges import update_facility_ranges_session
 from opennem.core.networks import NetworkNEM
 from opennem.core.normalizers import clean_float
 from opennem.core.parsers.aemo.mms import AEMOTableSchema, AEMOTableSet
@@ -20,6 +24,7 @@ from opennem.db.models.opennem import BalancingSummary, FacilityScada
 from opennem.importer.rooftop import rooftop_remap_regionids
 from opennem.schema.core import BaseConfig
 from opennem.schema.network import NetworkAEMORooftop, NetworkSchema, NetworkWEM
+from opennem.utils.cache import update_scada_range_cache
 from opennem.utils.dates import parse_date
 from opennem.utils.numbers import float_to_str
 
@@ -112,6 +117,16 @@ def generate_balancing_summary(
     return return_records
 
 
+def get_max_generated_interval(records: List[Dict]) -> Optional[datetime]:
+    """Latest interval with a generation value in a set of facility scada records"""
+    intervals = [i["trading_interval"] for i in records if i.get("generated") is not None]
+
+    if not intervals:
+        return None
+
+    return max(intervals)
+
+
 # Processors
 
 
@@ -134,6 +149,8 @@ def process_dispatch_interconnectorres(table: AEMOTableSchema) -> ControllerRetu
         )
         cr.processed_records += 1
 
+    records_to_store, cr.duplicate_records = dedupe_records(records_to_store)
+
     # insert
     stmt = insert(FacilityScada).values(records_to_store)
     stmt.bind = engine
@@ -144,6 +161,8 @@ def process_dispatch_interconnectorres(table: AEMOTableSchema) -> ControllerRetu
 
     try:
         session.execute(stmt)
+        mark_dirty_intervals_session(session, records_to_store)
+        update_facility_ranges_session(session, records_to_store)
         session.commit()
     except Exception as e:
         logger.error("Error inserting records")
@@ -153,7 +172,7 @@ def process_dispatch_interconnectorres(table: AEMOTableSchema) -> ControllerRetu
     finally:
         session.close()
 
-    cr.inserted_records = cr.processed_records
+    cr.inserted_records = len(records_to_store)
     return cr
 
 
@@ -182,6 +201,10 @@ def process_nem_price(table: AEMOTableSchema) -> ControllerReturn:
 
         cr.processed_records += 1
 
+    records_to_store, cr.duplicate_records = dedupe_records(
+        records_to_store, keys=BALANCING_SUMMARY_KEYS
+    )
+
     stmt = insert(BalancingSummary).values(records_to_store)
     stmt.bind = engine
     stmt = stmt.on_conflict_do_update(
@@ -200,7 +223,7 @@ def process_nem_price(table: AEMOTableSchema) -> ControllerReturn:
     finally:
         session.close()
 
-    cr.inserted_records = cr.processed_records
+    cr.inserted_records = len(records_to_store)
     return cr
 
 
@@ -225,6 +248,10 @@ def process_dispatch_regionsum(table: AEMOTableSchema) -> ControllerReturn:
 
         cr.processed_records += 1
 
+    records_to_store, cr.duplicate_records = dedupe_records(
+        records_to_store, keys=BALANCING_SUMMARY_KEYS
+    )
+
     stmt = insert(BalancingSummary).values(records_to_store)
     stmt.bind = engine
     stmt = stmt.on_conflict_do_update(
@@ -247,7 +274,7 @@ def process_dispatch_regionsum(table: AEMOTableSchema) -> ControllerReturn:
     finally:
         session.close()
 
-    cr.inserted_records = cr.processed_records
+    cr.inserted_records = len(records_to_store)
     return cr
 
 
@@ -263,7 +290,6 @@ def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
     limit = None
     records_to_store = []
     records_processed = 0
-    primary_keys = []
 
     for record in records:
         trading_interval = parse_date(
@@ -276,13 +302,6 @@ def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
         if not trading_interval:
             continue
 
-        _pk = set([trading_interval, record["REGIONID"]])
-
-        if _pk in primary_keys:
-            continue
-
-        primary_keys.append(_pk)
-
         net_interchange = None
 
         if "NETINTERCHANGE" in record:
@@ -310,6 +329,10 @@ def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
             logger.info("Reached limit of: {} {}".format(limit, records_processed))
             break
 
+    records_to_store, duplicate_records = dedupe_records(
+        records_to_store, keys=BALANCING_SUMMARY_KEYS, policy=DedupePolicy.first
+    )
+
     stmt = insert(BalancingSummary).values(records_to_store)
     stmt.bind = engine
     stmt = stmt.on_conflict_do_update(
@@ -326,12 +349,12 @@ def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
     except Exception as e:
         logger.error("Error inserting records")
         logger.error(e)
-        return {"num_records": 0}
+        return {"num_records": 0, "duplicate_records": duplicate_records}
 
     finally:
         session.close()
 
-    return {"num_records": len(records_to_store)}
+    return {"num_records": len(records_to_store), "duplicate_records": duplicate_records}
 
 
 def process_unit_scada(table: AEMOTableSchema) -> ControllerReturn:
@@ -345,8 +368,14 @@ def process_unit_scada(table: AEMOTableSchema) -> ControllerReturn:
     )
 
     cr.processed_records = len(records)
+
+    records, cr.duplicate_records = dedupe_records(records)
+
     cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])
 
+    if cr.inserted_records:
+        cr.max_interval = get_max_generated_interval(records)
+
     return cr
 
 
@@ -361,8 +390,14 @@ def process_unit_solution(table: AEMOTableSchema) -> ControllerReturn:
     )
 
     cr.processed_records = len(records)
+
+    records, cr.duplicate_records = dedupe_records(records)
+
     cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])
 
+    if cr.inserted_records:
+        cr.max_interval = get_max_generated_interval(records)
+
     return cr
 
 
@@ -377,6 +412,9 @@ def process_meter_data_gen_duid(table: AEMOTableSchema) -> ControllerReturn:
     )
 
     cr.processed_records = len(records)
+
+    records, cr.duplicate_records = dedupe_records(records)
+
     cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])
 
     return cr
@@ -397,6 +435,9 @@ def process_rooftop_actual(table: AEMOTableSchema) -> ControllerReturn:
     records = [i for i in records if i]
 
     cr.processed_records = len(records)
+
+    records, cr.duplicate_records = dedupe_records(records)
+
     cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])
 
     return cr
@@ -418,6 +459,9 @@ def process_rooftop_forecase(table: AEMOTableSchema) -> ControllerReturn:
     records = [i for i in records if i]
 
     cr.processed_records = len(records)
+
+    records, cr.duplicate_records = dedupe_records(records)
+
     cr.inserted_records = bulkinsert_mms_items(FacilityScada, records, ["generated"])
 
     return cr
@@ -464,7 +508,21 @@ def store_aemo_tableset(tableset: AEMOTableSet) -> ControllerReturn:
             cr.processed_records += record_item.processed_records
             cr.total_records += record_item.total_records
             cr.inserted_records += record_item.inserted_records
+            cr.duplicate_records += record_item.duplicate_records
             cr.errors += record_item.errors
             cr.error_detail += record_item.error_detail
 
+            if record_item.max_interval and (
+                not cr.max_interval or record_item.max_interval > cr.max_interval
+            ):
+                cr.max_interval = record_item.max_interval
+
+    # expire cached api responses now there are new intervals
+    if cr.inserted_records:
+        invalidate_network_cache(NetworkNEM.code)
+
+    # move cached scada ranges on to the new intervals
+    if cr.max_interval:
+        update_scada_range_cache(NetworkNEM, cr.max_interval)
+
     return cr
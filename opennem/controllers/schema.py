@@ -6,8 +6,11 @@ from opennem.schema.core import BaseConfig
 
 class ControllerReturn(BaseConfig):
     last_modified: Optional[datetime]
+    # latest generation interval stored
+    max_interval: Optional[datetime]
     total_records: int = 0
     inserted_records: int = 0
     processed_records: int = 0
+    duplicate_records: int = 0
     errors: int = 0
     error_detail: List[Optional[str]] = []
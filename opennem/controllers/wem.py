@@ -1,24 +1,34 @@
 """WEM Controllers
 
 Update facility intervals and balancing summary for WEM
+
+Records are stored through the bulk COPY upsert (see opennem.db.bulk_insert_csv)
+so they carry every column of the table.
 """
 import logging
-
-from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime
 
 from opennem.clients.wem import WEMBalancingSummarySet, WEMFacilityIntervalSet
 from opennem.controllers.schema import ControllerReturn
-from opennem.db import SessionLocal, get_database_engine
+from opennem.core.dedupe import BALANCING_SUMMARY_KEYS, dedupe_records
+from opennem.db.bulk_insert_csv import bulkinsert_mms_items
 from opennem.db.models.opennem import BalancingSummary, FacilityScada
 
 logger = logging.getLogger(__name__)
 
 
+def _set_insert_result(cr: ControllerReturn, records_sent: int, table_name: str) -> None:
+    if cr.inserted_records < records_sent:
+        cr.errors = records_sent - cr.inserted_records
+        cr.error_detail.append(
+            "Inserted {} of {} {} records".format(cr.inserted_records, records_sent, table_name)
+        )
+
+
 def store_wem_balancingsummary_set(balancing_set: WEMBalancingSummarySet) -> ControllerReturn:
     """Persist wem balancing set to the database"""
-    engine = get_database_engine()
-    session = SessionLocal()
     cr = ControllerReturn()
+    created_at = datetime.now()
 
     records_to_store = []
 
@@ -31,14 +41,21 @@ def store_wem_balancingsummary_set(balancing_set: WEMBalancingSummarySet) -> Con
         records_to_store.append(
             {
                 "created_by": "wem.controller",
-                "trading_interval": _rec.trading_day_interval,
+                "created_at": created_at,
+                "updated_at": None,
                 "network_id": "WEM",
+                "trading_interval": _rec.trading_day_interval,
                 "network_region": "WEM",
-                "is_forecast": _rec.is_forecast,
                 "forecast_load": _rec.forecast_mw,
-                "generation_total": _rec.actual_total_generation,
                 "generation_scheduled": _rec.actual_nsg_mw,
+                "generation_non_scheduled": None,
+                "generation_total": _rec.actual_total_generation,
+                "net_interchange": None,
+                "demand_total": None,
                 "price": _rec.price,
+                "price_dispatch": None,
+                "net_interchange_trading": None,
+                "is_forecast": _rec.is_forecast,
             }
         )
         cr.processed_records += 1
@@ -46,41 +63,28 @@ def store_wem_balancingsummary_set(balancing_set: WEMBalancingSummarySet) -> Con
     if len(records_to_store) < 1:
         return cr
 
-    stmt = insert(BalancingSummary).values(records_to_store)
-    stmt.bind = engine
-    stmt = stmt.on_conflict_do_update(
-        index_elements=[
-            "trading_interval",
-            "network_id",
-            "network_region",
-        ],
-        set_={
-            "price": stmt.excluded.price,
-            "forecast_load": stmt.excluded.forecast_load,
-            "generation_total": stmt.excluded.generation_total,
-            "is_forecast": stmt.excluded.is_forecast,
-        },
+    records_to_store, cr.duplicate_records = dedupe_records(
+        records_to_store, keys=BALANCING_SUMMARY_KEYS
+    )
+
+    cr.inserted_records = bulkinsert_mms_items(
+        BalancingSummary,
+        records_to_store,
+        ["price", "forecast_load", "generation_total", "is_forecast"],
     )
 
-    try:
-        session.execute(stmt)
-        session.commit()
-        cr.inserted_records = len(records_to_store)
-    except Exception as e:
-        logger.error("Error: {}".format(e))
-        cr.errors = len(records_to_store)
-        cr.error_detail.append(str(e))
-    finally:
-        session.close()
+    _set_insert_result(cr, len(records_to_store), "balancing summary")
+
+    if cr.inserted_records:
+        cr.max_interval = max(i["trading_interval"] for i in records_to_store)
 
     return cr
 
 
 def store_wem_facility_intervals(balancing_set: WEMFacilityIntervalSet) -> ControllerReturn:
     """Persist WEM facility intervals"""
-    engine = get_database_engine()
-    session = SessionLocal()
     cr = ControllerReturn()
+    created_at = datetime.now()
 
     records_to_store = []
 
@@ -93,11 +97,15 @@ def store_wem_facility_intervals(balancing_set: WEMFacilityIntervalSet) -> Contr
         records_to_store.append(
             {
                 "created_by": "wem.controller",
+                "created_at": created_at,
+                "updated_at": None,
                 "network_id": "WEM",
                 "trading_interval": _rec.trading_interval,
                 "facility_code": _rec.facility_code,
                 "generated": _rec.generated,
                 "eoi_quantity": _rec.eoi_quantity,
+                "is_forecast": False,
+                "energy_quality_flag": 0,
             }
         )
         cr.processed_records += 1
@@ -105,25 +113,14 @@ def store_wem_facility_intervals(balancing_set: WEMFacilityIntervalSet) -> Contr
     if len(records_to_store) < 1:
         return cr
 
-    stmt = insert(FacilityScada).values(records_to_store)
-    stmt.bind = engine
-    stmt = stmt.on_conflict_do_update(
-        index_elements=["trading_interval", "network_id", "facility_code", "is_forecast"],
-        set_={
-            # "updated_by": stmt.excluded.created_by,
-            "eoi_quantity": stmt.excluded.eoi_quantity,
-        },
-    )
+    records_to_store, cr.duplicate_records = dedupe_records(records_to_store)
+
+    # dirty intervals and facility ranges are recorded by the bulk insert
+    cr.inserted_records = bulkinsert_mms_items(FacilityScada, records_to_store, ["eoi_quantity"])
+
+    _set_insert_result(cr, len(records_to_store), "facility scada")
 
-    try:
-        session.execute(stmt)
-        session.commit()
-        cr.inserted_records = len(records_to_store)
-    except Exception as e:
-        logger.error("Error: {}".format(e))
-        cr.errors = len(records_to_store)
-        cr.error_detail.append(str(e))
-    finally:
-        session.close()
+    if cr.inserted_records:
+        cr.max_interval = max(i["trading_interval"] for i in records_to_store)
 
     return cr
@@ -2,18 +2,33 @@
 OpenNEM Crawler Meta
 
 Gets metadata about crawls from the database
+
+All of the crawl meta rows are loaded in a single query and cached in process for
+CRAWL_META_CACHE_TTL seconds. Updates for a crawl are written as one upsert that
+merges the keys into the JSON data column so the row doesn't have to be read first.
+The upsert keeps the stored latest_processed if it is newer so it only moves forward
+when crawlers run concurrently.
 """
 
 import logging
+import threading
+import time
 from datetime import datetime
 from enum import Enum
 from typing import Any, Dict, Optional, Union
 
+from sqlalchemy import DateTime, case, cast, func
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
 from opennem.db import SessionLocal
 from opennem.db.models.opennem import CrawlMeta
+from opennem.exporter.encoders import opennem_deserialize, opennem_serialize
 
 logger = logging.getLogger("opennem.spider.meta")
 
+# seconds crawl meta is cached before it is loaded again
+CRAWL_META_CACHE_TTL = 60
+
 
 class CrawlStatTypes(Enum):
     last_crawled = "last_crawled"
@@ -21,35 +36,58 @@ class CrawlStatTypes(Enum):
     data = "data"
 
 
-def crawler_get_all_meta(crawler_name: str) -> Optional[Dict[str, Any]]:
-    session = SessionLocal()
+_crawl_meta_cache: Dict[str, Dict[str, Any]] = {}
+_crawl_meta_loaded_at: float = 0.0
+_crawl_meta_lock = threading.Lock()
 
-    spider_meta = session.query(CrawlMeta).filter_by(spider_name=crawler_name).one_or_none()
 
-    if not spider_meta:
-        return None
+def load_crawl_meta(refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Load the meta for all crawlers in one query. Cached in process"""
+    global _crawl_meta_loaded_at
 
-    if not spider_meta.data:
-        return None
+    with _crawl_meta_lock:
+        if not refresh and time.time() - _crawl_meta_loaded_at < CRAWL_META_CACHE_TTL:
+            return _crawl_meta_cache
 
-    return spider_meta.data
+        with SessionLocal() as session:
+            crawl_meta_rows = session.query(CrawlMeta.spider_name, CrawlMeta.data).all()
 
+        _crawl_meta_cache.clear()
+        _crawl_meta_cache.update({name: data for name, data in crawl_meta_rows if data})
+        _crawl_meta_loaded_at = time.time()
 
-def crawler_get_meta(crawler_name: str, key: CrawlStatTypes) -> Optional[Union[str, datetime]]:
-    session = SessionLocal()
+        logger.debug("Loaded meta for {} crawlers".format(len(_crawl_meta_cache)))
 
-    spider_meta = session.query(CrawlMeta).filter_by(spider_name=crawler_name).one_or_none()
+        return _crawl_meta_cache
+
+
+def reset_crawl_meta_cache() -> None:
+    global _crawl_meta_loaded_at
+
+    with _crawl_meta_lock:
+        _crawl_meta_cache.clear()
+        _crawl_meta_loaded_at = 0.0
+
+
+def crawler_get_all_meta(crawler_name: str) -> Optional[Dict[str, Any]]:
+    spider_meta = load_crawl_meta().get(crawler_name)
 
     if not spider_meta:
         return None
 
-    if not spider_meta.data:
+    return dict(spider_meta)
+
+
+def crawler_get_meta(crawler_name: str, key: CrawlStatTypes) -> Optional[Union[str, datetime]]:
+    spider_meta = load_crawl_meta().get(crawler_name)
+
+    if not spider_meta:
         return None
 
-    if key.value not in spider_meta.data:
+    if key.value not in spider_meta:
         return None
 
-    _val = spider_meta.data[key.value]
+    _val = spider_meta[key.value]
 
     if key in [CrawlStatTypes.latest_processed, CrawlStatTypes.last_crawled]:
         _val_processed = datetime.fromisoformat(_val)
@@ -58,33 +96,59 @@ def crawler_get_meta(crawler_name: str, key: CrawlStatTypes) -> Optional[Union[s
     return _val
 
 
-def crawler_set_meta(crawler_name: str, key: CrawlStatTypes, value: Any) -> None:
-    session = SessionLocal()
-
-    if key == CrawlStatTypes.latest_processed:
-        current_value = crawler_get_meta(crawler_name, key)
-
-        try:
-            if current_value and current_value >= value:
-                return None
-        except TypeError:
-            logger.error(
-                "Error comparing {} ({}) and {} ({})".format(
-                    current_value, type(current_value), value, type(value)
-                )
+def crawler_set_meta_many(crawler_name: str, values: Dict[CrawlStatTypes, Any]) -> None:
+    """Set a number of meta keys for a crawler in a single upsert"""
+    if not values:
+        return None
+
+    # as it is stored so the cache matches what is loaded
+    data = opennem_deserialize(opennem_serialize({k.value: v for k, v in values.items()}))
+
+    stmt = insert(CrawlMeta).values(spider_name=crawler_name, data=data)
+
+    latest_processed_key = CrawlStatTypes.latest_processed.value
+    stored_processed = CrawlMeta.data[latest_processed_key]
+    new_processed = stmt.excluded.data[latest_processed_key]
+
+    # latest processed only moves forward. Compared as timestamps in the upsert so
+    # concurrent crawls can't move it back
+    keep_stored_processed = case(
+        [
+            (
+                cast(stored_processed.astext, DateTime(timezone=True))
+                > cast(new_processed.astext, DateTime(timezone=True)),
+                func.jsonb_build_object(latest_processed_key, stored_processed),
             )
+        ],
+        else_=cast({}, JSONB),
+    )
 
-    spider_meta = session.query(CrawlMeta).filter_by(spider_name=crawler_name).one_or_none()
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["spider_name"],
+        set_={
+            "data": func.coalesce(CrawlMeta.data, cast({}, JSONB))
+            .op("||")(stmt.excluded.data)
+            .op("||")(keep_stored_processed),
+            "updated_at": func.now(),
+        },
+    ).returning(CrawlMeta.data)
 
-    if not spider_meta:
-        spider_meta = CrawlMeta(spider_name=crawler_name, data={})
+    with SessionLocal() as session:
+        stored_data = session.execute(stmt).scalar()
+        session.commit()
 
-    spider_meta.data[key.value] = value
+    with _crawl_meta_lock:
+        _crawl_meta_cache[crawler_name] = dict(stored_data or data)
 
-    logger.info("Spider {} meta: Set {} to {}".format(crawler_name, key.value, value))
+    if stored_data:
+        data = {k: stored_data[k] for k in data.keys() if k in stored_data}
 
-    session.add(spider_meta)
-    session.commit()
+    for key, value in data.items():
+        logger.info("Spider {} meta: Set {} to {}".format(crawler_name, key, value))
+
+
+def crawler_set_meta(crawler_name: str, key: CrawlStatTypes, value: Any) -> None:
+    crawler_set_meta_many(crawler_name, {key: value})
 
 
 if __name__ == "__main__":
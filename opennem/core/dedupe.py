@@ -0,0 +1,55 @@
+"""
+Dedupe records on their primary keys before they're inserted
+
+Records are keyed into a dict so dedupe is a single pass regardless of whether
+duplicates are adjacent. The policy decides which duplicate is kept and the
+number of dropped records is returned to be reported by the caller.
+"""
+import logging
+from enum import Enum
+from typing import Any, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger("opennem.core.dedupe")
+
+# primary keys of the tables records are generated for
+FACILITY_SCADA_KEYS = ["trading_interval", "network_id", "facility_code", "is_forecast"]
+
+BALANCING_SUMMARY_KEYS = ["trading_interval", "network_id", "network_region"]
+
+
+class DedupePolicy(Enum):
+    # keep the first record for a key
+    first = "first"
+
+    # keep the last record for a key
+    last = "last"
+
+
+def dedupe_records(
+    records: List[Dict[str, Any]],
+    keys: Sequence[str] = FACILITY_SCADA_KEYS,
+    policy: DedupePolicy = DedupePolicy.last,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Dedupe a list of record dicts on keys. Records missing a key are keyed on None.
+
+    Returns the deduped records in the order each key was first seen and the number
+    of duplicates that were dropped"""
+    records_keyed: Dict[Tuple, Dict[str, Any]] = {}
+
+    if policy == DedupePolicy.first:
+        for record in records:
+            records_keyed.setdefault(tuple(record.get(k) for k in keys), record)
+    else:
+        for record in records:
+            records_keyed[tuple(record.get(k) for k in keys)] = record
+
+    dropped = len(records) - len(records_keyed)
+
+    if dropped:
+        logger.debug(
+            "Dropped {} duplicate records on ({}) keeping {}".format(
+                dropped, ", ".join(keys), policy.value
+            )
+        )
+
+    return list(records_keyed.values()), dropped
@@ -0,0 +1,204 @@
+"""
+OpenNEM Dirty Intervals Ledger
+
+Records which (network, facility, 30 minute bucket) keys have had facility_scada
+readings stored so that the energy worker only has to recalculate those buckets.
+
+The ingest paths record keys in the same transaction as the scada upsert.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from itertools import groupby
+from textwrap import dedent
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from psycopg2.extras import execute_values
+from sqlalchemy.dialects.postgresql import insert
+
+from opennem.db import get_database_engine
+from opennem.db.models.opennem import FacilityScadaDirty
+from opennem.schema.core import BaseConfig
+
+logger = logging.getLogger("opennem.core.dirty_intervals")
+
+DIRTY_BUCKET_SIZE = timedelta(minutes=30)
+
+# buckets closer together than this are recalculated in a single run
+DIRTY_RANGE_MERGE_GAP = timedelta(hours=1)
+
+DIRTY_INTERVALS_INSERT_QUERY = """
+    INSERT INTO facility_scada_dirty (network_id, facility_code, trading_interval)
+    VALUES %s
+    ON CONFLICT DO NOTHING
+"""
+
+DirtyIntervalKey = Tuple[str, str, datetime]
+
+
+class DirtyIntervalRange(BaseConfig):
+    network_id: str
+    date_min: datetime
+    date_max: datetime
+    facility_codes: List[str]
+
+
+def dirty_bucket(trading_interval: datetime) -> datetime:
+    """Floors an interval to the start of its 30 minute bucket"""
+    return trading_interval.replace(
+        minute=trading_interval.minute - trading_interval.minute % 30, second=0, microsecond=0
+    )
+
+
+def dirty_interval_keys(records: List[Dict[str, Any]]) -> List[DirtyIntervalKey]:
+    """Get the unique bucket keys for a list of facility_scada records. Forecasts
+    don't have energies so are skipped"""
+    keys: Set[DirtyIntervalKey] = set()
+
+    for record in records:
+        if not record or record.get("is_forecast"):
+            continue
+
+        trading_interval = record.get("trading_interval")
+
+        if not isinstance(trading_interval, datetime):
+            continue
+
+        keys.add(
+            (record["network_id"], record["facility_code"], dirty_bucket(trading_interval))
+        )
+
+    return sorted(keys)
+
+
+def mark_dirty_intervals_cursor(cursor: Any, records: List[Dict[str, Any]]) -> int:
+    """Records dirty interval keys using a raw DBAPI cursor. The caller commits"""
+    keys = dirty_interval_keys(records)
+
+    if keys:
+        execute_values(cursor, DIRTY_INTERVALS_INSERT_QUERY, keys)
+
+    return len(keys)
+
+
+def mark_dirty_intervals_session(session: Any, records: List[Dict[str, Any]]) -> int:
+    """Records dirty interval keys using an ORM session. The caller commits"""
+    keys = dirty_interval_keys(records)
+
+    if keys:
+        stmt = insert(FacilityScadaDirty).values(
+            [
+                {"network_id": network_id, "facility_code": code, "trading_interval": bucket}
+                for network_id, code, bucket in keys
+            ]
+        )
+        stmt = stmt.on_conflict_do_nothing()
+        session.execute(stmt)
+
+    return len(keys)
+
+
+def claim_dirty_intervals(
+    network_id: str, limit: Optional[int] = None
+) -> List[Tuple[str, datetime]]:
+    """Removes and returns the dirty (facility_code, bucket) keys for a network.
+
+    Keys are committed as claimed straight away so ingest isn't blocked while
+    energies are calculated - failed runs put them back with release_dirty_intervals"""
+    engine = get_database_engine()
+
+    __query = """
+        delete from facility_scada_dirty fsd
+        using (
+            select network_id, facility_code, trading_interval
+            from facility_scada_dirty
+            where network_id = '{network_id}'
+            order by trading_interval asc
+            {limit_query}
+            for update skip locked
+        ) as claimed
+        where
+            fsd.network_id = claimed.network_id
+            and fsd.facility_code = claimed.facility_code
+            and fsd.trading_interval = claimed.trading_interval
+        returning fsd.facility_code, fsd.trading_interval
+    """
+
+    query = dedent(
+        __query.format(
+            network_id=network_id,
+            limit_query=f"limit {int(limit)}" if limit else "",
+        )
+    )
+
+    with engine.begin() as c:
+        logger.debug(query)
+        results = [(i[0], i[1]) for i in c.execute(query)]
+
+    logger.debug("Claimed {} dirty intervals for {}".format(len(results), network_id))
+
+    return results
+
+
+def release_dirty_intervals(network_id: str, keys: List[Tuple[str, datetime]]) -> None:
+    """Puts claimed keys back in the ledger"""
+    if not keys:
+        return None
+
+    conn = get_database_engine().raw_connection()
+
+    try:
+        cursor = conn.cursor()
+        execute_values(
+            cursor,
+            DIRTY_INTERVALS_INSERT_QUERY,
+            [(network_id, code, bucket) for code, bucket in keys],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def dirty_interval_ranges(
+    network_id: str, keys: List[Tuple[str, datetime]]
+) -> List[DirtyIntervalRange]:
+    """Merges dirty bucket keys into date ranges to recalculate energies for
+
+    Ranges are widened to cover the energy buckets that share an edge reading with
+    the dirty bucket and are aligned to start on the 5 minute past the hour bucket
+    edge so the first energy bucket is complete"""
+    ranges: List[DirtyIntervalRange] = []
+
+    sorted_keys = sorted(keys, key=lambda k: k[1])
+
+    range_keys: List[Tuple[str, datetime]] = []
+
+    def _close_range() -> None:
+        bucket_min = range_keys[0][1]
+        bucket_max = range_keys[-1][1]
+
+        date_min = (bucket_min - DIRTY_BUCKET_SIZE).replace(minute=5, second=0, microsecond=0)
+        date_max = (bucket_max + DIRTY_BUCKET_SIZE).replace(
+            minute=0, second=0, microsecond=0
+        ) + timedelta(hours=1)
+
+        ranges.append(
+            DirtyIntervalRange(
+                network_id=network_id,
+                date_min=date_min,
+                date_max=date_max,
+                facility_codes=sorted({code for code, _ in range_keys}),
+            )
+        )
+
+    for bucket, bucket_keys in groupby(sorted_keys, key=lambda k: k[1]):
+        if range_keys and bucket - range_keys[-1][1] > DIRTY_RANGE_MERGE_GAP:
+            _close_range()
+            range_keys = []
+
+        range_keys += list(bucket_keys)
+
+    if range_keys:
+        _close_range()
+
+    return ranges
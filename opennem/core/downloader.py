@@ -1,13 +1,20 @@
 import logging
+import shutil
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import Iterator
 from zipfile import ZipFile
 
+from opennem.utils.archive import stream_text_lines, stream_zip_contents
 from opennem.utils.handlers import _handle_zip, chain_streams
 from opennem.utils.http import http
 from opennem.utils.mime import mime_from_content, mime_from_url
 
 logger = logging.getLogger("opennem.downloader")
 
+# downloads larger than this are spooled to a temp file on disk
+DOWNLOAD_SPOOL_MAX_SIZE = 1024 * 1024 * 32
+
 
 def url_downloader(url: str) -> bytes:
     """Downloads a URL and returns content, handling embedded zips and other MIME's"""
@@ -47,3 +54,42 @@ def url_downloader(url: str) -> bytes:
             return chain_streams(c).read()
 
     return content.getvalue()
+
+
+def url_downloader_stream(url: str, encoding: str = "utf-8") -> Iterator[str]:
+    """Downloads a URL and returns an iterator of decoded text lines. The body is
+    spooled to a temp file and zips, including nested zips, are streamed through
+    rather than read into memory"""
+
+    logger.debug("Downloading stream: {}".format(url))
+
+    r = http.get(url, stream=True)
+
+    if not r.ok:
+        raise Exception("Bad link returned {}: {}".format(r.status_code, url))
+
+    content = SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MAX_SIZE)
+
+    with r:
+        r.raw.decode_content = True
+        shutil.copyfileobj(r.raw, content)
+
+    content.seek(0)
+
+    file_mime = mime_from_content(content)  # type: ignore
+
+    if not file_mime:
+        file_mime = mime_from_url(url)
+
+    stream = content
+
+    if file_mime == "application/zip":
+        stream = stream_zip_contents(content, "r")
+
+    def _stream_lines() -> Iterator[str]:
+        try:
+            yield from stream_text_lines(stream, encoding=encoding)  # type: ignore
+        finally:
+            content.close()
+
+    return _stream_lines()
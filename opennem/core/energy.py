@@ -9,7 +9,7 @@ Uses an average in 30 minute buckets
 """
 import logging
 from datetime import date, datetime, timedelta
-from typing import Any, Dict, Generator, List, Optional, Union
+from typing import Any, Dict, Generator, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -19,6 +19,9 @@ from opennem.schema.network import NetworkNEM, NetworkSchema
 
 logger = logging.getLogger("opennem.compat.energy")
 
+# These are the networks that run through the compat func
+COMPAT_NETWORKS = [NetworkNEM]
+
 
 class ScadaResultCompat(BaseConfig):
     interval: datetime
@@ -255,6 +258,128 @@ def _trapezium_integration_variable(d_ti: pd.Series) -> Optional[float]:
     return bucket_energy
 
 
+# 5 minute readings per 30 minute bucket including both edges
+BUCKET_READINGS = 7
+BUCKET_STEP = timedelta(minutes=5)
+BUCKET_TRAPEZIUM_WEIGHTS = np.array([1, 2, 2, 2, 2, 2, 1])
+
+
+def _trapezium_integration_matrix(readings: np.ndarray, gap_fill: bool = False) -> np.ndarray:
+    """Integrates buckets of readings along the last axis in a single pass
+
+    readings is an array of shape (..., 7) holding the 5 minute readings for each
+    30 minute bucket including both edges, with NaN for missing readings.
+
+    Without gap_fill missing readings are zero-filled and the edge weighted trapezium
+    from __trapezium_integration is applied. With gap_fill the rules from
+    _trapezium_integration_variable are applied over the readings that are present.
+    """
+    present = ~np.isnan(readings)
+    values = np.where(present, readings, 0.0)
+
+    if not gap_fill:
+        return 0.5 * (values * BUCKET_TRAPEZIUM_WEIGHTS).sum(axis=-1) / 12
+
+    count = present.sum(axis=-1)
+    positions = np.arange(readings.shape[-1])
+
+    # the edge readings are the first and last readings present in each bucket
+    first = np.where(present, positions, readings.shape[-1]).min(axis=-1, keepdims=True)
+    last = np.where(present, positions, -1).max(axis=-1, keepdims=True)
+
+    weights = np.where(present, 2, 0) - (positions == first) - (positions == last)
+    weighted_sum = (values * weights).sum(axis=-1)
+    values_sum = values.sum(axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        energy = np.where(
+            count > 3,
+            0.5 * weighted_sum / ((count - 1) * 2),
+            np.where(values_sum == 0, 0, 0.5 * values_sum / count),
+        )
+
+    energy = np.where(count == 1, values_sum * 0.5, energy)
+    energy = np.where(count == 0, np.nan, energy)
+
+    return energy
+
+
+def _energy_aggregate_matrix(
+    df: pd.DataFrame, power_field: str = "generated", gap_fill: bool = False
+) -> Optional[pd.DataFrame]:
+    """Vectorized version of _energy_aggregate_hours
+
+    Pivots the readings into a DUID x 5 minute interval matrix covering every
+    hour bucket from get_hour_range and integrates all of the 30 minute buckets
+    at once. Returns None if the readings don't sit on the 5 minute grid or
+    contain duplicates so the caller can fall back to the per-bucket path.
+    """
+    columns = ["trading_interval", "network_id", "facility_code", "eoi_quantity"]
+
+    hours = list(get_hour_range(df))
+
+    if len(hours) == 0:
+        logger.error("Got no hours from hour range")
+        return pd.DataFrame([], columns=columns)
+
+    duids = np.array(sorted(df.facility_code.unique()))
+    num_buckets = 2 * len(hours)
+    num_readings = 6 * num_buckets + 1
+
+    grid_start = hours[0].replace(minute=5)
+    step = pd.Timedelta(BUCKET_STEP).value
+
+    offsets = (df.index - grid_start).values.astype("timedelta64[ns]").astype(np.int64)
+    reading_index, reading_remainder = np.divmod(offsets, step)
+    in_range = (offsets >= 0) & (reading_index < num_readings)
+
+    if (reading_remainder[in_range] != 0).any():
+        logger.info("Readings are not on the 5 minute grid")
+        return None
+
+    duid_index = np.searchsorted(duids, df.facility_code.values[in_range])
+    reading_index = reading_index[in_range]
+
+    matrix_index = duid_index * num_readings + reading_index
+
+    if len(np.unique(matrix_index)) != len(matrix_index):
+        logger.info("Readings contain duplicate intervals")
+        return None
+
+    readings = np.full(len(duids) * num_readings, np.nan)
+    readings[matrix_index] = pd.to_numeric(df[power_field]).values[in_range]
+    readings = readings.reshape(len(duids), num_readings)
+
+    # bucket b covers readings 6b through 6b + 6 - edges are shared
+    bucket_index = np.arange(num_buckets)[:, None] * 6 + np.arange(BUCKET_READINGS)
+    bucket_readings = readings[:, bucket_index]
+
+    energy = _trapezium_integration_matrix(bucket_readings, gap_fill=gap_fill)
+
+    # bucket is keyed on its second last reading
+    bucket_intervals = np.arange(num_buckets) * 6 + BUCKET_READINGS - 2
+    trading_interval = np.broadcast_to(bucket_intervals, energy.shape).copy()
+
+    # rooftop buckets with a single reading are integrated the same as every other
+    # bucket. The per-bucket path's rooftop rule never applies as fueltech_id.all()
+    # returns a bool and is never equal to "solar_rooftop"
+
+    # order the same as the per-bucket path: hour, duid then bucket in hour
+    def _hour_order(values: np.ndarray) -> np.ndarray:
+        return values.reshape(len(duids), len(hours), 2).transpose(1, 0, 2).ravel()
+
+    return pd.DataFrame(
+        {
+            "trading_interval": grid_start
+            + pd.to_timedelta(_hour_order(trading_interval) * step, unit="ns"),
+            "network_id": "NEM",
+            "facility_code": _hour_order(np.broadcast_to(duids[:, None], energy.shape)),
+            "eoi_quantity": _hour_order(energy),
+        },
+        columns=columns,
+    )
+
+
 def _energy_aggregate(
     df: pd.DataFrame, power_column: str = "generated", zero_fill: bool = False
 ) -> pd.DataFrame:
@@ -315,13 +440,49 @@ def shape_energy_dataframe(
     df.generated = pd.to_numeric(df.generated)
 
     # timezone from network
-    df.trading_interval = df.apply(
-        lambda x: pd.Timestamp(x.trading_interval, tz=network.get_fixed_offset()), axis=1
-    )
+    if df.trading_interval.dt.tz is None:
+        df.trading_interval = df.trading_interval.dt.tz_localize(network.get_fixed_offset())
+    else:
+        df.trading_interval = df.trading_interval.dt.tz_convert(network.get_fixed_offset())
 
     return df
 
 
+def energy_bucket_split(
+    df: pd.DataFrame, network: NetworkSchema
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Splits a shaped frame of readings into the readings energy_sum can calculate
+    complete buckets for and the readings to carry over to the next frame
+
+    Used when streaming readings in chunks. The edge reading of the last complete
+    bucket is in both frames as it is shared with the following bucket.
+    """
+    if network not in COMPAT_NETWORKS or df.empty:
+        return df, df.iloc[0:0]
+
+    hours = list(get_hour_range(df.set_index(["trading_interval"])))
+
+    if not hours:
+        return df.iloc[0:0], df
+
+    bucket_end = hours[-1].replace(minute=5) + timedelta(hours=1)
+
+    if bucket_end > df.trading_interval.max():
+        bucket_end -= timedelta(hours=1)
+
+    if bucket_end <= df.trading_interval.min():
+        return df.iloc[0:0], df
+
+    # get_hour_range starts hours from the first reading so the frame has to extend
+    # past the bucket end by the same offset to include the last hour
+    hour_offset = max(hours[0] - hours[0].replace(minute=5), timedelta(0))
+
+    complete_df = df[df.trading_interval <= bucket_end + hour_offset]
+    carry_df = df[df.trading_interval >= bucket_end]
+
+    return complete_df, carry_df
+
+
 def energy_sum(
     df: pd.DataFrame,
     network: NetworkSchema,
@@ -332,13 +493,16 @@ def energy_sum(
     """Takes the energy sum for a series of raw duid intervals
     and returns a fresh dataframe to be imported"""
 
-    # These are the networks that run through the compat func
-    COMPAT_NETWORKS = [NetworkNEM]
-
     if network in COMPAT_NETWORKS:
         df = df.set_index(["trading_interval"])
         if hours:
-            df = _energy_aggregate_hours(df)
+            energy_df = _energy_aggregate_matrix(df)
+
+            if energy_df is None:
+                logger.warning("Falling back to per-bucket energy aggregate")
+                energy_df = _energy_aggregate_hours(df)
+
+            df = energy_df
         else:
             df = _energy_aggregate(df)
 
@@ -0,0 +1,270 @@
+"""
+OpenNEM Facility Ranges
+
+Maintains the first and last intervals each facility has been seen in
+facility_scada in the facility_scada_range table so that scada ranges and facility
+seen dates are read from a row per facility rather than aggregated from the
+facility_scada hypertable.
+
+The ingest paths update ranges in the same transaction as the scada upsert. Ranges
+only ever widen on ingest. `verify_facility_ranges` in the facility data ranges
+worker recomputes them from facility_scada and repairs any that have drifted.
+
+Columns are:
+
+    * data_first_seen, data_last_seen - interval with generated > 0 or an
+      eoi_quantity. Same as the facility seen dates
+    * generated_last_seen - last interval with a generated value
+    * energy_last_seen - last interval with an eoi_quantity
+"""
+
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+from sqlalchemy import sql
+from sqlalchemy.sql.elements import TextClause
+
+from opennem.db.query import bind_query
+
+logger = logging.getLogger("opennem.core.facility_ranges")
+
+FACILITY_RANGES_UPSERT_QUERY = """
+    INSERT INTO facility_scada_range (
+        network_id,
+        facility_code,
+        is_forecast,
+        data_first_seen,
+        data_last_seen,
+        generated_last_seen,
+        energy_last_seen
+    )
+    VALUES {values}
+    ON CONFLICT (network_id, facility_code, is_forecast) DO UPDATE SET
+        data_first_seen = least(facility_scada_range.data_first_seen, excluded.data_first_seen),
+        data_last_seen = greatest(facility_scada_range.data_last_seen, excluded.data_last_seen),
+        generated_last_seen = greatest(
+            facility_scada_range.generated_last_seen, excluded.generated_last_seen
+        ),
+        energy_last_seen = greatest(
+            facility_scada_range.energy_last_seen, excluded.energy_last_seen
+        ),
+        updated_at = now()
+    WHERE
+        facility_scada_range.data_first_seen is distinct from
+            least(facility_scada_range.data_first_seen, excluded.data_first_seen)
+        or facility_scada_range.data_last_seen is distinct from
+            greatest(facility_scada_range.data_last_seen, excluded.data_last_seen)
+        or facility_scada_range.generated_last_seen is distinct from
+            greatest(facility_scada_range.generated_last_seen, excluded.generated_last_seen)
+        or facility_scada_range.energy_last_seen is distinct from
+            greatest(facility_scada_range.energy_last_seen, excluded.energy_last_seen)
+"""
+
+FACILITY_RANGES_SESSION_VALUES = """(
+        :network_id,
+        :facility_code,
+        :is_forecast,
+        :data_first_seen,
+        :data_last_seen,
+        :generated_last_seen,
+        :energy_last_seen
+    )"""
+
+FacilityRangeKey = Tuple[str, str, bool]
+
+FacilityRangeRow = Tuple[
+    str, str, bool, Optional[datetime], Optional[datetime], Optional[datetime], Optional[datetime]
+]
+
+# interconnectors and rooftop are not part of network scada ranges
+SCADA_RANGE_FUELTECHS_EXCLUDE = ["solar_rooftop", "imports", "exports"]
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _min(current: Optional[datetime], value: Optional[datetime]) -> Optional[datetime]:
+    if current is None or value is None:
+        return current or value
+
+    return min(current, value)
+
+
+def _max(current: Optional[datetime], value: Optional[datetime]) -> Optional[datetime]:
+    if current is None or value is None:
+        return current or value
+
+    return max(current, value)
+
+
+def facility_range_rows(records: List[Dict[str, Any]]) -> List[FacilityRangeRow]:
+    """Get the range of each (network, facility, is_forecast) in a list of
+    facility_scada records. Records with no values don't change a range"""
+    ranges: Dict[FacilityRangeKey, List[Optional[datetime]]] = {}
+
+    for record in records:
+        if not record:
+            continue
+
+        trading_interval = record.get("trading_interval")
+
+        if not isinstance(trading_interval, datetime):
+            continue
+
+        generated = _number(record.get("generated"))
+        eoi_quantity = _number(record.get("eoi_quantity"))
+
+        if generated is None and eoi_quantity is None:
+            continue
+
+        key = (
+            record["network_id"],
+            record["facility_code"],
+            bool(record.get("is_forecast") or False),
+        )
+
+        if key not in ranges:
+            ranges[key] = [None, None, None, None]
+
+        key_range = ranges[key]
+
+        if (generated is not None and generated > 0) or eoi_quantity is not None:
+            key_range[0] = _min(key_range[0], trading_interval)
+            key_range[1] = _max(key_range[1], trading_interval)
+
+        if generated is not None:
+            key_range[2] = _max(key_range[2], trading_interval)
+
+        if eoi_quantity is not None:
+            key_range[3] = _max(key_range[3], trading_interval)
+
+    return [
+        (network_id, facility_code, is_forecast, *key_range)  # type: ignore
+        for (network_id, facility_code, is_forecast), key_range in sorted(ranges.items())
+    ]
+
+
+def update_facility_ranges_cursor(cursor: Any, records: List[Dict[str, Any]]) -> int:
+    """Widens facility ranges using a raw DBAPI cursor. The caller commits"""
+    rows = facility_range_rows(records)
+
+    if rows:
+        execute_values(cursor, FACILITY_RANGES_UPSERT_QUERY.format(values="%s"), rows)
+
+    return len(rows)
+
+
+def update_facility_ranges_session(session: Any, records: List[Dict[str, Any]]) -> int:
+    """Widens facility ranges using an ORM session. The caller commits"""
+    rows = facility_range_rows(records)
+
+    if rows:
+        stmt = sql.text(FACILITY_RANGES_UPSERT_QUERY.format(values=FACILITY_RANGES_SESSION_VALUES))
+        session.execute(
+            stmt,
+            [
+                {
+                    "network_id": network_id,
+                    "facility_code": facility_code,
+                    "is_forecast": is_forecast,
+                    "data_first_seen": data_first_seen,
+                    "data_last_seen": data_last_seen,
+                    "generated_last_seen": generated_last_seen,
+                    "energy_last_seen": energy_last_seen,
+                }
+                for (
+                    network_id,
+                    facility_code,
+                    is_forecast,
+                    data_first_seen,
+                    data_last_seen,
+                    generated_last_seen,
+                    energy_last_seen,
+                ) in rows
+            ],
+        )
+
+    return len(rows)
+
+
+def facility_seen_range_query(facility_codes: List[str]) -> TextClause:
+    """First and last seen dates for a list of facilities"""
+    query = """
+        select
+            min(data_first_seen) as first_seen,
+            max(data_last_seen) as last_seen
+        from facility_scada_range
+        where facility_code = ANY(:facility_codes)
+    """
+
+    return bind_query("facility_seen_range", query, facility_codes=list(facility_codes))
+
+
+def scada_range_query(
+    timezone: str,
+    date_min: datetime,
+    network_ids: Optional[List[str]] = None,
+    network_region: Optional[str] = None,
+    facilities: Optional[List[str]] = None,
+    energy: bool = False,
+) -> TextClause:
+    """Scada range for a network, region or list of facilities from the facilities
+    seen since date_min"""
+    __query = """
+    select
+        min(fsr.data_first_seen) at time zone :timezone,
+        max(fsr.{field}) at time zone :timezone
+    from facility_scada_range fsr
+    join facility f on fsr.facility_code = f.code
+    where
+        fsr.{field} >= :date_min and
+        {facility_query}
+        {network_query}
+        {network_region_query}
+        f.fueltech_id != ALL(:fueltechs_exclude)
+        and f.interconnector is FALSE
+    """
+
+    params: Dict[str, Any] = {
+        "timezone": timezone,
+        "date_min": date_min,
+        "fueltechs_exclude": SCADA_RANGE_FUELTECHS_EXCLUDE,
+    }
+
+    facility_query = ""
+    network_query = ""
+    network_region_query = ""
+
+    if facilities:
+        facility_query = "f.code = ANY(:facility_codes) and"
+        params["facility_codes"] = list(facilities)
+
+    if network_ids:
+        network_query = "f.network_id = ANY(:network_ids) and"
+        params["network_ids"] = list(network_ids)
+
+    if network_region:
+        network_region_query = "f.network_region = :network_region and"
+        params["network_region"] = network_region
+
+    query = __query.format(
+        field="energy_last_seen" if energy else "generated_last_seen",
+        facility_query=facility_query,
+        network_query=network_query,
+        network_region_query=network_region_query,
+    )
+
+    return bind_query("scada_range", query, **params)
@@ -5,21 +5,26 @@ Parse AEMO MMS CSV format which can have multiple tables and definitions per CSV
 
 import csv
 import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from pydantic import BaseModel, validator
 from pydantic.error_wrappers import ValidationError
-from pydantic.fields import PrivateAttr
+from pydantic.fields import ModelField, PrivateAttr
 
-from opennem.core.downloader import url_downloader
+from opennem.core.downloader import url_downloader, url_downloader_stream
 from opennem.schema.aemo.mms import MMSBase, get_mms_schema_for_table
 from opennem.schema.core import BaseConfig
+from opennem.settings import settings
 from opennem.utils.version import get_version
 
 _HAVE_PANDAS = False
 
 try:
+    import numpy as np
     import pandas as pd
 
     _HAVE_PANDAS = True
@@ -29,6 +34,53 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# number of rows validated through the pydantic schema per table in columnar mode
+COLUMNAR_VALIDATE_SAMPLE = 100
+
+# field types that are coerced in bulk without running through pydantic
+COLUMNAR_NUMERIC_TYPES = [float, int]
+
+
+def _coerce_column(raw: Any, field: ModelField, schema: BaseModel) -> Tuple[Any, Any]:
+    """Coerce a column of raw csv strings to the schema field type in bulk
+
+    Numeric fields without validators are converted with pandas. All other fields
+    are validated once per unique value through the pydantic field which runs
+    the schema validators. Returns the coerced column and a mask of valid rows"""
+
+    if field.type_ in COLUMNAR_NUMERIC_TYPES and not field.class_validators:
+        coerced = pd.to_numeric(raw.str.strip(), errors="coerce")
+        valid = coerced.notnull()
+
+        if field.type_ is int and valid.all():
+            coerced = coerced.astype("int64")
+
+        return coerced, valid
+
+    values_map: Dict[Any, Any] = {}
+    values_invalid: List[Any] = []
+
+    for value in pd.unique(raw):
+        value_validated, errors = field.validate(value, {}, loc=field.name, cls=schema)
+
+        if errors:
+            logger.error("{} has error: {} '{}'".format(field.name, errors, value))
+            values_invalid.append(value)
+            continue
+
+        values_map[value] = value_validated
+
+    coerced = raw.map(values_map)
+    valid = ~raw.isin(values_invalid)
+
+    if field.type_ is datetime:
+        try:
+            coerced = pd.to_datetime(coerced)
+        except (ValueError, TypeError):
+            pass
+
+    return coerced, valid
+
 
 # pylint: disable=no-self-argument
 class AEMOTableSchema(BaseConfig):
@@ -37,6 +89,11 @@ class AEMOTableSchema(BaseConfig):
     fieldnames: List[str]
     _records: List[Union[MMSBase, Dict[str, Any]]] = []
 
+    # columnar mode - raw rows are collected while parsing and coerced per
+    # column into a typed frame once the table block is complete
+    _raw_rows: List[List[str]] = []
+    _frame: Optional[Any] = None
+
     # optionally it has a schema
     _record_schema: Optional[BaseModel] = PrivateAttr()
 
@@ -90,8 +147,113 @@ class AEMOTableSchema(BaseConfig):
 
     @property
     def records(self) -> List[Union[MMSBase, Dict[str, Any]]]:
+        if self._frame is not None and not self._records:
+            self._records = self._frame_to_records()
+
         return self._records
 
+    @property
+    def is_columnar(self) -> bool:
+        return self._frame is not None
+
+    def add_raw_row(self, values: List[str]) -> None:
+        self._raw_rows.append(values)
+
+    def build_frame(self, validate_sample: int = COLUMNAR_VALIDATE_SAMPLE) -> bool:
+        """Coerce the collected raw rows into a typed frame. Pydantic validation
+        is only run on a sample of validate_sample rows"""
+        if not _HAVE_PANDAS:
+            raise AEMOParserException("Columnar parsing requires pandas")
+
+        raw_frame = pd.DataFrame(self._raw_rows, columns=self.fieldnames, dtype=object)
+
+        schema = getattr(self, "_record_schema", None)
+
+        if not schema:
+            self._frame = raw_frame
+            self._raw_rows = []
+            return True
+
+        self._validate_sample(validate_sample)
+
+        columns: Dict[str, Any] = {}
+        valid = pd.Series(True, index=raw_frame.index)
+
+        for field_name, field in schema.__fields__.items():
+            if field_name not in raw_frame.columns:
+                if field.required:
+                    logger.error("{} is missing required field {}".format(self.name, field_name))
+                    valid &= False
+
+                columns[field_name] = None
+                continue
+
+            columns[field_name], field_valid = _coerce_column(
+                raw_frame[field_name], field, schema
+            )
+            valid &= field_valid
+
+        if not valid.all():
+            logger.error("{}: {} invalid records".format(self.full_name, (~valid).sum()))
+
+        self._frame = pd.DataFrame(columns, index=raw_frame.index)[valid].reset_index(drop=True)
+        self._raw_rows = []
+        self._records = []
+
+        return True
+
+    def _validate_sample(self, validate_sample: int) -> None:
+        """Run a sample of the raw rows through pydantic validation"""
+        if validate_sample < 1 or not self._raw_rows:
+            return None
+
+        sample_index = np.unique(
+            np.linspace(0, len(self._raw_rows) - 1, min(validate_sample, len(self._raw_rows)))
+            .round()
+            .astype(int)
+        )
+
+        sample_errors = 0
+
+        for row_index in sample_index:
+            try:
+                self._record_schema(**dict(zip(self.fieldnames, self._raw_rows[row_index])))  # type: ignore
+            except ValidationError as e:
+                sample_errors += 1
+                logger.error("{} sample record has error: {}".format(self.full_name, e))
+
+        logger.debug(
+            "{}: {} of {} sampled records failed validation".format(
+                self.full_name, sample_errors, len(sample_index)
+            )
+        )
+
+    def _frame_to_records(self) -> List[Union[MMSBase, Dict[str, Any]]]:
+        """Materialize records from the typed frame without validating them again"""
+        frame = self._frame.astype(object)
+
+        for column_name, column_type in self._frame.dtypes.items():
+            if pd.api.types.is_datetime64_any_dtype(column_type):
+                frame[column_name] = pd.Series(
+                    self._frame[column_name].dt.to_pydatetime(), dtype=object
+                )
+
+        frame = frame.where(self._frame.notnull(), None)
+
+        frame_records = frame.to_dict("records")
+
+        schema = getattr(self, "_record_schema", None)
+
+        if not schema:
+            return frame_records
+
+        return [schema.construct(**r) for r in frame_records]
+
+    def merge_frame(self, table: "AEMOTableSchema") -> None:
+        """Merge the frame of another columnar table into this one"""
+        self._frame = pd.concat([self._frame, table._frame], ignore_index=True)
+        self._records = []
+
     def add_record(self, record: Union[Dict, BaseModel]) -> bool:
         if isinstance(record, dict) and hasattr(self, "_record_schema") and self._record_schema:
             _record = None
@@ -125,7 +287,10 @@ class AEMOTableSchema(BaseConfig):
 
         _index_keys = []
 
-        _df = pd.DataFrame(self.records)
+        if self._frame is not None:
+            _df = self._frame.copy()
+        else:
+            _df = pd.DataFrame(self.records)
 
         if hasattr(self, "_record_schema") and self._record_schema:
             if hasattr(self._record_schema, "_primary_keys"):
@@ -189,7 +354,14 @@ class AEMOTableSet(BaseModel):
     def add_table(self, table: AEMOTableSchema) -> bool:
         _existing_table = self.get_table(table.full_name)
 
-        if _existing_table:
+        if _existing_table and _existing_table.is_columnar and table.is_columnar:
+            _existing_table.merge_frame(table)
+        elif _existing_table:
+            # materialize the columnar records before adding row records
+            if _existing_table.is_columnar:
+                _existing_table._records = list(_existing_table.records)
+                _existing_table._frame = None
+
             for r in table.records:
                 _existing_table.add_record(r)
         else:
@@ -229,20 +401,34 @@ AEMO_ROW_HEADER_TYPES = ["C", "I", "D"]
 
 
 def parse_aemo_mms_csv(
-    content: str,
+    content: Union[str, Iterable[str]],
     table_set: Optional[AEMOTableSet] = None,
     namespace_filter: Optional[List[str]] = None,
+    columnar: bool = False,
+    validate_sample: int = COLUMNAR_VALIDATE_SAMPLE,
 ) -> AEMOTableSet:
     """
     Parse AEMO CSV's into schemas and return a table set
 
+    Content is either the full csv as a str or an iterable of lines such as the
+    stream from url_downloader_stream
+
+    In columnar mode the records for each table are coerced in bulk per column
+    and only a sample of validate_sample records is validated through pydantic
+
     Exception raised on error and logs malformed CSVs
     """
 
     if not table_set:
         table_set = AEMOTableSet()
 
-    content_split = content.splitlines()
+    def _add_table(table: AEMOTableSchema) -> None:
+        if columnar:
+            table.build_frame(validate_sample=validate_sample)
+
+        table_set.add_table(table)  # type: ignore
+
+    content_split = content.splitlines() if isinstance(content, str) else content
 
     # @NOTE more efficient csv parsing
     datacsv = csv.reader(content_split)
@@ -264,12 +450,13 @@ def parse_aemo_mms_csv(
         if record_type == "C":
             # @TODO csv meta stored in table
             if table_current:
-                table_set.add_table(table_current)
+                _add_table(table_current)
+                table_current = None
 
         # new table
         elif record_type == "I":
             if table_current:
-                table_set.add_table(table_current)
+                _add_table(table_current)
 
             table_namespace = row[1]
             table_name = row[2]
@@ -304,6 +491,10 @@ def parse_aemo_mms_csv(
                 logger.error("Malformed AEMO csv - length mismatch between records and fields")
                 continue
 
+            if columnar:
+                table_current.add_raw_row(values)
+                continue
+
             record = dict(zip(table_current.fieldnames, values))
 
             table_current.add_record(record)
@@ -314,19 +505,91 @@ def parse_aemo_mms_csv(
     return table_set
 
 
-def parse_aemo_urls(urls: List[str]) -> AEMOTableSet:
-    """Parse a list of URLs into an AEMOTableSet"""
-    aemo = AEMOTableSet()
+def _fetch_url(url: str, stream: bool = False) -> Tuple[Union[bytes, Iterator[str], None], float]:
+    """Download a url in the fetch stage. Returns the content and the fetch time"""
+    fetch_start = time.perf_counter()
 
-    for url in urls:
-        csv_content = url_downloader(url)
+    content: Union[bytes, Iterator[str], None] = None
 
-        if not csv_content:
-            logger.error("Could not parse URL: {}".format(url))
-            continue
+    if stream:
+        content = url_downloader_stream(url)
+    else:
+        content = url_downloader(url)
+
+    return content, time.perf_counter() - fetch_start
+
+
+def parse_aemo_urls(
+    urls: List[str],
+    workers: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    columnar: bool = False,
+    stream: bool = False,
+) -> AEMOTableSet:
+    """Parse a list of URLs into an AEMOTableSet
 
-        csv_content_decoded = csv_content.decode("utf-8")
-        aemo = parse_aemo_mms_csv(csv_content_decoded, aemo)
+    URLs are downloaded concurrently by a pool of workers which feeds the parse
+    stage through a bounded queue of at most queue_size pending downloads. The
+    parse stage merges into the table set in url order so the result is the
+    same as parsing each url in turn
+
+    With stream set downloads are spooled to temp files and parsed line by line
+    rather than held in memory"""
+    aemo = AEMOTableSet()
+
+    if not workers:
+        workers = settings.http_fetch_workers
+
+    if not queue_size:
+        queue_size = workers * 2
+
+    run_start = time.perf_counter()
+    fetch_time = 0.0
+    wait_time = 0.0
+    parse_time = 0.0
+
+    urls_queue = deque(urls)
+    fetch_queue: Deque[Tuple[str, Future]] = deque()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="opennem_fetch") as executor:
+        try:
+            while urls_queue or fetch_queue:
+                while urls_queue and len(fetch_queue) < queue_size:
+                    url = urls_queue.popleft()
+                    fetch_queue.append((url, executor.submit(_fetch_url, url, stream)))
+
+                url, fetch_future = fetch_queue.popleft()
+
+                wait_start = time.perf_counter()
+                csv_content, url_fetch_time = fetch_future.result()
+                wait_time += time.perf_counter() - wait_start
+                fetch_time += url_fetch_time
+
+                if not csv_content:
+                    logger.error("Could not parse URL: {}".format(url))
+                    continue
+
+                parse_start = time.perf_counter()
+                if isinstance(csv_content, bytes):
+                    csv_content = csv_content.decode("utf-8")
+
+                aemo = parse_aemo_mms_csv(csv_content, aemo, columnar=columnar)
+                parse_time += time.perf_counter() - parse_start
+        finally:
+            for _, fetch_future in fetch_queue:
+                fetch_future.cancel()
+
+    logger.info(
+        "Parsed {} urls in {:.2f}s. fetch: {:.2f}s ({} workers) "
+        "wait: {:.2f}s parse: {:.2f}s".format(
+            len(urls),
+            time.perf_counter() - run_start,
+            fetch_time,
+            workers,
+            wait_time,
+            parse_time,
+        )
+    )
 
     return aemo
 
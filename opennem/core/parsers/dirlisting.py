@@ -7,16 +7,24 @@ Currently supports:
 
     * IIS default listings and variations
     * Extracing metadata from AEMO filenames
+
+`get_dirlisting_cached` is used by the crawlers that check a listing every few
+minutes. It sends conditional requests, caches the parsed listing per url and
+parses only the lines added since the last request. Processed files are
+remembered with `mark_processed_files` so they're not fetched again.
 """
 
 import html
 import logging
 import re
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from enum import Enum
 from operator import attrgetter
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Pattern, Union
+from urllib.parse import urljoin
 
 from pydantic import ValidationError, validator
 from scrapy.http import HtmlResponse
@@ -24,13 +32,23 @@ from scrapy.http import HtmlResponse
 from opennem.core.downloader import url_downloader
 from opennem.core.normalizers import is_number, strip_double_spaces
 from opennem.schema.core import BaseConfig
+from opennem.utils.http import http
 
 logger = logging.getLogger("opennem.parsers.dirlisting")
 
+# IIS listings use uppercase tags so matches ignore case
 __iis_line_match = re.compile(
-    r"(?P<modified_date>.*[AM|PM])\ {2,}(?P<file_size>(\d{1,}|\<dir\>))\ <a href=['\"]?(?P<link>[^'\" >]+)['\"]>(?P<filename>[^\<]+)"
+    r"(?P<modified_date>.*[AM|PM])\ {2,}(?P<file_size>(\d{1,}|\<dir\>))\ <a href=['\"]?(?P<link>[^'\" >]+)['\"]>(?P<filename>[^\<]+)",
+    re.IGNORECASE,
 )
 
+_pre_block_match = re.compile(r"<pre>(?P<listing>.*?)</pre>", re.IGNORECASE | re.DOTALL)
+
+_line_break_split = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+
+# number of processed files remembered for each listing
+DIRLISTING_PROCESSED_MAX = 5000
 
 # AEMO files have a created timestamp in their filenames. This extracts it.
 _aemo_created_date_match = re.compile(r"\_(?P<date_created>\d{12})\_")
@@ -185,6 +203,36 @@ def parse_dirlisting_line(dirlisting_line: str) -> Optional[DirlistingEntry]:
     return model
 
 
+def _dirlisting_lines(content: str) -> List[str]:
+    """Split the pre block of a listing page into its lines"""
+    pre_block = _pre_block_match.search(content)
+
+    if not pre_block:
+        raise Exception("No listing in dirlisting page")
+
+    return _line_break_split.split(pre_block.group("listing"))
+
+
+def _is_entry_line(dirlisting_line: str) -> bool:
+    """Skips the parent directory link and blank lines"""
+    line = dirlisting_line.strip()
+
+    return bool(line) and not line.lower().startswith("<a")
+
+
+def _parse_dirlisting_line_link(url: str, dirlisting_line: str) -> Optional[DirlistingEntry]:
+    if not _is_entry_line(dirlisting_line):
+        return None
+
+    model = parse_dirlisting_line(html.unescape(dirlisting_line.strip()))
+
+    if model:
+        # append the base URL to the model link
+        model.link = urljoin(url, model.link)
+
+    return model
+
+
 def get_dirlisting(url: str) -> DirectoryListing:
     """Parse a directory listng into a list of DirlistingEntry models"""
     dirlisting_content = url_downloader(url)
@@ -210,3 +258,155 @@ def get_dirlisting(url: str) -> DirectoryListing:
     model = DirectoryListing(url=url, entries=_dirlisting_models)
 
     return model
+
+
+class DirlistingCacheEntry(BaseConfig):
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    entries: List[DirlistingEntry] = []
+
+
+_dirlisting_cache: Dict[str, DirlistingCacheEntry] = {}
+_dirlisting_processed: Dict[str, "OrderedDict[str, None]"] = {}
+_dirlisting_lock = threading.Lock()
+
+
+def parse_dirlisting_tail(
+    url: str, lines: List[str], cached_entries: List[DirlistingEntry]
+) -> List[DirlistingEntry]:
+    """Parse the lines of a listing newer than the cached entries.
+
+    Listings are ordered oldest to newest so lines are parsed from the end back to
+    the newest cached entry. Older lines are matched to the cached entries. Files
+    age out from the start of the listing after any directories, so only the lines
+    up to the last aged out file are parsed to find which cached entries to drop"""
+    entry_lines = [i for i in lines if _is_entry_line(i)]
+    cached_index = {entry.link: index for index, entry in enumerate(cached_entries)}
+
+    tail_entries: List[DirlistingEntry] = []
+    boundary_model: Optional[DirlistingEntry] = None
+    line_position = 0
+
+    for line_position in range(len(entry_lines) - 1, -1, -1):
+        model = _parse_dirlisting_line_link(url, entry_lines[line_position])
+
+        if not model:
+            continue
+
+        if model.link in cached_index:
+            boundary_model = model
+            break
+
+        tail_entries.append(model)
+
+    tail_entries.reverse()
+
+    if not boundary_model:
+        return tail_entries
+
+    older_lines = entry_lines[:line_position]
+    older_cached = cached_entries[: cached_index[boundary_model.link]]
+
+    aged_out_count = len(older_cached) - len(older_lines)
+
+    # lines were added part way through the listing
+    if aged_out_count < 0:
+        head_entries = [_parse_dirlisting_line_link(url, i) for i in older_lines]
+
+        return [i for i in head_entries if i] + [boundary_model] + tail_entries
+
+    head_entries = []
+    line_index = 0
+    cached_index_head = 0
+
+    while aged_out_count > 0 and line_index < len(older_lines):
+        model = _parse_dirlisting_line_link(url, older_lines[line_index])
+
+        if not model:
+            line_index += 1
+            continue
+
+        if model.link == older_cached[cached_index_head].link:
+            head_entries.append(older_cached[cached_index_head])
+            line_index += 1
+        else:
+            aged_out_count -= 1
+
+        cached_index_head += 1
+
+    # the remaining cached entries match the remaining lines unless the lines ran
+    # out first, in which case the rest of the cached entries have aged out too
+    if aged_out_count == 0:
+        head_entries += older_cached[cached_index_head:]
+
+    return head_entries + [boundary_model] + tail_entries
+
+
+def get_dirlisting_cached(url: str) -> DirectoryListing:
+    """Get a directory listing with a conditional request. Listings are cached per
+    url and only the entries added since the last request are parsed. If the
+    listing hasn't changed the cached listing is returned"""
+    with _dirlisting_lock:
+        cached = _dirlisting_cache.get(url)
+
+    request_headers: Dict[str, str] = {}
+
+    if cached and cached.etag:
+        request_headers["If-None-Match"] = cached.etag
+
+    if cached and cached.last_modified:
+        request_headers["If-Modified-Since"] = cached.last_modified
+
+    logger.debug("Downloading dirlisting: {}".format(url))
+
+    r = http.get(url, headers=request_headers)
+
+    if cached and r.status_code == 304:
+        logger.debug("Dirlisting not modified: {}".format(url))
+        return DirectoryListing(url=url, entries=list(cached.entries))
+
+    if not r.ok:
+        raise Exception("Bad link returned {}: {}".format(r.status_code, url))
+
+    lines = _dirlisting_lines(r.content.decode("utf-8"))
+
+    entries = parse_dirlisting_tail(url, lines, cached.entries if cached else [])
+
+    with _dirlisting_lock:
+        _dirlisting_cache[url] = DirlistingCacheEntry(
+            url=url,
+            etag=r.headers.get("ETag"),
+            last_modified=r.headers.get("Last-Modified"),
+            entries=entries,
+        )
+
+    return DirectoryListing(url=url, entries=list(entries))
+
+
+def get_unprocessed_files(url: str, entries: List[DirlistingEntry]) -> List[DirlistingEntry]:
+    """Entries in a listing that haven't been marked processed"""
+    with _dirlisting_lock:
+        processed = _dirlisting_processed.get(url, {})
+
+        return [i for i in entries if i.link not in processed]
+
+
+def mark_processed_files(url: str, entries: List[DirlistingEntry]) -> None:
+    """Remember entries from a listing have been processed. The most recent
+    DIRLISTING_PROCESSED_MAX entries are kept for each url"""
+    with _dirlisting_lock:
+        processed = _dirlisting_processed.setdefault(url, OrderedDict())
+
+        for entry in entries:
+            processed[entry.link] = None
+            processed.move_to_end(entry.link)
+
+        while len(processed) > DIRLISTING_PROCESSED_MAX:
+            processed.popitem(last=False)
+
+
+def reset_dirlisting_cache() -> None:
+    with _dirlisting_lock:
+        _dirlisting_cache.clear()
+        _dirlisting_processed.clear()
@@ -3,17 +3,29 @@
 """
 import logging
 from datetime import datetime
+from functools import partial
 from typing import List, Optional
 
 import pytz
 
-from opennem.clients.bom import get_bom_observations
-from opennem.controllers.bom import store_bom_observation_intervals
+from opennem.clients.bom import get_bom_observations_many
+from opennem.controllers.bom import store_bom_observations_many
 from opennem.controllers.nem import ControllerReturn, store_aemo_tableset
-from opennem.core.crawlers.meta import CrawlStatTypes, crawler_get_all_meta, crawler_set_meta
+from opennem.core.crawlers.meta import (
+    CrawlStatTypes,
+    crawler_get_all_meta,
+    crawler_set_meta_many,
+    load_crawl_meta,
+)
 from opennem.core.parsers.aemo.mms import parse_aemo_urls
-from opennem.core.parsers.dirlisting import DirlistingEntry, get_dirlisting
+from opennem.core.parsers.dirlisting import (
+    DirlistingEntry,
+    get_dirlisting_cached,
+    get_unprocessed_files,
+    mark_processed_files,
+)
 from opennem.crawlers.apvi import crawl_apvi_forecasts
+from opennem.crawlers.executor import run_crawlers
 from opennem.crawlers.schema import CrawlerDefinition, CrawlerPriority, CrawlerSchedule, CrawlerSet
 from opennem.crawlers.wem import (
     run_wem_balancing_crawl,
@@ -30,6 +42,9 @@ def load_crawlers() -> CrawlerSet:
     """Loads all the crawler definitions from a module and returns a CrawlSet"""
     _crawlers = []
 
+    # meta for all crawlers in a single query
+    load_crawl_meta(refresh=True)
+
     for i in globals():
         if isinstance(globals()[i], CrawlerDefinition):
             _crawler_inst = globals()[i]
@@ -64,7 +79,7 @@ def run_aemo_mms_crawl(
     if not crawler.url:
         raise Exception("Require a URL to run AEMO MMS crawlers")
 
-    dirlisting = get_dirlisting(crawler.url)
+    dirlisting = get_dirlisting_cached(crawler.url)
 
     if crawler.filename_filter:
         dirlisting.apply_filter(crawler.filename_filter)
@@ -86,17 +101,23 @@ def run_aemo_mms_crawl(
     else:
         entries_to_fetch = dirlisting.get_files()
 
+    # skip files already stored by an earlier run
+    entries_to_fetch = get_unprocessed_files(crawler.url, entries_to_fetch)
+
     if not entries_to_fetch:
         logger.info("Nothing to do")
         return None
 
     logger.info("Fetching {} entries".format(len(entries_to_fetch)))
 
-    ts = parse_aemo_urls([i.link for i in entries_to_fetch])
+    ts = parse_aemo_urls([i.link for i in entries_to_fetch], columnar=True, stream=True)
 
     controller_returns = store_aemo_tableset(ts)
     controller_returns.last_modified = max([i.modified_date for i in entries_to_fetch])  # type: ignore
 
+    if not controller_returns.errors:
+        mark_processed_files(crawler.url, entries_to_fetch)
+
     return controller_returns
 
 
@@ -125,8 +146,13 @@ def run_crawl(crawler: CrawlerDefinition, last_crawled: bool = True, limit: bool
         crawler.last_crawled = cr.last_modified
         crawler.last_processed = datetime.now().astimezone(pytz.timezone("Australia/Sydney"))
 
-        crawler_set_meta(crawler.name, CrawlStatTypes.last_crawled, crawler.last_crawled)
-        crawler_set_meta(crawler.name, CrawlStatTypes.latest_processed, crawler.last_processed)
+        crawler_set_meta_many(
+            crawler.name,
+            {
+                CrawlStatTypes.last_crawled: crawler.last_crawled,
+                CrawlStatTypes.latest_processed: crawler.last_processed,
+            },
+        )
 
         logger.info("Set last updated to {}".format(cr.last_modified))
 
@@ -136,9 +162,9 @@ def crawl_bom_capitals(
 ) -> ControllerReturn:
     bom_stations = get_stations_priority()
 
-    for bom_station in bom_stations:
-        bom_observations = get_bom_observations(bom_station.feed_url, bom_station.code)
-        cr = store_bom_observation_intervals(bom_observations)
+    bom_observations = get_bom_observations_many([(i.feed_url, i.code) for i in bom_stations])
+
+    cr = store_bom_observations_many(bom_observations)
 
     cr.last_modified = datetime.now()
 
@@ -267,11 +293,24 @@ def run_crawls_all(last_crawled: bool = True) -> None:
 
 
 def run_crawls_by_schedule(schedule: CrawlerSchedule, last_crawled: bool = True) -> None:
+    """Run the crawlers in a schedule concurrently. See opennem.crawlers.executor"""
     if not _CRAWLER_SET.crawlers:
         raise Exception("No crawlers found")
 
-    for crawler in _CRAWLER_SET.get_crawlers_by_schedule(schedule):
-        run_crawl(crawler, last_crawled=last_crawled)
+    results = run_crawlers(
+        _CRAWLER_SET.get_crawlers_by_schedule(schedule),
+        partial(run_crawl, last_crawled=last_crawled),
+    )
+
+    for result in results:
+        if result.skipped:
+            continue
+
+        if result.error:
+            logger.error("Crawl {} failed: {}".format(result.name, result.error))
+            continue
+
+        logger.info("Crawled {} in {:.2f}s".format(result.name, result.seconds))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+"""
+Crawl executor
+
+Runs the crawlers in a schedule concurrently so a slow crawler doesn't hold up the
+others in the schedule past the next run.
+
+Crawlers are started in priority order. Lower priority crawlers can only take up
+part of the workers so slots are always left for high priority crawlers - see
+CRAWL_PRIORITY_RESERVED.
+
+Each crawler is waited on for its timeout, which defaults to the schedule interval.
+Threads can't be stopped so a crawler that times out is left to finish in the
+background and is skipped by later runs until it does.
+
+Crawl latency and time run past the schedule interval are exported to prometheus
+when `prometheus_client` is installed.
+"""
+import logging
+import threading
+import time
+from queue import Empty, Queue
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from opennem.crawlers.schema import CrawlerDefinition, CrawlerPriority, get_schedule_seconds
+from opennem.schema.core import BaseConfig
+from opennem.settings import settings
+
+_HAVE_PROMETHEUS = False
+
+try:
+    from prometheus_client import Counter, Histogram
+
+    _HAVE_PROMETHEUS = True
+except ImportError:
+    pass
+
+logger = logging.getLogger("opennem.crawlers.executor")
+
+# workers kept free for higher priority crawlers
+CRAWL_PRIORITY_RESERVED = {
+    CrawlerPriority.high: 0,
+    CrawlerPriority.medium: 1,
+    CrawlerPriority.low: 2,
+}
+
+CrawlFunc = Callable[[CrawlerDefinition], None]
+
+# crawlers with a thread running, including those that timed out
+_crawls_running: Set[str] = set()
+_crawls_running_lock = threading.Lock()
+
+if _HAVE_PROMETHEUS:
+    _prometheus_crawl_seconds = Histogram(
+        "opennem_crawl_seconds", "Crawl run time in seconds", ["crawler"]
+    )
+    _prometheus_crawl_overrun_seconds = Histogram(
+        "opennem_crawl_overrun_seconds",
+        "Seconds a crawl ran past its schedule interval",
+        ["crawler"],
+    )
+    _prometheus_crawl_timeouts = Counter(
+        "opennem_crawl_timeouts", "Crawls that timed out", ["crawler"]
+    )
+
+
+class CrawlResult(BaseConfig):
+    name: str
+    priority: CrawlerPriority
+    seconds: float = 0.0
+    overrun_seconds: float = 0.0
+    timed_out: bool = False
+    skipped: bool = False
+    error: Optional[str]
+
+
+def get_priority_slots(priority: CrawlerPriority, workers: int) -> int:
+    """Number of workers crawlers of priority or lower can use"""
+    return max(1, workers - CRAWL_PRIORITY_RESERVED.get(priority, 0))
+
+
+def _claim_running(name: str) -> bool:
+    with _crawls_running_lock:
+        if name in _crawls_running:
+            return False
+
+        _crawls_running.add(name)
+
+    return True
+
+
+def _release_running(name: str) -> None:
+    with _crawls_running_lock:
+        _crawls_running.discard(name)
+
+
+def record_crawl(crawler: CrawlerDefinition, result: CrawlResult) -> None:
+    schedule_seconds = get_schedule_seconds(crawler.schedule)
+
+    if schedule_seconds:
+        result.overrun_seconds = max(0.0, result.seconds - schedule_seconds)
+
+    if result.overrun_seconds:
+        logger.warning(
+            "Crawl {} ran {:.2f}s past its schedule".format(crawler.name, result.overrun_seconds)
+        )
+
+    if _HAVE_PROMETHEUS:
+        _prometheus_crawl_seconds.labels(crawler=crawler.name).observe(result.seconds)
+        _prometheus_crawl_overrun_seconds.labels(crawler=crawler.name).observe(
+            result.overrun_seconds
+        )
+
+        if result.timed_out:
+            _prometheus_crawl_timeouts.labels(crawler=crawler.name).inc()
+
+
+def _run_crawler(crawl_func: CrawlFunc, crawler: CrawlerDefinition, done_queue: Queue) -> None:
+    error = None
+
+    try:
+        crawl_func(crawler)
+    except Exception as e:
+        logger.error("Error running crawl {}: {}".format(crawler.name, e))
+        error = str(e)
+    finally:
+        _release_running(crawler.name)
+        done_queue.put((crawler.name, error))
+
+
+def run_crawlers(
+    crawlers: List[CrawlerDefinition],
+    crawl_func: CrawlFunc,
+    workers: Optional[int] = None,
+) -> List[CrawlResult]:
+    """Run crawl_func for each crawler concurrently. Returns a result with the run
+    time of each crawler in the order of crawlers"""
+    worker_count = workers or settings.crawl_workers
+
+    results: Dict[str, CrawlResult] = {
+        i.name: CrawlResult(name=i.name, priority=i.priority) for i in crawlers
+    }
+
+    pending = sorted(crawlers, key=lambda i: i.priority.value)
+    running: Dict[str, Tuple[CrawlerDefinition, float]] = {}
+
+    # crawler threads put (name, error) when they finish
+    done_queue: Queue = Queue()
+
+    def _can_start(crawler: CrawlerDefinition) -> bool:
+        if len(running) >= worker_count:
+            return False
+
+        running_at_priority = len(
+            [c for c, _ in running.values() if c.priority.value >= crawler.priority.value]
+        )
+
+        return running_at_priority < get_priority_slots(crawler.priority, worker_count)
+
+    def _finish(name: str, error: Optional[str] = None, timed_out: bool = False) -> None:
+        crawler, crawl_start = running.pop(name)
+        result = results[name]
+
+        result.seconds = time.perf_counter() - crawl_start
+        result.error = error
+        result.timed_out = timed_out
+
+        record_crawl(crawler, result)
+
+    while pending or running:
+        for crawler in list(pending):
+            if not _can_start(crawler):
+                continue
+
+            pending.remove(crawler)
+
+            if not _claim_running(crawler.name):
+                logger.warning("Crawl {} is still running. Skipping".format(crawler.name))
+                results[crawler.name].skipped = True
+                continue
+
+            running[crawler.name] = (crawler, time.perf_counter())
+
+            threading.Thread(
+                target=_run_crawler,
+                args=(crawl_func, crawler, done_queue),
+                name="opennem_crawl_{}".format(crawler.name),
+                daemon=True,
+            ).start()
+
+        if not running:
+            continue
+
+        now = time.perf_counter()
+        deadlines = {
+            name: crawl_start + (crawler.get_timeout() or float("inf"))
+            for name, (crawler, crawl_start) in running.items()
+        }
+        wait_seconds = max(0.0, min(deadlines.values()) - now)
+
+        try:
+            name, error = done_queue.get(
+                timeout=None if wait_seconds == float("inf") else wait_seconds
+            )
+
+            # timed out crawlers report in once they finish
+            if name in running:
+                _finish(name, error=error)
+        except Empty:
+            pass
+
+        now = time.perf_counter()
+
+        for name, deadline in deadlines.items():
+            if name in running and now >= deadline:
+                logger.error("Crawl {} timed out".format(name))
+                _finish(name, error="Timed out", timed_out=True)
+
+    return [results[i.name] for i in crawlers]
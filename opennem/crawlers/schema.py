@@ -21,6 +21,24 @@ class CrawlerSchedule(Enum):
     daily = "1d"
 
 
+CRAWLER_SCHEDULE_SECONDS = {
+    CrawlerSchedule.live: 60,
+    CrawlerSchedule.frequent: 60 * 5,
+    CrawlerSchedule.quarter_hour: 60 * 15,
+    CrawlerSchedule.half_hour: 60 * 30,
+    CrawlerSchedule.hourly: 60 * 60,
+    CrawlerSchedule.daily: 60 * 60 * 24,
+}
+
+
+def get_schedule_seconds(schedule: Optional[CrawlerSchedule]) -> Optional[int]:
+    """Seconds between runs of a schedule"""
+    if not schedule:
+        return None
+
+    return CRAWLER_SCHEDULE_SECONDS[schedule]
+
+
 class CrawlerDefinition(BaseConfig):
     """Defines a crawler"""
 
@@ -32,12 +50,21 @@ class CrawlerDefinition(BaseConfig):
     priority: CrawlerPriority
     schedule: Optional[CrawlerSchedule]
 
+    # seconds to wait on the crawler. Defaults to the schedule interval
+    timeout: Optional[int]
+
     # crawl metadata
     last_crawled: Optional[datetime]
     last_processed: Optional[datetime]
 
     processor: Callable
 
+    def get_timeout(self) -> Optional[int]:
+        if self.timeout:
+            return self.timeout
+
+        return get_schedule_seconds(self.schedule)
+
 
 class CrawlerSet(BaseConfig):
     """Defines a set of crawlers"""
@@ -1,4 +1,12 @@
-"""WEM Crawlers"""
+"""WEM Crawlers
+
+The delayed balancing summary and facility scada files are crawled incrementally.
+The latest interval stored is kept as the crawler's last crawled meta and only
+rows after it are parsed and stored on the next run. The live files carry
+forecasts that are revised so they're stored in full each run.
+"""
+from datetime import datetime
+from typing import Optional
 
 from opennem.clients.wem import (
     get_wem_balancing_summary,
@@ -11,20 +19,35 @@ from opennem.controllers.wem import store_wem_balancingsummary_set, store_wem_fa
 from opennem.crawlers.schema import CrawlerDefinition
 
 
+def _crawl_after(crawler: CrawlerDefinition, last_crawled: bool) -> Optional[datetime]:
+    """Latest interval stored by a previous crawl"""
+    if not last_crawled:
+        return None
+
+    return crawler.last_crawled
+
+
+def _set_crawl_watermark(crawler: CrawlerDefinition, cr: ControllerReturn) -> ControllerReturn:
+    """Sets the latest interval stored as last modified so that it's saved as the
+    crawler's last crawled. Kept as is when there were no new rows"""
+    cr.last_modified = cr.max_interval or crawler.last_crawled
+    return cr
+
+
 def run_wem_balancing_crawl(
     crawler: CrawlerDefinition, last_crawled: bool = True, limit: bool = False
 ) -> ControllerReturn:
-    balancing_set = get_wem_balancing_summary()
+    balancing_set = get_wem_balancing_summary(after=_crawl_after(crawler, last_crawled))
     cr = store_wem_balancingsummary_set(balancing_set)
-    return cr
+    return _set_crawl_watermark(crawler, cr)
 
 
 def run_wem_facility_scada_crawl(
     crawler: CrawlerDefinition, last_crawled: bool = True, limit: bool = False
 ) -> ControllerReturn:
-    generated_set = get_wem_facility_intervals()
+    generated_set = get_wem_facility_intervals(after=_crawl_after(crawler, last_crawled))
     cr = store_wem_facility_intervals(generated_set)
-    return cr
+    return _set_crawl_watermark(crawler, cr)
 
 
 def run_wem_live_balancing_crawl(
@@ -1,5 +1,5 @@
 import logging
-from typing import Generator, Optional
+from typing import Any, Generator, Optional
 
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
@@ -96,3 +96,58 @@ def get_database_engine() -> Engine:
 
     """
     return engine
+
+
+_async_engine: Optional[Any] = None
+
+_async_engine_created = False
+
+
+def db_connect_async(db_conn_str: Optional[str] = None, timeout: int = 100) -> Any:
+    """
+    Creates an asyncio sqlalchemy engine using asyncpg. The async engine has its
+    own pool sized the same as the sync engine
+
+    Returns None if asyncpg is not installed
+    """
+    try:
+        import asyncpg  # noqa: F401
+        from sqlalchemy.ext.asyncio import create_async_engine
+    except ImportError:
+        logger.error("Async database access requires the asyncpg library")
+        return None
+
+    if not db_conn_str:
+        db_conn_str = settings.db_url
+
+    db_conn_str = db_conn_str.replace("postgresql://", "postgresql+asyncpg://", 1).replace(
+        "postgres://", "postgresql+asyncpg://", 1
+    )
+
+    return create_async_engine(
+        db_conn_str,
+        json_serializer=opennem_serialize,
+        json_deserializer=opennem_deserialize,
+        echo=settings.db_debug,
+        pool_size=30,
+        max_overflow=20,
+        pool_recycle=100,
+        pool_timeout=timeout,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+    )
+
+
+def get_database_engine_async() -> Optional[Any]:
+    """
+    Gets the asyncio database engine, created on first use. Returns None if
+    async access isn't available
+
+    """
+    global _async_engine, _async_engine_created
+
+    if not _async_engine_created:
+        _async_engine = db_connect_async()
+        _async_engine_created = True
+
+    return _async_engine
@@ -0,0 +1,37 @@
+# pylint: disable=no-member
+"""
+Facility scada dirty intervals ledger
+
+Revision ID: 3e6a9c2d41b7
+Revises: 109f0ddd92ad
+Create Date: 2021-12-02 10:12:44.180327
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3e6a9c2d41b7"
+down_revision = "109f0ddd92ad"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "facility_scada_dirty",
+        sa.Column("network_id", sa.Text(), nullable=False),
+        sa.Column("facility_code", sa.Text(), nullable=False),
+        sa.Column("trading_interval", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("network_id", "facility_code", "trading_interval"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("facility_scada_dirty")
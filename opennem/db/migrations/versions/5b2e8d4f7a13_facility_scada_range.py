@@ -0,0 +1,88 @@
+# pylint: disable=no-member
+"""
+Facility scada range table
+
+Revision ID: 5b2e8d4f7a13
+Revises: 8c1f5d27a9e4
+Create Date: 2021-12-08 14:12:51.204417
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b2e8d4f7a13"
+down_revision = "8c1f5d27a9e4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "facility_scada_range",
+        sa.Column("network_id", sa.Text(), nullable=False),
+        sa.Column("facility_code", sa.Text(), nullable=False),
+        sa.Column("is_forecast", sa.Boolean(), nullable=False),
+        sa.Column("data_first_seen", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("data_last_seen", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("generated_last_seen", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("energy_last_seen", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("network_id", "facility_code", "is_forecast"),
+    )
+
+    op.create_index(
+        "ix_facility_scada_range_generated_last_seen",
+        "facility_scada_range",
+        ["generated_last_seen"],
+    )
+    op.create_index(
+        "ix_facility_scada_range_energy_last_seen",
+        "facility_scada_range",
+        ["energy_last_seen"],
+    )
+
+    # seed the ranges from what is already stored
+    op.execute(
+        """
+        insert into facility_scada_range (
+            network_id,
+            facility_code,
+            is_forecast,
+            data_first_seen,
+            data_last_seen,
+            generated_last_seen,
+            energy_last_seen
+        )
+        select
+            fs.network_id,
+            fs.facility_code,
+            fs.is_forecast,
+            min(fs.trading_interval) filter (
+                where fs.generated > 0 or fs.eoi_quantity is not null
+            ),
+            max(fs.trading_interval) filter (
+                where fs.generated > 0 or fs.eoi_quantity is not null
+            ),
+            max(fs.trading_interval) filter (where fs.generated is not null),
+            max(fs.trading_interval) filter (where fs.eoi_quantity is not null)
+        from facility_scada fs
+        where fs.generated is not null or fs.eoi_quantity is not null
+        group by 1, 2, 3
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_facility_scada_range_energy_last_seen", table_name="facility_scada_range"
+    )
+    op.drop_index(
+        "ix_facility_scada_range_generated_last_seen", table_name="facility_scada_range"
+    )
+    op.drop_table("facility_scada_range")
@@ -0,0 +1,43 @@
+# pylint: disable=no-member
+"""
+Energy backfill checkpoints
+
+Revision ID: 8c1f5d27a9e4
+Revises: 3e6a9c2d41b7
+Create Date: 2021-12-03 09:41:18.520913
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8c1f5d27a9e4"
+down_revision = "3e6a9c2d41b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "energy_backfill_checkpoint",
+        sa.Column("run_id", sa.Text(), nullable=False),
+        sa.Column("network_id", sa.Text(), nullable=False),
+        sa.Column("network_region", sa.Text(), nullable=False),
+        sa.Column("fueltech_id", sa.Text(), nullable=False),
+        sa.Column("date_min", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("date_max", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("records", sa.Integer(), nullable=True),
+        sa.Column(
+            "completed_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint(
+            "run_id", "network_id", "network_region", "fueltech_id", "date_min"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("energy_backfill_checkpoint")
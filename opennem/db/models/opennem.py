@@ -703,6 +703,56 @@ class FacilityScada(Base, BaseModel):
     )
 
 
+class FacilityScadaDirty(Base):
+    """
+    Ledger of facility scada 30 minute buckets that have had readings
+    stored since energies were last calculated for them
+    """
+
+    __tablename__ = "facility_scada_dirty"
+
+    network_id = Column(Text, primary_key=True, nullable=False)
+    facility_code = Column(Text, primary_key=True, nullable=False)
+    trading_interval = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class FacilityScadaRange(Base):
+    """
+    First and last intervals each facility has been seen in facility
+    scada. Maintained by ingest - see opennem.core.facility_ranges
+    """
+
+    __tablename__ = "facility_scada_range"
+
+    network_id = Column(Text, primary_key=True, nullable=False)
+    facility_code = Column(Text, primary_key=True, nullable=False)
+    is_forecast = Column(Boolean, primary_key=True, nullable=False, default=False)
+    data_first_seen = Column(TIMESTAMP(timezone=True), nullable=True)
+    data_last_seen = Column(TIMESTAMP(timezone=True), nullable=True)
+    generated_last_seen = Column(TIMESTAMP(timezone=True), nullable=True, index=True)
+    energy_last_seen = Column(TIMESTAMP(timezone=True), nullable=True, index=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class EnergyBackfillCheckpoint(Base):
+    """
+    Partitions of an energy backfill run that have completed so that a
+    stopped run can be resumed
+    """
+
+    __tablename__ = "energy_backfill_checkpoint"
+
+    run_id = Column(Text, primary_key=True, nullable=False)
+    network_id = Column(Text, primary_key=True, nullable=False)
+    network_region = Column(Text, primary_key=True, nullable=False)
+    fueltech_id = Column(Text, primary_key=True, nullable=False)
+    date_min = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False)
+    date_max = Column(TIMESTAMP(timezone=True), nullable=False)
+    records = Column(Integer, nullable=True)
+    completed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class BalancingSummary(Base, BaseModel):
 
     __tablename__ = "balancing_summary"
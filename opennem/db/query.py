@@ -0,0 +1,212 @@
+"""
+OpenNEM query layer
+
+Queries are built as `sqlalchemy.text` statements with bound parameters so the
+SQL text for a query is the same on every call and only the parameters change,
+which removes the need to escape values into the query and lets sqlalchemy cache
+the compiled statement.
+
+Plans are only reused on the asyncio engine where asyncpg prepares statements on
+the server and caches them per connection. psycopg2 interpolates the parameters
+on the client so on the sync engine each call is planned again.
+
+Each statement is named and run through `run_query`, or `run_query_async` on the
+asyncio engine, which keep per query latency and row stats. Planning time can be
+sampled with `explain_query`. Stats are exported to prometheus when
+`prometheus_client` is installed.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+from textwrap import dedent
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import sql
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.sql.elements import TextClause
+
+from opennem.db import get_database_engine, get_database_engine_async
+from opennem.schema.core import BaseConfig
+
+_HAVE_PROMETHEUS = False
+
+try:
+    from prometheus_client import Counter, Histogram
+
+    _HAVE_PROMETHEUS = True
+except ImportError:
+    pass
+
+logger = logging.getLogger("opennem.db.query")
+
+QUERY_NAME_OPTION = "opennem_query_name"
+
+QUERY_NAME_DEFAULT = "unnamed"
+
+_PLANNING_TIME_MATCH = re.compile(r"Planning Time: ([\d\.]+) ms")
+
+
+class QueryStat(BaseConfig):
+    name: str
+    calls: int = 0
+    rows: int = 0
+    seconds_total: float = 0.0
+    seconds_max: float = 0.0
+    plan_samples: int = 0
+    plan_seconds_total: float = 0.0
+
+    @property
+    def seconds_mean(self) -> float:
+        return self.seconds_total / self.calls if self.calls else 0.0
+
+    @property
+    def plan_seconds_mean(self) -> float:
+        return self.plan_seconds_total / self.plan_samples if self.plan_samples else 0.0
+
+
+_query_stats: Dict[str, QueryStat] = {}
+_query_stats_lock = threading.Lock()
+
+if _HAVE_PROMETHEUS:
+    _prometheus_query_seconds = Histogram(
+        "opennem_query_seconds", "Query execution time in seconds", ["query"]
+    )
+    _prometheus_query_rows = Counter("opennem_query_rows", "Rows returned by query", ["query"])
+    _prometheus_query_plan_seconds = Histogram(
+        "opennem_query_plan_seconds", "Sampled query planning time in seconds", ["query"]
+    )
+
+
+def bind_query(name: str, query: str, **params: Any) -> TextClause:
+    """Build a named text statement from query with params bound. Lists are bound
+    as arrays so use `= ANY(:param)` rather than `IN` to keep the text stable"""
+    return (
+        sql.text(dedent(query))
+        .bindparams(**params)
+        .execution_options(**{QUERY_NAME_OPTION: name})
+    )
+
+
+def get_query_name(statement: Any) -> str:
+    if isinstance(statement, TextClause):
+        return statement.get_execution_options().get(QUERY_NAME_OPTION, QUERY_NAME_DEFAULT)
+
+    return QUERY_NAME_DEFAULT
+
+
+def _get_stat(name: str) -> QueryStat:
+    if name not in _query_stats:
+        _query_stats[name] = QueryStat(name=name)
+
+    return _query_stats[name]
+
+
+def record_query(name: str, seconds: float, rows: int) -> None:
+    with _query_stats_lock:
+        stat = _get_stat(name)
+        stat.calls += 1
+        stat.rows += rows
+        stat.seconds_total += seconds
+        stat.seconds_max = max(stat.seconds_max, seconds)
+
+    if _HAVE_PROMETHEUS:
+        _prometheus_query_seconds.labels(query=name).observe(seconds)
+        _prometheus_query_rows.labels(query=name).inc(rows)
+
+
+def record_query_plan(name: str, seconds: float) -> None:
+    with _query_stats_lock:
+        stat = _get_stat(name)
+        stat.plan_samples += 1
+        stat.plan_seconds_total += seconds
+
+    if _HAVE_PROMETHEUS:
+        _prometheus_query_plan_seconds.labels(query=name).observe(seconds)
+
+
+def get_query_stats() -> List[QueryStat]:
+    """Query stats ordered by total time"""
+    with _query_stats_lock:
+        stats = [i.copy() for i in _query_stats.values()]
+
+    return sorted(stats, key=lambda i: i.seconds_total, reverse=True)
+
+
+def reset_query_stats() -> None:
+    with _query_stats_lock:
+        _query_stats.clear()
+
+
+def run_query(statement: Any, engine: Optional[Engine] = None) -> List[Any]:
+    """Run a statement and return all the rows recording the query stats under
+    the statement name"""
+    if not engine:
+        engine = get_database_engine()
+
+    name = get_query_name(statement)
+
+    query_start = time.perf_counter()
+
+    with engine.connect() as c:
+        logger.debug(statement)
+        rows = list(c.execute(statement))
+
+    record_query(name, time.perf_counter() - query_start, len(rows))
+
+    return rows
+
+
+async def run_query_async(statement: Any, engine: Optional[Any] = None) -> List[Any]:
+    """Run a statement on the asyncio engine and return all the rows. Without
+    asyncpg installed the statement is run with run_query in the default executor"""
+    if not engine:
+        engine = get_database_engine_async()
+
+    if not engine:
+        return await asyncio.get_running_loop().run_in_executor(None, run_query, statement)
+
+    # the asyncio engine only runs executables
+    if isinstance(statement, str):
+        statement = sql.text(statement)
+
+    name = get_query_name(statement)
+
+    query_start = time.perf_counter()
+
+    async with engine.connect() as c:
+        logger.debug(statement)
+        result = await c.execute(statement)
+        rows = list(result.fetchall())
+
+    record_query(name, time.perf_counter() - query_start, len(rows))
+
+    return rows
+
+
+def explain_query(statement: TextClause, engine: Optional[Engine] = None) -> Optional[float]:
+    """Sample the planning time for a statement in seconds without running it"""
+    if not engine:
+        engine = get_database_engine()
+
+    name = get_query_name(statement)
+
+    explain_statement = sql.text("explain (summary true) " + statement.text).bindparams(
+        **statement.compile().params
+    )
+
+    with engine.connect() as c:
+        plan_rows = list(c.execute(explain_statement))
+
+    for row in plan_rows:
+        planning_time = _PLANNING_TIME_MATCH.search(row[0])
+
+        if planning_time:
+            plan_seconds = float(planning_time.group(1)) / 1000
+            record_query_plan(name, plan_seconds)
+            return plan_seconds
+
+    logger.warning("No planning time in explain for {}".format(name))
+
+    return None
@@ -1,16 +1,24 @@
 """
 OpenNEM S3 Bucket Module
 
-Writes OpennemDataSet's to AWS S3 buckets
+Writes OpennemDataSet's to AWS S3 buckets through the export store
+
+:see_also: opennem/exporter/storage.py
 """
 import json
 import logging
 from typing import Any, Optional
 
-import boto3
 from botocore.exceptions import ClientError
 
 from opennem.api.stats.schema import OpennemDataSet
+from opennem.api.stats.serializer import stat_set_to_json
+from opennem.exporter.storage import (
+    ExportWriteResult,
+    S3ExportStore,
+    get_content_hash,
+    write_export_object,
+)
 from opennem.settings import settings
 from opennem.utils.url import urljoin
 
@@ -18,12 +26,10 @@ logger = logging.getLogger(__name__)
 
 
 class OpennemDataSetSerializeS3:
-    bucket_name: str
-    debug: bool = False
     exclude_unset: bool = False
 
     def __init__(self, bucket_name: str, exclude_unset: bool = False, debug: bool = False) -> None:
-        self.bucket = boto3.resource("s3").Bucket(bucket_name)
+        self.store = S3ExportStore(bucket_name)
         self.debug = settings.debug
 
         if debug:
@@ -33,110 +39,88 @@ class OpennemDataSetSerializeS3:
 
     # @TODO return a full OpennemDataSet
     def load(self, key: str) -> Any:
-        return json.load(self.bucket.Object(key=key).get()["Body"])
+        return json.loads(self.store.get(key))
+
+    def dump(
+        self, key: str, stat_set: OpennemDataSet, exclude: Optional[set] = None
+    ) -> ExportWriteResult:
+        return write_export_object(
+            key,
+            _serialize_stat_set(stat_set, self.exclude_unset, exclude),
+            store=self.store,
+            data_hash=get_stat_set_data_hash(stat_set, self.exclude_unset, exclude),
+        )
 
-    def dump(self, key: str, stat_set: OpennemDataSet, exclude: Optional[set] = None) -> Any:
+    def write(
+        self, key: str, content: str, content_type: str = "application/json"
+    ) -> ExportWriteResult:
+        return write_export_object(key, content, content_type=content_type, store=self.store)
 
-        indent = None
 
-        if settings.debug:
-            indent = 4
+def _serialize_stat_set(
+    stat_set: OpennemDataSet, exclude_unset: bool = False, exclude: Optional[set] = None
+) -> str:
+    indent = None
 
-        stat_set_content = stat_set.json(
-            exclude_unset=self.exclude_unset, indent=indent, exclude=exclude
-        )
+    if settings.debug:
+        indent = 4
 
-        obj = self.bucket.Object(key=key)
-        _write_response = obj.put(Body=stat_set_content, ContentType="application/json")
+    if exclude:
+        return stat_set.json(exclude_unset=exclude_unset, indent=indent, exclude=exclude)
 
-        _write_response["length"] = len(stat_set_content)
+    return stat_set_to_json(stat_set, exclude_unset=exclude_unset, indent=indent)
 
-        return _write_response
 
-    def write(self, key: str, content: str, content_type: str = "application/json") -> Any:
-        obj = self.bucket.Object(key=key)
-        _write_response = obj.put(Body=content, ContentType=content_type)
+def get_stat_set_data_hash(
+    stat_set: OpennemDataSet, exclude_unset: bool = False, exclude: Optional[set] = None
+) -> str:
+    """Hash of a stat set without the fields that are set on every run so unchanged
+    data has the same hash"""
+    stat_set_data = stat_set.copy(update={"created_at": None, "version": None})
 
-        _write_response["length"] = len(content)
+    return get_content_hash(_serialize_stat_set(stat_set_data, exclude_unset, exclude))
 
-        return _write_response
 
-
-def write_statset_to_s3(
-    stat_set: OpennemDataSet, file_path: str, exclude: set = None, exclude_unset: bool = False
+def _write_export(
+    file_path: str,
+    content: str,
+    content_type: str = "application/json",
+    data_hash: Optional[str] = None,
 ) -> int:
-    """
-    Write an Opennem data set to an s3 bucket using boto
-    """
     s3_save_path = urljoin(f"https://{settings.s3_bucket_path}", file_path)
 
-    if file_path.startswith("/"):
-        file_path = file_path[1:]
-
-    if not settings.s3_bucket_path:
-        raise Exception("Require an S3 bucket to write to")
-
-    s3bucket = OpennemDataSetSerializeS3(settings.s3_bucket_path, exclude_unset=exclude_unset)
-    write_response = None
-
     try:
-        write_response = s3bucket.dump(file_path, stat_set, exclude=exclude)
+        write_result = write_export_object(
+            file_path, content, content_type=content_type, data_hash=data_hash
+        )
     except ClientError as e:
         logging.error(e)
         return 0
 
-    if "ResponseMetadata" not in write_response:
-        raise Exception("Error writing stat set to {} invalid write response".format(file_path))
-
-    if "HTTPStatusCode" not in write_response["ResponseMetadata"]:
-        raise Exception("Error writing stat set to {} invalid write response".format(file_path))
+    if write_result.unchanged:
+        logger.info("Unchanged {}".format(s3_save_path))
+    else:
+        logger.info("Wrote {} to {}".format(write_result.byte_count, s3_save_path))
 
-    if write_response["ResponseMetadata"]["HTTPStatusCode"] != 200:
-        raise Exception(
-            "Error writing stat set to {} - response code {}".format(
-                file_path, write_response["ResponseMetadata"]["HTTPStatusCode"]
-            )
-        )
+    return write_result.byte_count
 
-    logger.info("Wrote {} to {}".format(write_response["length"], s3_save_path))
 
-    return write_response["length"]
+def write_statset_to_s3(
+    stat_set: OpennemDataSet, file_path: str, exclude: set = None, exclude_unset: bool = False
+) -> int:
+    """
+    Write an Opennem data set to the export store. Returns the bytes written which is
+    0 if the stored data set is unchanged
+    """
+    return _write_export(
+        file_path,
+        _serialize_stat_set(stat_set, exclude_unset, exclude),
+        data_hash=get_stat_set_data_hash(stat_set, exclude_unset, exclude),
+    )
 
 
 def write_to_s3(content: str, file_path: str, content_type: str = "application/json") -> int:
     """
-    Write a string to s3
+    Write a string to the export store
     """
-    s3_save_path = urljoin(f"https://{settings.s3_bucket_path}", file_path)
-
-    if file_path.startswith("/"):
-        file_path = file_path[1:]
-
-    if not settings.s3_bucket_path:
-        raise Exception("Require an S3 bucket to write to")
-
-    s3bucket = OpennemDataSetSerializeS3(settings.s3_bucket_path)
-    write_response = None
-
-    try:
-        write_response = s3bucket.write(file_path, content, content_type=content_type)
-    except ClientError as e:
-        logging.error(e)
-        return 0
-
-    if "ResponseMetadata" not in write_response:
-        raise Exception("Error writing stat set to {} invalid write response".format(file_path))
-
-    if "HTTPStatusCode" not in write_response["ResponseMetadata"]:
-        raise Exception("Error writing stat set to {} invalid write response".format(file_path))
-
-    if write_response["ResponseMetadata"]["HTTPStatusCode"] != 200:
-        raise Exception(
-            "Error writing stat set to {} - response code {}".format(
-                file_path, write_response["ResponseMetadata"]["HTTPStatusCode"]
-            )
-        )
-
-    logger.info("Wrote {} to {}".format(write_response["length"], s3_save_path))
-
-    return write_response["length"]
+    return _write_export(file_path, content, content_type=content_type)
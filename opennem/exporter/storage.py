@@ -0,0 +1,303 @@
+"""
+OpenNEM export object storage
+
+Writes exported objects to a store - S3 in production or a local folder standing
+in for a bucket when testing.
+
+Bodies are compressed (gzip, or brotli if the library is installed) and uploaded
+with the matching Content-Encoding. Each object is stored with a hash of its data
+in its metadata. The upload is skipped if the stored hash is the same, so
+unchanged historic exports are not uploaded again each run. Stat sets are hashed
+without the fields that change every run (see opennem.exporter.aws). Other content
+is hashed as is.
+
+The S3 client is created once and shared by all writes in a process.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from opennem.schema.core import BaseConfig
+from opennem.settings import settings
+
+_HAVE_BROTLI = False
+
+try:
+    import brotli
+
+    _HAVE_BROTLI = True
+except ImportError:
+    pass
+
+logger = logging.getLogger("opennem.exporter.storage")
+
+EXPORT_ENCODING_GZIP = "gzip"
+EXPORT_ENCODING_BROTLI = "br"
+
+# object metadata key the data hash is stored under
+EXPORT_DATA_HASH_META = "data-hash"
+
+
+class ExportStoreException(Exception):
+    pass
+
+
+class ExportWriteResult(BaseConfig):
+    key: str
+    byte_count: int = 0
+    content_encoding: Optional[str]
+    unchanged: bool = False
+
+
+def get_content_hash(body: Union[str, bytes]) -> str:
+    """MD5 of the content"""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+
+    return hashlib.md5(body).hexdigest()
+
+
+def encode_body(body: bytes, encoding: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+    """Compress body with encoding. Returns the body and the content encoding used"""
+    if not encoding:
+        return body, None
+
+    if encoding == EXPORT_ENCODING_BROTLI:
+        if _HAVE_BROTLI:
+            return brotli.compress(body), EXPORT_ENCODING_BROTLI
+
+        logger.warning("Brotli export compression requires the brotli library. Using gzip")
+        encoding = EXPORT_ENCODING_GZIP
+
+    if encoding == EXPORT_ENCODING_GZIP:
+        return gzip.compress(body, mtime=0), EXPORT_ENCODING_GZIP
+
+    raise ExportStoreException("Unknown export compression: {}".format(encoding))
+
+
+def decode_body(body: bytes, encoding: Optional[str] = None) -> bytes:
+    if encoding == EXPORT_ENCODING_GZIP:
+        return gzip.decompress(body)
+
+    if encoding == EXPORT_ENCODING_BROTLI:
+        if not _HAVE_BROTLI:
+            raise ExportStoreException("Decoding brotli requires the brotli library")
+
+        return brotli.decompress(body)
+
+    return body
+
+
+class ExportStore(ABC):
+    """Base for export object stores"""
+
+    @abstractmethod
+    def get_data_hash(self, key: str) -> Optional[str]:
+        """Data hash of the stored object or None if it doesn't exist or has none"""
+
+    @abstractmethod
+    def put(
+        self,
+        key: str,
+        body: bytes,
+        content_type: str,
+        content_encoding: Optional[str] = None,
+        data_hash: Optional[str] = None,
+    ) -> None:
+        """Store the encoded body at key"""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """Stored object body decoded"""
+
+
+class S3ExportStore(ExportStore):
+    def __init__(self, bucket_name: str, client: Optional[Any] = None) -> None:
+        self.bucket_name = bucket_name
+        self.client = client or get_s3_client()
+
+    def get_data_hash(self, key: str) -> Optional[str]:
+        from botocore.exceptions import ClientError
+
+        try:
+            object_head = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ["404", "NoSuchKey", "NotFound"]:
+                return None
+            raise e
+
+        return object_head.get("Metadata", {}).get(EXPORT_DATA_HASH_META)
+
+    def put(
+        self,
+        key: str,
+        body: bytes,
+        content_type: str,
+        content_encoding: Optional[str] = None,
+        data_hash: Optional[str] = None,
+    ) -> None:
+        put_args: Dict[str, Any] = {
+            "Bucket": self.bucket_name,
+            "Key": key,
+            "Body": body,
+            "ContentType": content_type,
+        }
+
+        if content_encoding:
+            put_args["ContentEncoding"] = content_encoding
+
+        if data_hash:
+            put_args["Metadata"] = {EXPORT_DATA_HASH_META: data_hash}
+
+        write_response = self.client.put_object(**put_args)
+
+        status_code = write_response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+
+        if status_code != 200:
+            raise ExportStoreException(
+                "Error writing {} - response code {}".format(key, status_code)
+            )
+
+    def get(self, key: str) -> bytes:
+        object_response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+
+        return decode_body(object_response["Body"].read(), object_response.get("ContentEncoding"))
+
+
+class LocalExportStore(ExportStore):
+    """Stores objects in a local folder. Metadata is kept in a sidecar file next to
+    each object. Used in place of S3 for testing"""
+
+    def __init__(self, root_path: Union[str, Path]) -> None:
+        self.root_path = Path(root_path)
+
+    def _object_path(self, key: str) -> Path:
+        return self.root_path / key.lstrip("/")
+
+    def _meta_path(self, key: str) -> Path:
+        object_path = self._object_path(key)
+        return object_path.with_name(object_path.name + ".meta.json")
+
+    def get_data_hash(self, key: str) -> Optional[str]:
+        meta_path = self._meta_path(key)
+
+        if not meta_path.is_file():
+            return None
+
+        return json.loads(meta_path.read_text()).get("data_hash")
+
+    def put(
+        self,
+        key: str,
+        body: bytes,
+        content_type: str,
+        content_encoding: Optional[str] = None,
+        data_hash: Optional[str] = None,
+    ) -> None:
+        object_path = self._object_path(key)
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+
+        object_path.write_bytes(body)
+
+        self._meta_path(key).write_text(
+            json.dumps(
+                {
+                    "content_type": content_type,
+                    "content_encoding": content_encoding,
+                    "data_hash": data_hash,
+                }
+            )
+        )
+
+    def get(self, key: str) -> bytes:
+        meta = json.loads(self._meta_path(key).read_text())
+
+        return decode_body(self._object_path(key).read_bytes(), meta.get("content_encoding"))
+
+
+_s3_client: Optional[Any] = None
+_s3_client_lock = threading.Lock()
+
+_export_store: Optional[ExportStore] = None
+
+
+def get_s3_client() -> Any:
+    """Shared S3 client. boto3 clients are safe to share between threads"""
+    global _s3_client
+
+    with _s3_client_lock:
+        if not _s3_client:
+            import boto3
+
+            _s3_client = boto3.client("s3")
+
+    return _s3_client
+
+
+def get_export_store() -> ExportStore:
+    """The store exports are written to. Defaults to the S3 bucket in settings"""
+    global _export_store
+
+    if not _export_store:
+        if not settings.s3_bucket_path:
+            raise ExportStoreException("Require an S3 bucket to write to")
+
+        _export_store = S3ExportStore(settings.s3_bucket_path)
+
+    return _export_store
+
+
+def set_export_store(store: Optional[ExportStore]) -> None:
+    """Set the store exports are written to. None resets it to the S3 bucket"""
+    global _export_store
+
+    _export_store = store
+
+
+def write_export_object(
+    key: str,
+    content: Union[str, bytes],
+    content_type: str = "application/json",
+    store: Optional[ExportStore] = None,
+    data_hash: Optional[str] = None,
+) -> ExportWriteResult:
+    """Write content to the export store. Skips the write if the stored object has
+    the same data hash. data_hash defaults to the hash of the content"""
+    if not store:
+        store = get_export_store()
+
+    key = key.lstrip("/")
+
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    if not data_hash:
+        data_hash = get_content_hash(content)
+
+    result = ExportWriteResult(key=key)
+
+    if settings.export_skip_unchanged and store.get_data_hash(key) == data_hash:
+        logger.debug("Export {} is unchanged".format(key))
+        result.unchanged = True
+        return result
+
+    body, content_encoding = encode_body(content, settings.export_compression)
+
+    result.content_encoding = content_encoding
+
+    store.put(
+        key,
+        body,
+        content_type=content_type,
+        content_encoding=content_encoding,
+        data_hash=data_hash,
+    )
+
+    result.byte_count = len(body)
+
+    return result
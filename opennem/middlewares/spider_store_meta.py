@@ -6,10 +6,11 @@ Stores metadata about a spider crawl
 
 import logging
 from datetime import datetime
+from typing import Any, Dict
 
 from scrapy import signals
 
-from opennem.core.crawlers.meta import CrawlStatTypes, crawler_set_meta
+from opennem.core.crawlers.meta import CrawlStatTypes, crawler_set_meta, crawler_set_meta_many
 
 logger = logging.getLogger("opennem.extensions.spider_store_meta")
 
@@ -36,10 +37,12 @@ class ExtensionSpiderStoreMeta:
     def spider_closed(self, spider):  # type: ignore
         logger.info("closed spider %s", spider.name)
 
-        crawler_set_meta(spider.name, CrawlStatTypes.last_crawled, datetime.now())
+        spider_meta: Dict[CrawlStatTypes, Any] = {CrawlStatTypes.last_crawled: datetime.now()}
 
         if hasattr(spider, "data"):
-            crawler_set_meta(spider.name, CrawlStatTypes.data, spider.data)
+            spider_meta[CrawlStatTypes.data] = spider.data
+
+        crawler_set_meta_many(spider.name, spider_meta)
 
     def item_scraped(self, item, spider):  # type: ignore
         if isinstance(item, dict) and "_data" in item:
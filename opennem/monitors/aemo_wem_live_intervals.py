@@ -33,7 +33,7 @@ def get_aemo_wem_live_facility_intervals_recent_date() -> datetime:
     if not csvreader.fieldnames or len(csvreader.fieldnames) < 1:
         logger.error("WEM live facility intervals returning bad CSV: {}".format(LIVE_FACILITIES))
 
-    records = unit_scada_generate_facility_scada(
+    records, _ = unit_scada_generate_facility_scada(
         records=csvreader,
         interval_field="PERIOD",
         facility_code_field="FACILITY_CODE",
@@ -3,6 +3,9 @@ OpenNEM Bulk Insert Pipeline
 
 Bulk inserts records using temporary tables and CSV imports with copy_from
 
+`bulk_upsert` is the chunked alternative that copies in binary through a staging
+table kept on the connection and reports per-chunk counts and timings
+
 This is by far the fastest way to bulk insert large records sets of consistent width
 and supports on conflict upserts with postgres
 
@@ -13,15 +16,23 @@ from `csv.py`
 
 """
 import logging
+import time
 from datetime import datetime
 from io import StringIO
-from typing import Any, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Union
 
 # from sqlalchemy.exc import StatementError
 from sqlalchemy.sql.schema import Column, Table
 
 from opennem.core.crawlers.meta import CrawlStatTypes, crawler_set_meta
 from opennem.db import get_database_engine
+from opennem.pipelines.copy_binary import (
+    generate_copy_binary_from_records,
+    get_copy_column_list,
+    get_session_timezone,
+)
+from opennem.schema.core import BaseConfig
+from opennem.settings import settings
 from opennem.utils.pipelines import check_spider_pipeline
 
 logger = logging.getLogger(__name__)
@@ -31,7 +42,7 @@ BULK_INSERT_QUERY = """
     (LIKE {table_schema}{table_name} INCLUDING DEFAULTS)
     ON COMMIT DROP;
 
-    COPY __tmp_{table_name}_{tmp_table_name} FROM STDIN WITH (FORMAT CSV, HEADER TRUE, DELIMITER ',');
+    COPY __tmp_{table_name}_{tmp_table_name} {copy_columns} FROM STDIN WITH ({copy_options});
 
     INSERT INTO {table_schema}{table_name}
         SELECT *
@@ -39,18 +50,40 @@ BULK_INSERT_QUERY = """
     ON CONFLICT {on_conflict}
 """
 
+# copy formats. binary streams are generated by `copy_binary.py`
+COPY_FORMAT_CSV = "csv"
+COPY_FORMAT_BINARY = "binary"
+
+BULK_INSERT_COPY_OPTIONS = {
+    COPY_FORMAT_CSV: "FORMAT CSV, HEADER TRUE, DELIMITER ','",
+    COPY_FORMAT_BINARY: "FORMAT BINARY",
+}
+
+# bulk upsert queries. the staging table is created per connection and emptied on commit
+BULK_UPSERT_STAGING_QUERY = """
+    CREATE TEMP TABLE IF NOT EXISTS {staging_table}
+    (LIKE {table_schema}{table_name} INCLUDING DEFAULTS)
+    ON COMMIT DELETE ROWS
+"""
+
+BULK_UPSERT_COPY_QUERY = """
+    COPY {staging_table} {copy_columns} FROM STDIN WITH ({copy_options})
+"""
+
+BULK_UPSERT_QUERY = """
+    INSERT INTO {table_schema}{table_name}
+        SELECT *
+        FROM {staging_table}
+    ON CONFLICT {on_conflict}
+"""
+
 BULK_INSERT_CONFLICT_UPDATE = """
     ({pk_columns}) DO UPDATE set {update_values}
 """
 
 
-def build_insert_query(
-    table: Table,
-    update_cols: List[Union[str, Column]] = None,
-) -> str:
-    """
-    Builds the bulk insert query
-    """
+def _get_on_conflict(table: Table, update_cols: Optional[List[Union[str, Column]]] = None) -> str:
+    """Build the on conflict clause updating update_cols"""
     on_conflict = "DO NOTHING"
 
     def get_column_name(column: Union[str, Column]) -> str:
@@ -75,8 +108,11 @@ def build_insert_query(
             update_values=", ".join([f"{n} = EXCLUDED.{n}" for n in update_col_names]),
         )
 
-    # Table schema
-    table_schema: str = ""
+    return on_conflict
+
+
+def _get_table_schema(table: Table) -> str:
+    """Get the schema name of a table if it has one set"""
     _ts: str = ""
 
     if hasattr(table, "__table_args__"):
@@ -90,9 +126,31 @@ def build_insert_query(
                     _ts = i["schema"]  # type: ignore
 
         if not _ts:
-            logger.warn("Table schema not found for table: {}".format(table.__table__.name))
-        else:
-            table_schema = f"{_ts}."
+            logger.warning("Table schema not found for table: {}".format(table.__table__.name))
+
+    return _ts
+
+
+def build_insert_query(
+    table: Table,
+    update_cols: List[Union[str, Column]] = None,
+    copy_format: str = COPY_FORMAT_CSV,
+) -> str:
+    """
+    Builds the bulk insert query. copy_format selects whether the copy reads
+    CSV or the binary format from `copy_binary.generate_copy_binary_from_records`
+    """
+    if copy_format not in BULK_INSERT_COPY_OPTIONS:
+        raise Exception("Invalid copy format: {}".format(copy_format))
+
+    on_conflict = _get_on_conflict(table, update_cols)
+
+    # Table schema
+    table_schema: str = ""
+    _ts = _get_table_schema(table)
+
+    if _ts:
+        table_schema = f"{_ts}."
 
     # Temporary table name uniq
     tmp_table_name: str = ""
@@ -102,11 +160,20 @@ def build_insert_query(
     if _ts:
         tmp_table_name = f"{_ts}_{tmp_table_name}"
 
+    # binary rows are encoded in model column order which isn't always the physical
+    # table order. csv rows are in record key order so are left to the header
+    copy_columns = ""
+
+    if copy_format == COPY_FORMAT_BINARY:
+        copy_columns = get_copy_column_list(table)
+
     query = BULK_INSERT_QUERY.format(
         table_name=table.__table__.name,  # type: ignore
         table_schema=table_schema,
         on_conflict=on_conflict,
         tmp_table_name=tmp_table_name,
+        copy_columns=copy_columns,
+        copy_options=BULK_INSERT_COPY_OPTIONS[copy_format],
     )
 
     logger.debug(query)
@@ -114,10 +181,168 @@ def build_insert_query(
     return query
 
 
+class BulkUpsertChunk(BaseConfig):
+    rows: int
+    upserted: int
+    seconds: float
+    error: Optional[str]
+
+
+class BulkUpsertResult(BaseConfig):
+    table_name: str
+    chunks: List[BulkUpsertChunk] = []
+
+    @property
+    def rows(self) -> int:
+        return sum([c.rows for c in self.chunks if not c.error])
+
+    @property
+    def upserted(self) -> int:
+        return sum([c.upserted for c in self.chunks if not c.error])
+
+    @property
+    def errors(self) -> int:
+        return len([c for c in self.chunks if c.error])
+
+    @property
+    def seconds(self) -> float:
+        return sum([c.seconds for c in self.chunks])
+
+
+def _staging_table_name(table: Table) -> str:
+    _ts = _get_table_schema(table)
+
+    if _ts:
+        return f"__staging_{_ts}_{table.__table__.name}"  # type: ignore
+
+    return f"__staging_{table.__table__.name}"  # type: ignore
+
+
+def bulk_upsert(
+    table: Table,
+    records: List[Dict],
+    update_cols: Optional[List[Union[str, Column]]] = None,
+    chunk_size: Optional[int] = None,
+    before_commit: Optional[Callable[[Any, List[Dict]], None]] = None,
+) -> BulkUpsertResult:
+    """
+    Upsert records into table through a staging table that is kept on the
+    connection and cleared on each commit. Records are copied in binary and
+    committed in chunks of chunk_size so large backfills don't hold long locks
+    on the table while live crawlers write to it.
+
+    before_commit is called with the cursor and chunk records to write related
+    records in the same transaction
+    """
+    if not chunk_size:
+        chunk_size = settings.bulk_insert_chunk_size
+
+    result = BulkUpsertResult(table_name=table.__table__.name)  # type: ignore
+
+    if not records:
+        return result
+
+    table_schema = _get_table_schema(table)
+
+    staging_table = _staging_table_name(table)
+
+    staging_query = BULK_UPSERT_STAGING_QUERY.format(
+        staging_table=staging_table,
+        table_schema=f"{table_schema}." if table_schema else "",
+        table_name=table.__table__.name,  # type: ignore
+    )
+
+    copy_query = BULK_UPSERT_COPY_QUERY.format(
+        staging_table=staging_table,
+        copy_columns=get_copy_column_list(table),
+        copy_options=BULK_INSERT_COPY_OPTIONS[COPY_FORMAT_BINARY],
+    )
+
+    upsert_query = BULK_UPSERT_QUERY.format(
+        staging_table=staging_table,
+        table_schema=f"{table_schema}." if table_schema else "",
+        table_name=table.__table__.name,  # type: ignore
+        on_conflict=_get_on_conflict(table, update_cols),
+    )
+
+    conn = get_database_engine().raw_connection()
+
+    try:
+        cursor = conn.cursor()
+
+        # staging table lives as long as the connection and is emptied on commit
+        cursor.execute(staging_query)
+        naive_timezone = get_session_timezone(cursor)
+        conn.commit()
+
+        for chunk_start in range(0, len(records), chunk_size):
+            chunk_records = records[chunk_start : chunk_start + chunk_size]
+            chunk_timer = time.perf_counter()
+            chunk_error: Optional[str] = None
+            upserted = 0
+
+            try:
+                cursor.copy_expert(
+                    copy_query,
+                    generate_copy_binary_from_records(
+                        table, chunk_records, naive_timezone=naive_timezone
+                    ),
+                )
+                cursor.execute(upsert_query)
+                upserted = cursor.rowcount
+
+                if before_commit:
+                    before_commit(cursor, chunk_records)
+
+                conn.commit()
+            except Exception as generic_error:
+                conn.rollback()
+
+                if hasattr(generic_error, "hide_parameters"):
+                    generic_error.hide_parameters = True  # type: ignore
+
+                chunk_error = str(generic_error)
+                logger.error(generic_error)
+
+            chunk = BulkUpsertChunk(
+                rows=len(chunk_records),
+                upserted=upserted,
+                seconds=time.perf_counter() - chunk_timer,
+                error=chunk_error,
+            )
+            result.chunks.append(chunk)
+
+            logger.debug(
+                "{}: chunk {} upserted {} of {} rows in {:.2f}s".format(
+                    result.table_name,
+                    len(result.chunks),
+                    chunk.upserted,
+                    chunk.rows,
+                    chunk.seconds,
+                )
+            )
+    finally:
+        conn.close()
+
+    logger.info(
+        "{}: upserted {} of {} rows in {} chunks in {:.2f}s with {} errors".format(
+            result.table_name,
+            result.upserted,
+            len(records),
+            len(result.chunks),
+            result.seconds,
+            result.errors,
+        )
+    )
+
+    return result
+
+
 class BulkInsertPipeline(object):
     @check_spider_pipeline
     def process_item(self, item: List[dict], spider):
         num_records = 0
+        duplicate_records = 0
         conn = get_database_engine().raw_connection()
 
         if not isinstance(item, list):
@@ -166,6 +391,8 @@ class BulkInsertPipeline(object):
             except Exception:
                 pass
 
+            duplicate_records += single_item.get("duplicate_records", 0)
+
         # store the latest processed date
         if num_records > 0:
             last_processed_dt: Optional[datetime] = None
@@ -179,4 +406,7 @@ class BulkInsertPipeline(object):
             if last_processed_dt:
                 crawler_set_meta(spider.name, CrawlStatTypes.latest_processed, last_processed_dt)
 
-        return {"num_records": num_records}
+        if duplicate_records:
+            logger.info("Dropped {} duplicate records".format(duplicate_records))
+
+        return {"num_records": num_records, "duplicate_records": duplicate_records}
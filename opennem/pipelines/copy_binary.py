@@ -0,0 +1,387 @@
+"""
+OpenNEM Binary COPY encoder
+
+Encodes records into the PostgreSQL binary COPY format straight from typed python
+values so datetimes and numerics are not formatted into strings only to be parsed
+again by postgres. This is the binary alternative to `generate_csv_from_records` in
+`csv.py` and is selected with `copy_format` in `bulk_insert.build_insert_query`
+
+Columns are encoded in model declaration order and named in the COPY statement
+since later migrations have left the physical column order of tables different
+
+Rows are encoded in chunks as the stream is read by `copy_expert` rather than
+into one buffer
+
+@see https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+"""
+import logging
+import struct
+from datetime import date, datetime, timedelta, tzinfo
+from decimal import Decimal
+from functools import lru_cache
+from io import BufferedReader, BytesIO
+from typing import Any, Callable, Dict, Iterator, List, Union
+
+import pytz
+from sqlalchemy.sql.schema import Column, Table
+from sqlalchemy.types import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    Integer,
+    Numeric,
+    SmallInteger,
+    String,
+)
+
+from opennem.db.models.opennem import BalancingSummary, FacilityScada
+from opennem.utils.handlers import chain_streams
+
+logger = logging.getLogger(__name__)
+
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+
+# number of rows encoded per chunk of the stream
+COPY_BINARY_CHUNK_SIZE = 10000
+
+COPY_BINARY_NULL = struct.pack("!i", -1)
+
+COPY_BINARY_TRUE = struct.pack("!i?", 1, True)
+COPY_BINARY_FALSE = struct.pack("!i?", 1, False)
+
+POSTGRES_EPOCH = datetime(2000, 1, 1)
+
+POSTGRES_EPOCH_DATE = date(2000, 1, 1)
+
+# numeric sign flags
+NUMERIC_POS = 0x0000
+NUMERIC_NEG = 0x4000
+NUMERIC_NAN = 0xC000
+
+# number of distinct encoded values cached per column type
+NUMERIC_CACHE_SIZE = 1024 * 64
+TEXT_CACHE_SIZE = 1024 * 4
+TIMESTAMP_CACHE_SIZE = 1024 * 16
+
+ColumnEncoder = Callable[[Any], bytes]
+
+
+class CopyBinaryException(Exception):
+    pass
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _encode_text(value: Any) -> bytes:
+    value_encoded = str(value).encode("utf-8")
+    return struct.pack("!i", len(value_encoded)) + value_encoded
+
+
+def _encode_bool(value: Any) -> bytes:
+    return COPY_BINARY_TRUE if value else COPY_BINARY_FALSE
+
+
+def _encode_int2(value: Any) -> bytes:
+    return struct.pack("!ih", 2, int(value))
+
+
+def _encode_int4(value: Any) -> bytes:
+    return struct.pack("!ii", 4, int(value))
+
+
+def _encode_int8(value: Any) -> bytes:
+    return struct.pack("!iq", 8, int(value))
+
+
+def _encode_float8(value: Any) -> bytes:
+    return struct.pack("!id", 8, float(value))
+
+
+def _pack_numeric(sign: bool, integer_part: str, fraction_part: str) -> bytes:
+    """Pack the digits either side of the decimal point into a postgres numeric which
+    is stored as base 10000 digit groups"""
+    dscale = len(fraction_part)
+    fraction_groups = (dscale + 3) // 4
+
+    # all the digits as one integer with the fraction padded out to whole groups
+    digits_value = int(integer_part + fraction_part.ljust(fraction_groups * 4, "0") or "0")
+
+    # groups are split out least significant first
+    groups: List[int] = []
+
+    while digits_value:
+        digits_value, group = divmod(digits_value, 10000)
+        groups.append(group)
+
+    weight = len(groups) - fraction_groups - 1
+
+    # strip trailing zero groups
+    trailing_zeros = 0
+
+    while trailing_zeros < len(groups) and groups[trailing_zeros] == 0:
+        trailing_zeros += 1
+
+    groups = groups[trailing_zeros:][::-1]
+
+    if not groups:
+        weight = 0
+
+    return struct.pack(
+        "!ihhHh{}h".format(len(groups)),
+        8 + 2 * len(groups),
+        len(groups),
+        weight,
+        NUMERIC_NEG if sign and groups else NUMERIC_POS,
+        dscale,
+        *groups,
+    )
+
+
+def _encode_decimal(value: Decimal) -> bytes:
+    if value.is_nan():
+        return struct.pack("!ihhHh", 8, 0, 0, NUMERIC_NAN, 0)
+
+    if value.is_infinite():
+        raise CopyBinaryException("Numeric does not support infinity: {}".format(value))
+
+    sign, digits, exponent = value.as_tuple()
+
+    digits_str = "".join(str(d) for d in digits)
+
+    if exponent > 0:  # type: ignore
+        digits_str += "0" * exponent  # type: ignore
+        exponent = 0
+
+    dscale = -exponent  # type: ignore
+
+    if len(digits_str) < dscale:
+        digits_str = digits_str.rjust(dscale, "0")
+
+    return _pack_numeric(
+        bool(sign), digits_str[: len(digits_str) - dscale], digits_str[len(digits_str) - dscale :]
+    )
+
+
+@lru_cache(maxsize=NUMERIC_CACHE_SIZE)
+def _encode_float_numeric(value: float) -> bytes:
+    """Floats are encoded from their repr which is the same value the CSV writer
+    outputs. Scada values repeat a lot so these are cached"""
+    value_repr = repr(value)
+
+    if "e" in value_repr or "n" in value_repr:
+        return _encode_decimal(Decimal(value_repr))
+
+    sign = value_repr.startswith("-")
+    integer_part, fraction_part = value_repr.lstrip("-").split(".")
+
+    return _pack_numeric(sign, integer_part, fraction_part)
+
+
+@lru_cache(maxsize=NUMERIC_CACHE_SIZE)
+def _encode_int_numeric(value: int) -> bytes:
+    return _pack_numeric(value < 0, str(abs(value)), "")
+
+
+def _encode_numeric(value: Any) -> bytes:
+    """Encode a value as a postgres numeric"""
+    if isinstance(value, float):
+        return _encode_float_numeric(float(value))
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        return _encode_int_numeric(int(value))
+
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+
+    return _encode_decimal(value)
+
+
+def _timedelta_microseconds(delta: timedelta) -> int:
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _encode_date(value: Any) -> bytes:
+    if isinstance(value, datetime):
+        value = value.date()
+
+    return struct.pack("!ii", 4, (value - POSTGRES_EPOCH_DATE).days)
+
+
+def _get_timestamp_encoder(timezone: bool, naive_timezone: tzinfo) -> ColumnEncoder:
+    """Timestamps are encoded as microseconds since the postgres epoch. Naive values
+    for timestamptz columns are read in naive_timezone the same way postgres reads
+    them in the session timezone from CSV. Intervals repeat across facilities so the
+    encoded values are cached per column"""
+
+    @lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+    def _encode_timestamp(value: datetime) -> bytes:
+        if value.tzinfo:
+            value = value.replace(tzinfo=None)
+
+        return struct.pack("!iq", 8, _timedelta_microseconds(value - POSTGRES_EPOCH))
+
+    @lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+    def _encode_timestamptz(value: datetime) -> bytes:
+        if not value.tzinfo:
+            if hasattr(naive_timezone, "localize"):
+                value = naive_timezone.localize(value)  # type: ignore
+            else:
+                value = value.replace(tzinfo=naive_timezone)
+
+        value = value.astimezone(pytz.utc).replace(tzinfo=None)
+
+        return struct.pack("!iq", 8, _timedelta_microseconds(value - POSTGRES_EPOCH))
+
+    if timezone:
+        return _encode_timestamptz
+
+    return _encode_timestamp
+
+
+def get_column_encoder(column: Column, naive_timezone: tzinfo = pytz.utc) -> ColumnEncoder:
+    """Get the binary encoder for a table column from its type"""
+    column_type = column.type
+
+    # order matters - subclasses before their bases
+    if isinstance(column_type, Boolean):
+        return _encode_bool
+
+    if isinstance(column_type, SmallInteger):
+        return _encode_int2
+
+    if isinstance(column_type, BigInteger):
+        return _encode_int8
+
+    if isinstance(column_type, Integer):
+        return _encode_int4
+
+    if isinstance(column_type, Float):
+        return _encode_float8
+
+    if isinstance(column_type, Numeric):
+        return _encode_numeric
+
+    if isinstance(column_type, DateTime):
+        return _get_timestamp_encoder(bool(column_type.timezone), naive_timezone)
+
+    if isinstance(column_type, Date):
+        return _encode_date
+
+    if isinstance(column_type, String):
+        return _encode_text
+
+    raise CopyBinaryException(
+        "No binary encoder for column {} of type {}".format(column.name, column_type)
+    )
+
+
+def get_copy_column_names(table: Union[Table, FacilityScada, BalancingSummary]) -> List[str]:
+    """Columns in the order they're encoded. This is model declaration order which
+    can differ from the physical order of the table so the COPY statement has to
+    list them - see `get_copy_column_list`"""
+    return [c.name for c in table.__table__.columns.values()]  # type: ignore
+
+
+def get_copy_column_list(table: Union[Table, FacilityScada, BalancingSummary]) -> str:
+    """Column list for the COPY statement matching the encoded column order"""
+    return "({})".format(", ".join(get_copy_column_names(table)))
+
+
+def generate_copy_binary_chunks(
+    table: Union[Table, FacilityScada, BalancingSummary],
+    records: List[Dict],
+    chunk_size: int = COPY_BINARY_CHUNK_SIZE,
+    naive_timezone: tzinfo = pytz.utc,
+) -> Iterator[bytes]:
+    """Encode records in the order of `get_copy_column_names` yielding chunks of
+    chunk_size rows"""
+    table_columns = list(table.__table__.columns.values())  # type: ignore
+
+    column_encoders = [
+        (c.name, get_column_encoder(c, naive_timezone=naive_timezone)) for c in table_columns
+    ]
+    row_header = struct.pack("!h", len(column_encoders))
+
+    yield COPY_BINARY_HEADER
+
+    chunk: List[bytes] = []
+    chunk_rows = 0
+
+    for record in records:
+        if not record:
+            continue
+
+        chunk.append(row_header)
+
+        for column_name, column_encoder in column_encoders:
+            value = record.get(column_name)
+
+            chunk.append(COPY_BINARY_NULL if value is None else column_encoder(value))
+
+        chunk_rows += 1
+
+        if chunk_rows >= chunk_size:
+            yield b"".join(chunk)
+            chunk = []
+            chunk_rows = 0
+
+    if chunk:
+        yield b"".join(chunk)
+
+    yield COPY_BINARY_TRAILER
+
+
+def generate_copy_binary_from_records(
+    table: Union[Table, FacilityScada, BalancingSummary],
+    records: List[Dict],
+    chunk_size: int = COPY_BINARY_CHUNK_SIZE,
+    naive_timezone: tzinfo = pytz.utc,
+) -> BufferedReader:
+    """
+    Take a list of dict records and a table schema and return a stream of the
+    records in binary COPY format to be used in bulk_insert
+
+    """
+    if len(records) < 1:
+        raise Exception("No records")
+
+    table_column_names = get_copy_column_names(table)
+
+    # sanity check the records we received to make sure
+    # they match the table schema
+    record_field_names = list(records[0].keys())
+
+    for field_name in record_field_names:
+        if field_name not in table_column_names:
+            raise Exception(
+                "Column name from records not found in table: {}. Have {}".format(
+                    field_name, ", ".join(table_column_names)
+                )
+            )
+
+    for column_name in table_column_names:
+        if column_name not in record_field_names:
+            raise Exception("Missing value for column {}".format(column_name))
+
+    return chain_streams(
+        BytesIO(c)
+        for c in generate_copy_binary_chunks(
+            table, records, chunk_size=chunk_size, naive_timezone=naive_timezone
+        )
+    )
+
+
+def get_session_timezone(cursor: Any) -> tzinfo:
+    """Get the timezone postgres reads naive timestamps in for this session"""
+    cursor.execute("show timezone")
+    timezone_name = cursor.fetchone()[0]
+
+    try:
+        return pytz.timezone(timezone_name)
+    except pytz.UnknownTimeZoneError:
+        logger.warning("Unknown session timezone {}. Using UTC".format(timezone_name))
+
+    return pytz.utc
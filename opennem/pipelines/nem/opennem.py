@@ -7,12 +7,12 @@ NEMWEB Data ingress into OpenNEM format
 
 import logging
 from datetime import datetime
-from itertools import groupby
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from scrapy import Spider
 from sqlalchemy.dialects.postgresql import insert
 
+from opennem.core.dedupe import BALANCING_SUMMARY_KEYS, DedupePolicy, dedupe_records
 from opennem.core.networks import NetworkNEM
 from opennem.core.normalizers import clean_float, normalize_duid
 from opennem.db import SessionLocal, get_database_engine
@@ -45,10 +45,12 @@ def unit_scada_generate_facility_scada(
     created_by: str = None,
     limit: int = 0,
     duid: str = None,
-) -> List[Dict]:
+) -> Tuple[List[Dict], int]:
+    """Generate facility_scada records from rows. Returns the records and the number
+    of duplicates that were dropped. Records are deduped before limit is applied"""
     created_at = datetime.now()
-    primary_keys = []
     return_records = []
+    duplicate_records = 0
 
     created_by = ""
 
@@ -73,14 +75,6 @@ def unit_scada_generate_facility_scada(
         if duid and facility_code != duid:
             continue
 
-        if primary_key_track:
-            pkey = (trading_interval, facility_code)
-
-            if pkey in primary_keys:
-                continue
-
-            primary_keys.append(pkey)
-
         generated = None
 
         if power_field and power_field in row:
@@ -118,28 +112,19 @@ def unit_scada_generate_facility_scada(
 
         return_records.append(__rec)
 
-        if limit > 0 and len(return_records) >= limit:
-            break
-
-    if not groupby_filter:
-        return return_records
-
-    return_records_grouped = {}
+    if primary_key_track:
+        return_records, duplicate_records = dedupe_records(
+            return_records, keys=["trading_interval", "facility_code"], policy=DedupePolicy.first
+        )
 
-    for pk_values, rec_value in groupby(
-        return_records,
-        key=lambda r: (
-            r.get("network_id"),
-            r.get("trading_interval"),
-            r.get("facility_code"),
-        ),
-    ):
-        if pk_values not in return_records_grouped:
-            return_records_grouped[pk_values] = list(rec_value).pop()
+    if groupby_filter:
+        return_records, dropped = dedupe_records(return_records)
+        duplicate_records += dropped
 
-    return_records = list(return_records_grouped.values())
+    if limit > 0:
+        return_records = return_records[:limit]
 
-    return return_records
+    return return_records, duplicate_records
 
 
 def generate_balancing_summary(
@@ -258,20 +243,7 @@ def process_dispatch_interconnectorres(table: Dict, spider: Spider) -> Dict:
         )
 
     # remove duplicates
-    return_records_grouped = {}
-
-    for pk_values, rec_value in groupby(
-        records_to_store,
-        key=lambda r: (
-            r.get("trading_interval"),
-            r.get("network_id"),
-            r.get("facility_code"),
-        ),
-    ):
-        if pk_values not in return_records_grouped:
-            return_records_grouped[pk_values] = list(rec_value).pop()
-
-    records_to_store = list(return_records_grouped.values())
+    records_to_store, duplicate_records = dedupe_records(records_to_store)
 
     # insert
     stmt = insert(FacilityScada).values(records_to_store)
@@ -287,11 +259,11 @@ def process_dispatch_interconnectorres(table: Dict, spider: Spider) -> Dict:
     except Exception as e:
         logger.error("Error inserting records")
         logger.error(e)
-        return {"num_records": 0}
+        return {"num_records": 0, "duplicate_records": duplicate_records}
     finally:
         session.close()
 
-    return {"num_records": len(records_to_store)}
+    return {"num_records": len(records_to_store), "duplicate_records": duplicate_records}
 
 
 def _clear_scada_for_range(item: Dict[str, Any]) -> None:
@@ -332,7 +304,6 @@ def process_trading_price(table: Dict, spider: Spider) -> Dict[str, Any]:
     limit = None
     records_to_store = []
     records_processed = 0
-    primary_keys = []
 
     price_field = "price"
 
@@ -350,13 +321,6 @@ def process_trading_price(table: Dict, spider: Spider) -> Dict[str, Any]:
         if not trading_interval:
             continue
 
-        _pk = set([trading_interval, record["REGIONID"]])
-
-        if _pk in primary_keys:
-            continue
-
-        primary_keys.append(_pk)
-
         price = None
 
         if "RRP" in record:
@@ -381,6 +345,10 @@ def process_trading_price(table: Dict, spider: Spider) -> Dict[str, Any]:
             logger.info("Reached limit of: {} {}".format(limit, records_processed))
             break
 
+    records_to_store, duplicate_records = dedupe_records(
+        records_to_store, keys=BALANCING_SUMMARY_KEYS, policy=DedupePolicy.first
+    )
+
     stmt = insert(BalancingSummary).values(records_to_store)
     stmt.bind = engine
     stmt = stmt.on_conflict_do_update(
@@ -394,11 +362,11 @@ def process_trading_price(table: Dict, spider: Spider) -> Dict[str, Any]:
     except Exception as e:
         logger.error("Error inserting records")
         logger.error(e)
-        return {"num_records": 0}
+        return {"num_records": 0, "duplicate_records": duplicate_records}
     finally:
         session.close()
 
-    return {"num_records": len(records_to_store)}
+    return {"num_records": len(records_to_store), "duplicate_records": duplicate_records}
 
 
 def process_dispatch_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
@@ -413,7 +381,6 @@ def process_dispatch_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
     limit = None
     records_to_store = []
     records_processed = 0
-    primary_keys = []
 
     for record in records:
         trading_interval = parse_date(
@@ -426,13 +393,6 @@ def process_dispatch_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
         if not trading_interval:
             continue
 
-        _pk = set([trading_interval, record["REGIONID"]])
-
-        if _pk in primary_keys:
-            continue
-
-        primary_keys.append(_pk)
-
         net_interchange = None
 
         if "NETINTERCHANGE" in record:
@@ -460,6 +420,10 @@ def process_dispatch_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
             logger.info("Reached limit of: {} {}".format(limit, records_processed))
             break
 
+    records_to_store, duplicate_records = dedupe_records(
+        records_to_store, keys=BALANCING_SUMMARY_KEYS, policy=DedupePolicy.first
+    )
+
     stmt = insert(BalancingSummary).values(records_to_store)
     stmt.bind = engine
     stmt = stmt.on_conflict_do_update(
@@ -476,12 +440,12 @@ def process_dispatch_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
     except Exception as e:
         logger.error("Error inserting records")
         logger.error(e)
-        return {"num_records": 0}
+        return {"num_records": 0, "duplicate_records": duplicate_records}
 
     finally:
         session.close()
 
-    return {"num_records": len(records_to_store)}
+    return {"num_records": len(records_to_store), "duplicate_records": duplicate_records}
 
 
 def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
@@ -496,7 +460,6 @@ def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
     limit = None
     records_to_store = []
     records_processed = 0
-    primary_keys = []
 
     for record in records:
         trading_interval = parse_date(
@@ -509,13 +472,6 @@ def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
         if not trading_interval:
             continue
 
-        _pk = set([trading_interval, record["REGIONID"]])
-
-        if _pk in primary_keys:
-            continue
-
-        primary_keys.append(_pk)
-
         net_interchange = None
 
         if "NETINTERCHANGE" in record:
@@ -543,6 +499,10 @@ def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
             logger.info("Reached limit of: {} {}".format(limit, records_processed))
             break
 
+    records_to_store, duplicate_records = dedupe_records(
+        records_to_store, keys=BALANCING_SUMMARY_KEYS, policy=DedupePolicy.first
+    )
+
     stmt = insert(BalancingSummary).values(records_to_store)
     stmt.bind = engine
     stmt = stmt.on_conflict_do_update(
@@ -559,12 +519,12 @@ def process_trading_regionsum(table: Dict[str, Any], spider: Spider) -> Dict:
     except Exception as e:
         logger.error("Error inserting records")
         logger.error(e)
-        return {"num_records": 0}
+        return {"num_records": 0, "duplicate_records": duplicate_records}
 
     finally:
         session.close()
 
-    return {"num_records": len(records_to_store)}
+    return {"num_records": len(records_to_store), "duplicate_records": duplicate_records}
 
 
 def process_unit_scada(table: Dict[str, Any], spider: Spider) -> Dict:
@@ -576,7 +536,7 @@ def process_unit_scada(table: Dict[str, Any], spider: Spider) -> Dict:
 
     item["table_schema"] = FacilityScada
     item["update_fields"] = ["generated"]
-    item["records"] = unit_scada_generate_facility_scada(
+    item["records"], item["duplicate_records"] = unit_scada_generate_facility_scada(
         records,
         spider,
         power_field="SCADAVALUE",
@@ -597,7 +557,7 @@ def process_unit_solution(table: Dict[str, Any], spider: Spider) -> Dict:
 
     item["table_schema"] = FacilityScada
     item["update_fields"] = ["generated"]
-    item["records"] = unit_scada_generate_facility_scada(
+    item["records"], item["duplicate_records"] = unit_scada_generate_facility_scada(
         records,
         spider,
         network=NetworkNEM,
@@ -622,7 +582,7 @@ def process_meter_data_gen_duid(table: Dict[str, Any], spider: Spider) -> Dict:
 
     item["table_schema"] = FacilityScada
     item["update_fields"] = ["generated"]
-    item["records"] = unit_scada_generate_facility_scada(
+    item["records"], item["duplicate_records"] = unit_scada_generate_facility_scada(
         records,
         spider,
         network=NetworkNEM,
@@ -653,7 +613,7 @@ def process_rooftop_actual(table: Dict[str, Any], spider: Spider) -> Dict:
     if not records_filtered:
         records_filtered = list(filter(lambda x: x["TYPE"] == "MEASUREMENT", records))
 
-    scada_records = unit_scada_generate_facility_scada(
+    scada_records, duplicate_records = unit_scada_generate_facility_scada(
         records_filtered,
         spider,
         network=NetworkAEMORooftop,
@@ -671,24 +631,12 @@ def process_rooftop_actual(table: Dict[str, Any], spider: Spider) -> Dict:
     scada_records = [i for i in scada_records if i]
 
     # dedupe
-    return_records_grouped = {}
-
-    for pk_values, rec_value in groupby(
-        scada_records,
-        key=lambda r: (
-            r.get("trading_interval"),
-            r.get("network_id"),
-            r.get("facility_code"),
-        ),
-    ):
-        if pk_values not in return_records_grouped:
-            return_records_grouped[pk_values] = list(rec_value).pop()
-
-    scada_records = list(return_records_grouped.values())
+    scada_records, dropped = dedupe_records(scada_records)
 
     item["table_schema"] = FacilityScada
     item["update_fields"] = ["generated"]
     item["records"] = scada_records
+    item["duplicate_records"] = duplicate_records + dropped
     item["content"] = None
 
     return item
@@ -701,7 +649,7 @@ def process_rooftop_forecast(table: Dict[str, Any], spider: Spider) -> Dict:
     records = table["records"]
     item: Dict[str, Any] = dict()
 
-    scada_records = unit_scada_generate_facility_scada(
+    scada_records, duplicate_records = unit_scada_generate_facility_scada(
         records,
         spider,
         network=NetworkAEMORooftop,
@@ -727,6 +675,7 @@ def process_rooftop_forecast(table: Dict[str, Any], spider: Spider) -> Dict:
     item["table_schema"] = FacilityScada
     item["update_fields"] = ["generated"]
     item["records"] = scada_records
+    item["duplicate_records"] = duplicate_records
     item["content"] = None
 
     return item
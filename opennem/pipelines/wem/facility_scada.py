@@ -30,7 +30,7 @@ class WemStoreFacilityScada(object):
 
         item["table_schema"] = FacilityScada
         item["update_fields"] = ["generated", "eoi_quantity"]
-        item["records"] = unit_scada_generate_facility_scada(
+        item["records"], item["duplicate_records"] = unit_scada_generate_facility_scada(
             csvreader,
             spider,
             interval_field="Trading Interval",
@@ -57,7 +57,7 @@ class WemStoreFacilityIntervals(object):
 
         item["table_schema"] = FacilityScada
         item["update_fields"] = ["generated"]
-        item["records"] = unit_scada_generate_facility_scada(
+        item["records"], item["duplicate_records"] = unit_scada_generate_facility_scada(
             csvreader,
             spider,
             interval_field="PERIOD",
@@ -3,6 +3,7 @@ import logging
 
 from sqlalchemy.dialects.postgresql import insert
 
+from opennem.core.dedupe import BALANCING_SUMMARY_KEYS, DedupePolicy, dedupe_records
 from opennem.core.normalizers import clean_float
 from opennem.db import SessionLocal, get_database_engine
 from opennem.db.models.opennem import BalancingSummary
@@ -22,35 +23,36 @@ class WemStorePulse(object):
         csvreader = csv.DictReader(item["content"].split("\n"))
 
         records_to_store = []
-        primary_keys = []
 
         for row in csvreader:
             trading_interval = parse_date(
                 row["TRADING_DAY_INTERVAL"], network=NetworkWEM, dayfirst=False
             )
 
-            if trading_interval not in primary_keys:
-                forecast_load = clean_float(row["FORECAST_EOI_MW"])
-
-                generation_total = None
-
-                if "ACTUAL_TOTAL_GENERATION" in row:
-                    generation_total = clean_float(row["ACTUAL_TOTAL_GENERATION"])
-
-                records_to_store.append(
-                    {
-                        "created_by": spider.name,
-                        "trading_interval": trading_interval,
-                        "network_id": "WEM",
-                        "network_region": "WEM",
-                        "forecast_load": forecast_load,
-                        "generation_total": generation_total,
-                        # generation_scheduled=row["Scheduled Generation (MW)"],
-                        # generation_total=row["Total Generation (MW)"],
-                        "price": clean_float(row["PRICE"]),
-                    }
-                )
-                primary_keys.append(trading_interval)
+            forecast_load = clean_float(row["FORECAST_EOI_MW"])
+
+            generation_total = None
+
+            if "ACTUAL_TOTAL_GENERATION" in row:
+                generation_total = clean_float(row["ACTUAL_TOTAL_GENERATION"])
+
+            records_to_store.append(
+                {
+                    "created_by": spider.name,
+                    "trading_interval": trading_interval,
+                    "network_id": "WEM",
+                    "network_region": "WEM",
+                    "forecast_load": forecast_load,
+                    "generation_total": generation_total,
+                    # generation_scheduled=row["Scheduled Generation (MW)"],
+                    # generation_total=row["Total Generation (MW)"],
+                    "price": clean_float(row["PRICE"]),
+                }
+            )
+
+        records_to_store, duplicate_records = dedupe_records(
+            records_to_store, keys=BALANCING_SUMMARY_KEYS, policy=DedupePolicy.first
+        )
 
         stmt = insert(BalancingSummary).values(records_to_store)
         stmt.bind = get_database_engine()
@@ -73,8 +75,8 @@ class WemStorePulse(object):
         except Exception as e:
             logger.error("Error inserting records")
             logger.error(e)
-            return 0
+            return {"num_records": 0, "duplicate_records": duplicate_records}
         finally:
             s.close()
 
-        return len(records_to_store)
+        return {"num_records": len(records_to_store), "duplicate_records": duplicate_records}
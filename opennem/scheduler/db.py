@@ -20,8 +20,11 @@ from opennem.utils.scrapyd import job_schedule_all
 from opennem.workers.aggregates import run_aggregates_all, run_aggregates_all_days
 from opennem.workers.daily_summary import run_daily_fueltech_summary
 from opennem.workers.emissions import run_emission_update_day
-from opennem.workers.energy import run_energy_update_days
-from opennem.workers.facility_data_ranges import update_facility_seen_range
+from opennem.workers.energy import run_energy_update_days, run_energy_update_dirty
+from opennem.workers.facility_data_ranges import (
+    update_facility_seen_range,
+    verify_facility_ranges,
+)
 from opennem.workers.gap_fill import run_energy_gapfill
 
 # Py 3.8 on MacOS changed the default multiprocessing model
@@ -66,8 +69,15 @@ def db_refresh_material_views_recent() -> None:
     refresh_material_views("mv_region_emissions_45d")
 
 
-# Run aggregate table aggregates for all networks
-@huey.periodic_task(crontab(hour="*/1", minute="15"))
+# Recalculate energies for the buckets ingest has marked dirty
+@huey.periodic_task(crontab(minute="*/5"))
+@huey.lock_task("db_run_energy_dirty")
+def db_run_energy_dirty() -> None:
+    run_energy_update_dirty()
+
+
+# Full gap scan as a backstop to the dirty intervals ledger
+@huey.periodic_task(crontab(hour="4", minute="15"))
 @huey.lock_task("db_run_energy_gapfil")
 def db_run_energy_gapfil() -> None:
     run_energy_gapfill()
@@ -129,6 +139,7 @@ def schedule_facility_first_seen_check() -> None:
 @huey.lock_task("db_facility_seen_update")
 def db_facility_seen_update() -> None:
     if settings.workers_db_run:
+        verify_facility_ranges()
         update_facility_seen_range()
 
 
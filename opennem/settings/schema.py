@@ -56,6 +56,13 @@ class OpennemSettings(BaseSettings):
 
     s3_bucket_path: str = "s3://data.opennem.org.au/"
 
+    # compress exported objects with gzip or br (brotli). None to upload as is
+    # see opennem.exporter.storage
+    export_compression: Optional[str] = "gzip"
+
+    # skip uploading exports that are the same as the stored object
+    export_skip_unchanged: bool = True
+
     interval_default: str = "15m"
 
     period_default: str = "7d"
@@ -65,9 +72,20 @@ class OpennemSettings(BaseSettings):
     # show database debug
     db_debug: bool = False
 
+    # number of staged rows committed per chunk in bulk upserts
+    # see opennem.pipelines.bulk_insert.bulk_upsert
+    bulk_insert_chunk_size: int = 50000
+
     # cache scada values for
     cache_scada_values_ttl_sec: int = 60 * 5
 
+    # cache stats api responses in redis until the next network interval
+    # see opennem.api.cache
+    api_cache_enabled: bool = True
+
+    # ttl for responses when the network interval isn't known
+    api_cache_ttl_default: int = 60 * 5
+
     # asgi server settings
     server_host: str = "0.0.0.0"
     server_port: int = 8000
@@ -84,6 +102,22 @@ class OpennemSettings(BaseSettings):
     # cache http requests locally
     http_cache_local: bool = False
 
+    # number of concurrent downloads when fetching a list of urls
+    # see opennem.core.parsers.aemo.mms.parse_aemo_urls
+    http_fetch_workers: int = 4
+
+    # number of export map resources queried concurrently
+    # see opennem.api.export.executor.run_export_resources
+    export_workers: int = 4
+
+    # number of crawlers in a schedule run concurrently
+    # see opennem.crawlers.executor.run_crawlers
+    crawl_workers: int = 4
+
+    # number of processes an energy backfill runs on. Each opens its own database pool
+    # see opennem.workers.energy_multiprocess.run_energy_backfill
+    energy_backfill_workers: int = 2
+
     _static_folder_path: str = "opennem/static/"
 
     # output schema options
@@ -4,7 +4,7 @@ Module to handle zip files and nested zip files.
 """
 import io
 from io import BytesIO
-from typing import IO, Any
+from typing import IO, Any, Iterator
 from zipfile import ZipFile
 
 # limit how many zips within zips we'll parse
@@ -114,3 +114,14 @@ def stream_zip_contents(file_obj: IO[bytes], mode: str = "w"):  # type: ignore
                 c.append(zf.open(filename))
 
         return chain_streams(c)
+
+
+def stream_text_lines(file_obj: IO[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Iterate the decoded lines of a binary stream and close it once read
+    """
+    try:
+        for line in file_obj:
+            yield line.decode(encoding)
+    finally:
+        file_obj.close()
@@ -1,10 +1,24 @@
 """
 OpenNEM cache utilities
 
+Scada ranges are cached at two levels: an in-process cache with a short ttl, and
+redis, which all of the huey and API workers share. Concurrent misses for a range
+run the range query once. Threads in a process wait on a per key lock. Processes
+wait on a lock in redis held by the worker running the query.
+
+Ingest moves the end of cached network ranges on as new intervals are stored
+(see update_scada_range_cache) rather than the ranges being queried again.
+
+If redis is unavailable ranges are cached in-process only.
 """
+import json
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from functools import wraps
-from typing import Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 from cachetools import TTLCache
 
@@ -16,13 +30,187 @@ logger = logging.getLogger(__name__)
 
 CACHE_AGE = settings.cache_scada_values_ttl_sec
 
-scada_cache: TTLCache = TTLCache(maxsize=100, ttl=CACHE_AGE)
+# seconds to bypass redis after an error
+CACHE_ERROR_BACKOFF = 30
+
+SCADA_RANGE_PREFIX = "opennem:scada_range"
+
+# in-process ranges are kept briefly so ingest updates in other processes show up
+SCADA_RANGE_LOCAL_TTL = 15
+
+# seconds a worker holds the lock while it runs a range query
+SCADA_RANGE_LOCK_TTL = 30
+
+# seconds to wait on another worker running the range query before running it
+SCADA_RANGE_LOCK_WAIT = 10
+
+SCADA_RANGE_LOCK_POLL = 0.05
+
+scada_cache: TTLCache = TTLCache(maxsize=1000, ttl=SCADA_RANGE_LOCAL_TTL)
+
+_scada_cache_lock = threading.Lock()
+
+
+class _KeyLock:
+    """Lock for the misses on a key and the number of threads using it"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+# locks are removed once no thread is using them so keys for facility lists don't
+# build up for the life of the process
+_scada_key_locks: Dict[str, _KeyLock] = {}
+
+_cache_client: Optional[Any] = None
+
+_cache_down_until: float = 0.0
+
+
+def mark_cache_down(e: Exception) -> None:
+    """Bypass redis for a while so callers don't each wait on it timing out"""
+    global _cache_down_until
+
+    logger.error("Cache error. Bypassing for {}s: {}".format(CACHE_ERROR_BACKOFF, e))
+    _cache_down_until = time.time() + CACHE_ERROR_BACKOFF
+
+
+def get_cache_client() -> Optional[Any]:
+    """Lazily connect to redis. Returns None if redis is down"""
+    global _cache_client
+
+    if time.time() < _cache_down_until:
+        return None
+
+    if not _cache_client:
+        import redis
+
+        _cache_client = redis.Redis.from_url(
+            settings.cache_url, socket_timeout=1, socket_connect_timeout=1
+        )
+
+    return _cache_client
+
+
+def get_scada_range_key(
+    network: Optional[NetworkSchema] = None,
+    networks: Optional[List[NetworkSchema]] = None,
+    network_region: Optional[str] = None,
+    facilities: Optional[List[str]] = None,
+    energy: bool = False,
+) -> str:
+    """Key on every argument of the range query. Facilities are last as they are
+    the only part that is a list"""
+    return ":".join(
+        [
+            network.code if network else "",
+            ",".join(sorted([n.code for n in networks or []])),
+            network_region or "",
+            "energy" if energy else "power",
+            ",".join(sorted(facilities or [])),
+        ]
+    )
+
+
+def _key_network_codes(key: str) -> List[str]:
+    network_code, network_codes, _ = key.split(":", 2)
+
+    return [i for i in [network_code] + network_codes.split(",") if i]
+
+
+def _key_has_facilities(key: str) -> bool:
+    return key.split(":", 4)[4] != ""
+
+
+def _key_is_power(key: str) -> bool:
+    return key.split(":", 4)[3] == "power"
+
+
+def _redis_key(key: str) -> str:
+    return "{}:{}".format(SCADA_RANGE_PREFIX, key)
+
+
+def _redis_network_keys(network_code: str) -> str:
+    return "{}:keys:{}".format(SCADA_RANGE_PREFIX, network_code)
+
+
+@contextmanager
+def _key_lock(key: str) -> Iterator[None]:
+    with _scada_cache_lock:
+        if key not in _scada_key_locks:
+            _scada_key_locks[key] = _KeyLock()
+
+        key_lock = _scada_key_locks[key]
+        key_lock.users += 1
+
+    try:
+        with key_lock.lock:
+            yield
+    finally:
+        with _scada_cache_lock:
+            key_lock.users -= 1
+
+            if not key_lock.users:
+                del _scada_key_locks[key]
+
+
+def _get_local(key: str) -> Optional[Dict]:
+    with _scada_cache_lock:
+        return scada_cache.get(key)
+
+
+def _set_local(key: str, value: Dict) -> None:
+    with _scada_cache_lock:
+        scada_cache[key] = value
+
+
+def _range_to_value(scada_range: ScadaDateRange) -> Dict:
+    return {"start": scada_range.start.isoformat(), "end": scada_range.end.isoformat()}
+
+
+def _range_from_value(value: Dict, network: Optional[NetworkSchema]) -> ScadaDateRange:
+    return ScadaDateRange(
+        start=datetime.fromisoformat(value["start"]),
+        end=datetime.fromisoformat(value["end"]),
+        network=network,
+    )
+
+
+def _wait_for_shared(client: Any, key: str) -> Optional[Dict]:
+    """Wait on the worker holding the lock to store the range"""
+    wait_until = time.time() + SCADA_RANGE_LOCK_WAIT
+
+    while time.time() < wait_until:
+        time.sleep(SCADA_RANGE_LOCK_POLL)
+
+        cached_value = client.get(_redis_key(key))
+
+        if cached_value:
+            return json.loads(cached_value)
+
+        # the query returned no range or the worker failed
+        if not client.exists(_redis_key(key) + ":lock"):
+            return None
+
+    logger.warning("Timed out waiting on scada range {}".format(key))
+
+    return None
+
+
+def _set_shared(client: Any, key: str, value: Dict) -> None:
+    client.set(_redis_key(key), json.dumps(value), ex=CACHE_AGE)
+
+    # index the key by network so ingest can find the ranges to update
+    for network_code in _key_network_codes(key):
+        client.sadd(_redis_network_keys(network_code), key)
+        client.expire(_redis_network_keys(network_code), CACHE_AGE * 2)
 
 
 def cache_scada_result(func: Callable) -> Callable:
     """
-    Caches the scada_range results in memory since they're called so often
-    by wrapping the function.
+    Caches the scada_range results since they're called so often by wrapping the
+    function.
     """
 
     @wraps(func)
@@ -33,36 +221,144 @@ def cache_scada_result(func: Callable) -> Callable:
         facilities: Optional[List[str]] = None,
         energy: bool = False,
     ) -> Optional[ScadaDateRange]:
-        key_list = []
+        key = get_scada_range_key(network, networks, network_region, facilities, energy)
 
-        if network:
-            key_list = [network.code]
+        cached_value = _get_local(key)
 
-        if networks:
-            key_list += [n.code for n in networks]
+        if cached_value:
+            logger.debug("scada range HIT at key: {}".format(key))
+            return _range_from_value(cached_value, network)
 
-        if facilities:
-            key_list += facilities
+        with _key_lock(key):
+            # another thread may have fetched it while this one waited
+            cached_value = _get_local(key)
 
-        key_list.append(str(energy))
+            if cached_value:
+                logger.debug("scada range HIT at key: {}".format(key))
+                return _range_from_value(cached_value, network)
 
-        key = frozenset(key_list)
-        ret: Optional[ScadaDateRange] = None
+            client = get_cache_client()
+            has_lock = False
 
-        try:
-            _val: Dict = scada_cache[key]
-            ret = ScadaDateRange(**_val)
+            if client:
+                try:
+                    cached_value = client.get(_redis_key(key))
 
-            logger.debug("scada range HIT at key: {}".format(key))
+                    if cached_value:
+                        cached_value = json.loads(cached_value)
+                    else:
+                        has_lock = bool(
+                            client.set(
+                                _redis_key(key) + ":lock", "1", nx=True, ex=SCADA_RANGE_LOCK_TTL
+                            )
+                        )
 
-            return ret
-        except KeyError:
-            ret = func(network, networks, network_region, facilities, energy)
+                        if not has_lock:
+                            cached_value = _wait_for_shared(client, key)
+                except Exception as e:
+                    mark_cache_down(e)
+                    client = None
+
+            if cached_value:
+                logger.debug("scada range shared HIT at key: {}".format(key))
+                _set_local(key, cached_value)
+                return _range_from_value(cached_value, network)
+
+            try:
+                ret = func(network, networks, network_region, facilities, energy)
+            finally:
+                if client and has_lock:
+                    try:
+                        client.delete(_redis_key(key) + ":lock")
+                    except Exception as e:
+                        mark_cache_down(e)
 
             logger.debug("scada range MISS at key: {}".format(key))
 
-            if ret:
-                scada_cache[key] = ret.dict()
+            if not ret:
+                return ret
+
+            value = _range_to_value(ret)
+
+            _set_local(key, value)
+
+            if client:
+                try:
+                    _set_shared(client, key, value)
+                except Exception as e:
+                    mark_cache_down(e)
+
             return ret
 
     return _cache_scada_wrapper
+
+
+def _update_value(value: Dict, interval: datetime) -> Optional[Dict]:
+    """Move the end of the range on to interval. Returns None if it doesn't change"""
+    range_end = datetime.fromisoformat(value["end"])
+
+    if range_end.tzinfo:
+        interval = (
+            interval.astimezone(range_end.tzinfo)
+            if interval.tzinfo
+            else interval.replace(tzinfo=range_end.tzinfo)
+        )
+
+    if interval <= range_end:
+        return None
+
+    return {"start": value["start"], "end": interval.isoformat()}
+
+
+def update_scada_range_cache(network: NetworkSchema, interval: datetime) -> None:
+    """Move the end of the cached ranges for a network on to interval. Called by
+    ingest when new intervals are stored. Facility ranges are left to expire since
+    the intervals stored may not be for those facilities. Energy ranges are left to
+    expire since energy is stored after the power intervals are.
+
+    Naive intervals are taken to be in network time"""
+    if not interval.tzinfo:
+        interval = interval.replace(tzinfo=network.get_fixed_offset())
+
+    def _should_update(key: str) -> bool:
+        return (
+            network.code in _key_network_codes(key)
+            and _key_is_power(key)
+            and not _key_has_facilities(key)
+        )
+
+    with _scada_cache_lock:
+        for key, value in list(scada_cache.items()):
+            if not _should_update(key):
+                continue
+
+            value_updated = _update_value(value, interval)
+
+            if value_updated:
+                scada_cache[key] = value_updated
+
+    client = get_cache_client()
+
+    if not client:
+        return None
+
+    try:
+        for key in client.smembers(_redis_network_keys(network.code)):
+            if isinstance(key, bytes):
+                key = key.decode("utf-8")
+
+            if not _should_update(key):
+                continue
+
+            cached_value = client.get(_redis_key(key))
+            key_ttl = client.ttl(_redis_key(key))
+
+            if not cached_value or not key_ttl or key_ttl < 1:
+                continue
+
+            value_updated = _update_value(json.loads(cached_value), interval)
+
+            if value_updated:
+                client.set(_redis_key(key), json.dumps(value_updated), ex=key_ttl)
+    except Exception as e:
+        mark_cache_down(e)
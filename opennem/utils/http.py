@@ -20,6 +20,9 @@ logger = logging.getLogger("opennem.utils.http")
 DEFAULT_TIMEOUT = settings.http_timeout
 DEFAULT_RETRIES = settings.http_retries
 
+# size the connection pool so concurrent fetchers share connections
+DEFAULT_POOL_SIZE = max(10, settings.http_fetch_workers)
+
 
 def setup_http_cache() -> bool:
     """Sets up requests session local cachine using
@@ -67,7 +70,7 @@ http.mount("https://", adapter_timeout)
 http.mount("http://", adapter_timeout)
 
 
-adapter_retry = HTTPAdapter(max_retries=retry_strategy)
+adapter_retry = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=DEFAULT_POOL_SIZE)
 http.mount("https://", adapter_retry)
 http.mount("http://", adapter_retry)
 
@@ -1,23 +1,29 @@
 import logging
 from datetime import datetime, timedelta
-from itertools import groupby
 from textwrap import dedent
-from typing import Dict, List, Optional
+from typing import Dict, Generator, List, Optional, Tuple
 
+import pandas as pd
 from pytz import FixedOffset
 
-from opennem.api.stats.controllers import duid_in_case, get_scada_range
+from opennem.api.stats.controllers import get_scada_range
 from opennem.api.time import human_to_interval, human_to_period
-from opennem.core.energy import energy_sum, shape_energy_dataframe
+from opennem.core.dedupe import dedupe_records
+from opennem.core.dirty_intervals import (
+    claim_dirty_intervals,
+    dirty_interval_ranges,
+    release_dirty_intervals,
+)
+from opennem.core.energy import energy_bucket_split, energy_sum, shape_energy_dataframe
 from opennem.core.facility.fueltechs import load_fueltechs
+from opennem.core.facility_ranges import update_facility_ranges_cursor
 from opennem.core.flows import FlowDirection, fueltech_to_flow, generated_flow_station_id
 from opennem.core.network_regions import get_network_regions
 from opennem.core.networks import get_network_region_schema
 from opennem.db import get_database_engine
 from opennem.db.models.opennem import FacilityScada
 from opennem.notifications.slack import slack_message
-from opennem.pipelines.bulk_insert import build_insert_query
-from opennem.pipelines.csv import generate_csv_from_records
+from opennem.pipelines.bulk_insert import bulk_upsert
 from opennem.schema.dates import DatetimeRange, TimeSeries
 from opennem.schema.network import (
     NetworkAEMORooftop,
@@ -28,6 +34,7 @@ from opennem.schema.network import (
 )
 from opennem.utils.dates import DATE_CURRENT_YEAR, get_last_complete_day_for_network
 from opennem.utils.interval import get_human_interval
+from opennem.utils.sql import duid_in_case
 from opennem.workers.facility_data_ranges import get_facility_seen_range
 
 logger = logging.getLogger("opennem.workers.energy")
@@ -38,6 +45,10 @@ YEAR_EARLIEST = 2010
 
 NEMWEB_DISPATCH_OLD_MIN_DATE = datetime.fromisoformat("1998-12-07 01:40:00")
 
+# Number of rows fetched per round trip from the server-side cursor
+# when streaming generated values
+STREAM_CHUNK_SIZE = 50000
+
 
 def get_generated_query(
     date_min: datetime,
@@ -196,6 +207,7 @@ def get_generated(
     network_region: Optional[str] = None,
     fueltech_id: Optional[str] = None,
     facility_codes: Optional[List[str]] = None,
+    raise_errors: bool = False,
 ) -> List[Dict]:
     """Gets generated values for a date range for a network and network region
     and optionally for a single fueltech"""
@@ -230,17 +242,97 @@ def get_generated(
             except Exception as e:
                 logger.error(e)
 
+                if raise_errors:
+                    raise
+
     logger.debug("Got back {} rows".format(len(results)))
 
     return results
 
 
+def get_generated_stream(
+    date_min: datetime,
+    date_max: datetime,
+    network: NetworkSchema,
+    run_clear: bool = False,
+    network_region: Optional[str] = None,
+    fueltech_id: Optional[str] = None,
+    facility_codes: Optional[List[str]] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Generator[List[Tuple], None, None]:
+    """Streams generated values for a date range from a named server-side cursor
+
+    Yields chunks of rows that always contain every reading for the intervals
+    they cover so that energy buckets can be completed from them"""
+    query = get_generated_query(
+        date_min,
+        date_max,
+        network,
+        fueltech_id=fueltech_id,
+        facility_codes=facility_codes,
+        network_region=network_region,
+    )
+
+    engine = get_database_engine()
+
+    if run_clear:
+        query_clear = get_clear_query(network_region, date_min, date_max, network, fueltech_id)
+
+        with engine.connect() as c:
+            logger.debug(query_clear)
+            c.execute(query_clear)
+
+    logger.debug(query)
+
+    if DRY_RUN:
+        return None
+
+    conn = engine.raw_connection()
+    num_rows = 0
+
+    try:
+        with conn.cursor(name="opennem_energy_generated") as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query)
+
+            pending_rows: List[Tuple] = []
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+
+                if not rows:
+                    break
+
+                num_rows += len(rows)
+                pending_rows += rows
+
+                # hold back the last interval since the next fetch can have
+                # more readings for it
+                last_interval = pending_rows[-1][0]
+                split_index = len(pending_rows)
+
+                while split_index > 0 and pending_rows[split_index - 1][0] == last_interval:
+                    split_index -= 1
+
+                if split_index > 0:
+                    yield pending_rows[:split_index]
+                    pending_rows = pending_rows[split_index:]
+
+            if pending_rows:
+                yield pending_rows
+    finally:
+        conn.close()
+
+    logger.debug("Streamed back {} rows".format(num_rows))
+
+
 def get_flows(
     date_min: datetime,
     date_max: datetime,
     network_region: str,
     network: NetworkSchema,
     flow: FlowDirection,
+    raise_errors: bool = False,
 ) -> List[Dict]:
     """Gets flows"""
 
@@ -259,22 +351,29 @@ def get_flows(
             except Exception as e:
                 logger.error(e)
 
+                if raise_errors:
+                    raise
+
     logger.debug("Got back {} flow rows".format(len(results)))
 
     return results
 
 
-def insert_energies(results: List[Dict], network: NetworkSchema) -> int:
+def insert_energies(
+    results: List[Dict], network: NetworkSchema, raise_errors: bool = False
+) -> int:
     """Takes a list of generation values and calculates energies and bulk-inserts
-    into the database"""
+    into the database. With raise_errors insert errors are raised"""
 
     # Get the energy sums as a dataframe
     esdf = energy_sum(results, network=network)
 
     # Add metadata
+    created_at = datetime.now()
+
     esdf["created_by"] = "opennem.worker.energy"
-    esdf["created_at"] = ""
-    esdf["updated_at"] = datetime.now()
+    esdf["created_at"] = created_at
+    esdf["updated_at"] = created_at
     esdf["generated"] = None
     esdf["is_forecast"] = False
     esdf["energy_quality_flag"] = 0
@@ -301,42 +400,34 @@ def insert_energies(results: List[Dict], network: NetworkSchema) -> int:
         return 0
 
     # dedupe records
-    return_records_grouped = {}
-
-    for pk_values, rec_value in groupby(
-        records_to_store,
-        key=lambda r: (
-            r.get("trading_interval"),
-            r.get("network_id"),
-            r.get("facility_code"),
-        ),
-    ):
-        if pk_values not in return_records_grouped:
-            return_records_grouped[pk_values] = list(rec_value).pop()
-
-    records_to_store = list(return_records_grouped.values())
-
-    # Build SQL + CSV and bulk-insert
-    sql_query = build_insert_query(FacilityScada, ["updated_at", "eoi_quantity"])
-    conn = get_database_engine().raw_connection()
-    cursor = conn.cursor()
-
-    csv_content = generate_csv_from_records(
-        FacilityScada,
-        records_to_store,
-        column_names=list(records_to_store[0].keys()),
-    )
+    records_to_store, _ = dedupe_records(records_to_store)
 
     try:
-        cursor.copy_expert(sql_query, csv_content)
-        conn.commit()
+        # widen energy_last_seen in the same transaction. Energies don't mark dirty
+        # intervals since they are the result of running them
+        result = bulk_upsert(
+            FacilityScada,
+            records_to_store,
+            ["updated_at", "eoi_quantity"],
+            before_commit=update_facility_ranges_cursor,
+        )
     except Exception as e:
         logger.error("Error inserting records: {}".format(e))
+
+        if raise_errors:
+            raise
+
         return 0
 
-    logger.info("Inserted {} records".format(len(records_to_store)))
+    if result.errors:
+        logger.error("Error inserting {} chunks of records".format(result.errors))
+
+        if raise_errors:
+            raise Exception("Error inserting {} chunks of energies".format(result.errors))
+
+    logger.info("Inserted {} records".format(result.rows))
 
-    return len(records_to_store)
+    return result.rows
 
 
 def get_date_range(network: NetworkSchema) -> DatetimeRange:
@@ -361,8 +452,17 @@ def run_energy_calc(
     fueltech_id: Optional[str] = None,
     facility_codes: Optional[List[str]] = None,
     run_clear: bool = False,
+    stream: bool = False,
+    raise_errors: bool = False,
 ) -> int:
-    """Runs the actual energy calc - believe it or not"""
+    """Runs the actual energy calc - believe it or not
+
+    With stream the generated values are read through a server-side cursor
+    and calculated and inserted in chunks - see run_energy_calc_stream
+
+    Errors are logged and the run returns the records stored so far. With
+    raise_errors they're raised so callers that track runs can tell a failed run
+    from one with no results"""
     generated_results: List[Dict] = []
 
     flow = None
@@ -373,7 +473,23 @@ def run_energy_calc(
     # @TODO get rid of the hard-coded networknem part
     if flow and region and network == NetworkNEM:
         generated_results = get_flows(
-            date_min, date_max, network_region=region, network=network, flow=flow
+            date_min,
+            date_max,
+            network_region=region,
+            network=network,
+            flow=flow,
+            raise_errors=raise_errors,
+        )
+    elif stream:
+        return run_energy_calc_stream(
+            date_min,
+            date_max,
+            network=network,
+            region=region,
+            fueltech_id=fueltech_id,
+            facility_codes=facility_codes,
+            run_clear=run_clear,
+            raise_errors=raise_errors,
         )
     else:
         generated_results = get_generated(
@@ -384,6 +500,7 @@ def run_energy_calc(
             fueltech_id=fueltech_id,
             run_clear=run_clear,
             facility_codes=facility_codes,
+            raise_errors=raise_errors,
         )
 
     num_records = 0
@@ -399,16 +516,79 @@ def run_energy_calc(
 
         generated_frame = shape_energy_dataframe(generated_results, network=network)
 
-        num_records = insert_energies(generated_frame, network=network)
+        num_records = insert_energies(
+            generated_frame, network=network, raise_errors=raise_errors
+        )
 
         logger.info("Done {} for {} => {}".format(region, date_min, date_max))
     except Exception as e:
-        import traceback
-
-        print(traceback.format_exc())
-        logger.error(e.with_traceback())
+        logger.error(
+            "Energy calc error for {} {} => {}: {}".format(region, date_min, date_max, e),
+            exc_info=True,
+        )
         # slack_message("Energy archive error: {}".format(e))
 
+        if raise_errors:
+            raise
+
+    return num_records
+
+
+def run_energy_calc_stream(
+    date_min: datetime,
+    date_max: datetime,
+    network: NetworkSchema,
+    region: Optional[str] = None,
+    fueltech_id: Optional[str] = None,
+    facility_codes: Optional[List[str]] = None,
+    run_clear: bool = False,
+    raise_errors: bool = False,
+) -> int:
+    """Runs the energy calc over streamed chunks of generated values so that memory
+    stays flat regardless of the size of the date range. See run_energy_calc for
+    raise_errors"""
+    num_records = 0
+    carry_frame: Optional[pd.DataFrame] = None
+
+    try:
+        for generated_results in get_generated_stream(
+            date_min,
+            date_max,
+            network_region=region,
+            network=network,
+            fueltech_id=fueltech_id,
+            run_clear=run_clear,
+            facility_codes=facility_codes,
+        ):
+            generated_frame = shape_energy_dataframe(generated_results, network=network)
+
+            if carry_frame is not None:
+                generated_frame = pd.concat([carry_frame, generated_frame], ignore_index=True)
+
+            complete_frame, carry_frame = energy_bucket_split(generated_frame, network)
+
+            if complete_frame.empty:
+                continue
+
+            num_records += insert_energies(
+                complete_frame, network=network, raise_errors=raise_errors
+            )
+
+        if num_records < 1:
+            logger.warning(
+                "No results from get_generated_stream for {} {} {}".format(
+                    region, date_max, fueltech_id
+                )
+            )
+            return 0
+
+        logger.info("Done {} for {} => {}".format(region, date_min, date_max))
+    except Exception as e:
+        logger.error("Energy stream error: {}".format(e))
+
+        if raise_errors:
+            raise
+
     return num_records
 
 
@@ -420,6 +600,7 @@ def run_energy_update_archive(
     fueltech: Optional[str] = None,
     network: NetworkSchema = NetworkNEM,
     run_clear: bool = False,
+    stream: bool = True,
 ) -> None:
 
     date_range = get_date_range(network=network)
@@ -485,6 +666,7 @@ def run_energy_update_archive(
                         fueltech_id=fueltech_id,
                         network=network,
                         run_clear=run_clear,
+                        stream=stream,
                     )
 
 
@@ -527,15 +709,75 @@ def run_energy_update_days(
             )
 
 
+def run_energy_update_dirty(
+    networks: Optional[List[NetworkSchema]] = None, limit: Optional[int] = None
+) -> int:
+    """Recalculates energies for only the buckets that ingest has recorded
+    in the dirty intervals ledger since the last run"""
+
+    if not networks:
+        networks = [NetworkNEM, NetworkWEM, NetworkAPVI, NetworkAEMORooftop]
+
+    num_records = 0
+
+    for network in networks:
+        dirty_keys = claim_dirty_intervals(network.code, limit=limit)
+
+        if not dirty_keys:
+            continue
+
+        # claimed keys go back in the ledger unless every range completes
+        completed = False
+
+        try:
+            dirty_ranges = dirty_interval_ranges(network.code, dirty_keys)
+
+            logger.info(
+                "Running energies for {} dirty intervals in {} ranges for {}".format(
+                    len(dirty_keys), len(dirty_ranges), network.code
+                )
+            )
+
+            for dirty_range in dirty_ranges:
+                num_records += run_energy_calc(
+                    dirty_range.date_min,
+                    dirty_range.date_max,
+                    network=network,
+                    facility_codes=dirty_range.facility_codes,
+                    stream=dirty_range.date_max - dirty_range.date_min > timedelta(days=1),
+                    raise_errors=True,
+                )
+
+            completed = True
+        except Exception as e:
+            logger.error("Error running dirty energies for {}: {}".format(network.code, e))
+        finally:
+            if not completed:
+                release_dirty_intervals(network.code, dirty_keys)
+
+    return num_records
+
+
 def run_energy_update_all(
     network: NetworkSchema = NetworkNEM, fueltech: Optional[str] = None, run_clear: bool = False
 ) -> None:
     """Runs energy update for all regions and all years for one-off
-    inserts"""
-    for year in range(DATE_CURRENT_YEAR, 1997, -1):
-        run_energy_update_archive(
-            year=year, fueltech=fueltech, network=network, run_clear=run_clear
-        )
+    inserts. Runs as a checkpointed backfill so a stopped run resumes where
+    it left off"""
+    from opennem.workers.energy_multiprocess import run_energy_backfill
+
+    run_id = "energy_update_all_{}".format(network.code.lower())
+
+    if fueltech:
+        run_id = "{}_{}".format(run_id, fueltech)
+
+    run_energy_backfill(
+        network=network,
+        years=[year for year in range(DATE_CURRENT_YEAR, 1997, -1)],
+        fueltech=fueltech,
+        run_clear=run_clear,
+        run_id=run_id,
+    )
 
 
 def run_energy_update_facility(
@@ -1,82 +1,336 @@
 """
 Multiprocessor for energy workers
 
+Backfills are split into partitions of (network region, fueltech, date window)
+sized by their estimated row count. Partitions are queued largest first and
+pulled by the worker processes as they free up. Each completed partition is
+checkpointed to `energy_backfill_checkpoint` so a stopped run can be resumed.
+
 """
 import logging
+import math
 import multiprocessing
 import sys
-from datetime import datetime
-from typing import List, Optional, Tuple
+from datetime import datetime, timedelta
+from textwrap import dedent
+from typing import Dict, List, Optional, Set, Tuple
 
 import click
+from dateutil.relativedelta import relativedelta
+from sqlalchemy.dialects.postgresql import insert
 
 from opennem.core.facility.fueltechs import load_fueltechs
-from opennem.diff.versions import CUR_YEAR, get_network_regions
-from opennem.schema.network import NetworkNEM
-from opennem.workers.energy import run_energy_update_archive
+from opennem.core.flows import fueltech_to_flow
+from opennem.core.network_regions import get_network_regions
+from opennem.core.networks import network_from_network_code
+from opennem.db import get_database_engine
+from opennem.db.models.opennem import EnergyBackfillCheckpoint
+from opennem.schema.core import BaseConfig
+from opennem.schema.network import NetworkAPVI, NetworkNEM, NetworkSchema
+from opennem.settings import settings
+from opennem.utils.dates import DATE_CURRENT_YEAR
+from opennem.workers.energy import get_date_range, run_energy_calc
 
 logger = logging.getLogger("opennem.worker.energy_multi")
 
 CPU_COUNT = multiprocessing.cpu_count()
-WORKER_COUNT = 2
 YEAR_EARLIEST = 2020
-CUR_MONTH = datetime.now().month
 
+# partitions estimated above this many rows are split into smaller date windows
+PARTITION_TARGET_ROWS = 500000
+
+# padding either side of a window so the edge energy buckets are complete
+PARTITION_PADDING = timedelta(minutes=10)
+
+PartitionKey = Tuple[str, str, str, datetime]
+
+
+class BackfillPartition(BaseConfig):
+    network_id: str
+    network_region: str
+    fueltech_id: str
+    date_min: datetime
+    date_max: datetime
+    estimated_rows: int = 0
+
+    @property
+    def key(self) -> PartitionKey:
+        return (self.network_id, self.network_region, self.fueltech_id, self.date_min)
+
+
+def _get_facility_counts(network: NetworkSchema) -> Dict[Tuple[str, str], int]:
+    """Number of facilities per (network region, fueltech) used to estimate
+    partition row counts in a single query"""
+    __query = """
+        select
+            f.network_region,
+            f.fueltech_id,
+            count(distinct f.code)
+        from facility f
+        where
+            f.network_id = '{network_id}'
+            and f.fueltech_id is not null
+            and f.network_region is not null
+        group by 1, 2
+    """
+
+    query = dedent(__query.format(network_id=network.code))
 
-def _build_args_list(
-    year: Optional[int], region: Optional[str], fueltech: Optional[str]
-) -> List[Tuple[Optional[int], int, Optional[str], Optional[str]]]:
-    args_list = []
+    engine = get_database_engine()
 
-    network = NetworkNEM
+    with engine.connect() as c:
+        rows = list(c.execute(query))
 
-    regions = [region]
+    return {(region, fueltech_id): count for region, fueltech_id, count in rows}
 
-    if not region:
+
+def build_backfill_partitions(
+    network: NetworkSchema = NetworkNEM,
+    years: Optional[List[int]] = None,
+    regions: Optional[List[str]] = None,
+    fueltech: Optional[str] = None,
+    target_rows: int = PARTITION_TARGET_ROWS,
+) -> List[BackfillPartition]:
+    """Build the partitions for a backfill sorted largest first. Partitions
+    for fueltechs without facilities in a region are skipped"""
+    date_range = get_date_range(network=network)
+
+    if not years:
+        years = [i for i in range(DATE_CURRENT_YEAR, YEAR_EARLIEST - 1, -1)]
+
+    if not regions:
         regions = [i.code for i in get_network_regions(network)]
 
-    fueltechs = [fueltech]
+    # @TODO remove this and give APVI regions
+    if network == NetworkAPVI:
+        regions = ["WEM"]
 
-    if not fueltech:
-        fueltechs = [i for i in load_fueltechs().keys()]
+    fueltechs = [fueltech] if fueltech else [i for i in load_fueltechs().keys()]
 
-    years = [year]
+    facility_counts = _get_facility_counts(network)
 
-    if not year:
-        years = [i for i in range(CUR_YEAR, YEAR_EARLIEST - 1, -1)]
+    network_tz = network.get_fixed_offset()
+    partitions: List[BackfillPartition] = []
 
     for year in years:
-        for month in range(12, 0, -1):
-            if year == CUR_YEAR and month > CUR_MONTH:
+        for month in range(1, 13):
+            month_min = datetime(year, month, 1, tzinfo=network_tz)
+            month_max = month_min + relativedelta(months=1)
+
+            if month_min >= date_range.end or month_max <= date_range.start:
                 continue
 
+            month_max = min(month_max, date_range.end)
+
+            intervals = (month_max - month_min) / timedelta(minutes=network.interval_size)
+
             for region in regions:
-                if year == CUR_YEAR and month > CUR_MONTH:
-                    continue
+                for fueltech_id in fueltechs:
+                    facility_count = facility_counts.get((region, fueltech_id), 0)
 
-                for ft in fueltechs:
-                    args_list.append((year, month, region, ft))
+                    # flows are calculated from interconnectors not facilities
+                    if fueltech_to_flow(fueltech_id) and network == NetworkNEM:
+                        facility_count = max(facility_count, 1)
 
-    return args_list
+                    if not facility_count:
+                        continue
 
+                    estimated_rows = int(intervals * facility_count)
 
-def _worker_wrap(
-    year: Optional[int], months: int, region: str, fueltech_id: Optional[str]
-) -> None:
-    """Map to named args"""
-    return run_energy_update_archive(
-        year=year, months=[months], regions=[region], fueltech=fueltech_id
+                    # split large partitions into equal whole day windows
+                    window_count = max(math.ceil(estimated_rows / target_rows), 1)
+                    window_days = math.ceil((month_max - month_min).days / window_count) or 1
+
+                    month_length = month_max - month_min
+                    window_min = month_min
+
+                    while window_min < month_max:
+                        window_max = min(window_min + timedelta(days=window_days), month_max)
+
+                        partitions.append(
+                            BackfillPartition(
+                                network_id=network.code,
+                                network_region=region,
+                                fueltech_id=fueltech_id,
+                                date_min=window_min,
+                                date_max=window_max,
+                                estimated_rows=int(
+                                    estimated_rows * (window_max - window_min) / month_length
+                                ),
+                            )
+                        )
+
+                        window_min = window_max
+
+    partitions.sort(key=lambda p: p.estimated_rows, reverse=True)
+
+    return partitions
+
+
+def get_completed_partitions(run_id: str) -> Set[PartitionKey]:
+    """Get the keys of the partitions of a run that have been checkpointed"""
+    __query = """
+        select network_id, network_region, fueltech_id, date_min
+        from energy_backfill_checkpoint
+        where run_id = '{run_id}'
+    """
+
+    engine = get_database_engine()
+
+    with engine.connect() as c:
+        rows = list(c.execute(dedent(__query.format(run_id=run_id))))
+
+    return {(i[0], i[1], i[2], i[3]) for i in rows}
+
+
+def checkpoint_partition(run_id: str, partition: BackfillPartition, records: int) -> None:
+    """Record a completed partition"""
+    stmt = insert(EnergyBackfillCheckpoint).values(
+        run_id=run_id,
+        network_id=partition.network_id,
+        network_region=partition.network_region,
+        fueltech_id=partition.fueltech_id,
+        date_min=partition.date_min,
+        date_max=partition.date_max,
+        records=records,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["run_id", "network_id", "network_region", "fueltech_id", "date_min"],
+        set_={"records": stmt.excluded.records, "completed_at": stmt.excluded.completed_at},
     )
 
+    engine = get_database_engine()
+
+    with engine.begin() as c:
+        c.execute(stmt)
+
 
-def energy_process(args_list: List, worker_count: Optional[int]) -> None:
-    logger.debug("Starting with {} workers".format(WORKER_COUNT))
+def clear_checkpoints(run_id: str) -> None:
+    """Clear the checkpoints of a run so the next run starts from scratch"""
+    engine = get_database_engine()
 
-    if not worker_count:
-        worker_count = WORKER_COUNT
+    with engine.begin() as c:
+        c.execute(
+            EnergyBackfillCheckpoint.__table__.delete().where(
+                EnergyBackfillCheckpoint.run_id == run_id
+            )
+        )
 
-    with multiprocessing.Pool(processes=worker_count) as pool:
-        pool.starmap(_worker_wrap, args_list)
+
+def _worker_init() -> None:
+    """Each worker process gets its own connection pool rather than sharing the
+    connections inherited from the parent. The inherited pool is replaced without
+    closing its connections since they belong to the parent"""
+    engine = get_database_engine()
+    engine.pool = engine.pool.recreate()
+
+
+def _run_partition(
+    run_id: str, partition: BackfillPartition, run_clear: bool = False
+) -> Tuple[PartitionKey, Optional[int]]:
+    """Run and checkpoint a single partition. Partitions are only checkpointed if
+    they complete. Returns None for records on error"""
+    network = network_from_network_code(partition.network_id)
+
+    try:
+        records = run_energy_calc(
+            partition.date_min - PARTITION_PADDING,
+            partition.date_max + PARTITION_PADDING,
+            network=network,
+            region=partition.network_region,
+            fueltech_id=partition.fueltech_id,
+            run_clear=run_clear,
+            stream=True,
+            raise_errors=True,
+        )
+
+        checkpoint_partition(run_id, partition, records)
+    except Exception as e:
+        logger.error("Error running partition {}: {}".format(partition.key, e))
+        return partition.key, None
+
+    return partition.key, records
+
+
+def _run_partition_star(
+    args: Tuple[str, BackfillPartition, bool]
+) -> Tuple[PartitionKey, Optional[int]]:
+    return _run_partition(*args)
+
+
+def run_energy_backfill(
+    network: NetworkSchema = NetworkNEM,
+    years: Optional[List[int]] = None,
+    regions: Optional[List[str]] = None,
+    fueltech: Optional[str] = None,
+    run_clear: bool = False,
+    workers: Optional[int] = None,
+    run_id: Optional[str] = None,
+    resume: bool = True,
+) -> int:
+    """Run an energy backfill across worker processes.
+
+    Completed partitions are checkpointed under run_id. With resume set the
+    partitions checkpointed by a previous stopped run are skipped. Checkpoints are
+    cleared once every partition of a run completes"""
+    if not workers:
+        workers = settings.energy_backfill_workers
+
+    if not run_id:
+        run_id = "energy_backfill_{}".format(network.code.lower())
+
+    partitions = build_backfill_partitions(
+        network=network, years=years, regions=regions, fueltech=fueltech
+    )
+
+    if resume:
+        completed = get_completed_partitions(run_id)
+        partitions = [p for p in partitions if p.key not in completed]
+
+        if completed:
+            logger.info(
+                "Resuming {} skipping {} completed partitions".format(run_id, len(completed))
+            )
+    else:
+        clear_checkpoints(run_id)
+
+    logger.info(
+        "Running {} with {} partitions of ~{} rows on {} workers".format(
+            run_id, len(partitions), sum([p.estimated_rows for p in partitions]), workers
+        )
+    )
+
+    args_list = [(run_id, p, run_clear) for p in partitions]
+
+    num_records = 0
+    num_errors = 0
+
+    if workers < 2:
+        results = map(_run_partition_star, args_list)
+        results_list = list(results)
+    else:
+        # close the connections of this process so they aren't inherited by the workers
+        get_database_engine().dispose()
+
+        with multiprocessing.Pool(processes=workers, initializer=_worker_init) as pool:
+            # chunksize of one so idle workers pull the next partition off the queue
+            results_list = list(pool.imap_unordered(_run_partition_star, args_list, chunksize=1))
+
+    for _, records in results_list:
+        if records is None:
+            num_errors += 1
+            continue
+
+        num_records += records
+
+    if num_errors:
+        logger.error("{}: {} partitions failed. Rerun to resume".format(run_id, num_errors))
+    else:
+        clear_checkpoints(run_id)
+
+    logger.info("{}: inserted {} records".format(run_id, num_records))
+
+    return num_records
 
 
 @click.command()
@@ -84,15 +338,25 @@ def energy_process(args_list: List, worker_count: Optional[int]) -> None:
 @click.option("--workers", required=False, type=int)
 @click.option("--fueltech", required=False, type=str)
 @click.option("--region", required=False, type=str)
+@click.option("--run-id", required=False, type=str)
+@click.option("--restart", is_flag=True, default=False, help="Ignore checkpoints and start over")
 def cli(
     year: Optional[int] = None,
     fueltech: Optional[str] = None,
     region: Optional[str] = None,
     workers: Optional[int] = None,
+    run_id: Optional[str] = None,
+    restart: bool = False,
 ) -> None:
-    args_list = _build_args_list(year=year, region=region, fueltech=fueltech)
-    click.echo("Running {} items".format(len(args_list)))
-    energy_process(args_list, worker_count=workers)
+    num_records = run_energy_backfill(
+        years=[year] if year else None,
+        regions=[region] if region else None,
+        fueltech=fueltech,
+        workers=workers,
+        run_id=run_id,
+        resume=not restart,
+    )
+    click.echo("Inserted {} records".format(num_records))
 
 
 if __name__ == "__main__":
@@ -1,8 +1,10 @@
 """
-For each facility calculate the first and last data seen dates from facility_scada
+Facility first and last data seen dates
 
-The min dates are run less regularly since data is less likely to grow in that direction
-for most recent this is the last active date
+The ranges are maintained by ingest in facility_scada_range (see
+opennem.core.facility_ranges). This worker copies them onto the facility table and
+verifies them against facility_scada, repairing any that have drifted - for
+example from rows deleted or written outside of the ingest paths.
 
 @TODO move the utility functions into core/facility use this as only the worker
 """
@@ -11,39 +13,67 @@ from datetime import datetime
 from textwrap import dedent
 from typing import List, Optional
 
+from sqlalchemy import sql
+
+from opennem.core.facility_ranges import FACILITY_RANGES_SESSION_VALUES, facility_seen_range_query
 from opennem.db import get_database_engine
+from opennem.db.query import run_query
 from opennem.notifications.slack import slack_message
 from opennem.schema.core import BaseConfig
 from opennem.utils.sql import duid_in_case
 
 logger = logging.getLogger("opennem.workers.facility_data_ranges")
 
+FACILITY_RANGES_REPAIR_QUERY = """
+    INSERT INTO facility_scada_range (
+        network_id,
+        facility_code,
+        is_forecast,
+        data_first_seen,
+        data_last_seen,
+        generated_last_seen,
+        energy_last_seen
+    )
+    VALUES {values}
+    ON CONFLICT (network_id, facility_code, is_forecast) DO UPDATE SET
+        data_first_seen = excluded.data_first_seen,
+        data_last_seen = excluded.data_last_seen,
+        generated_last_seen = excluded.generated_last_seen,
+        energy_last_seen = excluded.energy_last_seen,
+        updated_at = now()
+"""
+
 
 def get_update_seen_query(
     include_first_seen: bool = True,
     facility_codes: Optional[List[str]] = None,
 ) -> str:
+    """Copy the seen dates from the facility ranges onto the facility table. Only
+    facilities that have changed are updated"""
     __query = """
     update facility f set
         {fs}data_first_seen = seen_query.data_first_seen,
         data_last_seen = seen_query.data_last_seen
     from (
         select
-            f.code as code,
-            {fs}min(fs.trading_interval) as data_first_seen,
-            max(fs.trading_interval) as data_last_seen
-            from facility_scada fs
-        left join facility f on fs.facility_code = f.code
-        where fs.generated > 0 or fs.eoi_quantity is not null
+            fsr.facility_code as code,
+            {fs}min(fsr.data_first_seen) as data_first_seen,
+            max(fsr.data_last_seen) as data_last_seen
+        from facility_scada_range fsr
+        where fsr.data_last_seen is not null
         {facility_codes_query}
         group by 1
     ) as seen_query
-    where f.code = seen_query.code;
+    where
+        f.code = seen_query.code and (
+            {fs}f.data_first_seen is distinct from seen_query.data_first_seen or
+            f.data_last_seen is distinct from seen_query.data_last_seen
+        );
     """
 
     fs = "" if include_first_seen else "--"
     facility_codes_query = (
-        f"and f.code in ({duid_in_case(facility_codes)})" if facility_codes else ""
+        f"and fsr.facility_code in ({duid_in_case(facility_codes)})" if facility_codes else ""
     )
 
     query = __query.format(fs=fs, facility_codes_query=facility_codes_query)
@@ -56,7 +86,7 @@ def update_facility_seen_range(
     facility_codes: Optional[List[str]] = None,
 ) -> bool:
     """Updates last seen and first seen. For each facility updates the date the facility
-    was seen for the first and last time in the power data from FacilityScada.
+    was seen for the first and last time in the power data from the facility ranges.
 
     Args:
         include_first_seen (bool, optional): Include earliest seen time. Defaults to False.
@@ -72,13 +102,126 @@ def update_facility_seen_range(
         include_first_seen=include_first_seen, facility_codes=facility_codes
     )
 
-    with engine.connect() as c:
+    with engine.begin() as c:
         logger.debug(__query)
         c.execute(__query)
 
     return True
 
 
+def get_verify_ranges_query(facility_codes: Optional[List[str]] = None) -> str:
+    """Facility ranges computed from facility_scada that differ from the
+    maintained ranges"""
+    __query = """
+    select
+        scada_range.network_id,
+        scada_range.facility_code,
+        scada_range.is_forecast,
+        scada_range.data_first_seen,
+        scada_range.data_last_seen,
+        scada_range.generated_last_seen,
+        scada_range.energy_last_seen
+    from (
+        select
+            fs.network_id,
+            fs.facility_code,
+            fs.is_forecast,
+            min(fs.trading_interval) filter (
+                where fs.generated > 0 or fs.eoi_quantity is not null
+            ) as data_first_seen,
+            max(fs.trading_interval) filter (
+                where fs.generated > 0 or fs.eoi_quantity is not null
+            ) as data_last_seen,
+            max(fs.trading_interval) filter (
+                where fs.generated is not null
+            ) as generated_last_seen,
+            max(fs.trading_interval) filter (
+                where fs.eoi_quantity is not null
+            ) as energy_last_seen
+        from facility_scada fs
+        where
+            (fs.generated is not null or fs.eoi_quantity is not null)
+            {facility_codes_query}
+        group by 1, 2, 3
+    ) as scada_range
+    left join facility_scada_range fsr on
+        fsr.network_id = scada_range.network_id
+        and fsr.facility_code = scada_range.facility_code
+        and fsr.is_forecast = scada_range.is_forecast
+    where
+        fsr.facility_code is null
+        or fsr.data_first_seen is distinct from scada_range.data_first_seen
+        or fsr.data_last_seen is distinct from scada_range.data_last_seen
+        or fsr.generated_last_seen is distinct from scada_range.generated_last_seen
+        or fsr.energy_last_seen is distinct from scada_range.energy_last_seen
+    """
+
+    facility_codes_query = (
+        f"and fs.facility_code in ({duid_in_case(facility_codes)})" if facility_codes else ""
+    )
+
+    return dedent(__query.format(facility_codes_query=facility_codes_query))
+
+
+def verify_facility_ranges(
+    facility_codes: Optional[List[str]] = None, repair: bool = True
+) -> int:
+    """Recompute the facility ranges from facility_scada and compare them to the
+    ranges maintained by ingest. Mismatches are reported and repaired.
+
+    Args:
+        facility_codes (Optional[List[str]], optional): Facility codes to verify. Defaults to None.
+        repair (bool, optional): Overwrite mismatched ranges. Defaults to True.
+
+    Returns:
+        int: Number of mismatched ranges
+    """
+    engine = get_database_engine()
+
+    query = get_verify_ranges_query(facility_codes=facility_codes)
+
+    with engine.connect() as c:
+        logger.debug(query)
+        mismatches = list(c.execute(query))
+
+    if not mismatches:
+        logger.info("Facility ranges verified")
+        return 0
+
+    for row in mismatches:
+        logger.warning("Facility range mismatch for {} {}".format(row[0], row[1]))
+
+    slack_message(
+        "Facility ranges: {} mismatched ranges {}".format(
+            len(mismatches), "repaired" if repair else "found"
+        )
+    )
+
+    if repair:
+        repair_query = sql.text(
+            FACILITY_RANGES_REPAIR_QUERY.format(values=FACILITY_RANGES_SESSION_VALUES)
+        )
+
+        with engine.begin() as c:
+            c.execute(
+                repair_query,
+                [
+                    {
+                        "network_id": row[0],
+                        "facility_code": row[1],
+                        "is_forecast": row[2],
+                        "data_first_seen": row[3],
+                        "data_last_seen": row[4],
+                        "generated_last_seen": row[5],
+                        "energy_last_seen": row[6],
+                    }
+                    for row in mismatches
+                ],
+            )
+
+    return len(mismatches)
+
+
 class FacilitySeenRange(BaseConfig):
     date_min: Optional[datetime]
     date_max: Optional[datetime]
@@ -94,23 +237,7 @@ def get_facility_seen_range(facility_codes: List[str]) -> FacilitySeenRange:
     Returns:
         FacilitySeenRange: Schema defining the date range
     """
-
-    __query = """
-        select
-            min(data_first_seen) as first_seen,
-            max(data_last_seen) as last_seen
-        from facility
-        where code in ({facilities});
-    """
-
-    engine = get_database_engine()
-    result = []
-
-    query = __query.format(facilities=duid_in_case(facility_codes))
-
-    with engine.connect() as c:
-        logger.debug(query)
-        result = list(c.execute(query))
+    result = run_query(facility_seen_range_query(facility_codes))
 
     if not result:
         raise Exception("Could not get facility seen range: No results")
@@ -129,4 +256,5 @@ def get_facility_seen_range(facility_codes: List[str]) -> FacilitySeenRange:
 
 
 if __name__ == "__main__":
+    verify_facility_ranges()
     update_facility_seen_range(True)
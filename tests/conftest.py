@@ -5,6 +5,9 @@ import pytest
 from betamax import Betamax
 from requests import Session
 from scrapy.http import Request, Response
+from sqlalchemy.engine import Engine
+
+from opennem.db import get_database_engine
 
 from .utils import PATH_TESTS_FIXTURES
 
@@ -63,6 +66,21 @@ def scrapy_mock_response() -> Callable:
     return _scrapy_response_from_file
 
 
+@pytest.fixture
+def db_engine() -> Engine:
+    """Database engine for tests that need postgres. Skipped when the database
+    isn't available"""
+    engine = get_database_engine()
+
+    try:
+        with engine.connect() as c:
+            c.execute("select 1")
+    except Exception as e:
+        pytest.skip("Database not available: {}".format(e))
+
+    return engine
+
+
 @pytest.fixture
 def xls_old_file(load_file: Callable) -> BinaryIO:
     return load_file("old.xls")
@@ -0,0 +1,104 @@
+import time
+import zipfile
+from typing import BinaryIO
+
+import pytest
+
+from opennem.core.parsers.aemo import mms
+from opennem.core.parsers.aemo.mms import AEMOTableSet, parse_aemo_mms_csv
+from opennem.utils.archive import stream_text_lines, stream_zip_contents
+
+
+def _read_dispatch_scada(fh: BinaryIO) -> str:
+    with zipfile.ZipFile(fh) as zf:
+        return zf.read(zf.namelist()[0]).decode("utf-8")
+
+
+@pytest.fixture
+def dispatch_scada_content(aemo_nemweb_dispatch_scada: BinaryIO) -> str:
+    return _read_dispatch_scada(aemo_nemweb_dispatch_scada)
+
+
+def test_parse_columnar_matches_rows(dispatch_scada_content: str) -> None:
+    table_rows = parse_aemo_mms_csv(dispatch_scada_content).get_table("dispatch_unit_scada")
+    table_columnar = parse_aemo_mms_csv(dispatch_scada_content, columnar=True).get_table(
+        "dispatch_unit_scada"
+    )
+
+    assert table_rows and table_columnar, "Parsed the table in both modes"
+    assert table_columnar.is_columnar, "Table is columnar"
+    assert len(table_columnar.records) == len(table_rows.records) == 390, "Correct record count"
+
+    assert [i.dict() for i in table_columnar.records] == [
+        i.dict() for i in table_rows.records
+    ], "Columnar records match row records"
+
+
+def test_parse_columnar_frame(dispatch_scada_content: str) -> None:
+    table = parse_aemo_mms_csv(dispatch_scada_content, columnar=True).get_table(
+        "dispatch_unit_scada"
+    )
+
+    assert table, "Parsed the table"
+
+    df = table.to_frame()
+
+    assert len(df) == 390, "Frame has all rows"
+    assert list(df.index.names) == ["settlementdate", "duid"], "Indexed on primary keys"
+    assert df["scadavalue"].dtype.kind == "f", "Values are coerced in bulk"
+
+
+def test_parse_columnar_merges_tables(dispatch_scada_content: str) -> None:
+    table_set = AEMOTableSet(tables=[])
+
+    for _ in range(2):
+        table_set = parse_aemo_mms_csv(dispatch_scada_content, table_set, columnar=True)
+
+    table = table_set.get_table("dispatch_unit_scada")
+
+    assert table and table.is_columnar, "Merged table stays columnar"
+    assert len(table.records) == 780, "Merged table has both files"
+
+
+def test_parse_aemo_urls_ordered(
+    dispatch_scada_content: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Downloads finish out of order but are merged in url order"""
+    content_lines = dispatch_scada_content.splitlines()
+    header, footer = content_lines[:2], content_lines[-1:]
+
+    url_contents = {
+        "http://test/{}".format(i): "\n".join(header + [content_lines[2 + i]] + footer)
+        for i in range(6)
+    }
+
+    def _mock_downloader(url: str) -> bytes:
+        time.sleep(0.05 if url.endswith("0") else 0)
+        return url_contents[url].encode("utf-8")
+
+    monkeypatch.setattr(mms, "url_downloader", _mock_downloader)
+
+    table_set = mms.parse_aemo_urls(list(url_contents.keys()), workers=3)
+    table = table_set.get_table("dispatch_unit_scada")
+
+    assert table, "Parsed the table"
+    assert [i.duid for i in table.records] == [
+        content_lines[2 + i].split(",")[5] for i in range(6)
+    ], "Records merged in url order"
+
+
+def test_parse_streamed_lines(
+    aemo_nemweb_dispatch_scada: BinaryIO, dispatch_scada_content: str
+) -> None:
+    """The parser accepts a stream of lines straight out of the zip"""
+    aemo_nemweb_dispatch_scada.seek(0)
+
+    lines = stream_text_lines(stream_zip_contents(aemo_nemweb_dispatch_scada, "r"))
+
+    table = parse_aemo_mms_csv(lines).get_table("dispatch_unit_scada")
+    table_expected = parse_aemo_mms_csv(dispatch_scada_content).get_table("dispatch_unit_scada")
+
+    assert table and table_expected, "Parsed the table"
+    assert [i.dict() for i in table.records] == [
+        i.dict() for i in table_expected.records
+    ], "Streamed records match"
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+import pytest
+
+from opennem.api import cache
+from opennem.api.cache import (
+    cache_response,
+    get_cache_key,
+    get_cache_ttl,
+    invalidate_network_cache,
+)
+from opennem.api.stats.schema import OpennemDataSet
+
+
+class MockRedis:
+    def __init__(self) -> None:
+        self.store: Dict[str, Any] = {}
+        self.ttls: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.store.get(key)
+
+    def set(self, key: str, value: Any, ex: int) -> None:
+        self.store[key] = value
+        self.ttls[key] = ex
+
+    def incr(self, key: str) -> None:
+        self.store[key] = int(self.store.get(key, 0)) + 1
+
+
+@pytest.fixture
+def mock_redis(monkeypatch: pytest.MonkeyPatch) -> MockRedis:
+    client = MockRedis()
+    monkeypatch.setattr(cache, "_get_client", lambda: client)
+    return client
+
+
+def test_cache_key_normalized() -> None:
+    key = get_cache_key(
+        "power_station", "nem", 2, {"station_code": " BAYSW ", "since": None, "engine": object()}
+    )
+
+    assert key == "opennem:api:power_station:NEM:2:station_code=BAYSW"
+
+
+def test_cache_ttl_follows_interval() -> None:
+    # 2 minutes into a 5 minute NEM interval
+    assert get_cache_ttl("NEM", now=1800 * 1000 + 120) == 180 + cache.API_CACHE_INTERVAL_LAG
+
+    # 2 minutes into a 30 minute WEM interval
+    assert get_cache_ttl("WEM", now=1800 * 1000 + 120) == 1680 + cache.API_CACHE_INTERVAL_LAG
+
+
+def test_cache_response(mock_redis: MockRedis) -> None:
+    calls = []
+
+    @cache_response("test_endpoint")
+    def _endpoint(network_code: str, station_code: str) -> OpennemDataSet:
+        calls.append(station_code)
+        return OpennemDataSet(type="power", data=[], code=station_code)
+
+    first = _endpoint(network_code="NEM", station_code="BAYSW")
+    second = _endpoint(network_code="NEM", station_code="BAYSW")
+
+    assert calls == ["BAYSW"], "Second request served from cache"
+    assert first.body == second.body, "Same response from cache"
+
+    _endpoint(network_code="NEM", station_code="ERARING")
+
+    assert calls == ["BAYSW", "ERARING"], "Keyed on parameters"
+
+    invalidate_network_cache("NEM")
+    _endpoint(network_code="NEM", station_code="BAYSW")
+
+    assert calls == ["BAYSW", "ERARING", "BAYSW"], "Invalidated on new intervals"
+
+
+def test_cache_response_async_off_event_loop(
+    mock_redis: MockRedis, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    redis_threads = []
+    redis_get = mock_redis.get
+
+    def _get(key: str) -> Optional[Any]:
+        redis_threads.append(threading.get_ident())
+        return redis_get(key)
+
+    monkeypatch.setattr(mock_redis, "get", _get)
+
+    calls = []
+
+    @cache_response("test_endpoint")
+    async def _endpoint(network_code: str, station_code: str) -> OpennemDataSet:
+        calls.append(threading.get_ident())
+        return OpennemDataSet(type="power", data=[], code=station_code)
+
+    first = asyncio.run(_endpoint(network_code="NEM", station_code="BAYSW"))
+    second = asyncio.run(_endpoint(network_code="NEM", station_code="BAYSW"))
+
+    assert len(calls) == 1, "Second request served from cache"
+    assert first.body == second.body, "Same response from cache"
+    assert redis_threads, "Cache was queried"
+    assert calls[0] not in redis_threads, "Redis calls run in the threadpool"
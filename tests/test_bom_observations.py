@@ -0,0 +1,138 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from opennem.clients import bom
+from opennem.clients.bom import (
+    get_bom_observations_many,
+    reset_bom_feed_validators,
+    save_bom_feed_validators,
+)
+from opennem.controllers import bom as bom_controller
+from opennem.controllers.bom import store_bom_observations_many
+
+BOM_FEED_URL = "http://www.bom.gov.au/fwo/IDN60901/IDN60901.94768.json"
+
+
+def _bom_feed(aifstimes: List[str]) -> Dict:
+    return {
+        "observations": {
+            "header": [{"state_time_zone": "NSW"}],
+            "data": [{"aifstime_utc": i, "air_temp": 20.1} for i in aifstimes],
+        }
+    }
+
+
+class _MockResponse:
+    def __init__(
+        self, status_code: int, body: Optional[Dict] = None, headers: Optional[Dict] = None
+    ) -> None:
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self) -> Optional[Dict]:
+        return self.body
+
+
+def test_get_bom_observations_many_conditional(monkeypatch: pytest.MonkeyPatch) -> None:
+    responses = [
+        _MockResponse(200, _bom_feed(["20211201000000"]), {"ETag": '"abc"'}),
+        _MockResponse(200, _bom_feed(["20211201000000"]), {"ETag": '"abc"'}),
+        _MockResponse(304),
+    ]
+    request_headers: List[Dict] = []
+
+    def _mock_get(url: str, headers: Dict) -> _MockResponse:
+        request_headers.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(bom, "http", type("MockHttp", (), {"get": staticmethod(_mock_get)}))
+
+    reset_bom_feed_validators()
+
+    observations = get_bom_observations_many([(BOM_FEED_URL, "066214")])
+
+    assert len(observations) == 1
+    assert observations[0].station_code == "066214"
+    assert observations[0].etag == '"abc"'
+    assert "If-None-Match" not in request_headers[0]
+
+    # validators are kept once the observations are stored
+    observations = get_bom_observations_many([(BOM_FEED_URL, "066214")])
+
+    assert len(observations) == 1, "Feed fetched again until stored"
+    assert "If-None-Match" not in request_headers[1]
+
+    save_bom_feed_validators(observations)
+
+    assert get_bom_observations_many([(BOM_FEED_URL, "066214")]) == [], "Unchanged feed skipped"
+    assert request_headers[2]["If-None-Match"] == '"abc"', "Sends a conditional request"
+
+    reset_bom_feed_validators()
+
+
+@pytest.mark.parametrize("store_error", [None, Exception("Insert error")])
+def test_store_bom_observations_many(
+    monkeypatch: pytest.MonkeyPatch, store_error: Optional[Exception]
+) -> None:
+    observations = bom.BOMObservationReturn(
+        **{
+            "station_code": "066214",
+            "state": "NSW",
+            "feed_url": BOM_FEED_URL,
+            "etag": '"abc"',
+            "observations": [
+                {"state": "NSW", "aifstime_utc": i, "air_temp": 20.1}
+                for i in ["20211201000000", "20211201003000", "20211201010000"]
+            ],
+        }
+    )
+
+    latest_stored = observations.observations[1].observation_time
+
+    monkeypatch.setattr(bom_controller, "run_query", lambda statement: [("066214", latest_stored)])
+
+    statements: List[Any] = []
+
+    class _MockSession:
+        def __enter__(self) -> "_MockSession":
+            return self
+
+        def __exit__(self, *args: Any) -> None:
+            pass
+
+        def execute(self, statement: Any) -> None:
+            statements.append(statement)
+
+            if store_error:
+                raise store_error
+
+        def commit(self) -> None:
+            pass
+
+    monkeypatch.setattr(bom_controller, "SessionLocal", _MockSession)
+
+    reset_bom_feed_validators()
+
+    cr = store_bom_observations_many([observations])
+
+    feed_headers = bom._get_conditional_headers(BOM_FEED_URL)
+    reset_bom_feed_validators()
+
+    if store_error:
+        assert cr.errors == 1
+        assert feed_headers == {}, "Validators not kept when the insert fails"
+        return None
+
+    assert feed_headers == {"If-None-Match": '"abc"'}, "Validators kept once stored"
+
+    assert cr.processed_records == 3
+    assert cr.inserted_records == 1, "Only observations newer than the latest stored"
+    assert len(statements) == 1, "Stations are stored in one insert"
+
+    stored_times = [i for i in statements[0].compile().params.values() if isinstance(i, datetime)]
+
+    assert stored_times == [observations.observations[2].observation_time]
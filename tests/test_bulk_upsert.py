@@ -0,0 +1,270 @@
+import re
+import struct
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import pytest
+import pytz
+from sqlalchemy import Boolean, Column, Numeric, Text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import DateTime
+
+from opennem.db.models.opennem import FacilityScada
+from opennem.pipelines import bulk_insert
+from opennem.pipelines.copy_binary import COPY_BINARY_HEADER
+
+# facility_scada columns in physical order. is_forecast and energy_quality_flag were
+# added by later migrations so follow eoi_quantity unlike in the model
+FACILITY_SCADA_PHYSICAL_COLUMNS = [
+    "created_by",
+    "created_at",
+    "updated_at",
+    "network_id",
+    "trading_interval",
+    "facility_code",
+    "generated",
+    "eoi_quantity",
+    "is_forecast",
+    "energy_quality_flag",
+]
+
+CopyOrderBase = declarative_base()
+
+
+class CopyOrderTest(CopyOrderBase):
+    """Model declared in a different column order to its table"""
+
+    __tablename__ = "__test_copy_order"
+
+    code = Column(Text, primary_key=True)
+    value = Column(Numeric)
+    is_flagged = Column(Boolean)
+    seen_at = Column(DateTime(timezone=True))
+
+
+COPY_ORDER_TABLE_QUERY = """
+    CREATE TABLE __test_copy_order (
+        code text primary key,
+        seen_at timestamptz,
+        is_flagged boolean,
+        value numeric
+    )
+"""
+
+
+class MockCursor:
+    def __init__(self, log: List[str]) -> None:
+        self.log = log
+        self.rowcount = 0
+        self._rows = 0
+
+    def execute(self, query: str) -> None:
+        self.log.append(query.split()[0].lower())
+
+        if query.strip().startswith("INSERT"):
+            self.rowcount = self._rows
+
+    def fetchone(self) -> List[str]:
+        return ["UTC"]
+
+    def copy_expert(self, query: str, content: Any) -> None:
+        copy_bytes = content.read()
+
+        assert copy_bytes.startswith(COPY_BINARY_HEADER), "Staged in binary"
+
+        self._rows = copy_bytes.count(b"BAYSW1")
+        self.log.append("copy")
+
+
+class MockCopyCursor(MockCursor):
+    """Reads the copy into rows of physical columns by the COPY column list"""
+
+    def __init__(self, log: List[str], physical_columns: List[str]) -> None:
+        super().__init__(log)
+        self.physical_columns = physical_columns
+        self.copied_rows: List[Dict[str, Any]] = []
+
+    def copy_expert(self, query: str, content: Any) -> None:
+        copy_columns_match = re.search(r"COPY \S+ \(([^)]*)\) FROM STDIN", query)
+
+        assert copy_columns_match, "COPY lists its columns"
+
+        copy_columns = [i.strip() for i in copy_columns_match.group(1).split(",")]
+
+        assert sorted(copy_columns) == sorted(self.physical_columns)
+
+        copy_bytes = content.read()
+        position = len(COPY_BINARY_HEADER)
+
+        while True:
+            (field_count,) = struct.unpack("!h", copy_bytes[position : position + 2])
+            position += 2
+
+            if field_count < 0:
+                break
+
+            row: Dict[str, Any] = {}
+
+            for column_name in copy_columns:
+                (field_length,) = struct.unpack("!i", copy_bytes[position : position + 4])
+                position += 4
+                row[column_name] = None
+
+                if field_length >= 0:
+                    row[column_name] = copy_bytes[position : position + field_length]
+                    position += field_length
+
+            self.copied_rows.append({i: row[i] for i in self.physical_columns})
+
+        self._rows = len(self.copied_rows)
+        self.log.append("copy")
+
+
+class MockConnection:
+    def __init__(self) -> None:
+        self.log: List[str] = []
+
+    def cursor(self) -> MockCursor:
+        return MockCursor(self.log)
+
+    def commit(self) -> None:
+        self.log.append("commit")
+
+    def rollback(self) -> None:
+        self.log.append("rollback")
+
+    def close(self) -> None:
+        self.log.append("close")
+
+
+class MockCopyConnection(MockConnection):
+    def __init__(self, physical_columns: List[str]) -> None:
+        super().__init__()
+        self.copy_cursor = MockCopyCursor(self.log, physical_columns)
+
+    def cursor(self) -> MockCopyCursor:
+        return self.copy_cursor
+
+
+class MockEngine:
+    def __init__(self, conn: MockConnection) -> None:
+        self.conn = conn
+
+    def raw_connection(self) -> MockConnection:
+        return self.conn
+
+
+def _scada_records(count: int) -> List[Dict]:
+    return [
+        {
+            "created_by": "test",
+            "created_at": datetime(2021, 1, 1),
+            "updated_at": None,
+            "network_id": "NEM",
+            "trading_interval": datetime(2021, 1, 1, 0, i, tzinfo=pytz.utc),
+            "facility_code": "BAYSW1",
+            "generated": 100.0,
+            "is_forecast": False,
+            "eoi_quantity": None,
+            "energy_quality_flag": 0,
+        }
+        for i in range(count)
+    ]
+
+
+def test_bulk_upsert_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn = MockConnection()
+    monkeypatch.setattr(bulk_insert, "get_database_engine", lambda: MockEngine(conn))
+
+    committed_chunks: List[int] = []
+
+    result = bulk_insert.bulk_upsert(
+        FacilityScada,
+        _scada_records(5),
+        ["generated"],
+        chunk_size=2,
+        before_commit=lambda cursor, records: committed_chunks.append(len(records)),
+    )
+
+    assert [c.rows for c in result.chunks] == [2, 2, 1], "Records split into chunks"
+    assert [c.upserted for c in result.chunks] == [2, 2, 1], "Upserted counts per chunk"
+    assert result.rows == 5 and result.errors == 0
+    assert committed_chunks == [2, 2, 1], "Hook called per chunk"
+
+    # staging table created once then each chunk copied, upserted and committed
+    assert conn.log == ["create", "show", "commit"] + ["copy", "insert", "commit"] * 3 + [
+        "close"
+    ]
+
+
+def test_bulk_upsert_staging_table_name() -> None:
+    assert bulk_insert._staging_table_name(FacilityScada) == "__staging_facility_scada"
+
+
+def test_bulk_upsert_copy_columns_physical_order(monkeypatch: pytest.MonkeyPatch) -> None:
+    model_columns = [c.name for c in FacilityScada.__table__.columns]
+
+    assert model_columns != FACILITY_SCADA_PHYSICAL_COLUMNS, "Model and table order differ"
+
+    conn = MockCopyConnection(FACILITY_SCADA_PHYSICAL_COLUMNS)
+    monkeypatch.setattr(bulk_insert, "get_database_engine", lambda: MockEngine(conn))
+
+    records = _scada_records(2)
+    records[0]["eoi_quantity"] = 8.5
+
+    result = bulk_insert.bulk_upsert(FacilityScada, records, ["generated"])
+
+    assert result.rows == 2 and result.errors == 0
+
+    copied_row = conn.copy_cursor.copied_rows[0]
+
+    assert copied_row["facility_code"] == b"BAYSW1"
+    assert copied_row["is_forecast"] == b"\x00", "Boolean lands in is_forecast"
+    assert copied_row["eoi_quantity"] is not None, "Numeric lands in eoi_quantity"
+    assert copied_row["energy_quality_flag"] is not None
+
+
+def test_build_insert_query_binary_copy_columns() -> None:
+    query = bulk_insert.build_insert_query(
+        FacilityScada, ["generated"], copy_format=bulk_insert.COPY_FORMAT_BINARY
+    )
+
+    model_columns = ", ".join([c.name for c in FacilityScada.__table__.columns])
+
+    assert "({}) FROM STDIN".format(model_columns) in query
+
+
+def test_bulk_upsert_physical_order_db(db_engine: Engine) -> None:
+    records = [
+        {
+            "code": "TEST{}".format(i),
+            "value": Decimal("10.5") + i,
+            "is_flagged": i % 2 == 0,
+            "seen_at": datetime(2021, 1, 1, 0, i, tzinfo=pytz.utc),
+        }
+        for i in range(3)
+    ]
+
+    with db_engine.begin() as c:
+        c.execute("DROP TABLE IF EXISTS __test_copy_order")
+        c.execute(COPY_ORDER_TABLE_QUERY)
+
+    try:
+        result = bulk_insert.bulk_upsert(CopyOrderTest, records, ["value"])
+
+        assert result.errors == 0 and result.upserted == 3
+
+        with db_engine.connect() as c:
+            rows = list(
+                c.execute("select code, seen_at, is_flagged, value from __test_copy_order")
+            )
+    finally:
+        with db_engine.begin() as c:
+            c.execute("DROP TABLE IF EXISTS __test_copy_order")
+
+    assert sorted([tuple(i) for i in rows]) == [
+        (i["code"], i["seen_at"], i["is_flagged"], i["value"]) for i in records
+    ]
+
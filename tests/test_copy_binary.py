@@ -0,0 +1,108 @@
+import struct
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, Tuple
+
+import pytest
+import pytz
+
+from opennem.db.models.opennem import FacilityScada
+from opennem.pipelines.copy_binary import (
+    COPY_BINARY_HEADER,
+    COPY_BINARY_TRAILER,
+    NUMERIC_NAN,
+    NUMERIC_NEG,
+    NUMERIC_POS,
+    _encode_numeric,
+    generate_copy_binary_from_records,
+)
+
+
+def _decode_numeric(field: bytes) -> Tuple[int, int, int, List[int]]:
+    ndigits, weight, sign, dscale = struct.unpack("!hhHh", field[:8])
+    digits = list(struct.unpack("!{}h".format(ndigits), field[8:]))
+
+    return weight, sign, dscale, digits
+
+
+@pytest.mark.parametrize(
+    ["value", "weight", "sign", "dscale", "digits"],
+    [
+        (1234.5678, 0, NUMERIC_POS, 4, [1234, 5678]),
+        (0.001, -1, NUMERIC_POS, 3, [10]),
+        (-12, 0, NUMERIC_NEG, 0, [12]),
+        (10000, 1, NUMERIC_POS, 0, [1]),
+        (600.0, 0, NUMERIC_POS, 1, [600]),
+        (0, 0, NUMERIC_POS, 0, []),
+        (1e-05, -2, NUMERIC_POS, 5, [1000]),
+        (Decimal("-123456.7"), 1, NUMERIC_NEG, 1, [12, 3456, 7000]),
+        (float("nan"), 0, NUMERIC_NAN, 0, []),
+    ],
+)
+def test_encode_numeric(
+    value: Any, weight: int, sign: int, dscale: int, digits: List[int]
+) -> None:
+    encoded = _encode_numeric(value)
+
+    (field_length,) = struct.unpack("!i", encoded[:4])
+
+    assert field_length == len(encoded) - 4, "Field length prefix is correct"
+    assert _decode_numeric(encoded[4:]) == (weight, sign, dscale, digits), "Numeric is correct"
+
+
+def test_copy_binary_facility_scada() -> None:
+    trading_interval = datetime(2021, 1, 1, 10, 5, tzinfo=pytz.FixedOffset(600))
+
+    record = {
+        "created_by": "test",
+        "created_at": datetime(2021, 1, 1, 0, 0),
+        "updated_at": None,
+        "network_id": "NEM",
+        "trading_interval": trading_interval,
+        "facility_code": "BAYSW1",
+        "generated": 600.5,
+        "is_forecast": False,
+        "eoi_quantity": None,
+        "energy_quality_flag": 0,
+    }
+
+    content = generate_copy_binary_from_records(FacilityScada, [record, record], chunk_size=1)
+    copy_bytes = content.read()
+
+    assert copy_bytes.startswith(COPY_BINARY_HEADER), "Has the copy header"
+    assert copy_bytes.endswith(COPY_BINARY_TRAILER), "Has the copy trailer"
+
+    # walk the first row
+    position = len(COPY_BINARY_HEADER)
+    (field_count,) = struct.unpack("!h", copy_bytes[position : position + 2])
+    position += 2
+
+    assert field_count == len(FacilityScada.__table__.columns), "One field per column"
+
+    fields: List[Any] = []
+
+    for _ in range(field_count):
+        (field_length,) = struct.unpack("!i", copy_bytes[position : position + 4])
+        position += 4
+
+        if field_length < 0:
+            fields.append(None)
+            continue
+
+        fields.append(copy_bytes[position : position + field_length])
+        position += field_length
+
+    row = dict(zip([c.name for c in FacilityScada.__table__.columns], fields))
+
+    assert row["network_id"] == b"NEM"
+    assert row["updated_at"] is None
+    assert row["eoi_quantity"] is None
+    assert row["is_forecast"] == b"\x00"
+
+    # 2021-01-01 00:05 UTC in microseconds since 2000-01-01
+    assert struct.unpack("!q", row["trading_interval"])[0] == 662774700000000
+
+    assert _decode_numeric(row["generated"]) == (0, NUMERIC_POS, 1, [600, 5000])
+
+    # the second row follows
+    assert struct.unpack("!h", copy_bytes[position : position + 2])[0] == field_count
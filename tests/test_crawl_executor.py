@@ -0,0 +1,79 @@
+import threading
+import time
+from typing import List
+
+from opennem.crawlers.executor import get_priority_slots, run_crawlers
+from opennem.crawlers.schema import CrawlerDefinition, CrawlerPriority, CrawlerSchedule
+
+
+def _crawler(name: str, priority: CrawlerPriority, timeout: int = 5) -> CrawlerDefinition:
+    return CrawlerDefinition(
+        name=name,
+        priority=priority,
+        schedule=CrawlerSchedule.live,
+        timeout=timeout,
+        processor=lambda **kwargs: None,
+    )
+
+
+def test_get_priority_slots() -> None:
+    assert get_priority_slots(CrawlerPriority.high, 4) == 4
+    assert get_priority_slots(CrawlerPriority.low, 4) == 2
+    assert get_priority_slots(CrawlerPriority.low, 1) == 1, "Always at least one slot"
+
+
+def test_run_crawlers_concurrent() -> None:
+    started: List[str] = []
+    lock = threading.Lock()
+
+    def _crawl_func(crawler: CrawlerDefinition) -> None:
+        with lock:
+            started.append(crawler.name)
+
+        if crawler.name == "error":
+            raise Exception("Crawl error")
+
+        time.sleep(0.1)
+
+    crawlers = [
+        _crawler("low", CrawlerPriority.low),
+        _crawler("error", CrawlerPriority.medium),
+        _crawler("high_1", CrawlerPriority.high),
+        _crawler("high_2", CrawlerPriority.high),
+    ]
+
+    run_start = time.perf_counter()
+    results = run_crawlers(crawlers, _crawl_func, workers=4)
+    run_seconds = time.perf_counter() - run_start
+
+    assert [i.name for i in results] == [i.name for i in crawlers], "Results in crawler order"
+    assert started[:2] == ["high_1", "high_2"], "High priority crawlers start first"
+    assert run_seconds < 0.3, "Crawlers run concurrently"
+
+    assert results[1].error == "Crawl error", "Crawl errors are reported"
+    assert results[0].seconds >= 0.1, "Crawl time is recorded"
+
+
+def test_run_crawlers_timeout() -> None:
+    release = threading.Event()
+
+    def _crawl_func(crawler: CrawlerDefinition) -> None:
+        if crawler.name == "slow":
+            release.wait(5)
+
+    crawlers = [
+        _crawler("slow", CrawlerPriority.high, timeout=1),
+        _crawler("fast", CrawlerPriority.high),
+    ]
+
+    results = run_crawlers(crawlers, _crawl_func, workers=2)
+
+    assert results[0].timed_out, "Slow crawler timed out"
+    assert not results[1].timed_out
+
+    # still running from the last run
+    results = run_crawlers(crawlers[:1], _crawl_func, workers=2)
+
+    assert results[0].skipped, "Crawlers still running are skipped"
+
+    release.set()
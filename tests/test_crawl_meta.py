@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+
+from opennem.core.crawlers import meta
+from opennem.core.crawlers.meta import (
+    CrawlStatTypes,
+    crawler_get_meta,
+    crawler_set_meta_many,
+    load_crawl_meta,
+    reset_crawl_meta_cache,
+)
+
+
+class _MockResult:
+    def __init__(self, value: Optional[Dict]) -> None:
+        self.value = value
+
+    def scalar(self) -> Optional[Dict]:
+        return self.value
+
+
+class _MockSession:
+    def __init__(
+        self, rows: List[Any], statements: List[Any], stored: Optional[Dict] = None
+    ) -> None:
+        self.rows = rows
+        self.statements = statements
+        self.stored = stored
+        self.closed = False
+
+    def __enter__(self) -> "_MockSession":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.closed = True
+
+    def query(self, *args: Any) -> "_MockSession":
+        self.statements.append("query")
+        return self
+
+    def all(self) -> List[Any]:
+        return self.rows
+
+    def execute(self, statement: Any) -> _MockResult:
+        self.statements.append(statement)
+        return _MockResult(self.stored)
+
+    def commit(self) -> None:
+        pass
+
+
+def test_crawl_meta_store(monkeypatch: pytest.MonkeyPatch) -> None:
+    rows = [
+        ("au.nem.dispatch_scada", {"latest_processed": "2021-12-01T10:00:00"}),
+        ("au.nem.rooftop", None),
+    ]
+    statements: List[Any] = []
+    sessions: List[_MockSession] = []
+
+    # the row as returned by the upsert which keeps the newer latest processed
+    stored = {"latest_processed": "2021-12-01T10:00:00", "last_crawled": "2021-12-01T11:00:00"}
+
+    def _session_local() -> _MockSession:
+        sessions.append(_MockSession(rows, statements, stored))
+        return sessions[-1]
+
+    monkeypatch.setattr(meta, "SessionLocal", _session_local)
+
+    reset_crawl_meta_cache()
+
+    assert load_crawl_meta() == {"au.nem.dispatch_scada": rows[0][1]}
+
+    latest_processed = crawler_get_meta("au.nem.dispatch_scada", CrawlStatTypes.latest_processed)
+    assert latest_processed == datetime.fromisoformat("2021-12-01T10:00:00")
+    assert crawler_get_meta("au.nem.rooftop", CrawlStatTypes.latest_processed) is None
+    assert statements == ["query"], "Meta is loaded in one query and cached"
+
+    crawler_set_meta_many(
+        "au.nem.dispatch_scada",
+        {
+            CrawlStatTypes.last_crawled: datetime.fromisoformat("2021-12-01T11:00:00"),
+            CrawlStatTypes.latest_processed: datetime.fromisoformat("2021-12-01T09:00:00"),
+        },
+    )
+
+    assert len(statements) == 2, "Meta keys are written in one statement"
+
+    upsert_sql = str(statements[1].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (spider_name) DO UPDATE" in upsert_sql
+    assert "CAST((crawl_meta.data ->> %(data_1)s) AS TIMESTAMP WITH TIME ZONE) >" in upsert_sql
+    assert "RETURNING crawl_meta.data" in upsert_sql
+
+    assert statements[1].compile().params["data"] == {
+        "last_crawled": "2021-12-01T11:00:00",
+        "latest_processed": "2021-12-01T09:00:00",
+    }
+
+    assert crawler_get_meta("au.nem.dispatch_scada", CrawlStatTypes.last_crawled) == (
+        datetime.fromisoformat("2021-12-01T11:00:00")
+    )
+    assert crawler_get_meta("au.nem.dispatch_scada", CrawlStatTypes.latest_processed) == (
+        datetime.fromisoformat("2021-12-01T10:00:00")
+    ), "Cache has the stored latest processed"
+    assert all([i.closed for i in sessions]), "Sessions are closed"
+
+    reset_crawl_meta_cache()
+
+
+def test_crawl_meta_latest_processed_db(db_engine: Engine) -> None:
+    crawler_name = "test.crawl_meta.latest_processed"
+    processed = datetime.fromisoformat("2021-12-01T10:00:00+10:00")
+    crawled = datetime.fromisoformat("2021-12-01T11:00:00+10:00")
+
+    def _latest_processed() -> Any:
+        reset_crawl_meta_cache()
+        return crawler_get_meta(crawler_name, CrawlStatTypes.latest_processed)
+
+    try:
+        crawler_set_meta_many(crawler_name, {CrawlStatTypes.latest_processed: processed})
+        crawler_set_meta_many(
+            crawler_name,
+            {
+                CrawlStatTypes.latest_processed: processed - timedelta(hours=1),
+                CrawlStatTypes.last_crawled: crawled,
+            },
+        )
+
+        assert _latest_processed() == processed, "Latest processed only moves forward"
+        assert crawler_get_meta(crawler_name, CrawlStatTypes.last_crawled) == crawled
+
+        crawler_set_meta_many(
+            crawler_name, {CrawlStatTypes.latest_processed: processed + timedelta(minutes=5)}
+        )
+
+        assert _latest_processed() == processed + timedelta(minutes=5)
+    finally:
+        with db_engine.connect() as c:
+            c.execute("delete from crawl_meta where spider_name = %s", (crawler_name,))
+
+        reset_crawl_meta_cache()
@@ -0,0 +1,172 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Callable, List
+
+import pytest
+
+from opennem.api.export.queries import (
+    energy_network_flow_query,
+    energy_network_fueltech_query,
+    energy_network_interconnector_emissions_query,
+    interconnector_flow_network_regions_query,
+    interconnector_power_flow,
+    power_network_fueltech_query,
+    weather_observation_query,
+)
+from opennem.api.time import human_to_interval, human_to_period
+from opennem.db.query import (
+    bind_query,
+    explain_query,
+    get_query_name,
+    get_query_stats,
+    reset_query_stats,
+    run_query,
+    run_query_async,
+)
+from opennem.schema.dates import TimeSeries
+from opennem.schema.network import NetworkNEM
+
+
+class MockConnection:
+    def __enter__(self) -> "MockConnection":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+    def execute(self, statement: Any) -> List[Any]:
+        return [(1,), (2,)]
+
+
+class MockEngine:
+    def connect(self) -> MockConnection:
+        return MockConnection()
+
+
+class MockAsyncResult:
+    def fetchall(self) -> List[Any]:
+        return [(1,), (2,), (3,)]
+
+
+class MockAsyncConnection:
+    async def __aenter__(self) -> "MockAsyncConnection":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        pass
+
+    async def execute(self, statement: Any) -> MockAsyncResult:
+        return MockAsyncResult()
+
+
+class MockAsyncEngine:
+    def connect(self) -> MockAsyncConnection:
+        return MockAsyncConnection()
+
+
+def _time_series(end: str) -> TimeSeries:
+    return TimeSeries(
+        start=datetime.fromisoformat("2021-01-01 00:00:00+10:00"),
+        end=datetime.fromisoformat(end),
+        network=NetworkNEM,
+        interval=human_to_interval("5m"),
+        period=human_to_period("7d"),
+    )
+
+
+def test_query_text_is_stable() -> None:
+    query_nsw = power_network_fueltech_query(
+        _time_series("2021-01-08 00:00:00+10:00"), network_region="NSW1"
+    )
+    query_qld = power_network_fueltech_query(
+        _time_series("2021-01-09 00:00:00+10:00"), network_region="QLD1"
+    )
+
+    assert query_nsw.text == query_qld.text, "Same text for different parameters"
+    assert "NSW1" not in query_nsw.text, "Values are bound not formatted"
+
+    assert get_query_name(query_nsw) == "power_network_fueltech"
+    assert query_nsw.compile().params["network_region"] == "NSW1"
+    assert query_nsw.compile().params["network_ids"] == ["NEM"]
+
+
+@pytest.mark.parametrize(
+    ["query_builder", "region_param"],
+    [
+        (lambda ts, region: weather_observation_query(ts, [region]), "station_codes"),
+        (interconnector_power_flow, "network_region"),
+        (interconnector_flow_network_regions_query, "network_region"),
+        (energy_network_fueltech_query, "network_region"),
+        (energy_network_flow_query, "network_region"),
+        (energy_network_interconnector_emissions_query, "network_region"),
+    ],
+)
+def test_export_queries_are_bound(query_builder: Callable, region_param: str) -> None:
+    query_nsw = query_builder(_time_series("2021-01-08 00:00:00+10:00"), "NSW1")
+    query_qld = query_builder(_time_series("2021-01-09 00:00:00+10:00"), "QLD1")
+
+    assert query_nsw.text == query_qld.text, "Same text for different parameters"
+    assert "NSW1" not in query_nsw.text and "2021" not in query_nsw.text
+
+    params = query_nsw.compile().params
+
+    assert params[region_param] in ["NSW1", ["NSW1"]]
+
+
+def test_run_query_records_stats() -> None:
+    reset_query_stats()
+
+    query = bind_query("test_query", "select * from test where id = :id", id=1)
+
+    for _ in range(3):
+        assert run_query(query, engine=MockEngine()) == [(1,), (2,)]  # type: ignore
+
+    stats = get_query_stats()
+
+    assert len(stats) == 1
+    assert stats[0].name == "test_query"
+    assert stats[0].calls == 3
+    assert stats[0].rows == 6
+    assert stats[0].seconds_max <= stats[0].seconds_total
+
+
+def test_run_query_async_records_stats() -> None:
+    reset_query_stats()
+
+    query = bind_query("test_query_async", "select * from test where id = :id", id=1)
+
+    rows = asyncio.run(run_query_async(query, engine=MockAsyncEngine()))
+
+    assert rows == [(1,), (2,), (3,)]
+
+    stats = get_query_stats()
+
+    assert len(stats) == 1
+    assert stats[0].name == "test_query_async"
+    assert stats[0].calls == 1
+    assert stats[0].rows == 3
+
+
+def test_explain_query() -> None:
+    statements: List[Any] = []
+
+    class MockExplainConnection(MockConnection):
+        def execute(self, statement: Any) -> List[Any]:
+            statements.append(statement)
+            return [("Seq Scan on facility_scada",), ("Planning Time: 1.500 ms",)]
+
+    class MockExplainEngine:
+        def connect(self) -> MockExplainConnection:
+            return MockExplainConnection()
+
+    reset_query_stats()
+
+    query = bind_query("explain_test", "select * from facility_scada where code = :code", code="X")
+
+    assert explain_query(query, engine=MockExplainEngine()) == 0.0015  # type: ignore
+
+    assert statements[0].text.startswith("explain (summary true) select")
+    assert statements[0].compile().params == {"code": "X"}, "Keeps the bound parameters"
+    assert get_query_stats()[0].plan_samples == 1
+
+    reset_query_stats()
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+
+from opennem.core.dedupe import BALANCING_SUMMARY_KEYS, DedupePolicy, dedupe_records
+from opennem.pipelines.nem.opennem import unit_scada_generate_facility_scada
+
+INTERVAL = datetime.fromisoformat("2021-09-02T12:55:00+10:00")
+INTERVAL_NEXT = datetime.fromisoformat("2021-09-02T13:00:00+10:00")
+
+SCADA_RECORDS = [
+    {"trading_interval": INTERVAL, "network_id": "NEM", "facility_code": "A", "generated": 1},
+    {"trading_interval": INTERVAL, "network_id": "NEM", "facility_code": "B", "generated": 2},
+    {"trading_interval": INTERVAL, "network_id": "NEM", "facility_code": "A", "generated": 3},
+    {"trading_interval": INTERVAL_NEXT, "network_id": "NEM", "facility_code": "A", "generated": 4},
+    {"trading_interval": INTERVAL, "network_id": "NEM", "facility_code": "A", "generated": 5},
+]
+
+
+@pytest.mark.parametrize(
+    ["policy", "generated_expected"],
+    [
+        (DedupePolicy.last, [5, 2, 4]),
+        (DedupePolicy.first, [1, 2, 4]),
+    ],
+)
+def test_dedupe_non_adjacent(policy: DedupePolicy, generated_expected: list) -> None:
+    records, dropped = dedupe_records(SCADA_RECORDS, policy=policy)
+
+    assert dropped == 2, "Dropped the non-adjacent duplicates"
+    assert [i["generated"] for i in records] == generated_expected, "Policy keeps correct record"
+
+
+def test_dedupe_balancing_keys() -> None:
+    records = [
+        {"trading_interval": INTERVAL, "network_id": "NEM", "network_region": "NSW1", "price": 1},
+        {"trading_interval": INTERVAL, "network_id": "NEM", "network_region": "QLD1", "price": 2},
+        {"trading_interval": INTERVAL, "network_id": "NEM", "network_region": "NSW1", "price": 3},
+    ]
+
+    records_deduped, dropped = dedupe_records(records, keys=BALANCING_SUMMARY_KEYS)
+
+    assert dropped == 1
+    assert [i["price"] for i in records_deduped] == [3, 2]
+
+
+def test_dedupe_empty() -> None:
+    assert dedupe_records([]) == ([], 0)
+
+
+# unit scada rows as they come out of the MMS tables with repeated duids
+UNIT_SCADA_ROWS = [
+    {"SETTLEMENTDATE": "2021/09/02 12:55:00", "DUID": "A", "SCADAVALUE": "1"},
+    {"SETTLEMENTDATE": "2021/09/02 12:55:00", "DUID": "A", "SCADAVALUE": "2"},
+    {"SETTLEMENTDATE": "2021/09/02 12:55:00", "DUID": "B", "SCADAVALUE": "3"},
+    {"SETTLEMENTDATE": "2021/09/02 12:55:00", "DUID": "A", "SCADAVALUE": "4"},
+    {"SETTLEMENTDATE": "2021/09/02 12:55:00", "DUID": "C", "SCADAVALUE": "5"},
+]
+
+
+@pytest.mark.parametrize(
+    ["limit", "facility_codes_expected"],
+    [
+        (0, ["A", "B", "C"]),
+        (2, ["A", "B"]),
+        (3, ["A", "B", "C"]),
+    ],
+)
+def test_generate_facility_scada_dedupes_before_limit(
+    limit: int, facility_codes_expected: list
+) -> None:
+    records, dropped = unit_scada_generate_facility_scada(
+        UNIT_SCADA_ROWS,
+        power_field="SCADAVALUE",
+        date_format="%Y/%m/%d %H:%M:%S",
+        limit=limit,
+    )
+
+    assert dropped == 2, "Reports the dropped duplicates"
+    assert [i["facility_code"] for i in records] == facility_codes_expected
+    assert records[0]["generated"] == "4.0", "Keeps the last duplicate"
@@ -1,17 +1,26 @@
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Union
+from typing import Dict, List, Optional, Union
 
 import pytest
 
+from opennem.core.parsers import dirlisting
 from opennem.core.parsers.dirlisting import (
     DirlistingEntry,
+    get_dirlisting_cached,
+    get_unprocessed_files,
+    mark_processed_files,
     parse_dirlisting_datetime,
     parse_dirlisting_line,
+    parse_dirlisting_tail,
+    reset_dirlisting_cache,
 )
 
 from .utils import PATH_TESTS_FIXTURES
 
+# IIS listing as served with uppercase tags
+DISPATCH_SCADA_DIRLISTING = "files/nemweb_dispatch_scada_dirlisting.html"
+
 
 def load_fixture(filename: str = "nemweb_dirlisting.html") -> str:
     fixture_path = PATH_TESTS_FIXTURES / Path(filename)
@@ -65,3 +74,105 @@ def test_dirlisting_line(line: str, result: Dict[str, Union[str, datetime, int]]
     dirlisting_line_result = parse_dirlisting_line(line)
 
     assert result_model == dirlisting_line_result, "Models match for dirlisting line"
+
+
+class _MockResponse:
+    def __init__(self, status_code: int, content: str = "", headers: Dict = {}) -> None:
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = content.encode("utf-8")
+        self.headers = headers
+
+
+def test_get_dirlisting_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    listing_url = "http://nemweb.com.au/Reports/Current/DispatchIS_Reports/"
+    fixture_content = load_fixture()
+
+    line_dir_end = fixture_content.index("<br>", fixture_content.index("&lt;dir&gt;")) + 4
+    line_first_end = fixture_content.index("<br>", line_dir_end) + 4
+    line_last_start = fixture_content.rindex("<br>", 0, fixture_content.rindex("<br>")) + 4
+
+    # the listing before the last file was added
+    content_prior = fixture_content[:line_last_start] + "</pre><hr></body></html>"
+
+    # the listing once the first file has aged out
+    content_current = fixture_content[:line_dir_end] + fixture_content[line_first_end:]
+
+    responses = [
+        _MockResponse(200, content_prior, {"ETag": '"1"'}),
+        _MockResponse(200, content_current),
+        _MockResponse(304),
+    ]
+    request_headers: List[Dict] = []
+
+    def _mock_get(url: str, headers: Dict) -> _MockResponse:
+        request_headers.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(dirlisting, "http", type("MockHttp", (), {"get": staticmethod(_mock_get)}))
+
+    reset_dirlisting_cache()
+
+    listing_prior = get_dirlisting_cached(listing_url)
+    assert request_headers[0] == {}
+
+    parsed_lines: List[str] = []
+    _parse_dirlisting_line = dirlisting.parse_dirlisting_line
+
+    def _mock_parse_dirlisting_line(line: str) -> Optional[DirlistingEntry]:
+        parsed_lines.append(line)
+        return _parse_dirlisting_line(line)
+
+    monkeypatch.setattr(dirlisting, "parse_dirlisting_line", _mock_parse_dirlisting_line)
+
+    listing = get_dirlisting_cached(listing_url)
+    assert request_headers[1] == {"If-None-Match": '"1"'}, "Sends a conditional request"
+
+    assert listing.count == listing_prior.count, "One file added and one aged out"
+    assert listing.entries[0] == listing_prior.entries[0], "Directories are kept"
+    assert listing.entries[1] == listing_prior.entries[2], "Aged out file is dropped"
+    assert len(parsed_lines) == 4, "Only parses the new line and up to the aged out line"
+    assert listing.entries[-1].link.endswith("PUBLIC_DISPATCHIS_202111101435_0000000352367891.zip")
+
+    listing_unchanged = get_dirlisting_cached(listing_url)
+    assert listing_unchanged.entries == listing.entries, "Not modified returns the cached listing"
+
+    files = listing.get_files()
+    mark_processed_files(listing_url, files[:-1])
+
+    assert get_unprocessed_files(listing_url, files) == files[-1:]
+
+    reset_dirlisting_cache()
+
+
+def test_dirlisting_lines_iis() -> None:
+    """IIS listings use uppercase tags"""
+    listing_url = "http://www.nemweb.com.au/Reports/CURRENT/Dispatch_SCADA/"
+    lines = dirlisting._dirlisting_lines(load_fixture(DISPATCH_SCADA_DIRLISTING))
+
+    entries = parse_dirlisting_tail(listing_url, lines, [])
+
+    assert len(entries) == 579
+    assert entries[0].link == "http://www.nemweb.com.au/Reports/CURRENT/Dispatch_SCADA/DUPLICATE/"
+    assert entries[1].link.endswith("PUBLIC_DISPATCHSCADA_202108311255_0000000348260618.zip")
+
+
+@pytest.mark.parametrize(["window", "step"], [(100, 1), (100, 40), (100, 99)])
+def test_parse_dirlisting_tail_window_shift(window: int, step: int) -> None:
+    listing_url = "http://www.nemweb.com.au/Reports/CURRENT/Dispatch_SCADA/"
+    lines = dirlisting._dirlisting_lines(load_fixture(DISPATCH_SCADA_DIRLISTING))
+
+    # parent directory link, blank line and the DUPLICATE directory
+    header_lines = lines[:3]
+    file_lines = [i for i in lines[3:] if i.strip()]
+
+    cached_lines = header_lines + file_lines[:window]
+    current_lines = header_lines + file_lines[step : window + step]
+
+    cached_entries = parse_dirlisting_tail(listing_url, cached_lines, [])
+    expected_entries = parse_dirlisting_tail(listing_url, current_lines, [])
+
+    entries = parse_dirlisting_tail(listing_url, current_lines, cached_entries)
+
+    assert len(cached_entries) == window + 1
+    assert [i.link for i in entries] == [i.link for i in expected_entries], "Aged out dropped"
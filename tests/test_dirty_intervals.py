@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from opennem.core.dirty_intervals import dirty_bucket, dirty_interval_keys, dirty_interval_ranges
+
+
+def test_dirty_bucket() -> None:
+    assert dirty_bucket(datetime.fromisoformat("2021-12-01 10:25:00+10:00")) == (
+        datetime.fromisoformat("2021-12-01 10:00:00+10:00")
+    )
+    assert dirty_bucket(datetime.fromisoformat("2021-12-01 10:30:00+10:00")) == (
+        datetime.fromisoformat("2021-12-01 10:30:00+10:00")
+    )
+
+
+def test_dirty_interval_keys() -> None:
+    dt = datetime.fromisoformat("2021-12-01 10:00:00+10:00")
+
+    records = [
+        {
+            "network_id": "NEM",
+            "facility_code": facility_code,
+            "trading_interval": dt + timedelta(minutes=5 * i),
+            "is_forecast": False,
+        }
+        for i in range(12)
+        for facility_code in ["BW01", "VP6"]
+    ]
+
+    records.append(
+        {
+            "network_id": "AEMO_ROOFTOP",
+            "facility_code": "ROOFTOP_NEM_NSW",
+            "trading_interval": dt,
+            "is_forecast": True,
+        }
+    )
+
+    keys = dirty_interval_keys(records)
+
+    assert len(keys) == 4, "Two buckets for each facility and forecasts skipped"
+    assert keys[0] == ("NEM", "BW01", dt)
+
+
+def test_dirty_interval_ranges() -> None:
+    dt = datetime.fromisoformat("2021-12-01 10:30:00+10:00")
+
+    keys = [
+        ("BW01", dt),
+        ("VP6", dt + timedelta(minutes=30)),
+        ("BW01", dt + timedelta(hours=5)),
+    ]
+
+    ranges = dirty_interval_ranges("NEM", keys)
+
+    assert len(ranges) == 2, "Buckets far apart are split into ranges"
+
+    assert ranges[0].facility_codes == ["BW01", "VP6"]
+    assert ranges[0].date_min == datetime.fromisoformat("2021-12-01 10:05:00+10:00")
+    assert ranges[0].date_max == datetime.fromisoformat("2021-12-01 12:00:00+10:00")
+
+    assert ranges[1].facility_codes == ["BW01"]
+    assert ranges[1].date_min == datetime.fromisoformat("2021-12-01 15:05:00+10:00")
+    assert ranges[1].date_max == datetime.fromisoformat("2021-12-01 17:00:00+10:00")
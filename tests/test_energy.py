@@ -1,8 +1,20 @@
 import csv
 from pathlib import Path
-from typing import List
-
-from opennem.core.energy import energy_sum, shape_energy_dataframe
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from opennem.core.energy import (
+    _energy_aggregate_hours,
+    _energy_aggregate_matrix,
+    _trapezium_integration_matrix,
+    _trapezium_integration_variable,
+    energy_bucket_split,
+    energy_sum,
+    shape_energy_dataframe,
+)
 from opennem.schema.network import NetworkNEM
 
 # from opennem.workers.emissions import load_factors
@@ -54,3 +66,110 @@ def _test_energy_sum_outputs() -> None:
     assert es.eoi_quantity.sum() > 1000, "Has energy value"
 
     return es
+
+
+def test_energy_aggregate_matrix_matches_buckets() -> None:
+    records = load_energy_fixture_csv("power_nsw1_two_units_1_day.csv")
+
+    # remove a run of readings so the zero-fill path is covered
+    del records[100:140]
+
+    power_df = shape_energy_dataframe(records).set_index(["trading_interval"])
+
+    energy_buckets = _energy_aggregate_hours(power_df)
+    energy_matrix = _energy_aggregate_matrix(power_df)
+
+    assert energy_matrix is not None, "Readings are on the 5 minute grid"
+    assert len(energy_matrix) == len(energy_buckets), "Same number of buckets"
+    assert (energy_matrix.trading_interval == energy_buckets.trading_interval).all()
+    assert (energy_matrix.facility_code == energy_buckets.facility_code).all()
+    assert (energy_matrix.eoi_quantity.values == energy_buckets.eoi_quantity.values).all()
+
+
+def test_energy_aggregate_matrix_matches_buckets_rooftop() -> None:
+    records = load_energy_fixture_csv("power_nsw1_two_units_1_day.csv")
+
+    # rooftop has a single 30 minute reading in each bucket
+    records = [
+        {**i, "fueltech_id": "solar_rooftop"}
+        for i in records
+        if i["trading_interval"][14:16] in ["00", "30"]
+    ]
+
+    power_df = shape_energy_dataframe(records).set_index(["trading_interval"])
+
+    energy_buckets = _energy_aggregate_hours(power_df)
+    energy_matrix = _energy_aggregate_matrix(power_df)
+
+    assert energy_matrix is not None, "Readings are on the 5 minute grid"
+    assert len(energy_matrix) == len(energy_buckets), "Same number of buckets"
+    assert (energy_matrix.trading_interval == energy_buckets.trading_interval).all()
+    assert (energy_matrix.eoi_quantity.values == energy_buckets.eoi_quantity.values).all()
+
+
+def test_energy_aggregate_matrix_off_grid() -> None:
+    records = load_energy_fixture_csv("power_nsw1_two_units_1_day.csv")
+    records[50]["trading_interval"] = "2021-02-01 02:02:00"
+
+    power_df = shape_energy_dataframe(records).set_index(["trading_interval"])
+
+    assert _energy_aggregate_matrix(power_df) is None, "Falls back when off the grid"
+
+
+@pytest.mark.parametrize(
+    "readings",
+    [
+        [None] * 7,
+        [None, None, 10.0, None, None, None, None],
+        [0.0, None, 0.0, None, None, 0.0, None],
+        [None, 12.5, None, 30.0, 22.0, None, None],
+        [10.0, 20.0, None, 40.0, 50.0, None, 70.0],
+        [100.0, 110.0, 120.0, 130.0, 140.0, 150.0, 160.0],
+    ],
+)
+def test_trapezium_integration_matrix_gap_fill(readings: List[Optional[float]]) -> None:
+    bucket = np.array([np.nan if i is None else i for i in readings])
+
+    energy = _trapezium_integration_matrix(bucket[None, :], gap_fill=True)[0]
+    energy_expected = _trapezium_integration_variable(
+        pd.Series(bucket).dropna().reset_index(drop=True)
+    )
+
+    if energy_expected is None:
+        assert np.isnan(energy), "No readings has no energy"
+    else:
+        assert energy == energy_expected, "Matches variable trapezium integration"
+
+
+@pytest.mark.parametrize("chunk_size", [14, 100, 400])
+def test_energy_bucket_split_matches_single_pass(chunk_size: int) -> None:
+    records = load_energy_fixture_csv("power_nsw1_two_units_1_day.csv")
+
+    energy_single = energy_sum(shape_energy_dataframe(records), NetworkNEM)
+
+    energy_chunks = []
+    carry_frame = None
+
+    for chunk_start in range(0, len(records), chunk_size):
+        power_df = shape_energy_dataframe(records[chunk_start : chunk_start + chunk_size])
+
+        if carry_frame is not None:
+            power_df = pd.concat([carry_frame, power_df], ignore_index=True)
+
+        complete_frame, carry_frame = energy_bucket_split(power_df, NetworkNEM)
+
+        if not complete_frame.empty:
+            energy_chunks.append(energy_sum(complete_frame, NetworkNEM))
+
+    energy_streamed = pd.concat(energy_chunks)
+    energy_streamed = energy_streamed.set_index(["trading_interval", "facility_code"]).sort_index()
+    energy_single = energy_single.set_index(["trading_interval", "facility_code"]).sort_index()
+
+    assert energy_streamed.index.is_unique, "No buckets repeated across chunks"
+
+    # the single pass zero-fills the final bucket which is missing its edge reading
+    assert len(energy_single) - len(energy_streamed) == 4, "Only the incomplete hour is held back"
+
+    assert energy_streamed.eoi_quantity.equals(
+        energy_single.loc[energy_streamed.index].eoi_quantity
+    )
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from opennem.core.energy import shape_energy_dataframe
+from opennem.core.facility_ranges import update_facility_ranges_cursor
+from opennem.db.models.opennem import FacilityScada
+from opennem.pipelines.bulk_insert import BulkUpsertChunk, BulkUpsertResult
+from opennem.pipelines.copy_binary import generate_copy_binary_from_records
+from opennem.schema.network import NetworkNEM
+from opennem.workers import energy
+from tests.test_energy import load_energy_fixture_csv
+
+
+def _mock_bulk_upsert(upserted: List[List[Dict]], hooks: Optional[List[Any]] = None) -> Any:
+    def _bulk_upsert(table: Any, records: List[Dict], *args: Any, **kwargs: Any) -> Any:
+        upserted.append(records)
+
+        if hooks is not None:
+            hooks.append(kwargs.get("before_commit"))
+
+        result = BulkUpsertResult(table_name="facility_scada")
+        result.chunks.append(BulkUpsertChunk(rows=len(records), upserted=len(records), seconds=0))
+
+        return result
+
+    return _bulk_upsert
+
+
+def test_insert_energies_copy_binary(monkeypatch: pytest.MonkeyPatch) -> None:
+    upserted: List[List[Dict]] = []
+    hooks: List[Any] = []
+    monkeypatch.setattr(energy, "bulk_upsert", _mock_bulk_upsert(upserted, hooks))
+
+    records = load_energy_fixture_csv("power_nsw1_two_units_1_day.csv")
+    power_df = shape_energy_dataframe(records)
+
+    num_records = energy.insert_energies(power_df, network=NetworkNEM)
+
+    assert num_records == len(upserted[0]) > 0
+    assert hooks == [update_facility_ranges_cursor], "Facility ranges updated on commit"
+
+    # records encode in binary for the bulk upsert
+    copy_bytes = generate_copy_binary_from_records(FacilityScada, upserted[0]).read()
+
+    assert copy_bytes, "Energies encode to binary copy"
+
+
+def test_insert_energies_raise_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _bulk_upsert_error(*args: Any, **kwargs: Any) -> BulkUpsertResult:
+        result = BulkUpsertResult(table_name="facility_scada")
+        result.chunks.append(BulkUpsertChunk(rows=10, upserted=0, seconds=0, error="error"))
+
+        return result
+
+    monkeypatch.setattr(energy, "bulk_upsert", _bulk_upsert_error)
+
+    power_df = shape_energy_dataframe(load_energy_fixture_csv("power_nsw1_two_units_1_day.csv"))
+
+    assert energy.insert_energies(power_df, network=NetworkNEM) == 0, "Errors are logged"
+
+    with pytest.raises(Exception):
+        energy.insert_energies(power_df, network=NetworkNEM, raise_errors=True)
+
+
+@pytest.mark.parametrize("error", [None, Exception("Energy calc error")])
+def test_run_energy_update_dirty_releases(
+    monkeypatch: pytest.MonkeyPatch, error: Optional[Exception]
+) -> None:
+    dt = datetime.fromisoformat("2021-12-01 10:30:00+10:00")
+    dirty_keys = [("BW01", dt), ("BW01", dt + timedelta(hours=5))]
+    released: List[Any] = []
+    calc_kwargs: List[Dict] = []
+
+    def _run_energy_calc(*args: Any, **kwargs: Any) -> int:
+        calc_kwargs.append(kwargs)
+
+        # the second range fails
+        if error and len(calc_kwargs) > 1:
+            raise error
+
+        return 4
+
+    monkeypatch.setattr(energy, "claim_dirty_intervals", lambda network_id, limit: dirty_keys)
+    monkeypatch.setattr(
+        energy, "release_dirty_intervals", lambda network_id, keys: released.append(keys)
+    )
+    monkeypatch.setattr(energy, "run_energy_calc", _run_energy_calc)
+
+    num_records = energy.run_energy_update_dirty(networks=[NetworkNEM])
+
+    assert all(i["raise_errors"] for i in calc_kwargs), "Failures are raised to the run"
+
+    if error:
+        assert released == [dirty_keys], "Claimed keys are released on failure"
+    else:
+        assert num_records == 8
+        assert released == [], "Completed keys stay claimed"
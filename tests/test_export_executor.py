@@ -0,0 +1,76 @@
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import pytest
+
+from opennem.api.export import executor, tasks
+from opennem.api.export.executor import ExportResult, run_export_resources
+from opennem.api.export.map import StatExport, StatType
+from opennem.api.stats.schema import OpennemDataSet
+from opennem.api.time import human_to_interval
+from opennem.schema.network import NetworkNEM
+
+
+def _stat_export(network_region: str) -> StatExport:
+    return StatExport(
+        stat_type=StatType.power,
+        country="au",
+        network=NetworkNEM,
+        network_region=network_region,
+        interval=human_to_interval("5m"),
+    )
+
+
+def test_run_export_resources(monkeypatch: pytest.MonkeyPatch) -> None:
+    written: List[str] = []
+
+    def _mock_write_output(path: str, stat_set: OpennemDataSet) -> int:
+        written.append(path)
+        return 10
+
+    monkeypatch.setattr(executor, "write_output", _mock_write_output)
+
+    def _export_func(stat: StatExport) -> Optional[OpennemDataSet]:
+        if stat.network_region == "SA1":
+            return None
+
+        if stat.network_region == "TAS1":
+            raise Exception("Query error")
+
+        # first resource finishes last
+        time.sleep(0.05 if stat.network_region == "NSW1" else 0)
+
+        return OpennemDataSet(type="power", data=[], created_at=datetime.now())
+
+    stats = [_stat_export(i) for i in ["NSW1", "QLD1", "SA1", "TAS1", "VIC1"]]
+
+    results = run_export_resources(stats, _export_func, workers=3)
+
+    assert [i.path for i in results] == [i.path for i in stats], "Results in resource order"
+    assert sorted(written) == sorted([stats[i].path for i in [0, 1, 4]]), "Wrote stat sets"
+
+    assert [i.byte_count for i in results] == [10, 10, 0, 0, 10]
+    assert [i.written for i in results] == [True, True, False, False, True]
+    assert results[3].error == "Query error", "Query errors are reported"
+    assert results[0].query_seconds >= 0.05, "Query time is recorded"
+
+
+def test_export_power_latest_unchanged(monkeypatch: pytest.MonkeyPatch) -> None:
+    """An unchanged stored object counts as the latest export"""
+    exported: List[str] = []
+
+    def _mock_run_export_resources(
+        stats: List[StatExport], export_func: executor.ExportQueryFunc, workers: int
+    ) -> List[ExportResult]:
+        exported.extend(i.path for i in stats)
+        return [ExportResult(path=i.path, byte_count=0, written=True) for i in stats]
+
+    monkeypatch.setattr(tasks, "run_export_resources", _mock_run_export_resources)
+
+    stats = [_stat_export(i) for i in ["NSW1", "QLD1"]]
+
+    results = tasks.export_power(stats=stats, latest=True)
+
+    assert exported == [stats[0].path], "Stopped after the first written resource"
+    assert [i.path for i in results] == [stats[0].path]
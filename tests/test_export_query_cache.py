@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import Any, List
+
+import pytest
+
+from opennem.api.export import query_cache
+from opennem.api.export.query_cache import ExportQueryCache, ExportQueryKind
+from opennem.api.time import human_to_interval, human_to_period
+from opennem.schema.dates import TimeSeries
+from opennem.schema.network import NetworkAEMORooftop, NetworkNEM
+
+
+@pytest.fixture
+def time_series() -> TimeSeries:
+    return TimeSeries(
+        start=datetime.fromisoformat("2021-01-01 00:00:00+10:00"),
+        end=datetime.fromisoformat("2021-01-08 00:00:00+10:00"),
+        network=NetworkNEM,
+        interval=human_to_interval("5m"),
+        period=human_to_period("7d"),
+    )
+
+
+def test_query_cache_splits_regions(
+    time_series: TimeSeries, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    queries: List[str] = []
+
+    def _mock_run_query(query: Any) -> List[Any]:
+        queries.append(str(query))
+
+        return [
+            ("2021-01-01 00:05", "coal_black", 100, "NSW1"),
+            ("2021-01-01 00:05", "coal_black", 50, "QLD1"),
+            ("2021-01-01 00:00", "coal_black", 90, "NSW1"),
+        ]
+
+    monkeypatch.setattr(query_cache, "run_query", _mock_run_query)
+
+    cache = ExportQueryCache()
+    networks = [NetworkNEM, NetworkAEMORooftop]
+
+    nsw_rows = cache.get_rows(ExportQueryKind.power_fueltech, time_series, "NSW1", networks)
+    qld_rows = cache.get_rows(ExportQueryKind.power_fueltech, time_series, "QLD1", networks)
+    sa_rows = cache.get_rows(ExportQueryKind.power_fueltech, time_series, "SA1", networks)
+
+    assert len(queries) == 1, "Regions are split from a single query"
+    assert "f.network_region" in queries[0] and ":network_region" not in queries[0]
+
+    assert nsw_rows == [
+        ("2021-01-01 00:05", "coal_black", 100),
+        ("2021-01-01 00:00", "coal_black", 90),
+    ], "Region rows in query order without the region column"
+    assert qld_rows == [("2021-01-01 00:05", "coal_black", 50)]
+    assert sa_rows == []
+
+    assert cache.hits == 2 and cache.misses == 1
+
+    # a different query kind or networks is a different key
+    cache.get_rows(ExportQueryKind.price, time_series, "NSW1", networks)
+    cache.get_rows(ExportQueryKind.power_fueltech, time_series, "NSW1", [NetworkNEM])
+
+    assert len(queries) == 3, "Keyed on query kind and networks"
@@ -0,0 +1,58 @@
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+from opennem.api.stats.loader import load_statset
+from opennem.api.stats.serializer import stat_set_to_json
+from opennem.exporter.aws import write_statset_to_s3
+from opennem.exporter.storage import (
+    LocalExportStore,
+    encode_body,
+    get_content_hash,
+    set_export_store,
+)
+from tests.test_opennem_schema_loader import get_fixture
+
+
+@pytest.fixture
+def export_store(tmp_path: Path) -> Generator[LocalExportStore, None, None]:
+    store = LocalExportStore(tmp_path)
+    set_export_store(store)
+
+    yield store
+
+    set_export_store(None)
+
+
+def test_gzip_is_deterministic() -> None:
+    body_first, encoding = encode_body(b'{"data": [1, 2, 3]}', "gzip")
+    body_second, _ = encode_body(b'{"data": [1, 2, 3]}', "gzip")
+
+    assert encoding == "gzip"
+    assert get_content_hash(body_first) == get_content_hash(body_second)
+
+
+def test_write_statset_skips_unchanged(export_store: LocalExportStore) -> None:
+    stat_set = load_statset(get_fixture("power-nsw1.json"))
+    stat_set.created_at = datetime.now()
+
+    assert write_statset_to_s3(stat_set, "/v3/stats/test.json") > 0
+    assert json.loads(export_store.get("v3/stats/test.json")) == json.loads(
+        stat_set_to_json(stat_set, exclude_unset=False)
+    )
+
+    # the same data built on a later run
+    stat_set_rerun = stat_set.copy(
+        update={"created_at": stat_set.created_at + timedelta(seconds=1), "version": "3.99.0"}
+    )
+
+    assert write_statset_to_s3(stat_set_rerun, "/v3/stats/test.json") == 0, "Unchanged skipped"
+
+    stat_set_changed = stat_set.copy(deep=True)
+    stat_set_changed.data[0].history.data[0] += 1
+
+    assert write_statset_to_s3(stat_set_changed, "/v3/stats/test.json") > 0, "Changed written"
+    assert write_statset_to_s3(stat_set_changed, "/v3/stats/test.json") == 0
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from opennem.core.facility_ranges import facility_range_rows, scada_range_query
+
+
+def test_facility_range_rows() -> None:
+    dt = datetime.fromisoformat("2021-12-01 10:00:00+10:00")
+
+    records = [
+        {
+            "network_id": "NEM",
+            "facility_code": "BW01",
+            "trading_interval": dt + timedelta(minutes=5 * i),
+            "generated": generated,
+            "eoi_quantity": None,
+        }
+        for i, generated in enumerate([0, 10.5, "20.1", None, 0])
+    ]
+
+    records.append(
+        {
+            "network_id": "WEM",
+            "facility_code": "ALINTA_WGP_GT",
+            "trading_interval": dt,
+            "generated": None,
+            "eoi_quantity": 4.2,
+            "is_forecast": False,
+        }
+    )
+
+    records.append(
+        {
+            "network_id": "AEMO_ROOFTOP",
+            "facility_code": "ROOFTOP_NEM_NSW",
+            "trading_interval": dt,
+            "generated": 100,
+            "is_forecast": True,
+        }
+    )
+
+    rows = facility_range_rows(records)
+
+    assert len(rows) == 3, "One range for each facility"
+
+    rooftop, bw01, alinta = rows
+
+    assert rooftop[:3] == ("AEMO_ROOFTOP", "ROOFTOP_NEM_NSW", True)
+
+    assert bw01[:3] == ("NEM", "BW01", False)
+    assert bw01[3] == dt + timedelta(minutes=5), "Seen from the first reading above zero"
+    assert bw01[4] == dt + timedelta(minutes=10)
+    assert bw01[5] == dt + timedelta(minutes=20), "Last generated includes zero readings"
+    assert bw01[6] is None
+
+    assert alinta[3:] == (dt, dt, None, dt)
+
+
+def test_facility_range_rows_empty() -> None:
+    dt = datetime.fromisoformat("2021-12-01 10:00:00+10:00")
+
+    records = [
+        {
+            "network_id": "NEM",
+            "facility_code": "BW01",
+            "trading_interval": dt,
+            "generated": None,
+            "eoi_quantity": None,
+        },
+        {},
+    ]
+
+    assert facility_range_rows(records) == []
+
+
+def test_scada_range_query_stable() -> None:
+    date_min = datetime.fromisoformat("2021-12-01 10:00:00+10:00")
+
+    query = scada_range_query("AEST", date_min, network_ids=["NEM"], network_region="NSW1")
+    query_next = scada_range_query(
+        "AEST", date_min + timedelta(days=1), network_ids=["NEM"], network_region="QLD1"
+    )
+
+    assert query.text == query_next.text, "Query text is the same for different params"
+    assert "generated_last_seen" in query.text
+
+    energy_query = scada_range_query("AEST", date_min, network_ids=["NEM"], energy=True)
+
+    assert "energy_last_seen" in energy_query.text
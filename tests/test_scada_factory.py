@@ -1,7 +1,8 @@
 import json
 from datetime import datetime, timedelta
+from decimal import Decimal
 
-from opennem.api.stats.controllers import stats_factory
+from opennem.api.stats.controllers import stats_factory, stats_factory_rows
 from opennem.api.stats.schema import DataQueryResult, OpennemData, OpennemDataSet
 from opennem.api.time import human_to_interval, human_to_period
 from opennem.core.networks import network_from_network_code
@@ -127,3 +128,46 @@ def test_power_returns_json() -> None:
 
     assert isinstance(r, dict), "JSON is a dict"
     assert "version" in r, "Has a version string"
+
+
+def test_stats_factory_rows_matches_stats_factory() -> None:
+    network = network_from_network_code("NEM")
+    dt = datetime.fromisoformat("2021-01-15 10:00:00")
+
+    # out of order with leading and trailing nulls and a null series
+    test_rows = [
+        (dt + timedelta(minutes=10), "coal_black", Decimal("2.5")),
+        (dt, "coal_black", None),
+        (dt + timedelta(minutes=5), "coal_black", 1),
+        (dt + timedelta(minutes=15), "coal_black", None),
+        (dt, "solar_utility", None),
+        (dt + timedelta(minutes=5), "wind", 3),
+        (dt + timedelta(minutes=10), "wind", 4),
+    ]
+
+    factory_args = dict(
+        network=network,
+        interval=human_to_interval("5m"),
+        period=human_to_period("7d"),
+        units=get_unit("power"),
+        region="NSW1",
+        fueltech_group=True,
+    )
+
+    stats = [DataQueryResult(interval=i[0], result=i[2], group_by=i[1]) for i in test_rows]
+
+    result = stats_factory(stats, **factory_args)
+    result_rows = stats_factory_rows(test_rows, **factory_args)
+
+    assert result and result_rows
+
+    result_data = {i.fuel_tech: i for i in result.data}
+    result_rows_data = {i.fuel_tech: i for i in result_rows.data}
+
+    assert sorted(result_rows_data.keys()) == ["coal_black", "wind"], "Null series skipped"
+
+    for fueltech, data in result_data.items():
+        assert result_rows_data[fueltech].history == data.history
+        assert result_rows_data[fueltech].id == data.id
+
+    assert result_rows_data["coal_black"].history.data == [1, 2.5, 0]
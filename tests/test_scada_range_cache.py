@@ -0,0 +1,141 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+import pytest
+
+from opennem.api.stats.schema import ScadaDateRange
+from opennem.schema.network import NetworkNEM
+from opennem.utils import cache
+from opennem.utils.cache import cache_scada_result, update_scada_range_cache
+
+RANGE_START = datetime.fromisoformat("2021-01-01 00:00:00+10:00")
+RANGE_END = datetime.fromisoformat("2021-06-01 00:00:00+10:00")
+
+
+class MockRedis:
+    def __init__(self) -> None:
+        self.store: Dict[str, Any] = {}
+        self.sets: Dict[str, Set[str]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.store.get(key)
+
+    def set(self, key: str, value: Any, ex: int, nx: bool = False) -> bool:
+        with self.lock:
+            if nx and key in self.store:
+                return False
+
+            self.store[key] = value
+            return True
+
+    def exists(self, key: str) -> bool:
+        return key in self.store
+
+    def delete(self, key: str) -> None:
+        self.store.pop(key, None)
+
+    def ttl(self, key: str) -> int:
+        return 300 if key in self.store else -2
+
+    def sadd(self, key: str, value: str) -> None:
+        self.sets.setdefault(key, set()).add(value)
+
+    def smembers(self, key: str) -> Set[str]:
+        return self.sets.get(key, set())
+
+    def expire(self, key: str, ttl: int) -> None:
+        pass
+
+
+@pytest.fixture
+def mock_redis(monkeypatch: pytest.MonkeyPatch) -> MockRedis:
+    client = MockRedis()
+    monkeypatch.setattr(cache, "get_cache_client", lambda: client)
+    cache.scada_cache.clear()
+    return client
+
+
+def _range_func(calls: List[Optional[str]], delay: float = 0) -> Any:
+    @cache_scada_result
+    def _get_scada_range(
+        network: Any = None,
+        networks: Any = None,
+        network_region: Optional[str] = None,
+        facilities: Any = None,
+        energy: bool = False,
+    ) -> ScadaDateRange:
+        calls.append(network_region)
+        time.sleep(delay)
+        return ScadaDateRange(start=RANGE_START, end=RANGE_END, network=network)
+
+    return _get_scada_range
+
+
+def test_keyed_on_network_region(mock_redis: MockRedis) -> None:
+    calls: List[Optional[str]] = []
+    get_scada_range = _range_func(calls)
+
+    get_scada_range(network=NetworkNEM, network_region="NSW1")
+    get_scada_range(network=NetworkNEM, network_region="QLD1")
+    get_scada_range(network=NetworkNEM, network_region="NSW1")
+
+    assert calls == ["NSW1", "QLD1"]
+
+
+def test_shared_between_processes(mock_redis: MockRedis) -> None:
+    calls: List[Optional[str]] = []
+    get_scada_range = _range_func(calls)
+
+    first = get_scada_range(network=NetworkNEM)
+
+    # another process with a cold in-process cache
+    cache.scada_cache.clear()
+    second = get_scada_range(network=NetworkNEM)
+
+    assert len(calls) == 1
+    assert first.start == second.start and first.end == second.end
+
+
+def test_concurrent_misses_query_once(mock_redis: MockRedis) -> None:
+    calls: List[Optional[str]] = []
+    get_scada_range = _range_func(calls, delay=0.2)
+
+    threads = [
+        threading.Thread(target=get_scada_range, kwargs={"network": NetworkNEM}) for _ in range(8)
+    ]
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert cache._scada_key_locks == {}, "Key locks are removed once unused"
+
+
+def test_ingest_updates_range_end(mock_redis: MockRedis) -> None:
+    calls: List[Optional[str]] = []
+    get_scada_range = _range_func(calls)
+
+    get_scada_range(network=NetworkNEM)
+    get_scada_range(network=NetworkNEM, facilities=["BAYSW1"])
+    get_scada_range(network=NetworkNEM, energy=True)
+
+    new_interval = RANGE_END + timedelta(minutes=5)
+
+    # naive intervals are in network time
+    update_scada_range_cache(NetworkNEM, new_interval.replace(tzinfo=None))
+
+    assert get_scada_range(network=NetworkNEM).end == new_interval
+    assert get_scada_range(network=NetworkNEM, facilities=["BAYSW1"]).end == RANGE_END
+    assert get_scada_range(network=NetworkNEM, energy=True).end == RANGE_END, "Energy not moved"
+
+    cache.scada_cache.clear()
+
+    assert get_scada_range(network=NetworkNEM).end == new_interval, "Shared range updated"
+    assert get_scada_range(network=NetworkNEM, energy=True).end == RANGE_END
+    assert len(calls) == 3
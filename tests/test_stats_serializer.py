@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from opennem.api.stats.controllers import stats_factory_rows
+from opennem.api.stats.schema import OpennemDataSet
+from opennem.api.stats.serializer import stat_set_to_json
+from opennem.api.time import human_to_interval, human_to_period
+from opennem.core.networks import network_from_network_code
+from opennem.core.units import get_unit
+
+
+def get_stat_set() -> OpennemDataSet:
+    network = network_from_network_code("NEM")
+    dt = datetime.fromisoformat("2021-01-15 10:00:00")
+
+    test_rows = []
+
+    for ft in ["coal_black", "solar_rooftop"]:
+        for v in [None, 1.23456789, 0, 1234567.89, -0.000123456, None, 5]:
+            test_rows.append((dt, ft, v))
+            dt = dt + timedelta(minutes=5)
+
+    stat_set = stats_factory_rows(
+        test_rows,
+        network=network,
+        interval=human_to_interval("5m"),
+        period=human_to_period("7d"),
+        units=get_unit("power"),
+        region="NSW1",
+        fueltech_group=True,
+        cast_nulls=False,
+    )
+
+    if not stat_set:
+        raise Exception("Bad unit test data")
+
+    stat_set.data[1].forecast = stat_set.data[0].history
+    stat_set.data[0].x_capacity_at_present = 100.5
+
+    return stat_set
+
+
+@pytest.mark.parametrize("exclude_unset", [True, False])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_stat_set_to_json_matches_pydantic(exclude_unset: bool, indent: int) -> None:
+    stat_set = get_stat_set()
+
+    assert stat_set_to_json(stat_set, exclude_unset=exclude_unset, indent=indent) == stat_set.json(
+        exclude_unset=exclude_unset, indent=indent
+    )
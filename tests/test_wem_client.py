@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from opennem.clients.wem import parse_wem_balancing_summary, parse_wem_facility_intervals
+
+_facility_scada_content = """Trading Date,Interval Number,Trading Interval,Participant Code,Facility Code,Energy Generated (MWh),EOI Quantity (MW),Extracted At
+2021-12-01,1,2021-12-01 08:00:00,ALINTA,ALINTA_WGP_GT,10.5,21,2021-12-02 08:00:00
+2021-12-01,1,2021-12-01 08:00:00,ALINTA,ALINTA_WGP_U2,9.5,19,2021-12-02 08:00:00
+2021-12-01,2,2021-12-01 08:30:00,ALINTA,ALINTA_WGP_GT,11.5,23,2021-12-02 08:00:00
+2021-12-01,2,2021-12-01 08:30:00,ALINTA,ALINTA_WGP_U2,8.5,17,2021-12-02 08:00:00
+2021-12-01,3,2021-12-01 09:00:00,ALINTA,ALINTA_WGP_GT,12.5,25,2021-12-02 08:00:00
+"""
+
+_balancing_summary_content = """Trading Interval,Final Price ($/MWh),Non-Scheduled Generation (MW),Total Generation (MW)
+2021-12-01 08:00:00,40.06,590.351,1781.858
+2021-12-01 08:30:00,42.98,738.482,1930.343
+"""
+
+
+def test_parse_wem_facility_intervals_after() -> None:
+    models = parse_wem_facility_intervals(_facility_scada_content)
+
+    assert len(models) == 5
+
+    after = models[1].trading_interval
+    models_after = parse_wem_facility_intervals(
+        iter(_facility_scada_content.splitlines()), after=after
+    )
+
+    assert len(models_after) == 3, "Rows up to the last stored interval are skipped"
+    assert all(i.trading_interval > after for i in models_after)
+    assert models_after[0].facility_code == "ALINTA_WGP_GT"
+    assert models_after[0].power == 23
+
+
+def test_parse_wem_facility_intervals_after_naive() -> None:
+    models = parse_wem_facility_intervals(
+        _facility_scada_content, after=datetime.fromisoformat("2021-12-01 08:30:00")
+    )
+
+    assert len(models) == 1, "Naive intervals are in network time"
+
+
+def test_parse_wem_balancing_summary_after() -> None:
+    models = parse_wem_balancing_summary(_balancing_summary_content)
+
+    assert len(models) == 2
+
+    models_after = parse_wem_balancing_summary(
+        _balancing_summary_content.splitlines(), after=models[0].trading_day_interval
+    )
+
+    assert len(models_after) == 1
+    assert models_after[0].price == 42.98
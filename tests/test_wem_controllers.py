@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.engine import Engine
+
+from opennem.clients.wem import (
+    WEMBalancingSummaryInterval,
+    WEMBalancingSummarySet,
+    WEMFacilityIntervalSet,
+    WEMGenerationInterval,
+)
+from opennem.controllers.wem import store_wem_balancingsummary_set, store_wem_facility_intervals
+from opennem.schema.network import NetworkWEM
+
+# intervals before WEM data starts so stored test rows don't overlap real ones
+TEST_INTERVAL_START = datetime(2001, 1, 1, 8, 0, tzinfo=NetworkWEM.get_fixed_offset())
+
+TEST_FACILITY_CODE = "TEST_WEM_STORE_1"
+
+
+def test_store_wem_facility_intervals_db(db_engine: Engine) -> None:
+    intervals = [
+        WEMGenerationInterval(
+            trading_interval=TEST_INTERVAL_START + timedelta(minutes=30 * i),
+            facility_code=TEST_FACILITY_CODE,
+            power=10.5 + i,
+            eoi_quantity=5.25 + i,
+        )
+        for i in range(3)
+    ]
+    interval_set = WEMFacilityIntervalSet(crawled_at=datetime.now(), intervals=intervals)
+
+    try:
+        cr = store_wem_facility_intervals(interval_set)
+
+        assert cr.inserted_records == 3
+        assert cr.errors == 0
+        assert cr.max_interval == intervals[-1].trading_interval
+
+        with db_engine.connect() as c:
+            rows = c.execute(
+                "select trading_interval, network_id, generated, eoi_quantity, is_forecast, "
+                "created_by from facility_scada where facility_code = %s "
+                "order by trading_interval",
+                (TEST_FACILITY_CODE,),
+            ).fetchall()
+
+        assert [tuple(i) for i in rows] == [
+            (i.trading_interval, "WEM", i.power, i.eoi_quantity, False, "wem.controller")
+            for i in intervals
+        ], "Columns are stored in place"
+    finally:
+        with db_engine.connect() as c:
+            for table_name in ["facility_scada", "facility_scada_dirty", "facility_scada_range"]:
+                c.execute(
+                    "delete from {} where facility_code = %s".format(table_name),
+                    (TEST_FACILITY_CODE,),
+                )
+
+
+def test_store_wem_balancingsummary_set_db(db_engine: Engine) -> None:
+    intervals = [
+        WEMBalancingSummaryInterval(
+            trading_day_interval=TEST_INTERVAL_START + timedelta(minutes=30 * i),
+            forecast_mw=1800.5 + i,
+            price=40.25 + i,
+            actual_nsg_mw=590.5,
+            actual_total_generation=1780.5 + i,
+        )
+        for i in range(2)
+    ]
+    balancing_set = WEMBalancingSummarySet(crawled_at=datetime.now(), intervals=intervals)
+
+    try:
+        cr = store_wem_balancingsummary_set(balancing_set)
+
+        assert cr.inserted_records == 2
+        assert cr.errors == 0
+
+        with db_engine.connect() as c:
+            rows = c.execute(
+                "select trading_interval, network_region, forecast_load, generation_scheduled, "
+                "generation_total, price, is_forecast from balancing_summary "
+                "where network_id = 'WEM' and trading_interval in %s order by trading_interval",
+                (tuple(i.trading_day_interval for i in intervals),),
+            ).fetchall()
+
+        assert [tuple(i) for i in rows] == [
+            (
+                i.trading_day_interval,
+                "WEM",
+                i.forecast_mw,
+                i.actual_nsg_mw,
+                i.actual_total_generation,
+                i.price,
+                False,
+            )
+            for i in intervals
+        ], "Columns are stored in place"
+    finally:
+        with db_engine.connect() as c:
+            c.execute(
+                "delete from balancing_summary where network_id = 'WEM' "
+                "and trading_interval in %s",
+                (tuple(i.trading_day_interval for i in intervals),),
+            )